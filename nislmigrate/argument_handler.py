@@ -1,9 +1,20 @@
+import hashlib
 import logging
 import os
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
 
-from argparse import ArgumentParser, Action, SUPPRESS
+from argparse import ArgumentParser, ArgumentTypeError, Action, SUPPRESS
 from nislmigrate.facades.facade_factory import FacadeFactory
+from nislmigrate.facades.file_copy_engine import LINK_MODE_COPY, LINK_MODES
+from nislmigrate.facades.file_system_facade import VERIFY_MODE_NONE, VERIFY_MODES
+from nislmigrate.facades.mongo_facade import (
+    DEFAULT_MAX_IDLE_TIME_MILLISECONDS,
+    DEFAULT_MAX_POOL_SIZE,
+    MONGO_ENGINE_TOOLS,
+    MONGO_ENGINES,
+    MONGO_PROFILE_PRODUCTION,
+    MONGO_PROFILES,
+)
 from nislmigrate.migration_action import MigrationAction
 from nislmigrate import migrators
 from nislmigrate.logs.migration_error import MigrationError
@@ -28,6 +39,22 @@ SECRET_ARGUMENT = 'secret'
 FORCE_ARGUMENT = 'force'
 FORCE_ARGUMENT_FLAG = 'f'
 LIST_INSTALLED_SERVICES_ARGUMENT = 'list'
+JOBS_ARGUMENT = 'jobs'
+INCREMENTAL_ARGUMENT = 'incremental'
+SYNC_ARGUMENT = 'sync'
+DEDUPLICATE_ARGUMENT = 'deduplicate'
+OBJECT_STORE_ARGUMENT = 'object_store'
+ARCHIVE_ARGUMENT = 'archive'
+LINK_ARGUMENT = 'link'
+CHECKSUM_ARGUMENT = 'checksum'
+VERIFY_ARGUMENT = 'verify'
+MONGO_PROFILE_ARGUMENT = 'mongo_profile'
+MONGO_ENGINE_ARGUMENT = 'mongo_engine'
+MONGO_POOL_SIZE_ARGUMENT = 'mongo_pool_size'
+MONGO_IDLE_TIME_ARGUMENT = 'mongo_idle_time'
+CHECKSUM_ALGORITHMS = sorted(
+    algorithm for algorithm in hashlib.algorithms_guaranteed if not algorithm.startswith('shake'))
+DEFAULT_JOBS = 1
 
 SECRET_ARGUMENT_HELP = ('Some migrators require this --secret to encrypt sensitive data during migration '
                         'otherwise it is ignored. You will need to provide the same '
@@ -40,6 +67,8 @@ Must specify at least one service to migrate, or migrate all services with the `
 Run `nislmigrate capture/restore/modify --help` to list all supported services."""
 
 MIGRATION_OPERATION_NOT_PROVIDED_ERROR_TEXT = 'The "capture", "restore" or "modify" argument must be provided'
+ARCHIVE_OPTIONS_ERROR_TEXT = ('--archive can not be combined with --checksum or --link, because archives are always '
+                              'written in full and checked against the checksums of their blocks')
 SERVICE_NOT_INSTALLED_ERROR_TEXT_FORMAT = """
 
 Service '{service_name}' cannot be migrated because the specified service is not installed locally.
@@ -56,6 +85,38 @@ ALL_SERVICES_ARGUMENT_HELP = 'use all provided migrator plugins during a capture
 FORCE_ARGUMENT_HELP = 'allows capture to delete existing data on the SystemLink server prior to restore'
 DEBUG_VERBOSITY_ARGUMENT_HELP = 'print all logged information and stack trace information in case an error occurs'
 SILENT_VERBOSITY_ARGUMENT_HELP = 'print all logged information except debugging information'
+JOBS_ARGUMENT_HELP = ('the maximum number of services to migrate at the same time (defaults to 1). Services that '
+                      'compete for the same disk are never migrated at the same time')
+INCREMENTAL_ARGUMENT_HELP = ('update an earlier capture in the migration directory by copying only the files that '
+                             'were added or changed since, and deleting the files that were removed')
+DEDUPLICATE_ARGUMENT_HELP = ('store the contents of captured files once in an object store shared by all captures '
+                             'next to the migration directory, and keep only a manifest of the files for each capture')
+OBJECT_STORE_ARGUMENT_HELP = ('the object store directory to use with --deduplicate (defaults to a .objects directory '
+                              'next to the migration directory)')
+ARCHIVE_ARGUMENT_HELP = ('pack the captured files of each service into a single archive of blocks that are compressed '
+                         'in parallel, storing files that are already compressed as they are. With --incremental '
+                         'an existing archive is replaced')
+LINK_ARGUMENT_HELP = ('how to capture files when the migration directory is on the same volume as the captured '
+                      'files: copy them (the default), clone them on file systems that support copy-on-write '
+                      'clones such as ReFS (reflink), or hard link files that are never modified in place and '
+                      'clone the rest (hardlink)')
+CHECKSUM_ARGUMENT_HELP = ('hash captured files with the given algorithm while they are copied, and record the hashes '
+                          'in a manifest next to each captured directory so the capture can be verified')
+VERIFY_ARGUMENT_HELP = ('before restoring, check every captured file (full) or a random sample of the captured files '
+                        '(sample) against the hashes recorded with --checksum during capture')
+MONGO_PROFILE_ARGUMENT_HELP = ('the settings to start the database with while restoring: the production settings (the '
+                               'default), or settings tuned for bulk loading (bulkload) with a larger cache, less '
+                               'frequent journal and data file flushes, and writes that do not wait for the journal')
+MONGO_ENGINE_ARGUMENT_HELP = ('how to dump and restore the databases: with the mongodump and mongorestore tools '
+                              'installed with SystemLink (the default), or natively by streaming documents through '
+                              'the database driver (native). Captures made natively are always restored natively')
+MONGO_POOL_SIZE_ARGUMENT_HELP = (f'the maximum number of connections to keep open to the database for each service '
+                                 f'(defaults to {DEFAULT_MAX_POOL_SIZE})')
+MONGO_IDLE_TIME_ARGUMENT_HELP = (f'the number of milliseconds an unused database connection stays open before it is '
+                                 f'closed (defaults to {DEFAULT_MAX_IDLE_TIME_MILLISECONDS})')
+SYNC_ARGUMENT_HELP = ('update existing files on the SystemLink server in place by copying only the captured files '
+                      'that differ and deleting files that were not captured, instead of deleting all existing '
+                      'files before copying')
 LIST_INSTALLED_SERVICES_ARGUMENT_HELP = ('list the SystemLink services this tool recognises as installed on the '
                                          'current machine')
 
@@ -68,6 +129,13 @@ def _is_migrator_arguments_key(key: str) -> bool:
     return key.endswith('_args')
 
 
+def _positive_integer(value: str) -> int:
+    number = int(value)
+    if number < 1:
+        raise ArgumentTypeError(f'{value} is not a positive integer')
+    return number
+
+
 class ArgumentHandler:
     """
     Processes arguments either from the command line or just a list of arguments and breaks them
@@ -91,6 +159,13 @@ class ArgumentHandler:
             self.parsed_arguments = argument_parser.parse_args()
         else:
             self.parsed_arguments = argument_parser.parse_args(arguments)
+        self.__validate_capture_options(argument_parser)
+
+    def __validate_capture_options(self, argument_parser: ArgumentParser) -> None:
+        if not self.is_archive_flag_present():
+            return
+        if self.get_checksum_algorithm() is not None or self.get_link_mode() != LINK_MODE_COPY:
+            argument_parser.error(ARCHIVE_OPTIONS_ERROR_TEXT)
 
     def get_list_of_services_to_capture_or_restore(self) -> List[MigratorPlugin]:
         """
@@ -156,6 +231,81 @@ class ArgumentHandler:
     def is_force_migration_flag_present(self) -> bool:
         return getattr(self.parsed_arguments, FORCE_ARGUMENT, False)
 
+    def is_incremental_capture_flag_present(self) -> bool:
+        return getattr(self.parsed_arguments, INCREMENTAL_ARGUMENT, False)
+
+    def is_deduplicate_flag_present(self) -> bool:
+        return getattr(self.parsed_arguments, DEDUPLICATE_ARGUMENT, False)
+
+    def get_object_store_directory(self) -> Optional[str]:
+        """Gets the object store directory to capture deduplicated file contents to.
+
+        :return: The object store directory from the arguments, or None if none was specified.
+        """
+        return getattr(self.parsed_arguments, OBJECT_STORE_ARGUMENT, None)
+
+    def is_archive_flag_present(self) -> bool:
+        return getattr(self.parsed_arguments, ARCHIVE_ARGUMENT, False)
+
+    def get_link_mode(self) -> str:
+        """Gets how captured files are created when they are on the same volume as the migration directory.
+
+        :return: The link mode from the arguments, or LINK_MODE_COPY if none was specified.
+        """
+        return getattr(self.parsed_arguments, LINK_ARGUMENT, LINK_MODE_COPY)
+
+    def get_checksum_algorithm(self) -> Optional[str]:
+        """Gets the algorithm to hash captured files with.
+
+        :return: The hashlib algorithm from the arguments, or None if captured files should not be hashed.
+        """
+        return getattr(self.parsed_arguments, CHECKSUM_ARGUMENT, None)
+
+    def get_verify_mode(self) -> str:
+        """Gets how captured files are checked against their hashes before they are restored.
+
+        :return: The verify mode from the arguments, or VERIFY_MODE_NONE if none was specified.
+        """
+        return getattr(self.parsed_arguments, VERIFY_ARGUMENT, VERIFY_MODE_NONE)
+
+    def get_mongo_profile(self) -> str:
+        """Gets the settings the database is started with while restoring.
+
+        :return: The mongo profile from the arguments, or MONGO_PROFILE_PRODUCTION if none was specified.
+        """
+        return getattr(self.parsed_arguments, MONGO_PROFILE_ARGUMENT, MONGO_PROFILE_PRODUCTION)
+
+    def get_mongo_engine(self) -> str:
+        """Gets how databases are dumped and restored.
+
+        :return: The mongo engine from the arguments, or MONGO_ENGINE_TOOLS if none was specified.
+        """
+        return getattr(self.parsed_arguments, MONGO_ENGINE_ARGUMENT, MONGO_ENGINE_TOOLS)
+
+    def get_mongo_pool_size(self) -> int:
+        """Gets the maximum number of connections to keep open to the database for each service.
+
+        :return: The pool size from the arguments, or DEFAULT_MAX_POOL_SIZE if none was specified.
+        """
+        return getattr(self.parsed_arguments, MONGO_POOL_SIZE_ARGUMENT, DEFAULT_MAX_POOL_SIZE)
+
+    def get_mongo_idle_time_milliseconds(self) -> int:
+        """Gets how long an unused database connection stays open before it is closed.
+
+        :return: The idle time from the arguments, or DEFAULT_MAX_IDLE_TIME_MILLISECONDS if none was specified.
+        """
+        return getattr(self.parsed_arguments, MONGO_IDLE_TIME_ARGUMENT, DEFAULT_MAX_IDLE_TIME_MILLISECONDS)
+
+    def is_sync_restore_flag_present(self) -> bool:
+        return getattr(self.parsed_arguments, SYNC_ARGUMENT, False)
+
+    def get_number_of_jobs(self) -> int:
+        """Gets the maximum number of migrators to run at the same time.
+
+        :return: The number of jobs from the arguments, or the default if none was specified.
+        """
+        return getattr(self.parsed_arguments, JOBS_ARGUMENT, DEFAULT_JOBS)
+
     @staticmethod
     def __remove_non_plugin_arguments(arguments: Dict[str, Any]) -> List[str]:
         return [
@@ -167,6 +317,19 @@ class ArgumentHandler:
             and not argument == VERBOSITY_ARGUMENT
             and not argument == FORCE_ARGUMENT
             and not argument == SECRET_ARGUMENT
+            and not argument == JOBS_ARGUMENT
+            and not argument == INCREMENTAL_ARGUMENT
+            and not argument == SYNC_ARGUMENT
+            and not argument == DEDUPLICATE_ARGUMENT
+            and not argument == OBJECT_STORE_ARGUMENT
+            and not argument == ARCHIVE_ARGUMENT
+            and not argument == LINK_ARGUMENT
+            and not argument == CHECKSUM_ARGUMENT
+            and not argument == VERIFY_ARGUMENT
+            and not argument == MONGO_PROFILE_ARGUMENT
+            and not argument == MONGO_ENGINE_ARGUMENT
+            and not argument == MONGO_POOL_SIZE_ARGUMENT
+            and not argument == MONGO_IDLE_TIME_ARGUMENT
             and not _is_migrator_arguments_key(argument)
         ]
 
@@ -224,16 +387,70 @@ class ArgumentHandler:
         self.__add_plugin_arguments(parent_parser)
 
         sub_parser = argument_parser.add_subparsers(dest=ACTION_ARGUMENT, metavar='command')
-        sub_parser.add_parser(CAPTURE_ARGUMENT, help=CAPTURE_COMMAND_HELP, parents=[parent_parser])
+        capture_parser = sub_parser.add_parser(CAPTURE_ARGUMENT, help=CAPTURE_COMMAND_HELP, parents=[parent_parser])
+        capture_parser.add_argument(
+            f'--{INCREMENTAL_ARGUMENT}',
+            help=INCREMENTAL_ARGUMENT_HELP,
+            action='store_true')
+        capture_format_group = capture_parser.add_mutually_exclusive_group()
+        capture_format_group.add_argument(
+            f'--{DEDUPLICATE_ARGUMENT}',
+            help=DEDUPLICATE_ARGUMENT_HELP,
+            action='store_true')
+        capture_format_group.add_argument(
+            f'--{ARCHIVE_ARGUMENT}',
+            help=ARCHIVE_ARGUMENT_HELP,
+            action='store_true')
+        capture_parser.add_argument(
+            '--object-store',
+            dest=OBJECT_STORE_ARGUMENT,
+            help=OBJECT_STORE_ARGUMENT_HELP,
+            metavar='PATH')
+        capture_parser.add_argument(
+            f'--{LINK_ARGUMENT}',
+            help=LINK_ARGUMENT_HELP,
+            choices=LINK_MODES,
+            default=LINK_MODE_COPY)
+        capture_parser.add_argument(
+            f'--{CHECKSUM_ARGUMENT}',
+            help=CHECKSUM_ARGUMENT_HELP,
+            choices=CHECKSUM_ALGORITHMS,
+            metavar='ALGORITHM')
+        self.__add_mongo_engine_option(capture_parser)
         restore_parser = sub_parser.add_parser(RESTORE_ARGUMENT, help=RESTORE_COMMAND_HELP, parents=[parent_parser])
         restore_parser.add_argument(
             f'-{FORCE_ARGUMENT_FLAG}',
             f'--{FORCE_ARGUMENT}',
             help=FORCE_ARGUMENT_HELP,
             action='store_true')
+        restore_parser.add_argument(
+            f'--{SYNC_ARGUMENT}',
+            help=SYNC_ARGUMENT_HELP,
+            action='store_true')
+        restore_parser.add_argument(
+            f'--{VERIFY_ARGUMENT}',
+            help=VERIFY_ARGUMENT_HELP,
+            choices=VERIFY_MODES,
+            default=VERIFY_MODE_NONE)
+        restore_parser.add_argument(
+            '--mongo-profile',
+            dest=MONGO_PROFILE_ARGUMENT,
+            help=MONGO_PROFILE_ARGUMENT_HELP,
+            choices=MONGO_PROFILES,
+            default=MONGO_PROFILE_PRODUCTION)
+        self.__add_mongo_engine_option(restore_parser)
         sub_parser.add_parser(MODIFY_ARGUMENT, help=MODIFY_COMMAND_HELP, parents=[parent_parser])
         sub_parser.add_parser(LIST_INSTALLED_SERVICES_ARGUMENT, help=LIST_INSTALLED_SERVICES_ARGUMENT_HELP)
 
+    @staticmethod
+    def __add_mongo_engine_option(parser: ArgumentParser) -> None:
+        parser.add_argument(
+            '--mongo-engine',
+            dest=MONGO_ENGINE_ARGUMENT,
+            help=MONGO_ENGINE_ARGUMENT_HELP,
+            choices=MONGO_ENGINES,
+            default=MONGO_ENGINE_TOOLS)
+
     @staticmethod
     def __add_additional_flag_options(parser: ArgumentParser) -> None:
         parser.add_argument(
@@ -245,6 +462,26 @@ class ArgumentHandler:
             '--' + ALL_SERVICES_ARGUMENT,
             help=ALL_SERVICES_ARGUMENT_HELP,
             action='store_true')
+        parser.add_argument(
+            f'--{JOBS_ARGUMENT}',
+            help=JOBS_ARGUMENT_HELP,
+            type=_positive_integer,
+            default=DEFAULT_JOBS,
+            metavar='N')
+        parser.add_argument(
+            '--mongo-pool-size',
+            dest=MONGO_POOL_SIZE_ARGUMENT,
+            help=MONGO_POOL_SIZE_ARGUMENT_HELP,
+            type=_positive_integer,
+            default=DEFAULT_MAX_POOL_SIZE,
+            metavar='N')
+        parser.add_argument(
+            '--mongo-idle-time',
+            dest=MONGO_IDLE_TIME_ARGUMENT,
+            help=MONGO_IDLE_TIME_ARGUMENT_HELP,
+            type=_positive_integer,
+            default=DEFAULT_MAX_IDLE_TIME_MILLISECONDS,
+            metavar='MILLISECONDS')
 
     @staticmethod
     def __add_logging_flag_options(parser: ArgumentParser) -> None:
@@ -1,7 +1,8 @@
-from typing import Dict, Any, Optional
+from typing import Dict, Any, Optional, List, Set
 
 import os
 import abc
+from enum import Enum
 
 from nislmigrate.facades.facade_factory import FacadeFactory
 from nislmigrate.utility.paths import get_ni_application_data_directory_path
@@ -13,6 +14,16 @@ DEFAULT_SERVICE_CONFIGURATION_DIRECTORY: str = os.path.join(
     'Config')
 
 
+class MigratorResource(Enum):
+    """
+    A host resource that a migrator spends most of its time waiting on. The migration scheduler
+    uses these to decide which migrators can run at the same time.
+    """
+    MONGO = 'mongo'
+    DISK = 'disk'
+    CPU = 'cpu'
+
+
 class ArgumentManager(abc.ABC):
     """
     Abstracts management of migrator-specific command line arguments.
@@ -93,6 +104,33 @@ class MigratorPlugin(abc.ABC):
         """
         return 'A short sentence describing the operation of the plugin'
 
+    @property
+    def resources(self) -> Set[MigratorResource]:
+        """
+        Gets the host resources this migrator is bound by while it runs. Migrators that share a
+        resource with a limited capacity (such as the disk) will not be run at the same time.
+        :return: The set of resources used by this migrator.
+        """
+        return {MigratorResource.MONGO}
+
+    @property
+    def dependencies(self) -> List[str]:
+        """
+        Gets the names of the migrators that must finish before this migrator is started. Dependencies
+        on migrators that are not part of the current migration are ignored.
+        :return: The list of migrator names this migrator must run after.
+        """
+        return []
+
+    @property
+    def relative_workload(self) -> int:
+        """
+        Gets a rough estimate of how long this migrator takes relative to a migrator that only
+        migrates a small database. Migrators with larger workloads are started first.
+        :return: The relative workload of this migrator.
+        """
+        return 1
+
     def config(self, facade_factory: FacadeFactory) -> Dict[str, Any]:
         """
         Gets the configuration dictionary this plugin provides.
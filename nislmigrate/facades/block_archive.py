@@ -0,0 +1,419 @@
+"""Pack directory trees into a single archive of independently compressed blocks."""
+
+import bisect
+import json
+import logging
+import os
+import random
+import struct
+import zlib
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, BinaryIO, Callable, Deque, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from nislmigrate.logs.migration_error import MigrationError
+
+ARCHIVE_MAGIC: bytes = b'NISLMARC'
+ARCHIVE_VERSION: int = 1
+ARCHIVE_FILE_SUFFIX: str = '.archive'
+DEFAULT_COMPRESSION_WORKERS: int = os.cpu_count() or 1
+DEFAULT_BLOCK_SIZE: int = 4 * 1024 * 1024
+DEFAULT_COMPRESSION_LEVEL: int = 6
+COMPRESSIBILITY_SAMPLE_SIZE: int = 64 * 1024
+COMPRESSIBILITY_THRESHOLD: float = 0.9
+METHOD_STORED: int = 0
+METHOD_ZLIB: int = 1
+
+_HEADER = struct.Struct('<8sB')
+_BLOCK_HEADER = struct.Struct('<BIII')
+_TRAILER = struct.Struct('<QQ8s')
+_READ_SIZE = 1024 * 1024
+_INVALID_ARCHIVE_ERROR_FORMAT = 'The file {path} is not an archive written by this tool, or it is truncated.'
+_CORRUPT_BLOCK_ERROR_FORMAT = 'The archive {path} is corrupt: block {index} does not match its checksum.'
+
+
+def get_archive_path(directory: str) -> str:
+    """
+    Gets the path of the archive holding a captured directory. The archive is stored next to
+    where the directory would have been captured.
+
+    :param directory: The captured directory.
+    :return: The path of the archive.
+    """
+    return os.path.normpath(directory) + ARCHIVE_FILE_SUFFIX
+
+
+def is_compressible(path: str, size: int) -> bool:
+    """
+    Guesses whether a file is worth compressing by compressing a sample from its start.
+    Files that are already compressed, such as packages and images, barely shrink.
+
+    :param path: The file to check.
+    :param size: The size of the file.
+    :return: True if the sample compressed well.
+    """
+    if size < 4096:
+        return True
+    with open(path, 'rb') as file:
+        sample = file.read(COMPRESSIBILITY_SAMPLE_SIZE)
+    return len(zlib.compress(sample, 1)) < len(sample) * COMPRESSIBILITY_THRESHOLD
+
+
+class ArchiveEntry:
+    """
+    A file in an archive and where its contents are in the uncompressed stream of the archive.
+    """
+    def __init__(self, path: str, offset: int, size: int, modified_time: int):
+        """
+        Creates a new instance of ArchiveEntry.
+
+        :param path: The path of the file relative to the archived directory, with forward slashes.
+        :param offset: The position of the contents in the uncompressed stream.
+        :param size: The size of the file in bytes.
+        :param modified_time: The modification time of the file in nanoseconds.
+        """
+        self.path: str = path
+        self.offset: int = offset
+        self.size: int = size
+        self.modified_time: int = modified_time
+
+
+class _ArchiveBlock:
+    def __init__(self, position: int, offset: int, size: int):
+        self.position: int = position
+        self.offset: int = offset
+        self.size: int = size
+
+
+class BlockArchiveWriter:
+    """
+    Writes a directory tree as one stream of file contents cut into blocks that are compressed
+    independently, on several threads. Blocks never mix files that compress well with files
+    that do not, and the latter are stored without compression. An index at the end of the
+    archive records where every file and block is.
+    """
+    def __init__(
+            self,
+            stream: BinaryIO,
+            workers: int = DEFAULT_COMPRESSION_WORKERS,
+            block_size: int = DEFAULT_BLOCK_SIZE,
+            compression_level: int = DEFAULT_COMPRESSION_LEVEL):
+        """
+        Creates a new instance of BlockArchiveWriter.
+
+        :param stream: The stream to write the archive to.
+        :param workers: The maximum number of blocks to compress at the same time.
+        :param block_size: The uncompressed size of each block.
+        :param compression_level: The zlib compression level.
+        """
+        self.__stream: BinaryIO = stream
+        self.__workers: int = max(1, workers)
+        self.__block_size: int = block_size
+        self.__compression_level: int = compression_level
+        self.__executor: ThreadPoolExecutor = ThreadPoolExecutor(max_workers=self.__workers)
+        self.__pending: Deque[Future] = deque()
+        self.__buffer: bytearray = bytearray()
+        self.__buffer_compressed: bool = True
+        self.__offset: int = 0
+        self.__position: int = _HEADER.size
+        self.__blocks: List[_ArchiveBlock] = []
+        self.__written_blocks: int = 0
+        self.__files: List[ArchiveEntry] = []
+        self.__directories: List[str] = []
+        self.__stream.write(_HEADER.pack(ARCHIVE_MAGIC, ARCHIVE_VERSION))
+
+    def add_directory(self, directory: str) -> None:
+        """
+        Adds every file and directory in a directory tree to the archive. Symbolic links are skipped,
+        so a link can not make the archive loop or include files from outside the tree.
+
+        :param directory: The root of the directory tree.
+        """
+        directories = [(directory, '')]
+        while directories:
+            current_directory, relative_directory = directories.pop()
+            with os.scandir(current_directory) as entries:
+                for entry in sorted(entries, key=lambda item: item.name):
+                    relative_path = relative_directory + entry.name
+                    if entry.is_symlink():
+                        log = logging.getLogger(BlockArchiveWriter.__name__)
+                        log.warning(f'Skipped the symbolic link {entry.path}, which archives can not store.')
+                    elif entry.is_dir(follow_symlinks=False):
+                        self.__directories.append(relative_path)
+                        directories.append((entry.path, relative_path + '/'))
+                    else:
+                        self.__add_file(entry.path, relative_path, entry.stat())
+
+    def close(self) -> None:
+        """
+        Writes the remaining blocks and the index. The stream is not closed.
+        """
+        try:
+            self.__flush_buffer()
+            while self.__pending:
+                self.__write_block(self.__pending.popleft().result())
+        finally:
+            self.__executor.shutdown()
+        index = {
+            'directories': self.__directories,
+            'files': [[entry.path, entry.offset, entry.size, entry.modified_time] for entry in self.__files],
+            'blocks': [[block.position, block.offset, block.size] for block in self.__blocks],
+        }
+        index_data = zlib.compress(json.dumps(index).encode('utf-8'))
+        self.__stream.write(index_data)
+        self.__stream.write(_TRAILER.pack(self.__position, len(index_data), ARCHIVE_MAGIC))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.__executor.shutdown()
+
+    def __add_file(self, path: str, relative_path: str, file_stat: os.stat_result) -> None:
+        compressed = is_compressible(path, file_stat.st_size)
+        if compressed != self.__buffer_compressed:
+            self.__flush_buffer()
+            self.__buffer_compressed = compressed
+        offset = self.__offset + len(self.__buffer)
+        self.__files.append(ArchiveEntry(relative_path, offset, file_stat.st_size, file_stat.st_mtime_ns))
+        size = 0
+        with open(path, 'rb') as file:
+            for chunk in iter(lambda: file.read(_READ_SIZE), b''):
+                size += len(chunk)
+                self.__buffer += chunk
+                while len(self.__buffer) >= self.__block_size:
+                    self.__flush_buffer(self.__block_size)
+        if size != file_stat.st_size:
+            raise MigrationError(f'The file {path} changed while it was being archived.')
+
+    def __flush_buffer(self, size: Optional[int] = None) -> None:
+        if not self.__buffer:
+            return
+        size = len(self.__buffer) if size is None else size
+        data = bytes(self.__buffer[:size])
+        del self.__buffer[:size]
+        self.__blocks.append(_ArchiveBlock(0, self.__offset, size))
+        self.__offset += size
+        if len(self.__pending) >= self.__workers * 2:
+            self.__write_block(self.__pending.popleft().result())
+        self.__pending.append(self.__executor.submit(
+            _compress_block,
+            data,
+            self.__compression_level if self.__buffer_compressed else None))
+
+    def __write_block(self, block: bytes) -> None:
+        self.__blocks[self.__written_blocks].position = self.__position
+        self.__written_blocks += 1
+        self.__stream.write(block)
+        self.__position += len(block)
+
+
+class BlockArchiveReader:
+    """
+    Reads files from an archive written by BlockArchiveWriter. Only the blocks holding the
+    requested files are read, and they are decompressed on several threads.
+    """
+    def __init__(self, stream: BinaryIO, workers: int = DEFAULT_COMPRESSION_WORKERS, name: str = ''):
+        """
+        Creates a new instance of BlockArchiveReader and reads the index of the archive.
+
+        :param stream: The archive. Must be seekable.
+        :param workers: The maximum number of blocks to decompress at the same time.
+        :param name: The name of the archive to use in error messages.
+        """
+        self.__stream: BinaryIO = stream
+        self.__workers: int = max(1, workers)
+        self.__name: str = name
+        index = self.__read_index()
+        self.directories: List[str] = index['directories']
+        self.files: Dict[str, ArchiveEntry] = {
+            path: ArchiveEntry(path, offset, size, modified_time)
+            for path, offset, size, modified_time in index['files']
+        }
+        self.__blocks: List[_ArchiveBlock] = [_ArchiveBlock(*block) for block in index['blocks']]
+        self.__block_offsets: List[int] = [block.offset for block in self.__blocks]
+
+    def extract(self, to_directory: str, path: str = '') -> int:
+        """
+        Extracts a file or a subtree of the archive, or the whole archive.
+
+        :param to_directory: The directory to extract into. Files keep their path relative to the archived directory.
+        :param path: The relative path of the file or directory to extract, with forward slashes,
+                     or an empty string to extract everything.
+        :return: The number of extracted files.
+        """
+        prefix = path.strip('/')
+        entries = sorted(
+            (entry for entry in self.files.values() if _is_in_subtree(entry.path, prefix)),
+            key=lambda entry: entry.offset)
+        for directory in self.directories:
+            if _is_in_subtree(directory, prefix):
+                os.makedirs(self.__get_target_path(to_directory, directory), exist_ok=True)
+        os.makedirs(to_directory, exist_ok=True)
+
+        block_indexes = sorted({index for entry in entries for index in self.__get_block_indexes(entry)})
+        open_files: Dict[str, BinaryIO] = {}
+        try:
+            for entry in entries:
+                if entry.size == 0:
+                    self.__create_file(to_directory, entry).close()
+                    self.__finish_file(to_directory, entry)
+            waiting = deque(entry for entry in entries if entry.size)
+            for index, data in self.__read_blocks(block_indexes):
+                block = self.__blocks[index]
+                # Files do not overlap in the stream, so only the first waiting file can have
+                # started in an earlier block.
+                while waiting and waiting[0].offset < block.offset + block.size:
+                    entry = waiting[0]
+                    start = max(entry.offset, block.offset)
+                    end = min(entry.offset + entry.size, block.offset + block.size)
+                    if entry.path not in open_files:
+                        open_files[entry.path] = self.__create_file(to_directory, entry)
+                    open_files[entry.path].write(data[start - block.offset:end - block.offset])
+                    if end < entry.offset + entry.size:
+                        break
+                    open_files.pop(entry.path).close()
+                    self.__finish_file(to_directory, entry)
+                    waiting.popleft()
+        finally:
+            for file in open_files.values():
+                file.close()
+        return len(entries)
+
+    def read_file(self, path: str) -> bytes:
+        """
+        Reads the contents of a single file.
+
+        :param path: The relative path of the file, with forward slashes.
+        :return: The contents of the file.
+        """
+        entry = self.files.get(path)
+        if entry is None:
+            raise MigrationError(f'The archive {self.__name} does not contain {path}.')
+        contents = bytearray()
+        for index, data in self.__read_blocks(self.__get_block_indexes(entry)):
+            block = self.__blocks[index]
+            start = max(entry.offset, block.offset) - block.offset
+            end = min(entry.offset + entry.size, block.offset + block.size) - block.offset
+            contents += data[start:end]
+        return bytes(contents)
+
+    def verify(self, sample_size: Optional[int] = None) -> int:
+        """
+        Checks blocks of the archive against their checksums. Raises a MigrationError for the
+        first block that does not match.
+
+        :param sample_size: The number of randomly chosen blocks to check, or None to check every block.
+        :return: The number of bytes checked.
+        """
+        indexes = list(range(len(self.__blocks)))
+        if sample_size is not None and sample_size < len(indexes):
+            indexes = sorted(random.sample(indexes, sample_size))
+        return sum(len(data) for _, data in self.__read_blocks(indexes))
+
+    def __read_index(self) -> Dict[str, Any]:
+        try:
+            self.__stream.seek(0)
+            magic, version = _HEADER.unpack(self.__stream.read(_HEADER.size))
+            self.__stream.seek(-_TRAILER.size, os.SEEK_END)
+            index_position, index_size, trailer_magic = _TRAILER.unpack(self.__stream.read(_TRAILER.size))
+            if magic != ARCHIVE_MAGIC or trailer_magic != ARCHIVE_MAGIC or version != ARCHIVE_VERSION:
+                raise ValueError(magic)
+            self.__stream.seek(index_position)
+            return json.loads(zlib.decompress(self.__stream.read(index_size)).decode('utf-8'))
+        except (ValueError, OSError, struct.error, zlib.error) as e:
+            raise MigrationError(_INVALID_ARCHIVE_ERROR_FORMAT.format(path=self.__name)) from e
+
+    def __get_block_indexes(self, entry: ArchiveEntry) -> List[int]:
+        if entry.size == 0:
+            return []
+        first = bisect.bisect_right(self.__block_offsets, entry.offset) - 1
+        last = bisect.bisect_right(self.__block_offsets, entry.offset + entry.size - 1) - 1
+        return list(range(first, last + 1))
+
+    def __read_blocks(self, indexes: List[int]) -> Iterator[Tuple[int, bytes]]:
+        # Blocks are read from the stream in order on the calling thread and only decompressed
+        # on the workers, so the stream is never shared between threads.
+        with ThreadPoolExecutor(max_workers=self.__workers) as executor:
+            results = _map_in_order(
+                executor,
+                lambda item: (item[0], _decompress_block(item[1], item[0], self.__name)),
+                ((index, self.__read_block_frame(index)) for index in indexes),
+                self.__workers * 2)
+            for index, data in results:
+                yield index, data
+
+    def __read_block_frame(self, index: int) -> bytes:
+        block = self.__blocks[index]
+        self.__stream.seek(block.position)
+        header = self.__stream.read(_BLOCK_HEADER.size)
+        if len(header) < _BLOCK_HEADER.size:
+            raise MigrationError(_INVALID_ARCHIVE_ERROR_FORMAT.format(path=self.__name))
+        _, _, stored_size, _ = _BLOCK_HEADER.unpack(header)
+        return header + self.__stream.read(stored_size)
+
+    def __get_target_path(self, to_directory: str, path: str) -> str:
+        parts = path.split('/')
+        if not path or os.path.isabs(path) or any(part in ('', '.', '..') for part in parts):
+            raise MigrationError(f'The archive {self.__name} contains a path outside of the archive: {path}')
+        return os.path.join(to_directory, *parts)
+
+    def __create_file(self, to_directory: str, entry: ArchiveEntry) -> BinaryIO:
+        target_path = self.__get_target_path(to_directory, entry.path)
+        os.makedirs(os.path.dirname(target_path), exist_ok=True)
+        return open(target_path, 'wb')
+
+    def __finish_file(self, to_directory: str, entry: ArchiveEntry) -> None:
+        target_path = self.__get_target_path(to_directory, entry.path)
+        os.utime(target_path, ns=(entry.modified_time, entry.modified_time))
+
+
+def _is_in_subtree(path: str, prefix: str) -> bool:
+    return not prefix or path == prefix or path.startswith(prefix + '/')
+
+
+def _compress_block(data: bytes, compression_level: Optional[int]) -> bytes:
+    checksum = zlib.crc32(data)
+    if compression_level is not None:
+        compressed = zlib.compress(data, compression_level)
+        if len(compressed) < len(data):
+            return _BLOCK_HEADER.pack(METHOD_ZLIB, checksum, len(compressed), len(data)) + compressed
+    return _BLOCK_HEADER.pack(METHOD_STORED, checksum, len(data), len(data)) + data
+
+
+def _decompress_block(frame: bytes, index: int, name: str) -> bytes:
+    method, checksum, stored_size, size = _BLOCK_HEADER.unpack_from(frame)
+    data = frame[_BLOCK_HEADER.size:]
+    try:
+        if len(data) != stored_size:
+            raise ValueError(index)
+        if method == METHOD_ZLIB:
+            data = zlib.decompress(data)
+        elif method != METHOD_STORED:
+            raise ValueError(method)
+    except (ValueError, zlib.error) as e:
+        raise MigrationError(_CORRUPT_BLOCK_ERROR_FORMAT.format(path=name, index=index)) from e
+    if len(data) != size or zlib.crc32(data) != checksum:
+        raise MigrationError(_CORRUPT_BLOCK_ERROR_FORMAT.format(path=name, index=index))
+    return data
+
+
+def _map_in_order(
+        executor: ThreadPoolExecutor,
+        function: Callable[[Any], Any],
+        items: Iterable[Any],
+        window: int) -> Iterator[Any]:
+    """
+    Like executor.map, but only submits a bounded number of items ahead of the results that
+    have been consumed, so large inputs are never held in memory all at once.
+    """
+    pending: Deque[Future] = deque()
+    for item in items:
+        if len(pending) >= window:
+            yield pending.popleft().result()
+        pending.append(executor.submit(function, item))
+    while pending:
+        yield pending.popleft().result()
@@ -0,0 +1,115 @@
+"""Describe changes to the documents in a collection that can be applied in a single pass."""
+
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+PIPELINE_UPDATE_MINIMUM_SERVER_VERSION: Tuple[int, ...] = (4, 2)
+
+
+class DocumentTransformStep:
+    """
+    A single change to the documents in a collection, expressed both as a Python function and,
+    optionally, as aggregation pipeline stages the database server can run.
+    """
+    def __init__(
+            self,
+            query_filter: Dict[str, Any],
+            predicate: Callable[[Dict[str, Any]], bool],
+            update_function: Callable[[Dict[str, Any]], Dict[str, Any]],
+            fields: List[str],
+            pipeline: Optional[List[Dict[str, Any]]] = None,
+            minimum_server_version: Tuple[int, ...] = PIPELINE_UPDATE_MINIMUM_SERVER_VERSION):
+        """
+        Creates a new instance of DocumentTransformStep.
+
+        :param query_filter: The filter selecting the documents the step changes.
+        :param predicate: Returns True for the documents the step changes. Must match the same
+                          documents as the query filter.
+        :param update_function: Returns the changed version of the given document.
+        :param fields: The document fields the step reads and writes.
+        :param pipeline: Aggregation pipeline stages performing the same change on the server.
+                         The stages are run on documents matched by other steps too, so they
+                         must leave documents that do not match the query filter unchanged.
+        :param minimum_server_version: The lowest server version that supports the pipeline stages.
+        """
+        self.query_filter: Dict[str, Any] = query_filter
+        self.predicate: Callable[[Dict[str, Any]], bool] = predicate
+        self.update_function: Callable[[Dict[str, Any]], Dict[str, Any]] = update_function
+        self.fields: List[str] = fields
+        self.pipeline: Optional[List[Dict[str, Any]]] = pipeline
+        self.minimum_server_version: Tuple[int, ...] = minimum_server_version
+
+
+class DocumentTransform:
+    """
+    An ordered list of steps that are applied to the documents of a collection in one scan, with
+    at most one write per document. Each step sees the document as changed by the steps before it.
+    """
+    def __init__(self):
+        self.steps: List[DocumentTransformStep] = []
+
+    def add_step(self, step: DocumentTransformStep) -> None:
+        """
+        Adds a step to be applied after the steps already added.
+
+        :param step: The step to add.
+        """
+        self.steps.append(step)
+
+    @property
+    def is_empty(self) -> bool:
+        return not self.steps
+
+    @property
+    def query_filter(self) -> Dict[str, Any]:
+        """
+        The filter selecting every document at least one of the steps changes.
+        """
+        if len(self.steps) == 1:
+            return self.steps[0].query_filter
+        return {'$or': [step.query_filter for step in self.steps]}
+
+    @property
+    def projection(self) -> Dict[str, Any]:
+        """
+        The projection reading every field the steps use.
+        """
+        return {field: 1 for step in self.steps for field in step.fields}
+
+    @property
+    def pipeline(self) -> List[Dict[str, Any]]:
+        """
+        The aggregation pipeline stages of every step, in order.
+        """
+        return [stage for step in self.steps for stage in step.pipeline or []]
+
+    def can_run_on_server(self, server_version: Tuple[int, ...]) -> bool:
+        """
+        Checks whether every step can be run as a pipeline update on a server.
+
+        :param server_version: The version of the database server.
+        :return: True if every step has pipeline stages that are supported by the server.
+        """
+        return all(
+            step.pipeline is not None and server_version >= step.minimum_server_version
+            for step in self.steps)
+
+    def predicate(self, document: Dict[str, Any]) -> bool:
+        """
+        Checks whether any step would change a document before the other steps are applied.
+
+        :param document: The document to check.
+        :return: True if at least one step matches the document.
+        """
+        return any(step.predicate(document) for step in self.steps)
+
+    def update_function(self, document: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Applies every step that matches the document, in order.
+
+        :param document: The document to change.
+        :return: The changed document.
+        """
+        for step in self.steps:
+            if step.predicate(document):
+                document = step.update_function(document)
+        return document
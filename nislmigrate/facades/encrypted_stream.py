@@ -0,0 +1,395 @@
+"""Encrypt and decrypt streams of data in authenticated chunks."""
+
+import logging
+import os
+import struct
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Any, Callable, Deque, Dict, Optional, Tuple
+
+from cryptography.exceptions import InvalidTag
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF
+from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
+
+from nislmigrate.logs.migration_error import MigrationError
+
+ENCRYPTED_STREAM_MAGIC: bytes = b'NISLMENC'
+ENCRYPTED_STREAM_VERSION: int = 1
+DEFAULT_KEY_DERIVATION_ITERATIONS: int = 320000
+DEFAULT_CHUNK_SIZE: int = 1024 * 1024
+DEFAULT_ENCRYPTION_WORKERS: int = os.cpu_count() or 1
+SALT_SIZE: int = 16
+KEY_SIZE: int = 32
+STREAM_SALT_SIZE: int = 16
+_STREAM_KEY_INFO: bytes = b'nislmigrate encrypted stream'
+_FINAL_CHUNK_FLAG: int = 1
+_HEADER = struct.Struct(f'<{len(ENCRYPTED_STREAM_MAGIC)}sB{SALT_SIZE}sII{STREAM_SALT_SIZE}s')
+_CHUNK_HEADER = struct.Struct('<BI')
+_CHUNK_AUTHENTICATED_DATA = struct.Struct('<QB')
+_CHUNK_NONCE = struct.Struct('<4xQ')
+_TAG_SIZE: int = 16
+_PENDING_CHUNKS_PER_WORKER: int = 2
+_CORRUPT_DATA_ERROR = 'The encrypted data is corrupt or the secret is wrong.'
+_TRUNCATED_DATA_ERROR = 'The encrypted data ended unexpectedly.'
+
+
+def validate_secret(secret: str) -> None:
+    """
+    Throws an exception if no secret was provided.
+
+    :param secret: The secret provided by the user.
+    """
+    if not secret:
+        raise MigrationError('Secret not provided via the --secret flag for encryption.')
+
+
+def derive_key(secret: str, salt: bytes, iterations: int) -> bytes:
+    """
+    Derives an encryption key from a secret.
+
+    :param secret: The secret provided by the user.
+    :param salt: The salt to derive the key with.
+    :param iterations: The number of PBKDF2 iterations.
+    :return: The key.
+    """
+    validate_secret(secret)
+    password = bytes(secret, 'utf-8')
+    key_derivation_function = PBKDF2HMAC(algorithm=hashes.SHA256(), length=KEY_SIZE, iterations=iterations, salt=salt)
+    return key_derivation_function.derive(password)
+
+
+def derive_stream_key(key: bytes, stream_salt: bytes) -> bytes:
+    """
+    Derives the key of a single stream from the key derived from the secret. Every stream has its
+    own random salt and therefore its own key, so the chunk counter used as the nonce is never
+    repeated under the same key, however many streams share a secret.
+
+    :param key: The key derived from the secret.
+    :param stream_salt: The random salt of the stream.
+    :return: The key of the stream.
+    """
+    key_derivation_function = HKDF(algorithm=hashes.SHA256(), length=KEY_SIZE, salt=stream_salt, info=_STREAM_KEY_INFO)
+    return key_derivation_function.derive(key)
+
+
+def is_encrypted_stream(header: bytes) -> bool:
+    """
+    Checks whether data starts with the header of an encrypted stream, as opposed to the single
+    Fernet token written by earlier versions.
+
+    :param header: At least the first bytes of the data.
+    :return: True if the data is an encrypted stream.
+    """
+    return header.startswith(ENCRYPTED_STREAM_MAGIC)
+
+
+class KeyManager:
+    """
+    Derives encryption keys from secrets and keeps them in memory for the rest of the run, so
+    the expensive key derivation runs once per secret and salt. Everything encrypted during the
+    run shares one random salt, which is stored in the header of each encrypted stream.
+    """
+    def __init__(self, iterations: int = DEFAULT_KEY_DERIVATION_ITERATIONS):
+        """
+        Creates a new instance of KeyManager.
+
+        :param iterations: The number of PBKDF2 iterations used to derive keys for encryption.
+        """
+        self.iterations: int = iterations
+        self.encryption_salt: bytes = os.urandom(SALT_SIZE)
+        self.key_derivation_seconds: float = 0.0
+        self.__keys: Dict[Tuple[str, bytes, int], bytes] = {}
+        self.__lock = threading.Lock()
+
+    def get_encryption_key(self, secret: str) -> Tuple[bytes, int, bytes]:
+        """
+        Gets the key to encrypt new data with.
+
+        :param secret: The secret provided by the user.
+        :return: The salt, the number of iterations and the key.
+        """
+        return self.encryption_salt, self.iterations, self.get_key(secret, self.encryption_salt, self.iterations)
+
+    def get_key(self, secret: str, salt: bytes, iterations: int) -> bytes:
+        """
+        Gets the key for a secret, salt and number of iterations, deriving it the first time.
+
+        :param secret: The secret provided by the user.
+        :param salt: The salt to derive the key with.
+        :param iterations: The number of PBKDF2 iterations.
+        :return: The key.
+        """
+        with self.__lock:
+            key = self.__keys.get((secret, salt, iterations))
+            if key is None:
+                start_time = time.perf_counter()
+                key = derive_key(secret, salt, iterations)
+                seconds = time.perf_counter() - start_time
+                self.key_derivation_seconds += seconds
+                log = logging.getLogger(KeyManager.__name__)
+                log.info(f'Derived an encryption key with {iterations} iterations in {seconds:.2f} s.')
+                self.__keys[(secret, salt, iterations)] = key
+            return key
+
+    def clear(self) -> None:
+        """
+        Forgets every key derived so far.
+        """
+        with self.__lock:
+            self.__keys.clear()
+
+
+class _ChunkPipeline:
+    """
+    Encrypts or decrypts chunks in order. The first chunk is processed in this process; once a
+    stream turns out to have more than one chunk the rest are processed on a pool of worker
+    processes, with a bounded number of chunks in flight so memory use stays constant.
+    """
+    def __init__(self, workers: int):
+        self.__workers: int = workers
+        self.__executor: Optional[ProcessPoolExecutor] = None
+        self.__pending: Deque[Tuple[Any, Future]] = deque()
+
+    @property
+    def is_full(self) -> bool:
+        return len(self.__pending) >= self.__workers * _PENDING_CHUNKS_PER_WORKER
+
+    @property
+    def is_empty(self) -> bool:
+        return not self.__pending
+
+    def submit(self, tag: Any, function: Callable[..., bytes], *arguments: Any) -> None:
+        if self.__workers > 1 and (self.__executor is not None or self.__pending):
+            if self.__executor is None:
+                self.__executor = ProcessPoolExecutor(max_workers=self.__workers)
+            future = self.__executor.submit(function, *arguments)
+        else:
+            future = Future()
+            try:
+                future.set_result(function(*arguments))
+            except Exception as e:
+                future.set_exception(e)
+        self.__pending.append((tag, future))
+
+    def take(self) -> Tuple[Any, bytes]:
+        tag, future = self.__pending.popleft()
+        try:
+            return tag, future.result()
+        except InvalidTag as e:
+            raise MigrationError(_CORRUPT_DATA_ERROR) from e
+
+    def shutdown(self) -> None:
+        for _, future in self.__pending:
+            future.cancel()
+        self.__pending.clear()
+        if self.__executor is not None:
+            self.__executor.shutdown()
+            self.__executor = None
+
+
+def _encrypt_chunk(key: bytes, nonce: bytes, data: bytes, authenticated_data: bytes) -> bytes:
+    return AESGCM(key).encrypt(nonce, data, authenticated_data)
+
+
+def _decrypt_chunk(key: bytes, nonce: bytes, data: bytes, authenticated_data: bytes) -> bytes:
+    return AESGCM(key).decrypt(nonce, data, authenticated_data)
+
+
+class EncryptingWriter:
+    """
+    A writable file object that encrypts everything written to it into a destination file object.
+    The data is split into chunks that are each encrypted with AES-GCM. Each chunk is authenticated
+    together with the header, its index and whether it is the last chunk, so chunks can not be
+    reordered, dropped or truncated without the decryption failing. Each stream is encrypted with its
+    own key, derived from the key of the secret and a random salt in the header. Because chunks are
+    independent they are encrypted on several processes at once, and written in order.
+    """
+    def __init__(
+            self,
+            destination,
+            secret: str,
+            chunk_size: int = DEFAULT_CHUNK_SIZE,
+            key_manager: Optional[KeyManager] = None,
+            workers: int = DEFAULT_ENCRYPTION_WORKERS):
+        """
+        Creates a new instance of EncryptingWriter and writes the header to the destination.
+
+        :param destination: The file object to write the encrypted data to.
+        :param secret: The secret to derive the key from.
+        :param chunk_size: The number of bytes of data in each encrypted chunk.
+        :param key_manager: Provides the key. A new KeyManager is used when not given.
+        :param workers: The maximum number of processes encrypting chunks at the same time.
+        """
+        salt, iterations, key = (key_manager or KeyManager()).get_encryption_key(secret)
+        stream_salt = os.urandom(STREAM_SALT_SIZE)
+        self.__key: bytes = derive_stream_key(key, stream_salt)
+        self.__header: bytes = _HEADER.pack(
+            ENCRYPTED_STREAM_MAGIC,
+            ENCRYPTED_STREAM_VERSION,
+            salt,
+            iterations,
+            chunk_size,
+            stream_salt)
+        self.__destination = destination
+        self.__chunk_size: int = chunk_size
+        self.__buffer = bytearray()
+        self.__chunk_index: int = 0
+        self.__closed: bool = False
+        self.__pipeline = _ChunkPipeline(workers)
+        destination.write(self.__header)
+
+    def write(self, data: bytes) -> int:
+        """
+        Encrypts data. Data is buffered until a whole chunk is available.
+
+        :param data: The data to encrypt.
+        :return: The number of bytes accepted.
+        """
+        self.__buffer += data
+        # Always keep the last chunk buffered because it is only known to be the last one on close.
+        while len(self.__buffer) > self.__chunk_size:
+            self.__submit_chunk(bytes(self.__buffer[:self.__chunk_size]), False)
+            del self.__buffer[:self.__chunk_size]
+        return len(data)
+
+    def close(self) -> None:
+        """
+        Encrypts the remaining buffered data as the last chunk. Does not close the destination.
+        """
+        if self.__closed:
+            return
+        self.__closed = True
+        try:
+            self.__submit_chunk(bytes(self.__buffer), True)
+            while not self.__pipeline.is_empty:
+                self.__write_next_chunk()
+        finally:
+            self.__buffer = bytearray()
+            self.__pipeline.shutdown()
+
+    def __submit_chunk(self, data: bytes, is_final: bool) -> None:
+        if self.__pipeline.is_full:
+            self.__write_next_chunk()
+        flags = _FINAL_CHUNK_FLAG if is_final else 0
+        nonce = _CHUNK_NONCE.pack(self.__chunk_index)
+        authenticated_data = self.__header + _CHUNK_AUTHENTICATED_DATA.pack(self.__chunk_index, flags)
+        self.__pipeline.submit(flags, _encrypt_chunk, self.__key, nonce, data, authenticated_data)
+        self.__chunk_index += 1
+
+    def __write_next_chunk(self) -> None:
+        flags, encrypted_data = self.__pipeline.take()
+        self.__destination.write(_CHUNK_HEADER.pack(flags, len(encrypted_data)))
+        self.__destination.write(encrypted_data)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exception_type, exception, traceback):
+        if exception_type is None:
+            self.close()
+        else:
+            self.__closed = True
+            self.__pipeline.shutdown()
+
+
+class DecryptingReader:
+    """
+    A readable file object that decrypts the data written by an EncryptingWriter from a source
+    file object. Chunks ahead of the reader are decrypted on several processes at once.
+    """
+    def __init__(
+            self,
+            source,
+            secret: str,
+            key_manager: Optional[KeyManager] = None,
+            workers: int = DEFAULT_ENCRYPTION_WORKERS):
+        """
+        Creates a new instance of DecryptingReader and reads the header from the source.
+
+        :param source: The file object to read the encrypted data from.
+        :param secret: The secret to derive the key from.
+        :param key_manager: Provides the key. A new KeyManager is used when not given.
+        :param workers: The maximum number of processes decrypting chunks at the same time.
+        """
+        self.__source = source
+        self.__header: bytes = self.__read_exactly(_HEADER.size)
+        magic, version, salt, iterations, self.__chunk_size, stream_salt = _HEADER.unpack(self.__header)
+        if magic != ENCRYPTED_STREAM_MAGIC:
+            raise MigrationError('The data is not an encrypted stream.')
+        if version != ENCRYPTED_STREAM_VERSION:
+            raise MigrationError(f'Version {version} of the encrypted stream format is not supported.')
+        key = (key_manager or KeyManager()).get_key(secret, salt, iterations)
+        self.__key: bytes = derive_stream_key(key, stream_salt)
+        self.__buffer: bytes = b''
+        self.__position: int = 0
+        self.__chunk_index: int = 0
+        self.__has_read_final_chunk: bool = False
+        self.__pipeline = _ChunkPipeline(workers)
+
+    def read(self, size: Optional[int] = -1) -> bytes:
+        """
+        Reads decrypted data.
+
+        :param size: The maximum number of bytes to read, or a negative number to read everything.
+        :return: The data, or an empty bytes object once all data has been read.
+        """
+        if size is None or size < 0:
+            parts = [self.__buffer[self.__position:]]
+            self.__buffer, self.__position = b'', 0
+            while self.__read_chunk():
+                parts.append(self.__buffer)
+                self.__buffer = b''
+            return b''.join(parts)
+        while self.__position >= len(self.__buffer):
+            if not self.__read_chunk():
+                return b''
+        data = self.__buffer[self.__position:self.__position + size]
+        self.__position += len(data)
+        return data
+
+    def close(self) -> None:
+        """
+        Stops decrypting chunks ahead of the reader. Does not close the source.
+        """
+        self.__pipeline.shutdown()
+
+    def __read_chunk(self) -> bool:
+        while not self.__has_read_final_chunk and not self.__pipeline.is_full:
+            self.__submit_chunk()
+        if self.__pipeline.is_empty:
+            if self.__source.read(1):
+                raise MigrationError(_CORRUPT_DATA_ERROR)
+            return False
+        _, self.__buffer = self.__pipeline.take()
+        self.__position = 0
+        return True
+
+    def __submit_chunk(self) -> None:
+        flags, encrypted_size = _CHUNK_HEADER.unpack(self.__read_exactly(_CHUNK_HEADER.size))
+        if encrypted_size > self.__chunk_size + _TAG_SIZE:
+            raise MigrationError(_CORRUPT_DATA_ERROR)
+        encrypted_data = self.__read_exactly(encrypted_size)
+        nonce = _CHUNK_NONCE.pack(self.__chunk_index)
+        authenticated_data = self.__header + _CHUNK_AUTHENTICATED_DATA.pack(self.__chunk_index, flags)
+        self.__pipeline.submit(flags, _decrypt_chunk, self.__key, nonce, encrypted_data, authenticated_data)
+        self.__chunk_index += 1
+        self.__has_read_final_chunk = bool(flags & _FINAL_CHUNK_FLAG)
+
+    def __read_exactly(self, size: int) -> bytes:
+        data = self.__source.read(size)
+        while len(data) < size:
+            more = self.__source.read(size - len(data))
+            if not more:
+                raise MigrationError(_TRUNCATED_DATA_ERROR)
+            data += more
+        return data
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exception_type, exception, traceback):
+        self.close()
@@ -0,0 +1,468 @@
+"""Copy directory trees with many files using several threads."""
+
+import ctypes
+import fnmatch
+import hashlib
+import logging
+import os
+import shutil
+import time
+from concurrent.futures import ThreadPoolExecutor, Future, wait, ALL_COMPLETED, FIRST_COMPLETED
+from typing import Dict, List, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None  # type: ignore
+try:
+    import msvcrt
+except ImportError:
+    msvcrt = None  # type: ignore
+
+DEFAULT_COPY_WORKERS: int = min(32, (os.cpu_count() or 1) * 4)
+DEFAULT_LARGE_FILE_THRESHOLD: int = 16 * 1024 * 1024
+COPY_CHUNK_SIZE: int = 8 * 1024 * 1024
+_PENDING_COPIES_PER_WORKER: int = 4
+
+LINK_MODE_COPY: str = 'copy'
+LINK_MODE_REFLINK: str = 'reflink'
+LINK_MODE_HARDLINK: str = 'hardlink'
+LINK_MODES: List[str] = [LINK_MODE_COPY, LINK_MODE_REFLINK, LINK_MODE_HARDLINK]
+_FICLONE: int = 0x40049409
+_FSCTL_DUPLICATE_EXTENTS_TO_FILE: int = 0x98344
+_FSCTL_SET_SPARSE: int = 0x900C4
+_FILE_ATTRIBUTE_SPARSE_FILE: int = 0x200
+# Each FSCTL_DUPLICATE_EXTENTS_TO_FILE call must clone less than 4 GiB.
+_MAX_CLONE_RANGE_SIZE: int = 1024 * 1024 * 1024
+_MAX_VOLUME_PATH_LENGTH: int = 32768
+
+
+class _DuplicateExtentsData(ctypes.Structure):
+    """
+    The DUPLICATE_EXTENTS_DATA input of FSCTL_DUPLICATE_EXTENTS_TO_FILE.
+    """
+    _fields_ = [
+        ('FileHandle', ctypes.c_void_p),
+        ('SourceFileOffset', ctypes.c_longlong),
+        ('TargetFileOffset', ctypes.c_longlong),
+        ('ByteCount', ctypes.c_longlong),
+    ]
+
+
+def _get_clone_ranges(size: int, cluster_size: int) -> List[Tuple[int, int]]:
+    """
+    Splits a file into the ranges to clone with FSCTL_DUPLICATE_EXTENTS_TO_FILE, which must start and
+    end on cluster boundaries and be smaller than 4 GiB. The last range is rounded up to a whole
+    cluster, which is allowed because it ends at the end of the file.
+
+    :param size: The size of the file.
+    :param cluster_size: The cluster size of the volume the file is on.
+    :return: The offset and size of each range.
+    """
+    aligned_size = -(-size // cluster_size) * cluster_size
+    range_size = max(cluster_size, _MAX_CLONE_RANGE_SIZE - _MAX_CLONE_RANGE_SIZE % cluster_size)
+    return [(offset, min(range_size, aligned_size - offset)) for offset in range(0, aligned_size, range_size)]
+
+
+class CopySummary:
+    """
+    The amount of data copied by a directory copy and how long it took.
+    """
+    def __init__(
+            self,
+            files: int = 0,
+            bytes_copied: int = 0,
+            seconds: float = 0.0,
+            files_linked: int = 0,
+            hashes: Optional[List[Optional[str]]] = None):
+        """
+        Creates a new instance of CopySummary.
+
+        :param files: The number of files copied.
+        :param bytes_copied: The total size of the copied files.
+        :param seconds: The time the copy took.
+        :param files_linked: The number of the copied files that share their storage with the
+                             source file, because they were created as hard links or clones.
+        :param hashes: The content hash of each copied file, in the order the files were given,
+                       if the copy computed hashes.
+        """
+        self.files: int = files
+        self.bytes_copied: int = bytes_copied
+        self.seconds: float = seconds
+        self.files_linked: int = files_linked
+        self.hashes: List[Optional[str]] = hashes or []
+
+    @property
+    def files_per_second(self) -> float:
+        return self.files / self.seconds if self.seconds else 0.0
+
+    @property
+    def bytes_per_second(self) -> float:
+        return self.bytes_copied / self.seconds if self.seconds else 0.0
+
+    def __str__(self):
+        megabytes_per_second = self.bytes_per_second / (1024 * 1024)
+        linked = f', {self.files_linked} linked' if self.files_linked else ''
+        return \
+            f'{self.files} files{linked}, {self.bytes_copied} bytes in {self.seconds:.1f} s ' \
+            f'({self.files_per_second:.0f} files/s, {megabytes_per_second:.1f} MB/s)'
+
+
+class FileCopyEngine:
+    """
+    Copies directory trees by creating the directories up front and copying the files on a
+    bounded pool of worker threads, so the copy is not limited by the latency of each file.
+    """
+    def __init__(
+            self,
+            workers: int = DEFAULT_COPY_WORKERS,
+            large_file_threshold: int = DEFAULT_LARGE_FILE_THRESHOLD,
+            link_mode: str = LINK_MODE_COPY,
+            hash_algorithm: Optional[str] = None,
+            hardlink_patterns: Optional[List[str]] = None):
+        """
+        Creates a new instance of FileCopyEngine.
+
+        :param workers: The maximum number of files to copy at the same time.
+        :param large_file_threshold: Files of at least this size are copied with the operating
+                                     system's in-kernel copy when it is available, or in chunks.
+        :param link_mode: How to create files on the same volume as their source. LINK_MODE_REFLINK
+                          clones files where the file system supports copy-on-write clones, and
+                          LINK_MODE_HARDLINK creates hard links, falling back to clones. Hard links
+                          share all changes with the source, so they are only suitable for files
+                          that are never modified in place. Files are copied where neither works.
+        :param hash_algorithm: The hashlib algorithm to hash the contents of each file with while it
+                               is copied, or None to not compute hashes.
+        :param hardlink_patterns: With LINK_MODE_HARDLINK, the name patterns of the files that may be
+                                  hard linked, or None to hard link every file. Other files are cloned.
+        """
+        self.workers: int = max(1, workers)
+        self.large_file_threshold: int = large_file_threshold
+        self.link_mode: str = link_mode
+        self.hash_algorithm: Optional[str] = hash_algorithm
+        self.hardlink_patterns: Optional[List[str]] = hardlink_patterns
+        self.__clone_failure_logged: bool = False
+
+    def copy_directory(self, from_directory: str, to_directory: str) -> CopySummary:
+        """
+        Copies the contents of a directory into a directory that does not exist yet. Symbolic links
+        are followed, and file metadata is copied along with the contents.
+
+        :param from_directory: The directory whose contents to copy.
+        :param to_directory: The directory to create with the copied contents.
+        :return: A summary of the copy.
+        """
+        start_time = time.perf_counter()
+        files = self.__create_directory_tree(from_directory, to_directory)
+        link_mode = self.__get_link_mode(from_directory, os.path.dirname(os.path.abspath(to_directory)), {})
+        files_linked, hashes = self.__copy_files(files, [link_mode] * len(files))
+        shutil.copystat(from_directory, to_directory)
+        summary = CopySummary(
+            len(files),
+            sum(size for _, _, size in files),
+            time.perf_counter() - start_time,
+            files_linked,
+            hashes)
+        log = logging.getLogger(FileCopyEngine.__name__)
+        log.info(f'Copied {from_directory} to {to_directory}: {summary}')
+        return summary
+
+    def copy_files(self, files: List[Tuple[str, str, int]]) -> CopySummary:
+        """
+        Copies individual files into directories that already exist, replacing any existing files.
+        Existing files are removed rather than overwritten when they may share their storage with
+        another file, so replacing a hard link never changes the file it is linked to. The files
+        may be on different devices, so the link mode is decided for each file.
+
+        :param files: The source path, destination path and size of each file to copy.
+        :return: A summary of the copy.
+        """
+        start_time = time.perf_counter()
+        devices: Dict[str, int] = {}
+        link_modes = [
+            self.__get_link_mode(os.path.dirname(source), os.path.dirname(destination), devices)
+            for source, destination, _ in files
+        ]
+        files_linked, hashes = self.__copy_files(files, link_modes, replace=True)
+        return CopySummary(
+            len(files),
+            sum(size for _, _, size in files),
+            time.perf_counter() - start_time,
+            files_linked,
+            hashes)
+
+    def __copy_files(
+            self,
+            files: List[Tuple[str, str, int]],
+            link_modes: List[str],
+            replace: bool = False) -> Tuple[int, List[Optional[str]]]:
+        pending: Dict[Future, int] = {}
+        errors: List[BaseException] = []
+        results: List[Tuple[bool, Optional[str]]] = [(False, None)] * len(files)
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            for index, ((source, destination, size), link_mode) in enumerate(zip(files, link_modes)):
+                if errors:
+                    break
+                if len(pending) >= self.workers * _PENDING_COPIES_PER_WORKER:
+                    pending = self.__wait_for_copies(pending, errors, results, FIRST_COMPLETED)
+                future = executor.submit(self.__copy_file, source, destination, size, link_mode, replace)
+                pending[future] = index
+            self.__wait_for_copies(pending, errors, results)
+        if errors:
+            raise errors[0]
+        return sum(linked for linked, _ in results), [content_hash for _, content_hash in results]
+
+    def __get_link_mode(self, source_directory: str, destination_directory: str, devices: Dict[str, int]) -> str:
+        """
+        Gets the link mode to use for copies between two directories, which is LINK_MODE_COPY unless
+        both are on the same device, since links and clones can not cross devices. The device of
+        each directory is looked up once and remembered in devices.
+        """
+        if self.link_mode == LINK_MODE_COPY:
+            return LINK_MODE_COPY
+        if self.__get_device(source_directory, devices) != self.__get_device(destination_directory, devices):
+            log = logging.getLogger(FileCopyEngine.__name__)
+            log.debug(f'{source_directory} and {destination_directory} are on different devices, so files are copied.')
+            return LINK_MODE_COPY
+        return self.link_mode
+
+    @staticmethod
+    def __get_device(directory: str, devices: Dict[str, int]) -> int:
+        device = devices.get(directory)
+        if device is None:
+            existing_directory = os.path.abspath(directory)
+            while not os.path.exists(existing_directory):
+                existing_directory = os.path.dirname(existing_directory)
+            device = os.stat(existing_directory).st_dev
+            devices[directory] = device
+        return device
+
+    @staticmethod
+    def __create_directory_tree(from_directory: str, to_directory: str) -> List[Tuple[str, str, int]]:
+        files: List[Tuple[str, str, int]] = []
+        os.makedirs(to_directory)
+        directories = [(from_directory, to_directory)]
+        while directories:
+            source_directory, destination_directory = directories.pop()
+            with os.scandir(source_directory) as entries:
+                for entry in entries:
+                    destination = os.path.join(destination_directory, entry.name)
+                    if entry.is_dir():
+                        os.mkdir(destination)
+                        directories.append((entry.path, destination))
+                    else:
+                        files.append((entry.path, destination, entry.stat().st_size))
+        return files
+
+    @staticmethod
+    def __wait_for_copies(
+            pending: Dict[Future, int],
+            errors: List[BaseException],
+            results: List[Tuple[bool, Optional[str]]],
+            return_when: str = ALL_COMPLETED) -> Dict[Future, int]:
+        done, _ = wait(pending, return_when=return_when)
+        for future in done:
+            error = future.exception()
+            if error is not None:
+                errors.append(error)
+            else:
+                results[pending[future]] = future.result()
+        return {future: index for future, index in pending.items() if future not in done}
+
+    def __copy_file(
+            self,
+            source: str,
+            destination: str,
+            size: int,
+            link_mode: str,
+            replace: bool) -> Tuple[bool, Optional[str]]:
+        """
+        Copies a single file.
+
+        :return: Whether the copy shares its storage with the source file, and the content hash
+                 of the file if the engine computes hashes.
+        """
+        if replace and os.path.lexists(destination) \
+                and (link_mode != LINK_MODE_COPY or os.lstat(destination).st_nlink > 1):
+            os.remove(destination)
+        if link_mode == LINK_MODE_HARDLINK and not self.__may_hardlink(source):
+            link_mode = LINK_MODE_REFLINK
+        if link_mode == LINK_MODE_HARDLINK and self.__link_file(source, destination):
+            return True, self.__hash_file(source)
+        if link_mode != LINK_MODE_COPY:
+            if self.__clone_file(source, destination):
+                return True, self.__hash_file(source)
+            self.__log_clone_failure(destination)
+        if self.hash_algorithm is not None:
+            return False, self.__copy_and_hash_file(source, destination, size, self.hash_algorithm)
+        if size < self.large_file_threshold:
+            shutil.copy2(source, destination)
+            return False, None
+        with open(source, 'rb') as source_file, open(destination, 'wb') as destination_file:
+            if not self.__copy_file_in_kernel(source_file.fileno(), destination_file.fileno(), size):
+                shutil.copyfileobj(source_file, destination_file, COPY_CHUNK_SIZE)
+        shutil.copystat(source, destination)
+        return False, None
+
+    @staticmethod
+    def __copy_and_hash_file(source: str, destination: str, size: int, hash_algorithm: str) -> str:
+        """
+        Copies a file through a buffer and hashes each chunk on the way, so the file is only read once.
+        """
+        file_hash = hashlib.new(hash_algorithm)
+        buffer = bytearray(max(1, min(size, COPY_CHUNK_SIZE)))
+        view = memoryview(buffer)
+        with open(source, 'rb', buffering=0) as source_file, open(destination, 'wb', buffering=0) as destination_file:
+            while True:
+                count = source_file.readinto(buffer)
+                if not count:
+                    break
+                file_hash.update(view[:count])
+                written = 0
+                while written < count:
+                    written += destination_file.write(view[written:count])
+        shutil.copystat(source, destination)
+        return file_hash.hexdigest()
+
+    def __hash_file(self, path: str) -> Optional[str]:
+        if self.hash_algorithm is None:
+            return None
+        file_hash = hashlib.new(self.hash_algorithm)
+        with open(path, 'rb') as file:
+            for chunk in iter(lambda: file.read(COPY_CHUNK_SIZE), b''):
+                file_hash.update(chunk)
+        return file_hash.hexdigest()
+
+    def __log_clone_failure(self, destination: str) -> None:
+        if self.__clone_failure_logged:
+            return
+        self.__clone_failure_logged = True
+        log = logging.getLogger(FileCopyEngine.__name__)
+        log.warning(f'The file system of {destination} does not support copy-on-write clones, so files '
+                    f'that are not hard linked are copied. Clones are supported by ReFS on Windows and by '
+                    f'Btrfs and XFS on Linux, but not by NTFS.')
+
+    def __may_hardlink(self, path: str) -> bool:
+        if self.hardlink_patterns is None:
+            return True
+        name = os.path.basename(path)
+        return any(fnmatch.fnmatch(name, pattern) for pattern in self.hardlink_patterns)
+
+    @staticmethod
+    def __link_file(source: str, destination: str) -> bool:
+        try:
+            os.link(source, destination)
+            return True
+        except OSError:
+            return False
+
+    @staticmethod
+    def __clone_file(source: str, destination: str) -> bool:
+        """
+        Creates a copy-on-write clone of a file, which shares its storage with the source until
+        either file is changed. Only supported by some file systems, such as ReFS on Windows and
+        Btrfs and XFS on Linux.
+
+        :return: True if the file was cloned, False if the file system does not support it.
+        """
+        if msvcrt is not None:
+            return _clone_file_on_windows(source, destination)
+        if fcntl is None:
+            return False
+        with open(source, 'rb') as source_file, open(destination, 'wb') as destination_file:
+            try:
+                fcntl.ioctl(destination_file.fileno(), _FICLONE, source_file.fileno())
+            except OSError:
+                return False
+        shutil.copystat(source, destination)
+        return True
+
+    @staticmethod
+    def __copy_file_in_kernel(source_descriptor: int, destination_descriptor: int, size: int) -> bool:
+        """
+        Copies a file without moving its contents through user space, when the operating system
+        supports it. copy_file_range lets the file system share or clone blocks where it can.
+
+        :return: True if the file was copied, False if the operating system does not support it.
+        """
+        copied = 0
+        try:
+            if hasattr(os, 'copy_file_range'):
+                while copied < size:
+                    count = os.copy_file_range(source_descriptor, destination_descriptor, size - copied)
+                    if count == 0:
+                        break
+                    copied += count
+                return True
+        except OSError:
+            if copied:
+                raise
+        try:
+            if hasattr(os, 'sendfile'):
+                while copied < size:
+                    count = os.sendfile(destination_descriptor, source_descriptor, copied, size - copied)
+                    if count == 0:
+                        break
+                    copied += count
+                return True
+        except OSError:
+            if copied:
+                raise
+        return False
+
+
+def _clone_file_on_windows(source: str, destination: str) -> bool:
+    """
+    Clones a file with FSCTL_DUPLICATE_EXTENTS_TO_FILE, which ReFS supports for files on the same
+    volume. The destination is given the size of the source before its clusters are cloned.
+
+    :return: True if the file was cloned, False if the volume does not support it.
+    """
+    kernel32 = ctypes.WinDLL('kernel32', use_last_error=True)  # type: ignore
+    volume = _get_volume_path(kernel32, os.path.dirname(os.path.abspath(destination)))
+    if volume is None or volume != _get_volume_path(kernel32, source):
+        return False
+    sectors_per_cluster = ctypes.c_ulong()
+    bytes_per_sector = ctypes.c_ulong()
+    free_clusters = ctypes.c_ulong()
+    total_clusters = ctypes.c_ulong()
+    if not kernel32.GetDiskFreeSpaceW(
+            ctypes.c_wchar_p(volume),
+            ctypes.byref(sectors_per_cluster),
+            ctypes.byref(bytes_per_sector),
+            ctypes.byref(free_clusters),
+            ctypes.byref(total_clusters)):
+        return False
+    cluster_size = sectors_per_cluster.value * bytes_per_sector.value
+    source_status = os.stat(source)
+    returned = ctypes.c_ulong()
+    with open(source, 'rb') as source_file, open(destination, 'wb') as destination_file:
+        source_handle = ctypes.c_void_p(msvcrt.get_osfhandle(source_file.fileno()))  # type: ignore
+        destination_handle = ctypes.c_void_p(msvcrt.get_osfhandle(destination_file.fileno()))  # type: ignore
+        if getattr(source_status, 'st_file_attributes', 0) & _FILE_ATTRIBUTE_SPARSE_FILE:
+            # Cloning a sparse file into a file that is not sparse would allocate its holes.
+            if not kernel32.DeviceIoControl(
+                    destination_handle, _FSCTL_SET_SPARSE, None, 0, None, 0, ctypes.byref(returned), None):
+                return False
+        destination_file.truncate(source_status.st_size)
+        for offset, size in _get_clone_ranges(source_status.st_size, cluster_size):
+            data = _DuplicateExtentsData(source_handle, offset, offset, size)
+            if not kernel32.DeviceIoControl(
+                    destination_handle,
+                    _FSCTL_DUPLICATE_EXTENTS_TO_FILE,
+                    ctypes.byref(data),
+                    ctypes.sizeof(data),
+                    None,
+                    0,
+                    ctypes.byref(returned),
+                    None):
+                return False
+    shutil.copystat(source, destination)
+    return True
+
+
+def _get_volume_path(kernel32, path: str) -> Optional[str]:
+    buffer = ctypes.create_unicode_buffer(_MAX_VOLUME_PATH_LENGTH)
+    if not kernel32.GetVolumePathNameW(ctypes.c_wchar_p(os.path.abspath(path)), buffer, _MAX_VOLUME_PATH_LENGTH):
+        return None
+    return os.path.normcase(buffer.value)
@@ -0,0 +1,100 @@
+"""Delete directory trees with many files using several threads."""
+
+import logging
+import os
+import stat
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Tuple
+
+from nislmigrate.facades.file_copy_engine import DEFAULT_COPY_WORKERS
+
+_FILES_PER_TASK: int = 64
+
+
+class FileDeletionEngine:
+    """
+    Deletes directory trees by listing the whole tree up front, unlinking the files on a bounded
+    pool of worker threads and then removing the emptied directories from the bottom up, so the
+    deletion is not limited by the latency of each file.
+    """
+    def __init__(self, workers: int = DEFAULT_COPY_WORKERS):
+        """
+        Creates a new instance of FileDeletionEngine.
+
+        :param workers: The maximum number of files to delete at the same time.
+        """
+        self.workers: int = max(1, workers)
+
+    def remove_directory(self, directory: str) -> int:
+        """
+        Deletes a directory and everything in it. Read-only files and directories are made
+        writable first. Symbolic links are removed without following them.
+
+        :param directory: The directory to delete.
+        :return: The number of files deleted.
+        """
+        if os.path.islink(directory):
+            raise OSError(f'Can not remove the symbolic link {directory} as a directory.')
+        start_time = time.perf_counter()
+        files, directories = self.__scan_directory_tree(directory)
+        # Files are handed to the workers in batches, since deleting a single file takes less time
+        # than handing it to another thread.
+        batches = [files[index:index + _FILES_PER_TASK] for index in range(0, len(files), _FILES_PER_TASK)]
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            # Consuming the results raises the first error any of the deletions hit.
+            for _ in executor.map(self.__remove_files, batches):
+                pass
+        for path in reversed(directories):
+            os.rmdir(path)
+        log = logging.getLogger(FileDeletionEngine.__name__)
+        log.info(f'Removed {directory}: {len(files)} files, {len(directories)} directories '
+                 f'in {time.perf_counter() - start_time:.1f} s')
+        return len(files)
+
+    @staticmethod
+    def __scan_directory_tree(directory: str) -> Tuple[List[Tuple[str, bool]], List[str]]:
+        """
+        Lists the files of a directory tree, with whether each one is read-only, and its
+        directories with every directory before the directories inside it. Read-only directories
+        are made writable while they are listed, since their entries can not be deleted otherwise.
+        """
+        files: List[Tuple[str, bool]] = []
+        directories: List[str] = [directory]
+        FileDeletionEngine.__make_writable_if_readonly(directory, os.stat(directory).st_mode)
+        index = 0
+        while index < len(directories):
+            with os.scandir(directories[index]) as entries:
+                for entry in entries:
+                    entry_stat = entry.stat(follow_symlinks=False)
+                    # Junctions are not symbolic links but must not be followed either.
+                    is_link = getattr(entry_stat, 'st_file_attributes', 0) & stat.FILE_ATTRIBUTE_REPARSE_POINT
+                    if entry.is_dir(follow_symlinks=False) and not is_link:
+                        FileDeletionEngine.__make_writable_if_readonly(entry.path, entry_stat.st_mode)
+                        directories.append(entry.path)
+                    else:
+                        files.append((entry.path, not entry_stat.st_mode & stat.S_IWRITE))
+            index += 1
+        return files, directories
+
+    @staticmethod
+    def __make_writable_if_readonly(path: str, mode: int):
+        if not mode & stat.S_IWRITE:
+            os.chmod(path, stat.S_IMODE(mode) | stat.S_IWRITE)
+
+    @staticmethod
+    def __remove_files(files: List[Tuple[str, bool]]):
+        for path, readonly in files:
+            FileDeletionEngine.__remove_file(path, readonly)
+
+    @staticmethod
+    def __remove_file(path: str, readonly: bool):
+        if readonly and not os.path.islink(path):
+            os.chmod(path, stat.S_IWRITE)
+        try:
+            os.unlink(path)
+        except (IsADirectoryError, PermissionError):
+            # Links to directories on Windows, such as junctions, can only be removed as directories.
+            if not os.path.isdir(path):
+                raise
+            os.rmdir(path)
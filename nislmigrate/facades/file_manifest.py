@@ -0,0 +1,183 @@
+"""Record the files of a directory tree so later copies only need to handle what changed."""
+
+import hashlib
+import json
+import os
+from typing import Any, Dict, List, Optional, Set
+
+from nislmigrate.logs.migration_error import MigrationError
+
+MANIFEST_VERSION: int = 1
+MANIFEST_FILE_SUFFIX: str = '.manifest.json'
+HASH_CHUNK_SIZE: int = 1024 * 1024
+_INVALID_MANIFEST_ERROR_FORMAT = 'The manifest {path} is corrupt or was written by a newer version of this tool.'
+
+
+class FileManifestEntry:
+    """
+    The size, modification time and optionally the content hash of a file.
+    """
+    def __init__(self, size: int, modified_time: int, content_hash: Optional[str] = None):
+        """
+        Creates a new instance of FileManifestEntry.
+
+        :param size: The size of the file in bytes.
+        :param modified_time: The modification time of the file in nanoseconds.
+        :param content_hash: The hex digest of the file contents, or None if it was not computed.
+        """
+        self.size: int = size
+        self.modified_time: int = modified_time
+        self.content_hash: Optional[str] = content_hash
+
+    def has_same_stat(self, other: 'FileManifestEntry') -> bool:
+        return self.size == other.size and self.modified_time == other.modified_time
+
+
+class FileManifest:
+    """
+    The files and directories of a directory tree, by path relative to the root of the tree.
+    Paths always use forward slashes so a manifest does not depend on the operating system.
+    The manifest of a capture kept in an object store records the path of the store, relative
+    to the manifest, in object_store.
+    """
+    def __init__(self, hash_algorithm: Optional[str] = None):
+        """
+        Creates a new, empty instance of FileManifest.
+
+        :param hash_algorithm: The hashlib algorithm used for the content hashes, or None if the
+                               manifest does not record content hashes.
+        """
+        self.hash_algorithm: Optional[str] = hash_algorithm
+        self.object_store: Optional[str] = None
+        self.files: Dict[str, FileManifestEntry] = {}
+        self.directories: Set[str] = set()
+
+    @staticmethod
+    def get_manifest_path(directory: str) -> str:
+        """
+        Gets the path of the manifest describing a directory. The manifest is stored next to the
+        directory rather than inside it, so it is never copied along with the files.
+
+        :param directory: The directory the manifest describes.
+        :return: The path of the manifest.
+        """
+        return os.path.normpath(directory) + MANIFEST_FILE_SUFFIX
+
+    @staticmethod
+    def scan(directory: str, hash_algorithm: Optional[str] = None) -> 'FileManifest':
+        """
+        Records the size and modification time of every file in a directory tree. Content hashes
+        are not computed; use compute_hash for the files that need one.
+
+        :param directory: The root of the directory tree.
+        :param hash_algorithm: The hashlib algorithm the manifest will use for content hashes.
+        :return: The manifest of the directory tree.
+        """
+        manifest = FileManifest(hash_algorithm)
+        directories = [(directory, '')]
+        while directories:
+            current_directory, relative_directory = directories.pop()
+            with os.scandir(current_directory) as entries:
+                for entry in entries:
+                    relative_path = relative_directory + entry.name
+                    if entry.is_dir():
+                        manifest.directories.add(relative_path)
+                        directories.append((entry.path, relative_path + '/'))
+                    else:
+                        file_stat = entry.stat()
+                        manifest.files[relative_path] = FileManifestEntry(file_stat.st_size, file_stat.st_mtime_ns)
+        return manifest
+
+    @staticmethod
+    def load(path: str) -> Optional['FileManifest']:
+        """
+        Reads a manifest written by save.
+
+        :param path: The path of the manifest.
+        :return: The manifest, or None if there is no manifest at the path.
+        """
+        if not os.path.isfile(path):
+            return None
+        try:
+            with open(path, encoding='utf-8') as manifest_file:
+                content: Dict[str, Any] = json.load(manifest_file)
+            if content.get('version') != MANIFEST_VERSION:
+                raise ValueError(content.get('version'))
+            manifest = FileManifest(content.get('hash_algorithm'))
+            manifest.object_store = content.get('object_store')
+            manifest.directories = set(content['directories'])
+            for relative_path, (size, modified_time, content_hash) in content['files'].items():
+                manifest.files[relative_path] = FileManifestEntry(size, modified_time, content_hash)
+            return manifest
+        except (ValueError, KeyError, TypeError) as e:
+            raise MigrationError(_INVALID_MANIFEST_ERROR_FORMAT.format(path=path)) from e
+
+    def save(self, path: str) -> None:
+        """
+        Writes the manifest. The previous manifest at the path is only replaced once the new one
+        has been written completely.
+
+        :param path: The path of the manifest.
+        """
+        content = {
+            'version': MANIFEST_VERSION,
+            'hash_algorithm': self.hash_algorithm,
+            'object_store': self.object_store,
+            'directories': sorted(self.directories),
+            'files': {
+                relative_path: [entry.size, entry.modified_time, entry.content_hash]
+                for relative_path, entry in self.files.items()
+            },
+        }
+        temporary_path = path + '.tmp'
+        with open(temporary_path, 'w', encoding='utf-8') as manifest_file:
+            json.dump(content, manifest_file)
+        os.replace(temporary_path, path)
+
+    def compute_hash(self, path: str) -> Optional[str]:
+        """
+        Computes the content hash of a file with the algorithm of the manifest.
+
+        :param path: The file to hash.
+        :return: The hex digest of the file contents, or None if the manifest does not use hashes.
+        """
+        if self.hash_algorithm is None:
+            return None
+        file_hash = hashlib.new(self.hash_algorithm)
+        with open(path, 'rb') as file:
+            for chunk in iter(lambda: file.read(HASH_CHUNK_SIZE), b''):
+                file_hash.update(chunk)
+        return file_hash.hexdigest()
+
+    def get_removed_files(self, previous: 'FileManifest') -> List[str]:
+        """
+        Finds the files of an earlier manifest of the same tree that no longer exist.
+
+        :param previous: The earlier manifest.
+        :return: The relative paths of the removed files.
+        """
+        return [relative_path for relative_path in previous.files if relative_path not in self.files]
+
+    def get_removed_directories(self, previous: 'FileManifest') -> List[str]:
+        """
+        Finds the directories of an earlier manifest of the same tree that no longer exist.
+        Directories inside another removed directory are left out.
+
+        :param previous: The earlier manifest.
+        :return: The relative paths of the removed directories.
+        """
+        removed = previous.directories - self.directories
+        return sorted(
+            relative_path for relative_path in removed
+            if relative_path.rpartition('/')[0] not in removed)
+
+    @staticmethod
+    def to_native_path(root: str, relative_path: str) -> str:
+        """
+        Converts a path from a manifest into a path on the file system.
+
+        :param root: The root of the directory tree the manifest describes.
+        :param relative_path: The path from the manifest.
+        :return: The path on the file system.
+        """
+        return os.path.join(root, *relative_path.split('/'))
@@ -1,24 +1,79 @@
 """Handle file and directory operations."""
 
 import json
+import logging
 import os
 import shutil
 import stat
 import base64
-
+import io
+import random
+import tarfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional, Tuple
+
+from nislmigrate.facades.block_archive import (
+    BlockArchiveReader,
+    BlockArchiveWriter,
+    DEFAULT_COMPRESSION_WORKERS,
+    get_archive_path,
+)
+from nislmigrate.facades.encrypted_stream import (
+    DecryptingReader,
+    EncryptingWriter,
+    DEFAULT_ENCRYPTION_WORKERS,
+    DEFAULT_KEY_DERIVATION_ITERATIONS,
+    ENCRYPTED_STREAM_MAGIC,
+    KeyManager,
+    is_encrypted_stream,
+    validate_secret,
+)
+from nislmigrate.facades.file_copy_engine import (
+    CopySummary,
+    FileCopyEngine,
+    DEFAULT_COPY_WORKERS,
+    LINK_MODE_COPY,
+    LINK_MODE_HARDLINK,
+    LINK_MODE_REFLINK,
+)
+from nislmigrate.facades.file_deletion_engine import FileDeletionEngine
+from nislmigrate.facades.file_manifest import FileManifest, FileManifestEntry
+from nislmigrate.facades.object_store import ObjectStore, DEFAULT_OBJECT_HASH_ALGORITHM
 from nislmigrate.logs.migration_error import MigrationError
 from nislmigrate.migration_action import MigrationAction
-from cryptography.fernet import Fernet
-from cryptography.hazmat.primitives import hashes
-from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
+from cryptography.fernet import Fernet, InvalidToken
 
-COMPRESSION_FORMAT = 'tar'
+TAR_FORMAT = tarfile.PAX_FORMAT
+LEGACY_ENCRYPTION_SALT = b'0' * 16
+VERIFY_MODE_NONE = 'none'
+VERIFY_MODE_SAMPLE = 'sample'
+VERIFY_MODE_FULL = 'full'
+VERIFY_MODES = [VERIFY_MODE_NONE, VERIFY_MODE_SAMPLE, VERIFY_MODE_FULL]
+VERIFY_SAMPLE_SIZE = 64
+_REPORTED_CORRUPT_FILES = 10
+_CORRUPT_CAPTURE_ERROR_FORMAT = ('{count} captured files in {directory} do not match the content hashes recorded when '
+                                 'they were captured: {files}')
 
 
 class FileSystemFacade:
     """
     Handles operations that act on the real file system.
     """
+    copy_workers: int = DEFAULT_COPY_WORKERS
+    encryption_workers: int = DEFAULT_ENCRYPTION_WORKERS
+    compression_workers: int = DEFAULT_COMPRESSION_WORKERS
+    archive_capture: bool = False
+    incremental_capture: bool = False
+    sync_restore: bool = False
+    content_hash_algorithm: Optional[str] = None
+    object_store_directory: Optional[str] = None
+    link_mode: str = LINK_MODE_COPY
+    verify_mode: str = VERIFY_MODE_NONE
+
+    def __init__(self):
+        self.key_manager: KeyManager = KeyManager()
+
     def determine_migration_directory_for_service(self,
                                                   migration_directory_root: str,
                                                   service_name: str) -> str:
@@ -63,13 +118,13 @@ class FileSystemFacade:
 
     def remove_directory(self, directory: str):
         """
-        Deletes the given directory and its children.
+        Deletes the given directory and its children. Files are deleted on several threads.
 
         :param dir_: The directory to remove.
         :return: None.
         """
         if os.path.isdir(directory):
-            shutil.rmtree(directory, onerror=self.__on_error_remove_readonly_and_retry)
+            FileDeletionEngine(self.copy_workers).remove_directory(directory)
 
     def migrate_singlefile(self,
                            migration_directory_root: str,
@@ -147,13 +202,22 @@ class FileSystemFacade:
         file_path = os.path.join(from_directory, file_name)
         shutil.copy(file_path, to_directory)
 
-    def copy_directory(self, from_directory: str, to_directory: str, force: bool):
+    def copy_directory(
+            self,
+            from_directory: str,
+            to_directory: str,
+            force: bool,
+            link_mode: str = LINK_MODE_COPY,
+            hardlink_patterns: Optional[List[str]] = None):
         """
         Copy an entire directory from one location to another.
 
         :param from_directory: The directory whose contents to copy.
         :param to_directory: The directory to put the copied contents.
         :param force: Whether to delete existing content in to_directory before copying.
+        :param link_mode: How to create files when both directories are on the same volume.
+                          See FileCopyEngine for the supported modes.
+        :param hardlink_patterns: The name patterns of the files that may be hard linked, or None for every file.
         """
         if os.path.exists(to_directory) and os.listdir(to_directory) and not force:
             error = "The tool can not copy to the non empty directory: '%s'" % to_directory
@@ -162,29 +226,412 @@ class FileSystemFacade:
             raise MigrationError("No data found at: '%s'" % from_directory)
 
         self.remove_directory(to_directory)
-        shutil.copytree(from_directory, to_directory)
+        engine = FileCopyEngine(self.copy_workers, link_mode=link_mode, hardlink_patterns=hardlink_patterns)
+        engine.copy_directory(from_directory, to_directory)
+
+    def capture_directory(self, from_directory: str, to_directory: str, immutable_files: Optional[List[str]] = None):
+        """
+        Copy an entire directory into a migration directory. When incremental capture is enabled
+        and the migration directory holds an earlier capture of the same directory, only the files
+        that were added or changed since are copied and the files that were removed are deleted.
+        When incremental capture or a content hash algorithm is enabled, a manifest of the captured
+        files, with their content hashes if enabled, is written next to the captured directory.
+        When an object store is configured, the file contents are added to the store instead and
+        only a manifest of the directory is written to the migration directory. When archive capture
+        is enabled, the directory is packed into a single block compressed archive instead.
+
+        When the link mode allows it and both directories are on the same volume, captured files
+        are cloned instead of copied, or hard linked if the files are immutable.
+
+        :param from_directory: The directory whose contents to capture.
+        :param to_directory: The directory in the migration directory to put the captured contents.
+        :param immutable_files: The name patterns of the files in the directory that are only ever
+                                added or deleted and never modified in place, so hard links to them
+                                stay valid captures.
+        """
+        link_mode = self.link_mode
+        if link_mode == LINK_MODE_HARDLINK and not immutable_files:
+            link_mode = LINK_MODE_REFLINK
+        if self.object_store_directory is not None:
+            self.__capture_directory_to_object_store(from_directory, to_directory, self.object_store_directory)
+            return
+        if self.archive_capture:
+            self.__capture_directory_to_archive(from_directory, to_directory)
+            return
+        if not self.incremental_capture and self.content_hash_algorithm is None:
+            self.copy_directory(from_directory, to_directory, False, link_mode, immutable_files)
+            return
+        if not os.path.exists(from_directory):
+            raise MigrationError("No data found at: '%s'" % from_directory)
+
+        manifest_path = FileManifest.get_manifest_path(to_directory)
+        previous = FileManifest.load(manifest_path) if self.incremental_capture else None
+        if previous is None or previous.object_store is not None:
+            self.__verify_directory_is_empty(to_directory)
+            previous = FileManifest(self.content_hash_algorithm)
+        elif not os.path.isdir(to_directory):
+            previous = FileManifest(previous.hash_algorithm)
+        current = FileManifest.scan(from_directory, self.content_hash_algorithm)
+        self.__synchronize_directory(
+            from_directory,
+            to_directory,
+            previous,
+            current,
+            link_mode=link_mode,
+            hardlink_patterns=immutable_files,
+            record_hashes=True)
+        current.save(manifest_path)
+
+    def capture_directory_if_exists(
+            self,
+            from_directory: str,
+            to_directory: str,
+            immutable_files: Optional[List[str]] = None) -> bool:
+        """
+        Calls capture_directory only if the source directory exists. See capture_directory for parameter descriptions.
+
+        :return True if a capture happened, otherwise false.
+        """
+        if os.path.exists(from_directory):
+            self.capture_directory(from_directory, to_directory, immutable_files)
+            return True
+        else:
+            return False
+
+    def restore_directory(self, from_directory: str, to_directory: str):
+        """
+        Copy a captured directory over the directory it was captured from, replacing its contents.
+        When sync restore is enabled the existing contents are compared with the captured contents
+        instead of being deleted, and only the files that differ are copied and only the files
+        that were not captured are deleted. Directories captured into an object store are
+        materialised from the store, as clones where possible. Directories captured into an
+        archive are always extracted in full, replacing the existing contents.
+
+        :param from_directory: The directory in the migration directory holding the captured contents.
+        :param to_directory: The directory to restore the contents to.
+        """
+        archive_path = get_archive_path(from_directory)
+        if not os.path.isdir(from_directory) and os.path.isfile(archive_path):
+            self.remove_directory(to_directory)
+            with open(archive_path, 'rb') as archive:
+                BlockArchiveReader(archive, self.compression_workers, archive_path).extract(to_directory)
+            return
+        manifest_path = FileManifest.get_manifest_path(from_directory)
+        manifest = FileManifest.load(manifest_path) if not os.path.isdir(from_directory) else None
+        if manifest is not None and manifest.object_store is not None:
+            object_store = self.__get_object_store_of_manifest(manifest_path, manifest.object_store, manifest)
+            if not self.sync_restore:
+                self.remove_directory(to_directory)
+            existing = self.__scan_directory_if_exists(to_directory, manifest.hash_algorithm)
+            self.__synchronize_directory(from_directory, to_directory, existing, manifest, object_store)
+            return
+        if not self.sync_restore:
+            self.copy_directory(from_directory, to_directory, True)
+            return
+        if not os.path.exists(from_directory):
+            raise MigrationError("No data found at: '%s'" % from_directory)
+
+        existing = self.__scan_directory_if_exists(to_directory, self.content_hash_algorithm)
+        captured = FileManifest.scan(from_directory, self.content_hash_algorithm)
+        self.__synchronize_directory(from_directory, to_directory, existing, captured)
+
+    def restore_directory_if_exists(self, from_directory: str, to_directory: str) -> bool:
+        """
+        Calls restore_directory only if the source directory exists. See restore_directory for parameter descriptions.
+
+        :return True if a restore happened, otherwise false.
+        """
+        if self.does_captured_directory_exist(from_directory):
+            self.restore_directory(from_directory, to_directory)
+            return True
+        else:
+            return False
+
+    def does_captured_directory_exist(self, directory: str) -> bool:
+        """
+        Determines whether a directory was captured, either as a directory, into an object store or into an archive.
+
+        :param directory: The directory in the migration directory to check.
+        :return: True if the directory can be restored.
+        """
+        return self.does_directory_exist(directory) \
+            or self.does_file_exist(FileManifest.get_manifest_path(directory)) \
+            or self.does_file_exist(get_archive_path(directory))
+
+    def verify_captured_directory(self, directory: str) -> None:
+        """
+        Checks the captured files of a directory against the content hashes recorded in its
+        manifest when it was captured. Depending on the verify mode every file or a random sample
+        of the files is checked, on several threads. Directories captured into an archive are
+        checked against the checksums of the blocks of the archive instead.
+
+        :param directory: The directory in the migration directory to check.
+        """
+        if self.verify_mode == VERIFY_MODE_NONE:
+            return
+        log = logging.getLogger(FileSystemFacade.__name__)
+        archive_path = get_archive_path(directory)
+        if not os.path.isdir(directory) and os.path.isfile(archive_path):
+            sample_size = VERIFY_SAMPLE_SIZE if self.verify_mode == VERIFY_MODE_SAMPLE else None
+            start_time = time.perf_counter()
+            with open(archive_path, 'rb') as archive:
+                reader = BlockArchiveReader(archive, self.compression_workers, archive_path)
+                bytes_checked = reader.verify(sample_size)
+            log.info(f'Verified {archive_path}: '
+                     f'{CopySummary(len(reader.files), bytes_checked, time.perf_counter() - start_time)}')
+            return
+        manifest_path = FileManifest.get_manifest_path(directory)
+        manifest = FileManifest.load(manifest_path)
+        if manifest is None or manifest.hash_algorithm is None:
+            log.warning(f'{directory} was captured without content hashes, so it can not be verified.')
+            return
+
+        if manifest.object_store is not None:
+            object_store = self.__get_object_store_of_manifest(manifest_path, manifest.object_store, manifest)
+        files: List[Tuple[str, str, FileManifestEntry]] = []
+        for relative_path, entry in manifest.files.items():
+            if entry.content_hash is None:
+                continue
+            if manifest.object_store is not None:
+                path = object_store.get_object_path(entry.content_hash)
+            else:
+                path = FileManifest.to_native_path(directory, relative_path)
+            files.append((relative_path, path, entry))
+        if self.verify_mode == VERIFY_MODE_SAMPLE and len(files) > VERIFY_SAMPLE_SIZE:
+            files = random.sample(files, VERIFY_SAMPLE_SIZE)
+
+        start_time = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=self.copy_workers) as executor:
+            matches = list(executor.map(lambda file: self.__does_file_match(manifest, file[1], file[2]), files))
+        failed = [relative_path for (relative_path, _, _), match in zip(files, matches) if not match]
+        summary = CopySummary(len(files), sum(entry.size for _, _, entry in files), time.perf_counter() - start_time)
+        log.info(f'Verified {directory}: {summary}')
+        if failed:
+            raise MigrationError(_CORRUPT_CAPTURE_ERROR_FORMAT.format(
+                directory=directory,
+                count=len(failed),
+                files=', '.join(sorted(failed)[:_REPORTED_CORRUPT_FILES])))
+
+    @staticmethod
+    def __does_file_match(manifest: FileManifest, path: str, entry: FileManifestEntry) -> bool:
+        try:
+            return os.path.getsize(path) == entry.size and manifest.compute_hash(path) == entry.content_hash
+        except OSError:
+            return False
+
+    def __get_object_store_of_manifest(
+            self,
+            manifest_path: str,
+            relative_store_path: str,
+            manifest: FileManifest) -> ObjectStore:
+        if os.path.isabs(relative_store_path):
+            object_store_directory = relative_store_path
+        else:
+            object_store_directory = os.path.join(os.path.dirname(manifest_path), *relative_store_path.split('/'))
+        return ObjectStore(
+            object_store_directory,
+            manifest.hash_algorithm or DEFAULT_OBJECT_HASH_ALGORITHM,
+            self.copy_workers)
+
+    def __capture_directory_to_object_store(self, from_directory: str, to_directory: str, object_store_directory: str):
+        """
+        Adds the contents of a directory to the object store and writes a manifest pointing into
+        the store. Files whose size and modification time match the previous manifest of the
+        same directory are not read again.
+        """
+        if not os.path.exists(from_directory):
+            raise MigrationError("No data found at: '%s'" % from_directory)
+        self.__verify_directory_is_empty(to_directory)
+
+        manifest_path = FileManifest.get_manifest_path(to_directory)
+        hash_algorithm = self.content_hash_algorithm or DEFAULT_OBJECT_HASH_ALGORITHM
+        object_store = ObjectStore(object_store_directory, hash_algorithm, self.copy_workers)
+        previous = FileManifest.load(manifest_path) or FileManifest(hash_algorithm)
+        if previous.object_store is None or previous.hash_algorithm != hash_algorithm:
+            previous = FileManifest(hash_algorithm)
+        current = FileManifest.scan(from_directory, hash_algorithm)
+        try:
+            relative_store_path = os.path.relpath(object_store.directory, os.path.dirname(manifest_path))
+            current.object_store = relative_store_path.replace(os.sep, '/')
+        except ValueError:
+            # A store on another drive can not be reached by a relative path.
+            current.object_store = os.path.abspath(object_store.directory)
+
+        changed: List[str] = []
+        for relative_path, entry in current.files.items():
+            previous_entry = previous.files.get(relative_path)
+            if previous_entry is not None and previous_entry.has_same_stat(entry) \
+                    and previous_entry.content_hash is not None and object_store.contains(previous_entry.content_hash):
+                entry.content_hash = previous_entry.content_hash
+            else:
+                changed.append(relative_path)
+        sources = [FileManifest.to_native_path(from_directory, relative_path) for relative_path in changed]
+        for relative_path, content_hash in zip(changed, object_store.add_files(sources)):
+            current.files[relative_path].content_hash = content_hash
+        os.makedirs(os.path.dirname(manifest_path), exist_ok=True)
+        current.save(manifest_path)
+        log = logging.getLogger(FileSystemFacade.__name__)
+        log.info(
+            f'Captured {from_directory} to the object store {object_store.directory}: '
+            f'{len(changed)} files hashed, {len(current.files) - len(changed)} files unchanged')
+
+    def __capture_directory_to_archive(self, from_directory: str, to_directory: str):
+        """
+        Packs a directory into an archive next to where the directory would have been captured.
+        The archive only appears once it has been written completely. An existing archive is only
+        replaced when incremental capture is enabled.
+        """
+        if not os.path.exists(from_directory):
+            raise MigrationError("No data found at: '%s'" % from_directory)
+        archive_path = get_archive_path(to_directory)
+        if os.path.exists(archive_path) and not self.incremental_capture:
+            raise MigrationError("The tool can not capture to the existing archive: '%s'" % archive_path)
+        self.__verify_directory_is_empty(to_directory)
+
+        os.makedirs(os.path.dirname(archive_path), exist_ok=True)
+        temporary_path = archive_path + '.tmp'
+        start_time = time.perf_counter()
+        try:
+            with open(temporary_path, 'wb') as archive:
+                with BlockArchiveWriter(archive, self.compression_workers) as writer:
+                    writer.add_directory(from_directory)
+            os.replace(temporary_path, archive_path)
+        finally:
+            if os.path.exists(temporary_path):
+                os.remove(temporary_path)
+        log = logging.getLogger(FileSystemFacade.__name__)
+        log.info(f'Captured {from_directory} to the archive {archive_path}: '
+                 f'{os.path.getsize(archive_path)} bytes in {time.perf_counter() - start_time:.2f}s')
+
+    def __synchronize_directory(
+            self,
+            from_directory: str,
+            to_directory: str,
+            previous: FileManifest,
+            current: FileManifest,
+            object_store: Optional[ObjectStore] = None,
+            link_mode: str = LINK_MODE_COPY,
+            hardlink_patterns: Optional[List[str]] = None,
+            record_hashes: bool = False):
+        """
+        Brings a copy of a directory described by one manifest up to date with another manifest
+        of the directory. Files whose size and modification time match are never read, so the
+        time taken depends on the number of changes rather than the size of the directory.
+        Files whose size matches but whose modification time differs are compared by content
+        hash when the manifests use hashes. Copied files are hashed while they are copied. When
+        an object store is given, the files are materialised from the store instead of being
+        copied from the source directory. When record_hashes is set, unchanged files that have
+        no hash in the previous manifest are hashed as well, so the new manifest is complete.
+        """
+        removed_files = current.get_removed_files(previous)
+        for relative_path in removed_files:
+            path = FileManifest.to_native_path(to_directory, relative_path)
+            if os.path.isfile(path) or os.path.islink(path):
+                self.__remove_file(path)
+        for relative_path in current.get_removed_directories(previous):
+            path = FileManifest.to_native_path(to_directory, relative_path)
+            if os.path.islink(path):
+                self.__remove_file(path)
+            else:
+                self.remove_directory(path)
+        os.makedirs(to_directory, exist_ok=True)
+        for relative_path in sorted(current.directories - previous.directories):
+            os.makedirs(FileManifest.to_native_path(to_directory, relative_path), exist_ok=True)
+
+        files: List[Tuple[str, str, int]] = []
+        copied_entries: List[FileManifestEntry] = []
+        objects: List[Tuple[str, str, int]] = []
+        previous_hashes_match = previous.hash_algorithm == current.hash_algorithm
+        for relative_path, entry in current.files.items():
+            source = FileManifest.to_native_path(from_directory, relative_path)
+            destination = FileManifest.to_native_path(to_directory, relative_path)
+            previous_entry = previous.files.get(relative_path)
+            if previous_entry is not None and previous_entry.has_same_stat(entry):
+                if entry.content_hash is None and previous_hashes_match:
+                    entry.content_hash = previous_entry.content_hash
+                if entry.content_hash is None and record_hashes:
+                    entry.content_hash = current.compute_hash(destination)
+                continue
+            if previous_entry is not None and previous_entry.size == entry.size and current.hash_algorithm is not None:
+                if entry.content_hash is None:
+                    entry.content_hash = current.compute_hash(source)
+                previous_hash = previous_entry.content_hash if previous_hashes_match else None
+                if entry.content_hash == (previous_hash or current.compute_hash(destination)):
+                    if object_store is None:
+                        shutil.copystat(source, destination)
+                    continue
+            if object_store is None:
+                files.append((source, destination, entry.size))
+                copied_entries.append(entry)
+            elif entry.content_hash is not None:
+                objects.append((entry.content_hash, destination, entry.modified_time))
+            else:
+                raise MigrationError(f'The manifest of {from_directory} has no content hash for {relative_path}.')
+
+        if object_store is None:
+            engine = FileCopyEngine(
+                self.copy_workers,
+                link_mode=link_mode,
+                hash_algorithm=current.hash_algorithm,
+                hardlink_patterns=hardlink_patterns)
+            summary = engine.copy_files(files)
+            for entry, content_hash in zip(copied_entries, summary.hashes):
+                entry.content_hash = entry.content_hash or content_hash
+            shutil.copystat(from_directory, to_directory)
+            details = str(summary)
+        else:
+            cloned = object_store.materialize_files(objects)
+            details = f'{cloned} files cloned, {len(objects) - cloned} files copied'
+        unchanged = len(current.files) - len(files) - len(objects)
+        log = logging.getLogger(FileSystemFacade.__name__)
+        log.info(
+            f'Synchronized {to_directory} with {from_directory}: {details}, '
+            f'{len(removed_files)} files removed, {unchanged} files unchanged')
+
+    @staticmethod
+    def __scan_directory_if_exists(directory: str, hash_algorithm: Optional[str]) -> FileManifest:
+        if os.path.isdir(directory):
+            return FileManifest.scan(directory, hash_algorithm)
+        return FileManifest(hash_algorithm)
+
+    @staticmethod
+    def __verify_directory_is_empty(directory: str):
+        if os.path.exists(directory) and os.listdir(directory):
+            error = "The tool can not copy to the non empty directory: '%s'" % directory
+            raise MigrationError(error)
 
     def copy_directory_to_encrypted_file(self, from_directory: str, encrypted_file_path: str, secret: str):
         """
-        Copy an entire directory from one location to another and encrypts it.
+        Copy an entire directory from one location to another and encrypts it. The encrypted file only
+        appears once it has been written completely. An existing encrypted file is only replaced when
+        incremental capture is enabled.
 
         :param from_directory: The directory whose contents to copy.
         :param encrypted_file_path: The directory to put the copied contents.
         :param secret: A password to use when encrypting the directory.
         """
 
-        if self.does_file_exist(encrypted_file_path):
+        if self.does_file_exist(encrypted_file_path) and not self.incremental_capture:
             raise FileExistsError("Captured data already exists: '%s'" % encrypted_file_path)
         if not self.does_directory_exist(from_directory):
             raise FileExistsError("No data found at: '%s'" % from_directory)
-        extension = f'.{COMPRESSION_FORMAT}'
-        if self.does_file_exist(from_directory + extension):
-            raise FileExistsError(f'Data not cleaned up from previous migration: {from_directory + extension}')
-
-        # shutil.make_archive automatically appends the compression formats file extension to the output path.
-        shutil.make_archive(from_directory, COMPRESSION_FORMAT, from_directory)
-        self.__encrypt_tar(secret, from_directory + extension, encrypted_file_path)
-        os.remove(from_directory + extension)
+        validate_secret(secret)
+
+        # The tar stream is encrypted as it is written, so no unencrypted archive is ever stored.
+        temporary_path = encrypted_file_path + '.tmp'
+        try:
+            with open(temporary_path, 'wb') as encrypted_file:
+                with EncryptingWriter(
+                        encrypted_file,
+                        secret,
+                        key_manager=self.key_manager,
+                        workers=self.encryption_workers) as encrypter:
+                    with tarfile.open(fileobj=encrypter, mode='w|', format=TAR_FORMAT) as tar:
+                        tar.add(from_directory, arcname=os.curdir)
+            os.replace(temporary_path, encrypted_file_path)
+        finally:
+            if os.path.exists(temporary_path):
+                os.remove(temporary_path)
 
     def copy_directory_from_encrypted_file(self, encrypted_file_path: str, to_directory: str, secret: str):
         """
@@ -197,13 +644,16 @@ class FileSystemFacade:
 
         if not self.does_file_exist(encrypted_file_path):
             raise MigrationError("No data found at: '%s'" % encrypted_file_path)
-        extension = f'.{COMPRESSION_FORMAT}'
-        if self.does_file_exist(encrypted_file_path + extension):
-            raise MigrationError(f'Data not cleaned up from previous migration: {encrypted_file_path + extension}')
 
-        self.__decrypt_tar(secret, encrypted_file_path, encrypted_file_path + extension)
-        shutil.unpack_archive(encrypted_file_path + extension, to_directory, COMPRESSION_FORMAT)
-        os.remove(encrypted_file_path + extension)
+        with open(encrypted_file_path, 'rb') as encrypted_file:
+            if is_encrypted_stream(encrypted_file.read(len(ENCRYPTED_STREAM_MAGIC))):
+                encrypted_file.seek(0)
+                with DecryptingReader(encrypted_file, secret, self.key_manager, self.encryption_workers) as reader:
+                    self.__extract_tar_stream(reader, to_directory)
+            else:
+                encrypted_file.seek(0)
+                text = self.__decrypt_legacy_file(secret, encrypted_file.read())
+                self.__extract_tar_stream(io.BytesIO(text), to_directory)
 
     def write_file(self, path: str, content: str) -> None:
         """
@@ -226,30 +676,28 @@ class FileSystemFacade:
         with open(path, 'r') as file:
             return file.read()
 
-    def __encrypt_tar(self, secret: str, tar_path: str, encrypted_path: str):
-        with open(tar_path, 'rb') as file:
-            text = file.read()
-        encrypter = self.__get_encrypter(secret)
-        encrypted_text = encrypter.encrypt(text)
-        with open(encrypted_path, 'wb') as file:
-            file.write(encrypted_text)
-
-    def __decrypt_tar(self, secret: str, encrypted_path: str, tar_path: str):
-        with open(encrypted_path, 'rb') as file:
-            encrypted_text = file.read()
-        encrypter = self.__get_encrypter(secret)
-        text = encrypter.decrypt(encrypted_text)
-        with open(tar_path, 'wb') as file:
-            file.write(text)
-
     @staticmethod
-    def __get_encrypter(secret: str):
-        password = bytes(secret, 'utf-8')
-        if not password:
-            raise MigrationError('Secret not provided via the --secret flag for encryption.')
-        key_derivation_function = PBKDF2HMAC(algorithm=hashes.SHA256(), length=32, iterations=320000, salt=b'0'*16)
-        key = base64.urlsafe_b64encode(key_derivation_function.derive(password))
-        return Fernet(key)
+    def __extract_tar_stream(stream, to_directory: str):
+        root = os.path.realpath(to_directory)
+        with tarfile.open(fileobj=stream, mode='r|') as tar:
+            for member in tar:
+                member_path = os.path.realpath(os.path.join(root, member.name))
+                if os.path.splitdrive(member_path)[0] != os.path.splitdrive(root)[0] \
+                        or os.path.commonpath([root, member_path]) != root:
+                    raise MigrationError(f'The encrypted archive contains a path outside of the archive: {member.name}')
+                tar.extract(member, root)
+
+    def __decrypt_legacy_file(self, secret: str, encrypted_text: bytes) -> bytes:
+        """
+        Decrypts a file captured by an earlier version, which encrypted the whole tar file into a
+        single Fernet token with a fixed salt.
+        """
+        key = self.key_manager.get_key(secret, LEGACY_ENCRYPTION_SALT, DEFAULT_KEY_DERIVATION_ITERATIONS)
+        fernet_key = base64.urlsafe_b64encode(key)
+        try:
+            return Fernet(fernet_key).decrypt(encrypted_text)
+        except InvalidToken as e:
+            raise MigrationError('The encrypted data is corrupt or the secret is wrong.') from e
 
     def copy_directory_if_exists(self, from_directory: str, to_directory: str, force: bool) -> bool:
         """
@@ -263,18 +711,12 @@ class FileSystemFacade:
         else:
             return False
 
-    def __on_error_remove_readonly_and_retry(self, func, path, execinfo):
-        """
-        Error handler that removes the readonly attribute from a file path
-        and then retries the previous operation.
-
-        :param func: A continuation to run with the path.
-        :param path: The path to remove the readonly attribute from.
-        :param execinfo: Will be the exception information returned by sys.exc_info()
-        :return: None.
-        """
-        self.__remove_readonly(path)
-        func(path)
+    def __remove_file(self, path):
+        try:
+            os.remove(path)
+        except PermissionError:
+            self.__remove_readonly(path)
+            os.remove(path)
 
     def __remove_readonly(self, path):
         """
@@ -0,0 +1,190 @@
+"""Read and write archives in the layout used by mongodump --archive."""
+
+import struct
+from io import BufferedIOBase
+from typing import Any, BinaryIO, Dict, Iterator, List, Optional, Tuple
+
+import bson
+from bson.int64 import Int64
+from bson.json_util import dumps, loads
+
+from nislmigrate.logs.migration_error import MigrationError
+
+ARCHIVE_MAGIC_NUMBER: int = 0x8199e26d
+ARCHIVE_TERMINATOR: int = -1
+ARCHIVE_FORMAT_VERSION: str = '0.1'
+NATIVE_ARCHIVE_TOOL_VERSION: str = 'nislmigrate-native'
+_INT32 = struct.Struct('<i')
+_INVALID_ARCHIVE_ERROR = 'The file is not a mongodump archive.'
+_TRUNCATED_ARCHIVE_ERROR = 'The mongodump archive ended unexpectedly.'
+
+
+class ArchiveCollection:
+    """
+    The metadata mongodump recorded for a collection in an archive.
+    """
+    def __init__(self, database_name: str, collection_name: str, metadata: Dict[str, Any]):
+        """
+        Creates a new instance of ArchiveCollection.
+
+        :param database_name: The name of the database the collection was captured from.
+        :param collection_name: The name of the collection.
+        :param metadata: The options and indexes of the collection.
+        """
+        self.database_name: str = database_name
+        self.collection_name: str = collection_name
+        self.options: Dict[str, Any] = metadata.get('options', {})
+        self.indexes: List[Dict[str, Any]] = metadata.get('indexes', [])
+
+    @property
+    def namespace(self) -> str:
+        return f'{self.database_name}.{self.collection_name}'
+
+
+class MongoArchiveReader:
+    """
+    Reads the collections and documents of a mongodump archive from an uncompressed stream.
+    The archive starts with a prelude describing every collection, followed by blocks of
+    documents that each belong to one collection. Blocks of different collections can be
+    interleaved.
+    """
+    def __init__(self, stream: BufferedIOBase):
+        """
+        Creates a new instance of MongoArchiveReader.
+
+        :param stream: The archive. Must be positioned at the start of the archive.
+        """
+        self.__stream: BufferedIOBase = stream
+        self.header: Dict[str, Any] = {}
+
+    def read_collections(self) -> List[ArchiveCollection]:
+        """
+        Reads the prelude of the archive. Must be called before the documents are read.
+
+        :return: The metadata of every collection in the archive.
+        """
+        magic_number = self.__read_int32()
+        if magic_number is None or magic_number & 0xffffffff != ARCHIVE_MAGIC_NUMBER:
+            raise MigrationError(_INVALID_ARCHIVE_ERROR)
+        header = self.__read_document()
+        self.header = bson.decode(header) if header else {}
+        collections: List[ArchiveCollection] = []
+        while True:
+            document = self.__read_document()
+            if document is None:
+                return collections
+            metadata = bson.decode(document)
+            collections.append(ArchiveCollection(
+                metadata['db'],
+                metadata['collection'],
+                loads(metadata['metadata']) if metadata.get('metadata') else {}))
+
+    def read_documents(self) -> Iterator[Tuple[str, bytes]]:
+        """
+        Reads the documents of every collection in the order they are stored in the archive.
+
+        :return: The namespace and encoded BSON of each document.
+        """
+        while True:
+            size = self.__read_int32()
+            if size is None:
+                return
+            if size == ARCHIVE_TERMINATOR:
+                continue
+            namespace_header = bson.decode(self.__read_document_of_size(size))
+            namespace = f'{namespace_header["db"]}.{namespace_header["collection"]}'
+            while True:
+                document = self.__read_document()
+                if document is None:
+                    break
+                yield namespace, document
+
+    def __read_int32(self) -> Optional[int]:
+        data = self.__stream.read(_INT32.size)
+        if not data:
+            return None
+        if len(data) < _INT32.size:
+            raise MigrationError(_TRUNCATED_ARCHIVE_ERROR)
+        return _INT32.unpack(data)[0]
+
+    def __read_document(self) -> Optional[bytes]:
+        size = self.__read_int32()
+        if size is None:
+            raise MigrationError(_TRUNCATED_ARCHIVE_ERROR)
+        if size == ARCHIVE_TERMINATOR:
+            return None
+        return self.__read_document_of_size(size)
+
+    def __read_document_of_size(self, size: int) -> bytes:
+        body = self.__stream.read(size - _INT32.size)
+        if len(body) < size - _INT32.size:
+            raise MigrationError(_TRUNCATED_ARCHIVE_ERROR)
+        return _INT32.pack(size) + body
+
+
+class MongoArchiveWriter:
+    """
+    Writes collections and documents to a stream in the layout read by MongoArchiveReader.
+    The archives are marked as written by nislmigrate and have no checksums, so they can
+    only be restored by nislmigrate and not by mongorestore.
+    """
+    def __init__(self, stream: BinaryIO):
+        """
+        Creates a new instance of MongoArchiveWriter.
+
+        :param stream: The stream to write the archive to.
+        """
+        self.__stream: BinaryIO = stream
+
+    def write_collections(self, database_name: str, collections: List[Tuple[str, Dict[str, Any]]]) -> None:
+        """
+        Writes the prelude of the archive. Must be called before any documents are written.
+
+        :param database_name: The name of the database of every collection.
+        :param collections: The name and the metadata, with its options and indexes, of each collection.
+        """
+        self.__stream.write(struct.pack('<I', ARCHIVE_MAGIC_NUMBER))
+        header = {'version': ARCHIVE_FORMAT_VERSION, 'tool_version': NATIVE_ARCHIVE_TOOL_VERSION}
+        self.__stream.write(bson.encode(header))
+        for collection_name, metadata in collections:
+            self.__stream.write(bson.encode({
+                'db': database_name,
+                'collection': collection_name,
+                'metadata': dumps(metadata),
+                'size': 0,
+                'type': 'collection',
+            }))
+        self.__write_terminator()
+
+    def write_documents(self, database_name: str, collection_name: str, documents: bytes) -> None:
+        """
+        Writes a block of documents of one collection.
+
+        :param database_name: The name of the database of the collection.
+        :param collection_name: The name of the collection.
+        :param documents: The encoded BSON of the documents, one after the other.
+        """
+        self.__write_namespace_header(database_name, collection_name, False)
+        self.__stream.write(documents)
+        self.__write_terminator()
+
+    def write_end_of_collection(self, database_name: str, collection_name: str) -> None:
+        """
+        Marks that every document of a collection was written.
+
+        :param database_name: The name of the database of the collection.
+        :param collection_name: The name of the collection.
+        """
+        self.__write_namespace_header(database_name, collection_name, True)
+        self.__write_terminator()
+
+    def __write_namespace_header(self, database_name: str, collection_name: str, end_of_collection: bool) -> None:
+        self.__stream.write(bson.encode({
+            'db': database_name,
+            'collection': collection_name,
+            'EOF': end_of_collection,
+            'CRC': Int64(0),
+        }))
+
+    def __write_terminator(self) -> None:
+        self.__stream.write(_INT32.pack(ARCHIVE_TERMINATOR))
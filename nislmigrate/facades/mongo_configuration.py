@@ -46,3 +46,12 @@ class MongoConfiguration(object):
                 and self.database_name == other.database_name \
                 and self.host_name == other.host_name
         return False
+
+    def __hash__(self):
+        return hash((
+            self.password,
+            self.user,
+            self.connection_string,
+            self.port,
+            self.database_name,
+            self.host_name))
@@ -0,0 +1,241 @@
+"""Write mongodump archives with parallel compression and report what was dumped."""
+
+import gzip
+import io
+import os
+import time
+import zlib
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import BinaryIO, Deque, Dict, Iterator, List, Optional
+
+from nislmigrate.facades.mongo_archive import NATIVE_ARCHIVE_TOOL_VERSION, MongoArchiveReader
+from nislmigrate.logs.migration_error import MigrationError
+
+DUMP_COMPRESSION_GZIP: str = 'gzip'
+DUMP_COMPRESSION_NONE: str = 'none'
+DUMP_COMPRESSIONS: List[str] = [DUMP_COMPRESSION_GZIP, DUMP_COMPRESSION_NONE]
+DEFAULT_DUMP_COMPRESSION_LEVEL: int = 6
+DEFAULT_PARALLEL_COLLECTIONS: int = 4
+DEFAULT_DUMP_COMPRESSION_WORKERS: int = os.cpu_count() or 1
+DUMP_COMPRESSION_BLOCK_SIZE: int = 4 * 1024 * 1024
+COLLECTION_ARCHIVE_SUFFIX: str = '.archive'
+_GZIP_MAGIC = b'\x1f\x8b'
+_GZIP_WINDOW_BITS = 16 + zlib.MAX_WBITS
+
+
+class MongoDumpOptions:
+    """
+    How a migrator wants its database dumped.
+    """
+    def __init__(
+            self,
+            parallel_collections: Optional[int] = None,
+            compression: str = DUMP_COMPRESSION_GZIP,
+            compression_level: int = DEFAULT_DUMP_COMPRESSION_LEVEL,
+            per_collection_archives: bool = False):
+        """
+        Creates a new instance of MongoDumpOptions.
+
+        :param parallel_collections: The number of collections to dump at the same time, or None
+                                     to use the default of mongodump.
+        :param compression: One of DUMP_COMPRESSIONS. Both can be restored by mongorestore directly.
+        :param compression_level: The gzip compression level, from 1 (fastest) to 9 (smallest).
+        :param per_collection_archives: Whether to dump every collection to its own archive with its
+                                        own mongodump process, instead of one archive for the database.
+        """
+        self.parallel_collections: Optional[int] = parallel_collections
+        self.compression: str = compression
+        self.compression_level: int = compression_level
+        self.per_collection_archives: bool = per_collection_archives
+
+
+class CollectionDumpReport:
+    """
+    The amount of data dumped from one collection and how long it took.
+    """
+    def __init__(self, namespace: str, documents: int = 0, bytes_dumped: int = 0, seconds: float = 0.0):
+        """
+        Creates a new instance of CollectionDumpReport.
+
+        :param namespace: The database and collection name, separated by a dot.
+        :param documents: The number of documents dumped.
+        :param bytes_dumped: The size of the dumped documents before compression.
+        :param seconds: The time between the first and the last documents of the collection.
+        """
+        self.namespace: str = namespace
+        self.documents: int = documents
+        self.bytes_dumped: int = bytes_dumped
+        self.seconds: float = seconds
+
+    def __str__(self):
+        return f'{self.namespace}: {self.documents} documents, {self.bytes_dumped} bytes in {self.seconds:.1f} s'
+
+
+class ParallelGzipWriter(io.RawIOBase):
+    """
+    Compresses a stream as a series of independent gzip members that are compressed on several
+    threads. Concatenated gzip members are a valid gzip file, which mongorestore --gzip reads.
+    """
+    def __init__(
+            self,
+            stream: BinaryIO,
+            executor: ThreadPoolExecutor,
+            compression_level: int = DEFAULT_DUMP_COMPRESSION_LEVEL,
+            block_size: int = DUMP_COMPRESSION_BLOCK_SIZE,
+            pending_blocks: int = 2 * DEFAULT_DUMP_COMPRESSION_WORKERS):
+        """
+        Creates a new instance of ParallelGzipWriter.
+
+        :param stream: The stream to write the compressed data to. It is not closed with the writer.
+        :param executor: The threads to compress blocks on. Can be shared by several writers.
+        :param compression_level: The gzip compression level.
+        :param block_size: The uncompressed size of each gzip member.
+        :param pending_blocks: The maximum number of blocks waiting to be written.
+        """
+        super().__init__()
+        self.__stream: BinaryIO = stream
+        self.__executor: ThreadPoolExecutor = executor
+        self.__compression_level: int = compression_level
+        self.__block_size: int = block_size
+        self.__pending_blocks: int = max(1, pending_blocks)
+        self.__pending: Deque[Future] = deque()
+        self.__buffer: bytearray = bytearray()
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self.__buffer += data
+        while len(self.__buffer) >= self.__block_size:
+            self.__submit_block(bytes(self.__buffer[:self.__block_size]))
+            del self.__buffer[:self.__block_size]
+        return len(data)
+
+    def close(self) -> None:
+        if not self.closed:
+            if self.__buffer:
+                self.__submit_block(bytes(self.__buffer))
+                self.__buffer = bytearray()
+            while self.__pending:
+                self.__stream.write(self.__pending.popleft().result())
+        super().close()
+
+    def __submit_block(self, block: bytes) -> None:
+        if len(self.__pending) >= self.__pending_blocks:
+            self.__stream.write(self.__pending.popleft().result())
+        self.__pending.append(self.__executor.submit(_compress_gzip_member, block, self.__compression_level))
+
+
+class _TeeReader(io.RawIOBase):
+    """
+    Reads from one stream and writes everything that was read to another.
+    """
+    def __init__(self, source: BinaryIO, sink: BinaryIO):
+        super().__init__()
+        self.__source: BinaryIO = source
+        self.__sink: BinaryIO = sink
+
+    def readable(self) -> bool:
+        return True
+
+    def read(self, size: int = -1) -> bytes:
+        data = self.__source.read(size)
+        if data:
+            self.__sink.write(data)
+        return data
+
+
+def write_dump_archive(
+        source: BinaryIO,
+        destination: BinaryIO,
+        options: MongoDumpOptions,
+        executor: ThreadPoolExecutor) -> List[CollectionDumpReport]:
+    """
+    Writes an uncompressed archive read from mongodump --archive to a file, compressed as the
+    options ask, and measures each collection in the archive on the way.
+
+    :param source: The uncompressed archive.
+    :param destination: The stream to write the archive to.
+    :param options: How to compress the archive.
+    :param executor: The threads to compress the archive on.
+    :return: A report for each collection in the archive.
+    """
+    with compressed_dump_stream(destination, options, executor) as sink:
+        reader = MongoArchiveReader(_TeeReader(source, sink))  # type: ignore
+        reports: Dict[str, CollectionDumpReport] = {
+            collection.namespace: CollectionDumpReport(collection.namespace)
+            for collection in reader.read_collections()
+        }
+        first_document_times: Dict[str, float] = {}
+        for namespace, document in reader.read_documents():
+            now = time.perf_counter()
+            report = reports.setdefault(namespace, CollectionDumpReport(namespace))
+            first_document_time = first_document_times.setdefault(namespace, now)
+            report.documents += 1
+            report.bytes_dumped += len(document)
+            report.seconds = now - first_document_time
+    return list(reports.values())
+
+
+@contextmanager
+def compressed_dump_stream(
+        destination: BinaryIO,
+        options: MongoDumpOptions,
+        executor: ThreadPoolExecutor) -> Iterator[BinaryIO]:
+    """
+    Gets a stream that compresses what is written to it as the options ask before writing it to a file.
+    The compressed data is flushed to the file when the context exits without an error.
+
+    :param destination: The stream to write the compressed data to. It is not closed.
+    :param options: How to compress the data.
+    :param executor: The threads to compress the data on.
+    :return: The stream to write the uncompressed data to.
+    """
+    if options.compression != DUMP_COMPRESSION_GZIP:
+        yield destination
+        return
+    writer = ParallelGzipWriter(destination, executor, options.compression_level)
+    yield writer  # type: ignore
+    writer.close()
+
+
+def open_dump_archive(path: str) -> BinaryIO:
+    """
+    Opens an archive written by mongodump or write_dump_archive for reading, decompressing it if it is compressed.
+
+    :param path: The path of the archive.
+    :return: The uncompressed archive.
+    """
+    if is_gzip_file(path):
+        return gzip.open(path, 'rb')  # type: ignore
+    return open(path, 'rb')
+
+
+def is_native_dump_archive(path: str) -> bool:
+    """
+    Checks whether an archive was written by the native engine instead of mongodump, in which case
+    mongorestore can not restore it.
+
+    :param path: The path of the archive.
+    :return: True if the archive was written by the native engine.
+    """
+    with open_dump_archive(path) as archive:
+        reader = MongoArchiveReader(archive)  # type: ignore
+        try:
+            reader.read_collections()
+        except (MigrationError, OSError, EOFError):
+            # Archives that can not be read are left for mongorestore to report.
+            return False
+        return reader.header.get('tool_version') == NATIVE_ARCHIVE_TOOL_VERSION
+
+
+def is_gzip_file(path: str) -> bool:
+    with open(path, 'rb') as file:
+        return file.read(len(_GZIP_MAGIC)) == _GZIP_MAGIC
+
+
+def _compress_gzip_member(data: bytes, compression_level: int) -> bytes:
+    compressor = zlib.compressobj(compression_level, zlib.DEFLATED, _GZIP_WINDOW_BITS)
+    return compressor.compress(data) + compressor.flush()
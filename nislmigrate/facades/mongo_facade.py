@@ -1,66 +1,521 @@
 """Handle Mongo operations."""
 
+import copy
+import ctypes
+import json
 import os
 import logging
-from typing import List, Optional, Callable, Any
+import shutil
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, Iterable, List, Optional, Callable, Any, Tuple, Union
 
 import bson
-from pymongo import MongoClient
+from pymongo import IndexModel, MongoClient, ReplaceOne, UpdateOne
+from pymongo.collection import Collection
+from pymongo.write_concern import WriteConcern
+from pymongo.errors import BulkWriteError, ConnectionFailure, PyMongoError
 
+from nislmigrate.facades.document_transform import DocumentTransform
+from nislmigrate.facades.mongo_archive import ArchiveCollection, MongoArchiveReader
 from nislmigrate.facades.mongo_configuration import MongoConfiguration
-from nislmigrate.facades.process_facade import ProcessFacade, BackgroundProcess, ProcessError
+from nislmigrate.facades.mongo_restore import MongoRestoreOptions
+from nislmigrate.facades.mongo_dump import (
+    COLLECTION_ARCHIVE_SUFFIX,
+    DEFAULT_DUMP_COMPRESSION_WORKERS,
+    DEFAULT_PARALLEL_COLLECTIONS,
+    CollectionDumpReport,
+    MongoDumpOptions,
+    compressed_dump_stream,
+    is_gzip_file,
+    is_native_dump_archive,
+    open_dump_archive,
+    write_dump_archive,
+)
+from nislmigrate.facades.mongo_native_engine import DEFAULT_NATIVE_INSERTION_WORKERS, NativeMongoEngine
+from nislmigrate.facades.process_facade import BackgroundProcess, ProcessFacade, ProcessError
 from nislmigrate.logs.migration_error import MigrationError
 from nislmigrate.utility.paths import get_ni_application_data_directory_path, get_ni_shared_directory_64_path
 
-MONGO_CONFIGURATION_PATH: str = os.path.join(
-    get_ni_application_data_directory_path(),
-    'Skyline',
-    'NoSqlDatabase',
-    'mongodb.conf')
-MONGO_BINARIES_DIRECTORY: str = os.path.join(
-    get_ni_shared_directory_64_path(),
-    'Skyline',
-    'NoSqlDatabase',
-    'bin')
-MONGO_DUMP_EXECUTABLE_PATH: str = os.path.join(MONGO_BINARIES_DIRECTORY, 'mongodump.exe')
-MONGO_RESTORE_EXECUTABLE_PATH: str = os.path.join(MONGO_BINARIES_DIRECTORY, 'mongorestore.exe')
-MONGO_EXECUTABLE_PATH: str = os.path.join(MONGO_BINARIES_DIRECTORY, 'mongod.exe')
+MONGO_DUMP_EXECUTABLE_NAME: str = 'mongodump.exe'
+MONGO_RESTORE_EXECUTABLE_NAME: str = 'mongorestore.exe'
+MONGO_EXECUTABLE_NAME: str = 'mongod.exe'
+MONGO_ENGINE_TOOLS: str = 'tools'
+MONGO_ENGINE_NATIVE: str = 'native'
+MONGO_ENGINES: List[str] = [MONGO_ENGINE_TOOLS, MONGO_ENGINE_NATIVE]
+DEFAULT_MAX_POOL_SIZE: int = 16
+DEFAULT_MAX_IDLE_TIME_MILLISECONDS: int = 60000
+DEFAULT_UPDATE_BATCH_SIZE: int = 1000
+DEFAULT_CURSOR_BATCH_SIZE: int = 1000
+DEFAULT_PARALLEL_PARTITIONS: int = os.cpu_count() or 1
+SAMPLED_DOCUMENTS_PER_PARTITION: int = 20
+DEFAULT_MONGO_START_TIMEOUT_SECONDS: float = 60.0
+DEFAULT_MONGO_STOP_TIMEOUT_SECONDS: float = 30.0
+DEFAULT_PING_TIMEOUT_MILLISECONDS: int = 250
+FIRST_PING_INTERVAL_SECONDS: float = 0.05
+MAXIMUM_PING_INTERVAL_SECONDS: float = 1.0
+DEFAULT_MONGO_PORT: int = 27017
+MONGO_PROFILE_PRODUCTION: str = 'production'
+MONGO_PROFILE_BULK_LOAD: str = 'bulkload'
+MONGO_PROFILES: List[str] = [MONGO_PROFILE_PRODUCTION, MONGO_PROFILE_BULK_LOAD]
+BULK_LOAD_CACHE_MEMORY_FRACTION: float = 0.7
+BULK_LOAD_MINIMUM_CACHE_GIGABYTES: float = 0.25
+BULK_LOAD_JOURNAL_COMMIT_INTERVAL_MILLISECONDS: int = 500
+BULK_LOAD_SYNC_DELAY_SECONDS: int = 300
+JOURNAL_FLUSH_COLLECTION_NAME: str = 'nislmigrate.journalflush'
+MEGABYTE: int = 1024 * 1024
+GIGABYTE: int = 1024 * MEGABYTE
+
+
+def get_mongo_configuration_path() -> str:
+    """
+    Gets the path of the configuration the SystemLink services start mongod with. The path is only
+    looked up when it is needed, so the native engine can be used where SystemLink is not installed.
+
+    :return: The path of the mongod configuration file.
+    """
+    return os.path.join(get_ni_application_data_directory_path(), 'Skyline', 'NoSqlDatabase', 'mongodb.conf')
+
+
+def get_mongo_executable_path(executable_name: str) -> str:
+    """
+    Gets the path of one of the mongo executables installed with SystemLink.
+
+    :param executable_name: The file name of the executable, such as MONGO_DUMP_EXECUTABLE_NAME.
+    :return: The path of the executable.
+    """
+    return os.path.join(get_ni_shared_directory_64_path(), 'Skyline', 'NoSqlDatabase', 'bin', executable_name)
+
+
+def get_mongod_profile_arguments(profile: str) -> List[str]:
+    """
+    Gets the mongod options that override the configuration file for a mongo profile.
+    The bulk load profile gives the WiredTiger cache most of the memory of the computer, since
+    the SystemLink services are stopped while it is used, and flushes the journal and the data
+    files as rarely as mongod allows.
+
+    :param profile: One of MONGO_PROFILES.
+    :return: The options to add to the mongod command.
+    """
+    if profile != MONGO_PROFILE_BULK_LOAD:
+        return []
+    arguments = [
+        '--journalCommitInterval', str(BULK_LOAD_JOURNAL_COMMIT_INTERVAL_MILLISECONDS),
+        '--syncdelay', str(BULK_LOAD_SYNC_DELAY_SECONDS),
+    ]
+    total_memory = _get_total_memory_bytes()
+    if total_memory is not None:
+        cache_gigabytes = max(
+            BULK_LOAD_CACHE_MEMORY_FRACTION * (total_memory - GIGABYTE) / GIGABYTE,
+            BULK_LOAD_MINIMUM_CACHE_GIGABYTES)
+        arguments.extend(['--wiredTigerCacheSizeGB', f'{cache_gigabytes:.2f}'])
+    return arguments
+
+
+def get_write_concern_for_profile(profile: str) -> Optional[WriteConcern]:
+    """
+    Gets the write concern to restore documents with for a mongo profile. The bulk load profile
+    does not wait for writes to reach the journal.
+
+    :param profile: One of MONGO_PROFILES.
+    :return: The write concern, or None to use the default of the server.
+    """
+    if profile == MONGO_PROFILE_BULK_LOAD:
+        return WriteConcern(w=1, j=False)
+    return None
+
+
+def _get_total_memory_bytes() -> Optional[int]:
+    if os.name == 'nt':
+        class MemoryStatus(ctypes.Structure):
+            _fields_ = [
+                ('dwLength', ctypes.c_ulong),
+                ('dwMemoryLoad', ctypes.c_ulong),
+                ('ullTotalPhys', ctypes.c_ulonglong),
+                ('ullAvailPhys', ctypes.c_ulonglong),
+                ('ullTotalPageFile', ctypes.c_ulonglong),
+                ('ullAvailPageFile', ctypes.c_ulonglong),
+                ('ullTotalVirtual', ctypes.c_ulonglong),
+                ('ullAvailVirtual', ctypes.c_ulonglong),
+                ('ullAvailExtendedVirtual', ctypes.c_ulonglong),
+            ]
+        status = MemoryStatus()
+        status.dwLength = ctypes.sizeof(MemoryStatus)
+        if not ctypes.windll.kernel32.GlobalMemoryStatusEx(ctypes.byref(status)):  # type: ignore
+            return None
+        return status.ullTotalPhys
+    try:
+        return os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES')
+    except (ValueError, OSError, AttributeError):
+        return None
+
+
+class DocumentUpdateSummary:
+    """
+    Counts of the documents affected by an update of the documents in a collection.
+    """
+    def __init__(self, matched: int = 0, modified: int = 0, failed: int = 0):
+        """
+        Creates a new instance of DocumentUpdateSummary.
+
+        :param matched: The number of documents matched by the update operations.
+        :param modified: The number of documents actually changed by the update operations.
+        :param failed: The number of update operations the database reported an error for.
+        """
+        self.matched: int = matched
+        self.modified: int = modified
+        self.failed: int = failed
+
+    def __add__(self, other: 'DocumentUpdateSummary') -> 'DocumentUpdateSummary':
+        return DocumentUpdateSummary(
+            self.matched + other.matched,
+            self.modified + other.modified,
+            self.failed + other.failed)
+
+    def __eq__(self, other):
+        if isinstance(other, DocumentUpdateSummary):
+            return \
+                self.matched == other.matched \
+                and self.modified == other.modified \
+                and self.failed == other.failed
+        return False
+
+    def __str__(self):
+        return f'{self.matched} matched, {self.modified} modified, {self.failed} failed'
+
+
+def _get_index_models(archive_collection: ArchiveCollection) -> List[IndexModel]:
+    """
+    Gets the indexes recorded for a collection in an archive, except the index on _id that every collection has.
+    """
+    return [
+        IndexModel(
+            list(index['key'].items()),
+            **{option: value for option, value in index.items() if option not in ('key', 'v', 'ns')})
+        for index in archive_collection.indexes
+        if index.get('name') != '_id_'
+    ]
+
+
+class _TransformedCollectionRestore:
+    """
+    Inserts the transformed documents of one collection read from an archive in batches.
+    """
+    def __init__(
+            self,
+            collection: Collection,
+            archive_collection: ArchiveCollection,
+            transform: DocumentTransform,
+            batch_size: int = DEFAULT_UPDATE_BATCH_SIZE,
+            build_indexes: bool = True):
+        self.collection: Collection = collection
+        self.archive_collection: ArchiveCollection = archive_collection
+        self.transform: DocumentTransform = transform
+        self.batch_size: int = batch_size
+        self.build_indexes: bool = build_indexes
+        self.inserted: int = 0
+        self.transformed: int = 0
+        self.__documents: List[Dict[str, Any]] = []
+
+    def add(self, encoded_document: bytes) -> None:
+        document = bson.decode(encoded_document, self.collection.codec_options)
+        if self.transform.predicate(document):
+            document = self.transform.update_function(document)
+            self.transformed += 1
+        self.__documents.append(document)
+        if len(self.__documents) >= self.batch_size:
+            self.__insert_documents()
+
+    def finish(self) -> None:
+        if self.__documents:
+            self.__insert_documents()
+        indexes = _get_index_models(self.archive_collection)
+        if indexes and self.build_indexes:
+            self.collection.create_indexes(indexes)
+        log = logging.getLogger(MongoFacade.__name__)
+        log.info(
+            f'Restored {self.inserted} documents to {self.archive_collection.collection_name}, '
+            f'{self.transformed} of them transformed.')
+
+    def __insert_documents(self) -> None:
+        try:
+            self.collection.insert_many(self.__documents, ordered=False)
+            self.inserted += len(self.__documents)
+        except BulkWriteError as e:
+            write_errors = e.details.get('writeErrors', [])
+            raise MigrationError(
+                f'Failed to restore {len(write_errors)} documents to {self.collection.name}: '
+                f'{write_errors[0].get("errmsg") if write_errors else e}')
+        self.__documents = []
+
+
+class MongoProcessManager:
+    """
+    Makes sure a mongod process is answering before the database is used. A mongod that is
+    already running is used as it is and left running. Otherwise one is started, waited for
+    and stopped again by stop.
+    """
+    def __init__(
+            self,
+            process_facade: ProcessFacade,
+            start_timeout_seconds: float = DEFAULT_MONGO_START_TIMEOUT_SECONDS,
+            stop_timeout_seconds: float = DEFAULT_MONGO_STOP_TIMEOUT_SECONDS):
+        """
+        Creates a new instance of MongoProcessManager.
+
+        :param process_facade: Facade used to start the mongod process.
+        :param start_timeout_seconds: How long to wait for a started mongod to answer.
+        :param stop_timeout_seconds: How long to wait for a started mongod to exit before it is killed.
+        """
+        self.process_facade: ProcessFacade = process_facade
+        self.start_timeout_seconds: float = start_timeout_seconds
+        self.stop_timeout_seconds: float = stop_timeout_seconds
+        self.__lock = threading.Lock()
+        self.__process: Optional[BackgroundProcess] = None
+        self.__configuration: Optional[MongoConfiguration] = None
+
+    def ensure_running(self, configuration: MongoConfiguration, get_arguments: Callable[[], List[str]]) -> bool:
+        """
+        Makes sure a mongod is answering on the server of the given configuration, starting one
+        if none is.
+
+        :param configuration: The mongo configuration of a service using the server.
+        :param get_arguments: Gets the command to start mongod with. Only called if mongod is started.
+        :return: True if this call found a mongod that was already running and did not start one.
+        """
+        with self.__lock:
+            if self.__configuration is not None:
+                return False
+            log = logging.getLogger(MongoProcessManager.__name__)
+            if self.ping(configuration):
+                log.info('Using the mongod that is already running.')
+                self.__configuration = configuration
+                return True
+            self.__process = self.process_facade.run_background_process(get_arguments())
+            start_time = time.perf_counter()
+            try:
+                self.__wait_until_ready(configuration, start_time + self.start_timeout_seconds)
+            except MigrationError:
+                # Forget the mongod that never became ready, so the next caller gets the error too.
+                self.__process.stop()
+                self.__process = None
+                raise
+            self.__configuration = configuration
+            log.info(f'Started mongod in {time.perf_counter() - start_time:.1f} s.')
+            return False
+
+    def stop(self) -> None:
+        """
+        Stops the mongod started by ensure_running, if it started one. The server is asked to shut
+        down cleanly and is only killed if it does not exit in time, including when the service
+        account is not allowed to shut it down.
+        """
+        with self.__lock:
+            process = self.__process
+            configuration = self.__configuration
+            self.__process = None
+            self.__configuration = None
+        if process is None or configuration is None:
+            return
+        log = logging.getLogger(MongoProcessManager.__name__)
+        try:
+            with self.__create_client(configuration) as client:
+                client.admin.command('shutdown')
+        except ConnectionFailure:
+            # The server closes the connection as it shuts down.
+            pass
+        except PyMongoError as e:
+            log.warning(
+                f'mongod refused to shut down: {e}. Waiting {self.stop_timeout_seconds:.0f} seconds for it '
+                f'to exit before it is killed.')
+        if not process.wait(self.stop_timeout_seconds):
+            log.warning(f'mongod did not exit within {self.stop_timeout_seconds:.0f} seconds, so it was killed.')
+            process.stop()
+
+    def ping(self, configuration: MongoConfiguration) -> bool:
+        """
+        Checks whether a mongod answers on the server of the given configuration.
+
+        :param configuration: The mongo configuration of a service using the server.
+        :return: True if the server answered.
+        """
+        try:
+            with self.__create_client(configuration) as client:
+                client.admin.command('ping')
+            return True
+        except PyMongoError:
+            return False
+
+    def __wait_until_ready(self, configuration: MongoConfiguration, deadline: float) -> None:
+        interval = FIRST_PING_INTERVAL_SECONDS
+        while not self.ping(configuration):
+            if self.__process is not None and not self.__process.is_running():
+                raise MigrationError('mongod exited before it was ready to accept connections.')
+            if time.perf_counter() + interval > deadline:
+                raise MigrationError(
+                    f'mongod did not accept connections within {self.start_timeout_seconds:.0f} seconds.')
+            time.sleep(interval)
+            interval = min(interval * 2, MAXIMUM_PING_INTERVAL_SECONDS)
+
+    @staticmethod
+    def __create_client(configuration: MongoConfiguration) -> MongoClient:
+        port = int(configuration.port) if configuration.port else DEFAULT_MONGO_PORT
+        return MongoClient(
+            configuration.connection_string or configuration.host_name or 'localhost',
+            port,
+            serverSelectionTimeoutMS=DEFAULT_PING_TIMEOUT_MILLISECONDS,
+            connectTimeoutMS=DEFAULT_PING_TIMEOUT_MILLISECONDS)
 
 
 class MongoFacade:
-    __mongo_process_handle: Optional[BackgroundProcess] = None
+    def __init__(
+            self,
+            process_facade: ProcessFacade,
+            max_pool_size: int = DEFAULT_MAX_POOL_SIZE,
+            max_idle_time_milliseconds: int = DEFAULT_MAX_IDLE_TIME_MILLISECONDS):
+        """
+        Creates a new instance of MongoFacade.
 
-    def __init__(self, process_facade: ProcessFacade):
+        :param process_facade: Facade used to run the mongo executables.
+        :param max_pool_size: The maximum number of connections each shared client keeps open.
+        :param max_idle_time_milliseconds: How long a pooled connection can stay idle before it is closed.
+        """
         self.process_facade: ProcessFacade = process_facade
+        self.max_pool_size: int = max_pool_size
+        self.max_idle_time_milliseconds: int = max_idle_time_milliseconds
+        self.mongo_process_manager: MongoProcessManager = MongoProcessManager(process_facade)
+        self.mongo_profile: str = MONGO_PROFILE_PRODUCTION
+        self.mongo_engine: str = MONGO_ENGINE_TOOLS
+        self.native_engine: NativeMongoEngine = NativeMongoEngine()
+        self.__clients: Dict[MongoConfiguration, MongoClient] = {}
+        self.__clients_lock = threading.Lock()
 
     def capture_database_to_directory(
             self,
             configuration: MongoConfiguration,
             directory: str,
             dump_name: str,
-            ) -> None:
+            options: Optional[MongoDumpOptions] = None,
+            ) -> List[CollectionDumpReport]:
         """
         Capture the data in mongoDB from the given service.
         :param configuration: The mongo configuration for a service.
         :param directory: The directory to migrate the service in to.
         :param dump_name: The name of the file to dump to.
+        :param options: How to dump the database, or None for the defaults.
+        :return: The number of documents and bytes dumped from each collection and how long it took.
         """
+        options = options or MongoDumpOptions()
         if not os.path.exists(directory):
             os.makedirs(directory)
         dump_path = os.path.join(directory, dump_name)
-        mongo_dump_command = [MONGO_DUMP_EXECUTABLE_PATH]
-        connection_arguments = self.__get_mongo_connection_arguments(configuration)
-        mongo_dump_command.extend(connection_arguments)
-        mongo_dump_command.append('--archive=' + dump_path)
-        mongo_dump_command.append('--gzip')
-        output = self.__ensure_mongo_process_is_running_and_execute_command(mongo_dump_command)
+        self.start_mongo(configuration)
+        start_time = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=DEFAULT_DUMP_COMPRESSION_WORKERS) as compression_executor:
+            if options.per_collection_archives:
+                reports = self.__dump_collections_to_archives(configuration, dump_path, options, compression_executor)
+            else:
+                reports = self.__dump_to_archive(configuration, dump_path, None, options, compression_executor)
+        log = logging.getLogger(MongoFacade.__name__)
+        for report in reports:
+            log.info(f'Captured {report}')
+        log.info(f'Captured {sum(report.bytes_dumped for report in reports)} bytes from {len(reports)} '
+                 f'collections of {configuration.database_name} in {time.perf_counter() - start_time:.1f} s')
+        return reports
+
+    def __dump_collections_to_archives(
+            self,
+            configuration: MongoConfiguration,
+            dump_path: str,
+            options: MongoDumpOptions,
+            compression_executor: ThreadPoolExecutor) -> List[CollectionDumpReport]:
+        """
+        Dumps each collection to its own archive in the dump directory, dumping several collections
+        at the same time. The archives are written to a new directory that replaces the dump
+        directory once every collection is dumped, so the archives of collections that were dropped
+        since an earlier capture are not restored. Views and system collections are skipped.
+        """
+        database = self.__get_client(configuration)[configuration.database_name]
+        log = logging.getLogger(MongoFacade.__name__)
+        collection_names: List[str] = []
+        for specification in database.list_collections():
+            name = specification['name']
+            if specification.get('type', 'collection') != 'collection' or name.startswith('system.'):
+                log.warning(f'Skipped {name} of {configuration.database_name}: views and system collections '
+                            f'are not captured with per-collection archives.')
+                continue
+            collection_names.append(name)
+        temporary_path = dump_path + '.tmp'
+        if os.path.exists(temporary_path):
+            shutil.rmtree(temporary_path)
+        os.makedirs(temporary_path)
+
+        def dump_collection(collection_name: str) -> List[CollectionDumpReport]:
+            archive_path = os.path.join(temporary_path, collection_name + COLLECTION_ARCHIVE_SUFFIX)
+            return self.__dump_to_archive(configuration, archive_path, collection_name, options, compression_executor)
+
+        parallel_collections = options.parallel_collections or DEFAULT_PARALLEL_COLLECTIONS
+        try:
+            with ThreadPoolExecutor(max_workers=parallel_collections) as executor:
+                reports = [
+                    report
+                    for reports in executor.map(dump_collection, sorted(collection_names))
+                    for report in reports
+                ]
+        except BaseException:
+            shutil.rmtree(temporary_path, ignore_errors=True)
+            raise
+        if os.path.isdir(dump_path):
+            shutil.rmtree(dump_path)
+        elif os.path.exists(dump_path):
+            os.remove(dump_path)
+        os.replace(temporary_path, dump_path)
+        return reports
+
+    def __dump_to_archive(
+            self,
+            configuration: MongoConfiguration,
+            archive_path: str,
+            collection_name: Optional[str],
+            options: MongoDumpOptions,
+            compression_executor: ThreadPoolExecutor) -> List[CollectionDumpReport]:
+        """
+        Dumps one collection, or the whole database if no collection is given, to an archive that
+        is compressed as the options ask on several threads, instead of the single compression
+        stream of mongodump --gzip.
+        """
+        if self.mongo_engine == MONGO_ENGINE_NATIVE:
+            database = self.__get_client(configuration)[configuration.database_name]
+            collection_names = [collection_name] if collection_name else None
+            parallel_collections = options.parallel_collections or DEFAULT_PARALLEL_COLLECTIONS
+            with open(archive_path, 'wb') as archive:
+                with compressed_dump_stream(archive, options, compression_executor) as stream:
+                    return self.native_engine.dump_database(database, stream, collection_names, parallel_collections)
+        mongo_dump_command = [get_mongo_executable_path(MONGO_DUMP_EXECUTABLE_NAME)]
+        mongo_dump_command.extend(self.__get_mongo_connection_arguments(configuration))
+        if collection_name:
+            mongo_dump_command.append('--collection=' + collection_name)
+        elif options.parallel_collections:
+            mongo_dump_command.append(f'--numParallelCollections={options.parallel_collections}')
+        mongo_dump_command.append('--archive')
+        with open(archive_path, 'wb') as archive:
+            try:
+                reports, output = self.process_facade.run_process_with_output(
+                    mongo_dump_command,
+                    lambda stream: write_dump_archive(stream, archive, options, compression_executor))
+            except ProcessError as e:
+                raise MigrationError(f'Mongo failed to dump {archive_path}: {e.error}') from e
         self.__check_mongo_output_for_errors(output)
+        return reports
 
     def restore_database_from_directory(
             self,
             configuration: MongoConfiguration,
             directory: str,
             dump_name: str,
+            transforms: Optional[Dict[str, DocumentTransform]] = None,
+            options: Optional[MongoRestoreOptions] = None,
     ) -> None:
         """
         Restore the data in mongoDB from the given service.
@@ -68,22 +523,224 @@ class MongoFacade:
         :param configuration: The mongo configuration for a service.
         :param directory: The directory to restore the service from.
         :param dump_name: The name of the file to restore from.
+        :param transforms: Transforms to apply to the documents of some collections, by collection name.
+                           These collections are read from the archive and inserted after being
+                           transformed, so each of their documents is written exactly once.
+        :param options: How to restore the database, or None for the defaults.
         """
+        options = options or MongoRestoreOptions()
         dump_path = os.path.join(directory, dump_name)
         self.validate_can_restore_database_from_directory(directory, dump_name)
-        mongo_restore_command = [MONGO_RESTORE_EXECUTABLE_PATH]
+        transforms = transforms or {}
+        if os.path.isdir(dump_path):
+            archive_paths = [
+                os.path.join(dump_path, name)
+                for name in sorted(os.listdir(dump_path))
+                if name.endswith(COLLECTION_ARCHIVE_SUFFIX)
+            ]
+        else:
+            archive_paths = [dump_path]
+        # Each archive is checked on its own, since a capture can mix archives written by both engines.
+        archive_options = {
+            archive_path: self.__get_archive_restore_options(archive_path, options)
+            for archive_path in archive_paths
+        }
+        start_time = time.perf_counter()
+        if os.path.isdir(dump_path):
+            self.__restore_collection_archives(configuration, archive_options, transforms, options)
+        else:
+            self.__restore_archive(configuration, dump_path, list(transforms), archive_options[dump_path])
+            if transforms:
+                self.__restore_transformed_collections(
+                    configuration, dump_path, transforms, archive_options[dump_path])
+        seconds = max(time.perf_counter() - start_time, 1e-9)
+        archive_megabytes = sum(os.path.getsize(path) for path in archive_paths) / MEGABYTE
+        log = logging.getLogger(MongoFacade.__name__)
+        log.info(f'Restored the documents of {configuration.database_name} from {archive_megabytes:.1f} MiB of '
+                 f'archives in {seconds:.1f} s ({archive_megabytes / seconds:.1f} MiB/s)')
+        deferred_archive_paths = [
+            archive_path
+            for archive_path in archive_paths
+            if archive_options[archive_path].defer_index_builds
+        ]
+        if deferred_archive_paths:
+            self.__build_captured_indexes(configuration, deferred_archive_paths, options)
+        self.__flush_restored_documents_to_journal(configuration)
+
+    def __flush_restored_documents_to_journal(self, configuration: MongoConfiguration) -> None:
+        """
+        Makes the restored documents durable when the mongo profile acknowledged them before they
+        reached the journal, so stopping mongod after the restore can not lose them. The journal is
+        written in order, so a single journaled write commits every write before it.
+        """
+        if get_write_concern_for_profile(self.mongo_profile) is None:
+            return
+        database = self.__get_client(configuration).get_database(
+            configuration.database_name,
+            write_concern=WriteConcern(j=True))
+        collection = database[JOURNAL_FLUSH_COLLECTION_NAME]
+        collection.insert_one({})
+        collection.drop()
+        log = logging.getLogger(MongoFacade.__name__)
+        log.info(f'Flushed the restored documents of {configuration.database_name} to the journal.')
+
+    def __get_archive_restore_options(self, archive_path: str, options: MongoRestoreOptions) -> MongoRestoreOptions:
+        """
+        Gets the options to restore one archive with. The native engine inserts the documents
+        without their indexes, so their index builds are always deferred.
+        """
+        if options.defer_index_builds or not self.__is_native_restore(archive_path):
+            return options
+        archive_options = copy.copy(options)
+        archive_options.defer_index_builds = True
+        return archive_options
+
+    def __restore_collection_archives(
+            self,
+            configuration: MongoConfiguration,
+            archive_options: Dict[str, MongoRestoreOptions],
+            transforms: Dict[str, DocumentTransform],
+            options: MongoRestoreOptions) -> None:
+        """
+        Restores a database captured with an archive for each collection, several collections at a time.
+        """
+        def restore_collection(archive_path: str) -> None:
+            collection_name = os.path.basename(archive_path)[:-len(COLLECTION_ARCHIVE_SUFFIX)]
+            restore_options = archive_options[archive_path]
+            if collection_name in transforms:
+                self.__restore_transformed_collections(configuration, archive_path, transforms, restore_options)
+            else:
+                self.__restore_archive(configuration, archive_path, [], restore_options)
+
+        parallel_collections = options.parallel_collections or DEFAULT_PARALLEL_COLLECTIONS
+        with ThreadPoolExecutor(max_workers=parallel_collections) as executor:
+            # Consuming the results raises the first error any of the restores hit.
+            for _ in executor.map(restore_collection, archive_options):
+                pass
+
+    def __restore_archive(
+            self,
+            configuration: MongoConfiguration,
+            archive_path: str,
+            excluded_collection_names: List[str],
+            options: MongoRestoreOptions) -> None:
+        if self.__is_native_restore(archive_path):
+            self.start_mongo(configuration)
+            database = self.__get_client(configuration).get_database(
+                configuration.database_name,
+                write_concern=get_write_concern_for_profile(self.mongo_profile))
+            insertion_workers = options.insertion_workers_per_collection or DEFAULT_NATIVE_INSERTION_WORKERS
+            with open_dump_archive(archive_path) as archive:
+                self.native_engine.restore_database(database, archive, excluded_collection_names, insertion_workers)
+            return
+        mongo_restore_command = [get_mongo_executable_path(MONGO_RESTORE_EXECUTABLE_NAME)]
         connection_arguments = self.__get_mongo_connection_arguments(configuration)
         # We need to provide the db option (even though it's redundant with the uri)
         # because of a bug with mongoDB 4.2
         # https://docs.mongodb.com/v4.2/reference/program/mongorestore/#cmdoption-mongorestore-uri
         connection_arguments.extend(['--db', configuration.database_name])
         mongo_restore_command.extend(connection_arguments)
-        mongo_restore_command.append('--gzip')
-        mongo_restore_command.append('--archive=' + dump_path)
+        if is_gzip_file(archive_path):
+            mongo_restore_command.append('--gzip')
+        mongo_restore_command.append('--archive=' + archive_path)
         mongo_restore_command.append('--drop')
-        output = self.__ensure_mongo_process_is_running_and_execute_command(mongo_restore_command)
+        write_concern = get_write_concern_for_profile(self.mongo_profile)
+        if write_concern is not None:
+            mongo_restore_command.append('--writeConcern=' + json.dumps(write_concern.document))
+        if options.insertion_workers_per_collection:
+            mongo_restore_command.append(
+                f'--numInsertionWorkersPerCollection={options.insertion_workers_per_collection}')
+        if options.parallel_collections:
+            mongo_restore_command.append(f'--numParallelCollections={options.parallel_collections}')
+        if options.defer_index_builds:
+            mongo_restore_command.append('--noIndexRestore')
+        for collection_name in excluded_collection_names:
+            mongo_restore_command.append('--nsExclude=*.' + collection_name)
+        output = self.__ensure_mongo_process_is_running_and_execute_command(configuration, mongo_restore_command)
         self.__check_mongo_output_for_errors(output)
 
+    def __is_native_restore(self, archive_path: str) -> bool:
+        """
+        Checks whether an archive is restored with the native engine, which is used when it is selected
+        and for archives it wrote, since mongorestore can not read them.
+        """
+        return self.mongo_engine == MONGO_ENGINE_NATIVE or is_native_dump_archive(archive_path)
+
+    def __restore_transformed_collections(
+            self,
+            configuration: MongoConfiguration,
+            dump_path: str,
+            transforms: Dict[str, DocumentTransform],
+            options: MongoRestoreOptions) -> None:
+        with open_dump_archive(dump_path) as archive:
+            reader = MongoArchiveReader(archive)  # type: ignore
+            restores: Dict[str, _TransformedCollectionRestore] = {}
+            for archive_collection in reader.read_collections():
+                transform = transforms.get(archive_collection.collection_name)
+                if transform is not None:
+                    collection = self.__create_collection(configuration, archive_collection)
+                    write_concern = get_write_concern_for_profile(self.mongo_profile)
+                    if write_concern is not None:
+                        collection = collection.with_options(write_concern=write_concern)
+                    restores[archive_collection.namespace] = _TransformedCollectionRestore(
+                        collection,
+                        archive_collection,
+                        transform,
+                        build_indexes=not options.defer_index_builds)
+            for namespace, document in reader.read_documents():
+                restore = restores.get(namespace)
+                if restore is not None:
+                    restore.add(document)
+        for restore in restores.values():
+            restore.finish()
+
+    def __build_captured_indexes(
+            self,
+            configuration: MongoConfiguration,
+            archive_paths: List[str],
+            options: MongoRestoreOptions) -> None:
+        """
+        Builds the indexes recorded in the archives after their documents were restored without them.
+        The indexes of a collection are created together, so the server builds them in a single scan
+        of the collection, and several collections are indexed at the same time.
+        """
+        archive_collections: List[ArchiveCollection] = []
+        for archive_path in archive_paths:
+            with open_dump_archive(archive_path) as archive:
+                archive_collections.extend(MongoArchiveReader(archive).read_collections())  # type: ignore
+        index_builds = [
+            (archive_collection, _get_index_models(archive_collection))
+            for archive_collection in archive_collections
+        ]
+        index_builds = [(archive_collection, indexes) for archive_collection, indexes in index_builds if indexes]
+
+        def build_indexes(archive_collection: ArchiveCollection, indexes: List[IndexModel]) -> None:
+            self.get_collection(configuration, archive_collection.collection_name).create_indexes(indexes)
+
+        start_time = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options.index_build_workers) as executor:
+            futures = [executor.submit(build_indexes, *index_build) for index_build in index_builds]
+            for future in as_completed(futures):
+                future.result()
+        seconds = max(time.perf_counter() - start_time, 1e-9)
+        index_count = sum(len(indexes) for _, indexes in index_builds)
+        log = logging.getLogger(MongoFacade.__name__)
+        log.info(f'Built {index_count} indexes on {len(index_builds)} collections of {configuration.database_name} '
+                 f'in {seconds:.1f} s ({index_count / seconds:.1f} indexes/s)')
+
+    def __create_collection(
+            self,
+            configuration: MongoConfiguration,
+            archive_collection: ArchiveCollection) -> Collection:
+        collection = self.get_collection(configuration, archive_collection.collection_name)
+        collection.drop()
+        if archive_collection.options:
+            collection.database.create_collection(
+                collection.name,
+                codec_options=collection.codec_options,
+                **archive_collection.options)
+        return collection
+
     @staticmethod
     def validate_can_restore_database_from_directory(
             directory: str,
@@ -100,14 +757,18 @@ class MongoFacade:
         if not os.path.exists(dump_path):
             raise FileNotFoundError('Could not find the captured service at ' + dump_path)
 
-    def __ensure_mongo_process_is_running_and_execute_command(self, arguments: List[str]) -> str:
+    def __ensure_mongo_process_is_running_and_execute_command(
+            self,
+            configuration: MongoConfiguration,
+            arguments: List[str]) -> str:
         """
         Ensures the mongo service is running and executed the given command in a subprocess.
 
+        :param configuration: The mongo configuration for a service.
         :param arguments: The list of arguments to execute in a subprocess.
         """
 
-        self.__start_mongo()
+        self.start_mongo(configuration)
         try:
             return self.process_facade.run_process(arguments)
         except ProcessError as e:
@@ -115,24 +776,33 @@ class MongoFacade:
             log.error(e.error)
         return ''
 
-    def __start_mongo(self) -> None:
+    def start_mongo(self, configuration: MongoConfiguration) -> None:
         """
-        Begins the mongo DB subprocess on this computer.
-        :return: The started subprocess handling mongo DB.
+        Makes sure a mongo DB server is answering, starting one on this computer and waiting
+        until it accepts connections if no server is already running. A started server uses the
+        production configuration with the overrides of the mongo profile. Once it is stopped, the
+        SystemLink services start the server with the production configuration again. A server
+        that is already running keeps its own settings.
+
+        :param configuration: The mongo configuration for a service.
         """
-        if not self.__mongo_process_handle:
-            arguments = [MONGO_EXECUTABLE_PATH, '--config', MONGO_CONFIGURATION_PATH]
-            self.__mongo_process_handle = self.process_facade.run_background_process(arguments)
+        def get_arguments() -> List[str]:
+            arguments = [get_mongo_executable_path(MONGO_EXECUTABLE_NAME), '--config', get_mongo_configuration_path()]
+            arguments.extend(get_mongod_profile_arguments(self.mongo_profile))
+            return arguments
 
-    def __stop_mongo(self) -> None:
+        if self.mongo_process_manager.ensure_running(configuration, get_arguments) \
+                and self.mongo_profile != MONGO_PROFILE_PRODUCTION:
+            log = logging.getLogger(MongoFacade.__name__)
+            log.warning(
+                f'mongod was already running, so it is not restarted with the settings of the '
+                f'{self.mongo_profile} mongo profile. Stop mongod before restoring to use them.')
+
+    def stop_mongo(self) -> None:
         """
-        Stops the mongo process.
-        :return: None.
+        Stops the mongo DB server if start_mongo started it. A server that was already running is left running.
         """
-        if self.__mongo_process_handle:
-            actual_handle: BackgroundProcess = self.__mongo_process_handle
-            self.__mongo_process_handle = None
-            actual_handle.stop()
+        self.mongo_process_manager.stop()
 
     @staticmethod
     def __get_mongo_connection_arguments(mongo_configuration: MongoConfiguration) -> List[str]:
@@ -160,31 +830,313 @@ class MongoFacade:
                 log = logging.getLogger('MongoProcess')
                 log.info(f'{line}')
 
+    def get_collection(self, configuration: MongoConfiguration, collection_name: str) -> Collection:
+        """
+        Gets a collection from the database of the given service. Connections are shared by every
+        caller using the same configuration until close_connections is called.
+
+        :param configuration: The mongo configuration for a service.
+        :param collection_name: The name of the collection to get.
+        :return: The collection.
+        """
+        self.start_mongo(configuration)
+        client = self.__get_client(configuration)
+        codec = bson.codec_options.CodecOptions(uuid_representation=bson.binary.UUID_SUBTYPE)
+        database = client.get_database(name=configuration.database_name, codec_options=codec)
+        return database[collection_name]
+
+    def get_server_version(self, configuration: MongoConfiguration) -> Tuple[int, ...]:
+        """
+        Gets the version of the mongo server used by the given service.
+
+        :param configuration: The mongo configuration for a service.
+        :return: The server version as a tuple of integers, such as (4, 2, 8).
+        """
+        self.start_mongo(configuration)
+        client = self.__get_client(configuration)
+        return tuple(client.server_info()['versionArray'][:3])
+
+    def close_connections(self) -> None:
+        """
+        Closes every shared client and the connections in their pools.
+        """
+        with self.__clients_lock:
+            clients = list(self.__clients.values())
+            self.__clients.clear()
+        for client in clients:
+            client.close()
+
+    def __get_client(self, configuration: MongoConfiguration) -> MongoClient:
+        with self.__clients_lock:
+            client = self.__clients.get(configuration)
+            if client is None:
+                client = MongoClient(
+                    configuration.connection_string,
+                    maxPoolSize=self.max_pool_size,
+                    maxIdleTimeMS=self.max_idle_time_milliseconds)
+                self.__clients[configuration] = client
+            return client
+
     def conditionally_update_documents_in_collection(
             self,
             configuration: MongoConfiguration,
             collection_name: str,
             predicate: Callable[[Any], bool],
-            update_function: Callable[[Any], Any]):
-        self.__start_mongo()
-        client = MongoClient(configuration.connection_string)
-        codec = bson.codec_options.CodecOptions(uuid_representation=bson.binary.UUID_SUBTYPE)
-        database = client.get_database(name=configuration.database_name, codec_options=codec)
-        collection = database[collection_name]
-        for document in collection.find():
-            if predicate(document):
-                document = update_function(document)
-                collection.replace_one({'_id': document['_id']}, document)
+            update_function: Callable[[Any], Any],
+            batch_size: int = DEFAULT_UPDATE_BATCH_SIZE,
+            query_filter: Optional[Dict[str, Any]] = None,
+            projection: Optional[Dict[str, Any]] = None,
+            cursor_batch_size: int = DEFAULT_CURSOR_BATCH_SIZE,
+            no_cursor_timeout: bool = False,
+            partitions: int = 1) -> DocumentUpdateSummary:
+        """
+        Updates every document in a collection that matches a predicate. Changes are sent to the
+        database in unordered batches.
+
+        :param configuration: The mongo configuration for a service.
+        :param collection_name: The name of the collection to update.
+        :param predicate: Returns True for the documents that should be updated.
+        :param update_function: Returns the updated version of the given document.
+        :param batch_size: The maximum number of changes to send to the database at once.
+        :param query_filter: A filter the database applies before documents are sent to the predicate.
+        :param projection: The fields of each document to read. When given, documents are updated
+                           by setting the changed fields instead of replacing the whole document.
+        :param cursor_batch_size: The number of documents to read from the database at once.
+        :param no_cursor_timeout: Whether to keep the cursor open on the server for long scans.
+        :param partitions: The number of _id ranges to split the collection into. Each range is
+                           scanned and updated on its own thread, so the predicate and update
+                           function must be safe to call from several threads at once.
+        :return: A summary of the documents that were updated.
+        """
+        collection = self.get_collection(configuration, collection_name)
+        partition_filters = self.__get_partition_filters(collection, query_filter or {}, partitions)
+
+        def update_partition(partition_filter: Dict[str, Any]) -> DocumentUpdateSummary:
+            cursor = collection.find(
+                partition_filter,
+                projection,
+                batch_size=cursor_batch_size,
+                no_cursor_timeout=no_cursor_timeout)
+            try:
+                documents = (document for document in cursor if predicate(document))
+                is_partial_document = projection is not None
+                return self.__update_documents(collection, documents, update_function, batch_size, is_partial_document)
+            finally:
+                cursor.close()
+
+        if len(partition_filters) == 1:
+            return update_partition(partition_filters[0])
+        return self.__update_partitions_in_parallel(collection_name, partition_filters, update_partition)
 
     def update_documents_in_collection(
             self,
             configuration: MongoConfiguration,
             collection_name: str,
-            update_function: Callable[[Any], Any]):
-        client = MongoClient(configuration.connection_string)
-        codec = bson.codec_options.CodecOptions(uuid_representation=bson.binary.UUID_SUBTYPE)
-        database = client.get_database(name=configuration.database_name, codec_options=codec)
-        collection = database[collection_name]
-        for document in collection.find():
-            document = update_function(document)
-            collection.replace_one({'_id': document['_id']}, document)
+            update_function: Callable[[Any], Any],
+            batch_size: int = DEFAULT_UPDATE_BATCH_SIZE,
+            query_filter: Optional[Dict[str, Any]] = None,
+            projection: Optional[Dict[str, Any]] = None,
+            cursor_batch_size: int = DEFAULT_CURSOR_BATCH_SIZE,
+            no_cursor_timeout: bool = False,
+            partitions: int = 1) -> DocumentUpdateSummary:
+        """
+        Updates every document in a collection. Changes are sent to the database in unordered batches.
+
+        :param configuration: The mongo configuration for a service.
+        :param collection_name: The name of the collection to update.
+        :param update_function: Returns the updated version of the given document.
+        :param batch_size: The maximum number of changes to send to the database at once.
+        :param query_filter: A filter selecting the documents to update.
+        :param projection: The fields of each document to read. When given, documents are updated
+                           by setting the changed fields instead of replacing the whole document.
+        :param cursor_batch_size: The number of documents to read from the database at once.
+        :param no_cursor_timeout: Whether to keep the cursor open on the server for long scans.
+        :param partitions: The number of _id ranges to split the collection into and update in parallel.
+        :return: A summary of the documents that were updated.
+        """
+        return self.conditionally_update_documents_in_collection(
+            configuration,
+            collection_name,
+            lambda document: True,
+            update_function,
+            batch_size,
+            query_filter,
+            projection,
+            cursor_batch_size,
+            no_cursor_timeout,
+            partitions)
+
+    def update_documents_in_collection_on_server(
+            self,
+            configuration: MongoConfiguration,
+            collection_name: str,
+            query_filter: Dict[str, Any],
+            pipeline: List[Dict[str, Any]]) -> DocumentUpdateSummary:
+        """
+        Updates every document in a collection that matches a filter using an aggregation pipeline
+        that runs on the database server, so no documents are transferred. Requires a server version
+        of at least PIPELINE_UPDATE_MINIMUM_SERVER_VERSION.
+
+        :param configuration: The mongo configuration for a service.
+        :param collection_name: The name of the collection to update.
+        :param query_filter: The filter selecting the documents to update.
+        :param pipeline: The aggregation pipeline stages computing the updated documents.
+        :return: A summary of the documents that were updated.
+        """
+        collection = self.get_collection(configuration, collection_name)
+        result = collection.update_many(query_filter, pipeline)
+        return DocumentUpdateSummary(result.matched_count, result.modified_count)
+
+    def transform_documents_in_collection(
+            self,
+            configuration: MongoConfiguration,
+            collection_name: str,
+            transform: DocumentTransform,
+            partitions: int = 1) -> DocumentUpdateSummary:
+        """
+        Applies every step of a transform to the documents of a collection in a single pass. When the
+        server supports the pipeline stages of every step the transform runs as one pipeline update on
+        the server, otherwise the matching documents are read once and written at most once each.
+
+        :param configuration: The mongo configuration for a service.
+        :param collection_name: The name of the collection to update.
+        :param transform: The steps to apply.
+        :param partitions: The number of _id ranges to update in parallel when the transform runs in Python.
+        :return: A summary of the documents that were updated.
+        """
+        if transform.is_empty:
+            return DocumentUpdateSummary()
+        if transform.can_run_on_server(self.get_server_version(configuration)):
+            return self.update_documents_in_collection_on_server(
+                configuration,
+                collection_name,
+                transform.query_filter,
+                transform.pipeline)
+        return self.conditionally_update_documents_in_collection(
+            configuration,
+            collection_name,
+            transform.predicate,
+            transform.update_function,
+            query_filter=transform.query_filter,
+            projection=transform.projection,
+            no_cursor_timeout=True,
+            partitions=partitions)
+
+    @staticmethod
+    def __get_partition_filters(
+            collection: Collection,
+            query_filter: Dict[str, Any],
+            partitions: int) -> List[Dict[str, Any]]:
+        if partitions <= 1:
+            return [query_filter]
+        sample = [{'$sample': {'size': partitions * SAMPLED_DOCUMENTS_PER_PARTITION}}, {'$project': {'_id': 1}}]
+        sampled_ids = [document['_id'] for document in collection.aggregate(sample)]
+        if not sampled_ids or len({type(sampled_id) for sampled_id in sampled_ids}) > 1:
+            # Mongo orders values of different types by type first, so ranges of mixed ids can not be split evenly.
+            return [query_filter]
+        sampled_ids.sort()
+        split_points: List[Any] = []
+        for partition in range(1, partitions):
+            split_point = sampled_ids[partition * len(sampled_ids) // partitions]
+            if not split_points or split_points[-1] != split_point:
+                split_points.append(split_point)
+        if not split_points:
+            return [query_filter]
+        # The first range uses $not so that documents with an _id of another type than the sample are still updated.
+        id_ranges: List[Dict[str, Any]] = [{'$not': {'$gte': split_points[0]}}]
+        id_ranges += [{'$gte': lower, '$lt': upper} for lower, upper in zip(split_points, split_points[1:])]
+        id_ranges.append({'$gte': split_points[-1]})
+        return [
+            {'$and': [query_filter, {'_id': id_range}]} if query_filter else {'_id': id_range}
+            for id_range in id_ranges
+        ]
+
+    @staticmethod
+    def __update_partitions_in_parallel(
+            collection_name: str,
+            partition_filters: List[Dict[str, Any]],
+            update_partition: Callable[[Dict[str, Any]], DocumentUpdateSummary]) -> DocumentUpdateSummary:
+        log = logging.getLogger(MongoFacade.__name__)
+        partition_count = len(partition_filters)
+        log.info(f'Updating {collection_name} in {partition_count} partitions.')
+        summary = DocumentUpdateSummary()
+        errors: List[BaseException] = []
+        with ThreadPoolExecutor(max_workers=partition_count) as executor:
+            futures = [executor.submit(update_partition, partition_filter) for partition_filter in partition_filters]
+            for finished_count, future in enumerate(as_completed(futures), 1):
+                error = future.exception()
+                if error is not None:
+                    errors.append(error)
+                    continue
+                summary += future.result()
+                log.info(f'Updated {finished_count} of {partition_count} partitions of {collection_name}: {summary}')
+        if errors:
+            raise errors[0]
+        return summary
+
+    def __update_documents(
+            self,
+            collection: Collection,
+            documents: Iterable[Dict[str, Any]],
+            update_function: Callable[[Any], Any],
+            batch_size: int,
+            is_partial_document: bool) -> DocumentUpdateSummary:
+        summary = DocumentUpdateSummary()
+        operations: List[Union[UpdateOne, ReplaceOne]] = []
+        for document in documents:
+            original_document = copy.deepcopy(document)
+            operation = self.__create_update_operation(
+                original_document,
+                update_function(document),
+                is_partial_document)
+            if operation is None:
+                continue
+            operations.append(operation)
+            if len(operations) >= batch_size:
+                summary += self.__write_operations(collection, operations)
+                operations = []
+        if operations:
+            summary += self.__write_operations(collection, operations)
+        return summary
+
+    @staticmethod
+    def __create_update_operation(
+            original_document: Dict[str, Any],
+            updated_document: Dict[str, Any],
+            is_partial_document: bool) -> Optional[Union[UpdateOne, ReplaceOne]]:
+        changed_fields = [
+            field
+            for field, value in updated_document.items()
+            if field not in original_document or original_document[field] != value
+        ]
+        removed_fields = [field for field in original_document if field not in updated_document]
+        document_filter = {'_id': original_document['_id']}
+        if not changed_fields and not removed_fields:
+            return None
+        if is_partial_document or (len(changed_fields) == 1 and not removed_fields):
+            # A partial document is missing the fields outside the projection, so replacing
+            # the stored document with it would drop them.
+            update: Dict[str, Any] = {}
+            if changed_fields:
+                update['$set'] = {field: updated_document[field] for field in changed_fields}
+            if removed_fields:
+                update['$unset'] = {field: '' for field in removed_fields}
+            return UpdateOne(document_filter, update)
+        return ReplaceOne(document_filter, updated_document)
+
+    @staticmethod
+    def __write_operations(
+            collection: Collection,
+            operations: List[Union[UpdateOne, ReplaceOne]]) -> DocumentUpdateSummary:
+        try:
+            result = collection.bulk_write(operations, ordered=False)
+            return DocumentUpdateSummary(result.matched_count, result.modified_count)
+        except BulkWriteError as e:
+            write_errors = e.details.get('writeErrors', [])
+            log = logging.getLogger(MongoFacade.__name__)
+            for write_error in write_errors:
+                log.error(f'Failed to update document: {write_error.get("errmsg")}')
+            return DocumentUpdateSummary(
+                e.details.get('nMatched', 0),
+                e.details.get('nModified', 0),
+                len(write_errors))
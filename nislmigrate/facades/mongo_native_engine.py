@@ -0,0 +1,230 @@
+"""Dump and restore mongo databases with pymongo instead of the mongo tools."""
+
+import logging
+import os
+import queue
+import struct
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, BinaryIO, Dict, List, Optional, Tuple
+
+from bson.raw_bson import RawBSONDocument
+from pymongo.collection import Collection
+from pymongo.database import Database
+from pymongo.errors import BulkWriteError
+
+from nislmigrate.facades.mongo_archive import MongoArchiveReader, MongoArchiveWriter
+from nislmigrate.facades.mongo_dump import CollectionDumpReport
+from nislmigrate.logs.migration_error import MigrationError
+
+DEFAULT_NATIVE_DUMP_BATCH_SIZE: int = 1000
+DEFAULT_NATIVE_PARALLEL_COLLECTIONS: int = 4
+DEFAULT_NATIVE_INSERTION_WORKERS: int = min(8, os.cpu_count() or 1)
+DEFAULT_NATIVE_INSERT_BATCH_SIZE: int = 1000
+DEFAULT_NATIVE_INSERT_BATCH_BYTES: int = 8 * 1024 * 1024
+PENDING_BATCHES_PER_WORKER: int = 2
+_QUEUE_POLL_SECONDS: float = 0.1
+_INT32 = struct.Struct('<i')
+
+
+class NativeMongoEngine:
+    """
+    Streams the documents of a database between cursors and an archive, so a database can be
+    captured and restored without mongodump and mongorestore, on any computer that can reach a mongod.
+    The archives have the layout of mongodump archives, with the raw BSON of the documents copied
+    without decoding it.
+    """
+    def __init__(
+            self,
+            dump_batch_size: int = DEFAULT_NATIVE_DUMP_BATCH_SIZE,
+            insert_batch_size: int = DEFAULT_NATIVE_INSERT_BATCH_SIZE,
+            insert_batch_bytes: int = DEFAULT_NATIVE_INSERT_BATCH_BYTES):
+        """
+        Creates a new instance of NativeMongoEngine.
+
+        :param dump_batch_size: The number of documents to read from the server at a time.
+        :param insert_batch_size: The maximum number of documents to insert at a time.
+        :param insert_batch_bytes: The maximum size of the documents to insert at a time.
+        """
+        self.dump_batch_size: int = dump_batch_size
+        self.insert_batch_size: int = insert_batch_size
+        self.insert_batch_bytes: int = insert_batch_bytes
+
+    def dump_database(
+            self,
+            database: Database,
+            stream: BinaryIO,
+            collection_names: Optional[List[str]] = None,
+            parallel_collections: int = DEFAULT_NATIVE_PARALLEL_COLLECTIONS) -> List[CollectionDumpReport]:
+        """
+        Writes the collections of a database to an archive. Several collections are read at the same
+        time and their batches of documents are interleaved in the archive. Views and system
+        collections are skipped with a warning.
+
+        :param database: The database to dump.
+        :param stream: The stream to write the archive to.
+        :param collection_names: The collections to dump, or None to dump every collection.
+        :param parallel_collections: The number of collections to read at the same time.
+        :return: The number of documents and bytes dumped from each collection and how long it took.
+        """
+        collections = self.__get_collection_metadata(database, collection_names)
+        writer = MongoArchiveWriter(stream)
+        writer.write_collections(database.name, collections)
+        reports = {name: CollectionDumpReport(f'{database.name}.{name}') for name, _ in collections}
+        batches: queue.Queue = queue.Queue(maxsize=2 * max(1, parallel_collections))
+        cancelled = threading.Event()
+
+        def read_collection(collection_name: str) -> None:
+            try:
+                for batch in database[collection_name].find_raw_batches(batch_size=self.dump_batch_size):
+                    if not self.__put(batches, cancelled, (collection_name, batch)):
+                        return
+                self.__put(batches, cancelled, (collection_name, None))
+            except BaseException as e:
+                self.__put(batches, cancelled, (collection_name, e))
+
+        with ThreadPoolExecutor(max_workers=max(1, parallel_collections)) as executor:
+            try:
+                start_times: Dict[str, float] = {}
+                for collection_name, _ in collections:
+                    executor.submit(read_collection, collection_name)
+                remaining = len(collections)
+                while remaining:
+                    collection_name, batch = batches.get()
+                    report = reports[collection_name]
+                    start_time = start_times.setdefault(collection_name, time.perf_counter())
+                    if isinstance(batch, BaseException):
+                        raise MigrationError(f'Failed to dump {report.namespace}: {batch}') from batch
+                    if batch is None:
+                        writer.write_end_of_collection(database.name, collection_name)
+                        remaining -= 1
+                    elif batch:
+                        writer.write_documents(database.name, collection_name, batch)
+                        report.documents += _count_documents(batch)
+                        report.bytes_dumped += len(batch)
+                    report.seconds = time.perf_counter() - start_time
+            finally:
+                cancelled.set()
+        return list(reports.values())
+
+    def restore_database(
+            self,
+            database: Database,
+            stream: BinaryIO,
+            excluded_collection_names: Optional[List[str]] = None,
+            insertion_workers: int = DEFAULT_NATIVE_INSERTION_WORKERS) -> int:
+        """
+        Restores the collections in an archive, replacing any existing collection with the same name.
+        Documents are inserted in batches on several threads. At most a few batches per thread are
+        held in memory, so the memory used does not grow with the size of the archive. Indexes are
+        not built, so they can be built together once every document is inserted.
+
+        :param database: The database to restore to.
+        :param stream: The uncompressed archive.
+        :param excluded_collection_names: The collections in the archive not to restore.
+        :param insertion_workers: The number of batches to insert at the same time.
+        :return: The number of documents the server confirmed it inserted.
+        """
+        excluded_collection_names = excluded_collection_names or []
+        reader = MongoArchiveReader(stream)  # type: ignore
+        collections: Dict[str, Collection] = {}
+        for archive_collection in reader.read_collections():
+            if archive_collection.collection_name not in excluded_collection_names:
+                database.drop_collection(archive_collection.collection_name)
+                if archive_collection.options:
+                    database.create_collection(archive_collection.collection_name, **archive_collection.options)
+                collections[archive_collection.namespace] = database[archive_collection.collection_name]
+
+        workers = max(1, insertion_workers)
+        pending_batches = threading.BoundedSemaphore(workers * PENDING_BATCHES_PER_WORKER)
+        errors: List[BaseException] = []
+        batches: Dict[str, Tuple[List[RawBSONDocument], int]] = {}
+        inserted_counts: List[int] = []
+
+        def on_batch_inserted(future: Future) -> None:
+            pending_batches.release()
+            if future.exception() is not None:
+                errors.append(future.exception())  # type: ignore
+            else:
+                inserted_counts.append(future.result())
+
+        def submit_batch(collection: Collection, documents: List[RawBSONDocument]) -> None:
+            pending_batches.acquire()
+            if errors:
+                pending_batches.release()
+                raise errors[0]
+            executor.submit(_insert_documents, collection, documents).add_done_callback(on_batch_inserted)
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            for namespace, document in reader.read_documents():
+                collection = collections.get(namespace)
+                if collection is None:
+                    continue
+                documents, size = batches.get(namespace, ([], 0))
+                documents.append(RawBSONDocument(document))
+                size += len(document)
+                if len(documents) >= self.insert_batch_size or size >= self.insert_batch_bytes:
+                    submit_batch(collection, documents)
+                    documents, size = [], 0
+                batches[namespace] = (documents, size)
+            for namespace, (documents, _) in batches.items():
+                if documents:
+                    submit_batch(collections[namespace], documents)
+        if errors:
+            raise errors[0]
+        inserted = sum(inserted_counts)
+        log = logging.getLogger(NativeMongoEngine.__name__)
+        log.info(f'Inserted {inserted} documents into {len(collections)} collections of {database.name}.')
+        return inserted
+
+    @staticmethod
+    def __get_collection_metadata(
+            database: Database,
+            collection_names: Optional[List[str]]) -> List[Tuple[str, Dict[str, Any]]]:
+        collections: List[Tuple[str, Dict[str, Any]]] = []
+        log = logging.getLogger(NativeMongoEngine.__name__)
+        for specification in database.list_collections():
+            name = specification['name']
+            if collection_names is not None and name not in collection_names:
+                continue
+            if specification.get('type', 'collection') != 'collection' or name.startswith('system.'):
+                log.warning(f'Skipped {name} of {database.name}: the native engine does not capture views or '
+                            f'system collections. Capture with --mongo-engine tools to include it.')
+                continue
+            metadata = {
+                'options': specification.get('options', {}),
+                'indexes': [dict(index) for index in database[name].list_indexes()],
+            }
+            collections.append((name, metadata))
+        return sorted(collections, key=lambda collection: collection[0])
+
+    @staticmethod
+    def __put(batches: queue.Queue, cancelled: threading.Event, item: Tuple[str, Any]) -> bool:
+        # The queue is bounded, so a reader waits while the writer is behind, unless the dump failed.
+        while not cancelled.is_set():
+            try:
+                batches.put(item, timeout=_QUEUE_POLL_SECONDS)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+
+def _insert_documents(collection: Collection, documents: List[RawBSONDocument]) -> int:
+    try:
+        return len(collection.insert_many(documents, ordered=False).inserted_ids)
+    except BulkWriteError as e:
+        write_errors = e.details.get('writeErrors', [])
+        raise MigrationError(
+            f'Failed to restore {len(write_errors)} documents to {collection.name}: '
+            f'{write_errors[0].get("errmsg") if write_errors else e}')
+
+
+def _count_documents(documents: bytes) -> int:
+    count = 0
+    offset = 0
+    while offset < len(documents):
+        offset += _INT32.unpack_from(documents, offset)[0]
+        count += 1
+    return count
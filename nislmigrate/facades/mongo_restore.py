@@ -0,0 +1,35 @@
+"""Options for restoring mongo databases from mongodump archives."""
+
+import os
+from typing import Optional
+
+DEFAULT_INDEX_BUILD_WORKERS: int = min(8, os.cpu_count() or 1)
+
+
+class MongoRestoreOptions:
+    """
+    How a migrator wants its database restored.
+    """
+    def __init__(
+            self,
+            insertion_workers_per_collection: Optional[int] = None,
+            parallel_collections: Optional[int] = None,
+            defer_index_builds: bool = False,
+            index_build_workers: int = DEFAULT_INDEX_BUILD_WORKERS):
+        """
+        Creates a new instance of MongoRestoreOptions.
+
+        :param insertion_workers_per_collection: The number of threads mongorestore inserts the
+                                                 documents of each collection with, or None to use
+                                                 the default of mongorestore.
+        :param parallel_collections: The number of collections to restore at the same time, or None
+                                     to use the default of mongorestore.
+        :param defer_index_builds: Whether to restore the documents without their indexes and build
+                                   every captured index once all documents are restored, so the
+                                   indexes are not updated for each inserted document.
+        :param index_build_workers: The number of collections to build deferred indexes on at the same time.
+        """
+        self.insertion_workers_per_collection: Optional[int] = insertion_workers_per_collection
+        self.parallel_collections: Optional[int] = parallel_collections
+        self.defer_index_builds: bool = defer_index_builds
+        self.index_build_workers: int = max(1, index_build_workers)
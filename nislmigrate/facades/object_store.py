@@ -0,0 +1,121 @@
+"""Store file contents once by content hash so captures can share identical files."""
+
+import hashlib
+import os
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Tuple
+
+from nislmigrate.facades.file_copy_engine import FileCopyEngine, LINK_MODE_REFLINK
+from nislmigrate.facades.file_manifest import HASH_CHUNK_SIZE
+from nislmigrate.logs.migration_error import MigrationError
+
+OBJECT_STORE_DIRECTORY_NAME: str = '.objects'
+DEFAULT_OBJECT_HASH_ALGORITHM: str = 'sha256'
+_MISSING_OBJECT_ERROR_FORMAT = 'The object store {directory} is missing the contents of {path}.'
+
+
+def get_default_object_store_directory(migration_directory: str) -> str:
+    """
+    Gets the object store shared by a migration directory and its sibling migration directories,
+    so captures kept side by side, e.g. one directory per date, store identical files only once.
+
+    :param migration_directory: The migration directory being captured to.
+    :return: The object store directory next to the migration directory.
+    """
+    parent_directory = os.path.dirname(os.path.abspath(migration_directory))
+    return os.path.join(parent_directory, OBJECT_STORE_DIRECTORY_NAME)
+
+
+class ObjectStore:
+    """
+    A directory of file contents named by their hash. Objects are never modified once written,
+    so any number of captures can refer to the same object.
+    """
+    def __init__(self, directory: str, hash_algorithm: str = DEFAULT_OBJECT_HASH_ALGORITHM, workers: int = 1):
+        """
+        Creates a new instance of ObjectStore.
+
+        :param directory: The directory holding the objects.
+        :param hash_algorithm: The hashlib algorithm the objects are named by.
+        :param workers: The maximum number of files to add or materialise at the same time.
+        """
+        self.directory: str = directory
+        self.hash_algorithm: str = hash_algorithm
+        self.workers: int = max(1, workers)
+
+    def get_object_path(self, content_hash: str) -> str:
+        """
+        Gets the path of the object with the given hash.
+
+        :param content_hash: The hex digest of the contents.
+        :return: The path the object is stored at.
+        """
+        return os.path.join(self.directory, self.hash_algorithm, content_hash[:2], content_hash)
+
+    def contains(self, content_hash: str) -> bool:
+        return os.path.isfile(self.get_object_path(content_hash))
+
+    def add_files(self, paths: List[str]) -> List[str]:
+        """
+        Adds the contents of files to the store. Contents that are already in the store are
+        hashed but not written again.
+
+        :param paths: The files to add.
+        :return: The hex digest of the contents of each file, in the same order as the paths.
+        """
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            return list(executor.map(self.__add_file, paths))
+
+    def materialize_files(self, files: List[Tuple[str, str, int]]) -> int:
+        """
+        Creates files with the contents of objects in the store, replacing any existing files.
+        Files are cloned from the objects on file systems that support copy-on-write clones, such as
+        ReFS, so they take no extra space until they are changed, and copied otherwise, as on NTFS.
+        They are never hard linked, so changing a restored file can not change the object shared by
+        other captures.
+
+        :param files: The content hash, destination path and modification time in nanoseconds of each file.
+        :return: The number of files created as clones.
+        """
+        copies: List[Tuple[str, str, int]] = []
+        for content_hash, destination, _ in files:
+            object_path = self.get_object_path(content_hash)
+            if not os.path.isfile(object_path):
+                raise MigrationError(_MISSING_OBJECT_ERROR_FORMAT.format(directory=self.directory, path=destination))
+            copies.append((object_path, destination, os.path.getsize(object_path)))
+        summary = FileCopyEngine(self.workers, link_mode=LINK_MODE_REFLINK).copy_files(copies)
+        for _, destination, modified_time in files:
+            os.utime(destination, ns=(modified_time, modified_time))
+        return summary.files_linked
+
+    def __add_file(self, path: str) -> str:
+        content_hash = self.__compute_hash(path)
+        if self.contains(content_hash):
+            return content_hash
+
+        # The file is hashed again while it is copied, so the object always matches its name
+        # even if the file changed after it was first hashed.
+        os.makedirs(self.directory, exist_ok=True)
+        temporary_path = os.path.join(self.directory, f'{uuid.uuid4().hex}.tmp')
+        file_hash = hashlib.new(self.hash_algorithm)
+        try:
+            with open(path, 'rb') as source, open(temporary_path, 'wb') as destination:
+                for chunk in iter(lambda: source.read(HASH_CHUNK_SIZE), b''):
+                    file_hash.update(chunk)
+                    destination.write(chunk)
+            content_hash = file_hash.hexdigest()
+            object_path = self.get_object_path(content_hash)
+            os.makedirs(os.path.dirname(object_path), exist_ok=True)
+            os.replace(temporary_path, object_path)
+        finally:
+            if os.path.exists(temporary_path):
+                os.remove(temporary_path)
+        return content_hash
+
+    def __compute_hash(self, path: str) -> str:
+        file_hash = hashlib.new(self.hash_algorithm)
+        with open(path, 'rb') as file:
+            for chunk in iter(lambda: file.read(HASH_CHUNK_SIZE), b''):
+                file_hash.update(chunk)
+        return file_hash.hexdigest()
@@ -1,6 +1,9 @@
 import os
 import subprocess
-from typing import List
+import threading
+from typing import BinaryIO, Callable, List, Tuple, TypeVar
+
+T = TypeVar('T')
 
 
 class ProcessError(Exception):
@@ -25,6 +28,29 @@ class BackgroundProcess:
     def __del__(self):
         self.stop()
 
+    def is_running(self) -> bool:
+        """
+        Checks whether the background process is still running.
+
+        :return: True if the process has not exited.
+        """
+        return self._process_handle is not None and self._process_handle.poll() is None
+
+    def wait(self, timeout: float) -> bool:
+        """
+        Waits for the background process to exit.
+
+        :param timeout: The maximum number of seconds to wait.
+        :return: True if the process exited.
+        """
+        if not self._process_handle:
+            return True
+        try:
+            self._process_handle.wait(timeout)
+        except subprocess.TimeoutExpired:
+            return False
+        return True
+
     def stop(self):
         """
         Stops the background process if it is running
@@ -52,5 +78,34 @@ class ProcessFacade:
         except subprocess.CalledProcessError as e:
             raise ProcessError(e.stderr) from e
 
+    def run_process_with_output(self, arguments: List[str], read_output: Callable[[BinaryIO], T]) -> Tuple[T, str]:
+        """
+        Runs a command that writes data to its standard output, handing the output to a function
+        while the command runs instead of collecting it in memory.
+
+        :param arguments: The name of the process to run and the arguments to pass.
+        :param read_output: Reads the standard output of the process.
+        :return: What read_output returned and the text the process wrote to its standard error.
+        :raises:
+            ProcessError if the process returns an error.
+        """
+        process = subprocess.Popen(arguments, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        errors: List[bytes] = []
+        # The standard error is read on another thread so the process never blocks on a full pipe.
+        error_reader = threading.Thread(target=lambda: errors.append(process.stderr.read()))  # type: ignore
+        error_reader.start()
+        try:
+            result = read_output(process.stdout)  # type: ignore
+        except BaseException:
+            process.kill()
+            raise
+        finally:
+            process.wait()
+            error_reader.join()
+        error_output = b''.join(errors).decode('utf-8', errors='replace')
+        if process.returncode:
+            raise ProcessError(error_output)
+        return result, error_output
+
     def run_background_process(self, arguments: List[str]) -> BackgroundProcess:
         return BackgroundProcess(arguments)
@@ -3,9 +3,11 @@ import os
 
 from nislmigrate.argument_handler import ArgumentHandler, MIGRATION_OPERATION_NOT_PROVIDED_ERROR_TEXT
 from nislmigrate.facades.facade_factory import FacadeFactory
+from nislmigrate.facades.object_store import get_default_object_store_directory
 from nislmigrate.facades.ni_web_server_manager_facade import NiWebServerManagerFacade
 from nislmigrate.logs.migration_error import MigrationError
 from nislmigrate.migration_action import MigrationAction
+from nislmigrate.migration_scheduler import MigrationScheduler
 from nislmigrate.extensibility.migrator_plugin import MigratorPlugin
 from nislmigrate.facades.system_link_service_manager_facade import SystemLinkServiceManagerFacade
 from nislmigrate.utility.permission_checker import PermissionChecker
@@ -28,7 +30,9 @@ class MigrationFacilitator:
             raise MigrationError(MIGRATION_OPERATION_NOT_PROVIDED_ERROR_TEXT)
         self._migrators = argument_handler.get_list_of_services_to_capture_or_restore()
         self._migration_directory = argument_handler.get_migration_directory()
+        self._scheduler = MigrationScheduler(argument_handler.get_number_of_jobs())
         self._argument_handler = argument_handler
+        self.__configure_facades()
 
     def migrate(self):
         """Facilitates an entire migration operation from start to finish.
@@ -37,19 +41,49 @@ class MigrationFacilitator:
         self.__pre_migration_error_check()
         self.__stop_services_and_perform_migration()
 
+    def __configure_facades(self) -> None:
+        """Applies the options that change how directories and databases are captured and restored.
+        """
+        file_system_facade = self.facade_factory.get_file_system_facade()
+        argument_handler = self._argument_handler
+        if self._action == MigrationAction.CAPTURE:
+            file_system_facade.incremental_capture = argument_handler.is_incremental_capture_flag_present()
+            file_system_facade.archive_capture = argument_handler.is_archive_flag_present()
+            file_system_facade.link_mode = argument_handler.get_link_mode()
+            file_system_facade.content_hash_algorithm = argument_handler.get_checksum_algorithm()
+            if argument_handler.is_deduplicate_flag_present():
+                object_store_directory = argument_handler.get_object_store_directory()
+                if object_store_directory is None:
+                    object_store_directory = get_default_object_store_directory(self._migration_directory)
+                file_system_facade.object_store_directory = object_store_directory
+        elif self._action == MigrationAction.RESTORE:
+            file_system_facade.sync_restore = argument_handler.is_sync_restore_flag_present()
+            file_system_facade.verify_mode = argument_handler.get_verify_mode()
+            self.facade_factory.get_mongo_facade().mongo_profile = argument_handler.get_mongo_profile()
+        if self._action == MigrationAction.CAPTURE or self._action == MigrationAction.RESTORE:
+            self.facade_factory.get_mongo_facade().mongo_engine = argument_handler.get_mongo_engine()
+        mongo_facade = self.facade_factory.get_mongo_facade()
+        mongo_facade.max_pool_size = argument_handler.get_mongo_pool_size()
+        mongo_facade.max_idle_time_milliseconds = argument_handler.get_mongo_idle_time_milliseconds()
+
     def __stop_services_and_perform_migration(self) -> None:
         self.service_manager.stop_all_system_link_services()
         try:
-            for migrator in self._migrators:
-                migrator_directory = os.path.join(self._migration_directory, migrator.name)
-                self.__report_migration_starting(migrator.name)
-                self.__migrate_service(migrator, migrator_directory)
-                self.__report_migration_finished(migrator.name)
+            self._scheduler.run(self._migrators, self.__migrate_service_and_report_progress)
         finally:
+            mongo_facade = self.facade_factory.get_mongo_facade()
+            mongo_facade.close_connections()
+            mongo_facade.stop_mongo()
             if self._action == MigrationAction.RESTORE or self._action == MigrationAction.MODIFY:
                 self.web_server_manager.restart_web_server()
             self.service_manager.start_all_system_link_services()
 
+    def __migrate_service_and_report_progress(self, migrator: MigratorPlugin) -> None:
+        migrator_directory = os.path.join(self._migration_directory, migrator.name)
+        self.__report_migration_starting(migrator.name)
+        self.__migrate_service(migrator, migrator_directory)
+        self.__report_migration_finished(migrator.name)
+
     def __migrate_service(self, migrator: MigratorPlugin, migrator_directory) -> None:
         migrator_arguments = self._argument_handler.get_migrator_additional_arguments(migrator)
         if self._action == MigrationAction.CAPTURE:
@@ -0,0 +1,119 @@
+import os
+from concurrent.futures import ThreadPoolExecutor, Future, wait, FIRST_COMPLETED
+from typing import Callable, Dict, List, Optional, Set
+
+from nislmigrate.extensibility.migrator_plugin import MigratorPlugin, MigratorResource
+from nislmigrate.logs.migration_error import MigrationError
+
+DEFAULT_RESOURCE_LIMITS: Dict[MigratorResource, Optional[int]] = {
+    MigratorResource.MONGO: None,
+    MigratorResource.DISK: 1,
+    MigratorResource.CPU: os.cpu_count() or 1,
+}
+
+DEPENDENCY_CYCLE_ERROR_TEXT_FORMAT = 'The migrators {migrator_names} depend on each other and can not be scheduled.'
+UNSCHEDULABLE_ERROR_TEXT_FORMAT = 'The migrators {migrator_names} can not be scheduled with the given resource limits.'
+
+
+class MigrationScheduler:
+    """
+    Runs migrators on a bounded pool of worker threads while respecting the ordering
+    constraints and resource classes declared by each migrator.
+    """
+    def __init__(self, jobs: int = 1, resource_limits: Optional[Dict[MigratorResource, Optional[int]]] = None):
+        """
+        Creates a new instance of MigrationScheduler.
+
+        :param jobs: The maximum number of migrators to run at the same time.
+        :param resource_limits: The maximum number of running migrators that may use each resource.
+                                A limit of None means the resource is only limited by the number of jobs.
+        """
+        if jobs < 1:
+            raise MigrationError('The number of jobs must be at least 1.')
+        self.jobs: int = jobs
+        self.resource_limits: Dict[MigratorResource, Optional[int]] = resource_limits or DEFAULT_RESOURCE_LIMITS
+
+    def run(self, migrators: List[MigratorPlugin], migrate: Callable[[MigratorPlugin], None]) -> None:
+        """
+        Runs the given function once for every migrator. Migrators with larger workloads are started first.
+        If any migrator fails no more migrators are started, and the first error is raised once the
+        running migrators have finished.
+
+        :param migrators: The migrators to run.
+        :param migrate: The function that performs the migration for a single migrator.
+        """
+        dependencies = self.__get_dependencies_within_migration(migrators)
+        self.__verify_no_dependency_cycles(migrators, dependencies)
+        pending: List[MigratorPlugin] = sorted(migrators, key=lambda migrator: -migrator.relative_workload)
+        finished: Set[str] = set()
+        running: Dict[Future, MigratorPlugin] = {}
+        errors: List[BaseException] = []
+
+        with ThreadPoolExecutor(max_workers=self.jobs) as executor:
+            while pending or running:
+                if not errors:
+                    for migrator in self.__get_migrators_ready_to_start(pending, running, finished, dependencies):
+                        pending.remove(migrator)
+                        running[executor.submit(migrate, migrator)] = migrator
+                if not running:
+                    if pending and not errors:
+                        migrator_names = ', '.join(migrator.name for migrator in pending)
+                        raise MigrationError(UNSCHEDULABLE_ERROR_TEXT_FORMAT.format(migrator_names=migrator_names))
+                    break
+                done, _ = wait(list(running), return_when=FIRST_COMPLETED)
+                for future in done:
+                    migrator = running.pop(future)
+                    error = future.exception()
+                    if error is not None:
+                        errors.append(error)
+                    else:
+                        finished.add(migrator.name)
+
+        if errors:
+            raise errors[0]
+
+    def __get_migrators_ready_to_start(
+            self,
+            pending: List[MigratorPlugin],
+            running: Dict[Future, MigratorPlugin],
+            finished: Set[str],
+            dependencies: Dict[str, Set[str]]) -> List[MigratorPlugin]:
+        ready: List[MigratorPlugin] = []
+        scheduled: List[MigratorPlugin] = list(running.values())
+        for migrator in pending:
+            if len(scheduled) >= self.jobs:
+                break
+            if not dependencies[migrator.name].issubset(finished):
+                continue
+            if not self.__are_resources_available(migrator, scheduled):
+                continue
+            ready.append(migrator)
+            scheduled.append(migrator)
+        return ready
+
+    def __are_resources_available(self, migrator: MigratorPlugin, scheduled: List[MigratorPlugin]) -> bool:
+        for resource in migrator.resources:
+            limit = self.resource_limits.get(resource)
+            if limit is None:
+                continue
+            in_use = len([other for other in scheduled if resource in other.resources])
+            if in_use >= limit:
+                return False
+        return True
+
+    @staticmethod
+    def __get_dependencies_within_migration(migrators: List[MigratorPlugin]) -> Dict[str, Set[str]]:
+        names = {migrator.name for migrator in migrators}
+        return {migrator.name: set(migrator.dependencies) & names for migrator in migrators}
+
+    @staticmethod
+    def __verify_no_dependency_cycles(migrators: List[MigratorPlugin], dependencies: Dict[str, Set[str]]) -> None:
+        remaining = {migrator.name for migrator in migrators}
+        resolved: Set[str] = set()
+        while remaining:
+            ready = {name for name in remaining if dependencies[name].issubset(resolved)}
+            if not ready:
+                migrator_names = ', '.join(sorted(remaining))
+                raise MigrationError(DEPENDENCY_CYCLE_ERROR_TEXT_FORMAT.format(migrator_names=migrator_names))
+            resolved |= ready
+            remaining -= ready
@@ -1,9 +1,17 @@
 from nislmigrate.facades.facade_factory import FacadeFactory
 from nislmigrate.extensibility.migrator_plugin import MigratorPlugin
 from nislmigrate.facades.mongo_configuration import MongoConfiguration
+from nislmigrate.facades.mongo_dump import MongoDumpOptions
 from nislmigrate.facades.mongo_facade import MongoFacade
+from nislmigrate.facades.mongo_restore import MongoRestoreOptions
 from typing import Any, Dict
 
+# Alarm instances are a single large collection, so the dump is limited by how fast it is compressed.
+MONGO_DUMP_OPTIONS = MongoDumpOptions(compression_level=1)
+# A single collection is restored, so its documents are inserted on several threads and its
+# indexes are built once all of them are inserted.
+MONGO_RESTORE_OPTIONS = MongoRestoreOptions(insertion_workers_per_collection=4, defer_index_builds=True)
+
 
 class AlarmPlugin(MigratorPlugin):
 
@@ -19,13 +27,18 @@ class AlarmPlugin(MigratorPlugin):
     def help(self):
         return 'Migrate alarm instances'
 
+    @property
+    def relative_workload(self):
+        return 2
+
     def capture(self, migration_directory: str, facade_factory: FacadeFactory, arguments: Dict[str, Any]):
         mongo_facade: MongoFacade = facade_factory.get_mongo_facade()
         mongo_configuration: MongoConfiguration = MongoConfiguration(self.config(facade_factory))
         mongo_facade.capture_database_to_directory(
             mongo_configuration,
             migration_directory,
-            self.name)
+            self.name,
+            MONGO_DUMP_OPTIONS)
 
     def restore(self, migration_directory: str, facade_factory: FacadeFactory, arguments: Dict[str, Any]):
         mongo_facade: MongoFacade = facade_factory.get_mongo_facade()
@@ -33,7 +46,8 @@ class AlarmPlugin(MigratorPlugin):
         mongo_facade.restore_database_from_directory(
             mongo_configuration,
             migration_directory,
-            self.name)
+            self.name,
+            options=MONGO_RESTORE_OPTIONS)
 
     def pre_restore_check(
             self,
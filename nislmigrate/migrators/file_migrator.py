@@ -1,11 +1,14 @@
+import logging
 import os
-from typing import Any, Dict, Callable
+import re
+from typing import Any, Dict, Callable, List
 
-from nislmigrate.extensibility.migrator_plugin import MigratorPlugin, ArgumentManager
+from nislmigrate.extensibility.migrator_plugin import MigratorPlugin, MigratorResource, ArgumentManager
 from nislmigrate.facades.facade_factory import FacadeFactory
 from nislmigrate.facades.file_system_facade import FileSystemFacade
 from nislmigrate.facades.mongo_configuration import MongoConfiguration
-from nislmigrate.facades.mongo_facade import MongoFacade
+from nislmigrate.facades.document_transform import DocumentTransform, DocumentTransformStep
+from nislmigrate.facades.mongo_facade import MongoFacade, DocumentUpdateSummary, DEFAULT_PARALLEL_PARTITIONS
 from nislmigrate.logs.migration_error import MigrationError
 from nislmigrate.migration_action import MigrationAction
 from nislmigrate.utility.paths import get_ni_application_data_directory_path
@@ -56,8 +59,17 @@ _FILE_STORE_ROOT_NOT_SET_FOR_MODIFY_CHANGE_FILE_STORE_ERROR = """
 
 """
 
+_METADATA_UPDATE_FAILED_ERROR_FORMAT = 'Failed to update the metadata of {failed} files. See the log for details.'
+
 _SAVED_OLD_FILE_STORE_ROOT_FILE_NAME = 'file-store-root'
 
+_REPLACE_ALL_MINIMUM_SERVER_VERSION = (4, 4)
+
+_PATH_FIELDS = ['path']
+
+# Stored files are only ever added or deleted, never modified in place.
+_IMMUTABLE_FILE_PATTERNS = ['*']
+
 
 class _FileMigratorConfiguration:
     def __init__(
@@ -72,7 +84,7 @@ class _FileMigratorConfiguration:
         self.file_facade: FileSystemFacade = facade_factory.get_file_system_facade()
         self.mongo_configuration: MongoConfiguration = MongoConfiguration(config)
         self.file_migration_directory: str = os.path.join(migration_directory, 'files')
-        self.file_migration_directory_exists: bool = self.file_facade.does_directory_exist(
+        self.file_migration_directory_exists: bool = self.file_facade.does_captured_directory_exist(
                 self.file_migration_directory)
 
         self.data_directory: str = config.get(PATH_CONFIGURATION_KEY) or DEFAULT_DATA_DIRECTORY
@@ -103,6 +115,14 @@ class FileMigrator(MigratorPlugin):
     def help(self):
         return 'Migrate ingested files'
 
+    @property
+    def resources(self):
+        return {MigratorResource.MONGO, MigratorResource.DISK}
+
+    @property
+    def relative_workload(self):
+        return 10
+
     def capture(self, migration_directory: str, facade_factory: FacadeFactory, arguments: Dict[str, Any]):
         configuration = _FileMigratorConfiguration(
             MigrationAction.CAPTURE,
@@ -120,10 +140,10 @@ class FileMigrator(MigratorPlugin):
         configuration.file_facade.write_file(captured_file_store_root_path, configuration.data_directory)
 
         if configuration.should_migrate_files:
-            configuration.file_facade.copy_directory(
+            configuration.file_facade.capture_directory(
                 configuration.data_directory,
                 configuration.file_migration_directory,
-                False)
+                immutable_files=_IMMUTABLE_FILE_PATTERNS)
 
     def restore(self, migration_directory: str, facade_factory: FacadeFactory, arguments: Dict[str, Any]):
         configuration = _FileMigratorConfiguration(
@@ -134,18 +154,18 @@ class FileMigrator(MigratorPlugin):
             self.config(facade_factory)
         )
 
+        if configuration.should_update_store:
+            configuration.old_store_path = configuration.file_facade.read_file(_SAVED_OLD_FILE_STORE_ROOT_FILE_NAME)
+        transform = self.create_metadata_transform(configuration)
         configuration.mongo_facade.restore_database_from_directory(
             configuration.mongo_configuration,
             migration_directory,
-            self.name)
-        if configuration.should_update_store:
-            configuration.old_store_path = configuration.file_facade.read_file(_SAVED_OLD_FILE_STORE_ROOT_FILE_NAME)
-        self.update_database(configuration)
+            self.name,
+            None if transform.is_empty else {self.name.lower(): transform})
         if configuration.should_migrate_files:
-            configuration.file_facade.copy_directory(
+            configuration.file_facade.restore_directory(
                 configuration.file_migration_directory,
-                configuration.data_directory,
-                True)
+                configuration.data_directory)
 
     def modify(self, migration_directory: str, facade_factory: FacadeFactory, arguments: Dict[str, Any]):
         configuration = _FileMigratorConfiguration(
@@ -155,10 +175,7 @@ class FileMigrator(MigratorPlugin):
             arguments,
             self.config(facade_factory)
         )
-        if configuration.should_update_store:
-            self.update_root_file_path_in_metadata(configuration)
-        if configuration.use_forward_slashes:
-            self.update_file_path_slashes_in_metadata(configuration)
+        self.update_database(configuration)
 
     def pre_capture_check(
             self,
@@ -198,6 +215,8 @@ class FileMigrator(MigratorPlugin):
             raise MigrationError(_CANNOT_MIGRATE_S3_FILES_ERROR)
         elif not configuration.file_migration_directory_exists and configuration.should_migrate_files:
             raise MigrationError(_NO_FILES_ERROR)
+        elif configuration.should_migrate_files:
+            configuration.file_facade.verify_captured_directory(configuration.file_migration_directory)
 
     def pre_modify_check(
             self,
@@ -224,33 +243,75 @@ class FileMigrator(MigratorPlugin):
             metavar='existing-root-dir')
         argument_manager.add_switch(_CHANGE_FILE_STORE_SLASHES_ARGUMENT, help=_CHANGE_FILE_STORE_SLASHES_HELP)
 
-    def update_database(self, configuration: _FileMigratorConfiguration):
+    def create_metadata_transform(self, configuration: _FileMigratorConfiguration) -> DocumentTransform:
+        transform = DocumentTransform()
         if configuration.should_update_store:
-            self.update_root_file_path_in_metadata(configuration)
+            old_path = configuration.old_store_path
+            new_path = configuration.update_store_path
+            transform.add_step(self.replace_path_prefix_step(old_path, new_path))
         if configuration.use_forward_slashes:
-            self.update_file_path_slashes_in_metadata(configuration)
-
-    def update_root_file_path_in_metadata(self, configuration: _FileMigratorConfiguration):
-        old_path = configuration.old_store_path
-        new_path = configuration.update_store_path
-        collection_name = self.name.lower()
-        does_path_field_start_with_old_path = self.does_path_start_with_prefix_predicate(old_path)
-        replace_old_path_with_new_path = self.replace_path_prefix_in_document_function(old_path, new_path)
-        mongo_configuration = configuration.mongo_configuration
-        configuration.mongo_facade.conditionally_update_documents_in_collection(
-            mongo_configuration,
-            collection_name,
-            does_path_field_start_with_old_path,
-            replace_old_path_with_new_path)
-
-    def update_file_path_slashes_in_metadata(self, configuration: _FileMigratorConfiguration):
-        collection_name = self.name.lower()
-        replace_back_slashes_with_forward_slashes = self.replace_back_slashes_in_document_function()
-        mongo_configuration = configuration.mongo_configuration
-        configuration.mongo_facade.update_documents_in_collection(
-            mongo_configuration,
-            collection_name,
-            replace_back_slashes_with_forward_slashes)
+            transform.add_step(self.replace_back_slashes_step())
+        return transform
+
+    def update_database(self, configuration: _FileMigratorConfiguration):
+        transform = self.create_metadata_transform(configuration)
+        if transform.is_empty:
+            return
+        summary = configuration.mongo_facade.transform_documents_in_collection(
+            configuration.mongo_configuration,
+            self.name.lower(),
+            transform,
+            partitions=DEFAULT_PARALLEL_PARTITIONS)
+        self.__report_metadata_update(summary)
+
+    def replace_path_prefix_step(self, old_prefix: str, new_prefix: str) -> DocumentTransformStep:
+        return DocumentTransformStep(
+            self.path_starts_with_prefix_filter(old_prefix),
+            self.does_path_start_with_prefix_predicate(old_prefix),
+            self.replace_path_prefix_in_document_function(old_prefix, new_prefix),
+            _PATH_FIELDS,
+            self.replace_path_prefix_pipeline(old_prefix, new_prefix))
+
+    def replace_back_slashes_step(self) -> DocumentTransformStep:
+        return DocumentTransformStep(
+            self.path_contains_back_slash_filter(),
+            self.does_path_contain_back_slash_predicate(),
+            self.replace_back_slashes_in_document_function(),
+            _PATH_FIELDS,
+            self.replace_back_slashes_pipeline(),
+            _REPLACE_ALL_MINIMUM_SERVER_VERSION)
+
+    @staticmethod
+    def __report_metadata_update(summary: DocumentUpdateSummary):
+        log = logging.getLogger(FileMigrator.__name__)
+        log.info(f'Updated file metadata: {summary}')
+        if summary.failed:
+            raise MigrationError(_METADATA_UPDATE_FAILED_ERROR_FORMAT.format(failed=summary.failed))
+
+    @staticmethod
+    def path_starts_with_prefix_filter(prefix: str) -> Dict[str, Any]:
+        return {'path': {'$regex': '^' + re.escape(prefix)}}
+
+    @staticmethod
+    def replace_path_prefix_pipeline(old_prefix: str, new_prefix: str) -> List[Dict[str, Any]]:
+        old_prefix_length = len(old_prefix)
+        prefix = {'$substrCP': ['$path', 0, old_prefix_length]}
+        postfix_length = {'$subtract': [{'$strLenCP': '$path'}, old_prefix_length]}
+        postfix = {'$substrCP': ['$path', old_prefix_length, postfix_length]}
+        new_path = {'$concat': [new_prefix, postfix]}
+        return [{'$set': {'path': {'$cond': [{'$eq': [prefix, old_prefix]}, new_path, '$path']}}}]
+
+    @staticmethod
+    def path_contains_back_slash_filter() -> Dict[str, Any]:
+        return {'path': {'$regex': re.escape('\\')}}
+
+    @staticmethod
+    def replace_back_slashes_pipeline() -> List[Dict[str, Any]]:
+        return [{'$set': {'path': {'$replaceAll': {'input': '$path', 'find': '\\', 'replacement': '/'}}}}]
+
+    @staticmethod
+    def does_path_contain_back_slash_predicate() -> Callable[[Dict[str, Any]], bool]:
+        return lambda document: '\\' in document['path']
 
     @staticmethod
     def does_path_start_with_prefix_predicate(prefix: str) -> Callable[[Dict[str, Any]], bool]:
@@ -1,7 +1,7 @@
 import os
 
 from nislmigrate.facades.facade_factory import FacadeFactory
-from nislmigrate.extensibility.migrator_plugin import MigratorPlugin
+from nislmigrate.extensibility.migrator_plugin import MigratorPlugin, MigratorResource
 from nislmigrate.facades.file_system_facade import FileSystemFacade
 from nislmigrate.facades.mongo_configuration import MongoConfiguration
 from nislmigrate.facades.mongo_facade import MongoFacade
@@ -15,6 +15,7 @@ DEFAULT_BASE_REPOSITORY_PATH = os.path.join(
     'NI',
     'repo_webservice',
     'files')
+PACKAGE_FILE_PATTERNS = ['*.nipkg', '*.ipk']
 
 
 class RepositoryMigrator(MigratorPlugin):
@@ -31,6 +32,14 @@ class RepositoryMigrator(MigratorPlugin):
     def help(self):
         return 'Migrate packages and feeds'
 
+    @property
+    def resources(self):
+        return {MigratorResource.MONGO, MigratorResource.DISK}
+
+    @property
+    def relative_workload(self):
+        return 8
+
     def capture(self, migration_directory: str, facade_factory: FacadeFactory, arguments: Dict[str, Any]):
         mongo_facade: MongoFacade = facade_factory.get_mongo_facade()
         file_facade: FileSystemFacade = facade_factory.get_file_system_facade()
@@ -41,10 +50,10 @@ class RepositoryMigrator(MigratorPlugin):
             mongo_configuration,
             migration_directory,
             self.name)
-        file_facade.copy_directory_if_exists(
+        file_facade.capture_directory_if_exists(
             self.__find_repository_path(facade_factory),
             file_migration_directory,
-            False)
+            immutable_files=PACKAGE_FILE_PATTERNS)
 
     def restore(self, migration_directory: str, facade_factory: FacadeFactory, arguments: Dict[str, Any]):
         mongo_facade: MongoFacade = facade_factory.get_mongo_facade()
@@ -56,10 +65,9 @@ class RepositoryMigrator(MigratorPlugin):
             mongo_configuration,
             migration_directory,
             self.name)
-        file_facade.copy_directory_if_exists(
+        file_facade.restore_directory_if_exists(
             file_migration_directory,
-            self.__find_repository_path(facade_factory),
-            True)
+            self.__find_repository_path(facade_factory))
 
     def pre_restore_check(
             self,
@@ -70,6 +78,8 @@ class RepositoryMigrator(MigratorPlugin):
         mongo_facade.validate_can_restore_database_from_directory(
             migration_directory,
             self.name)
+        file_facade: FileSystemFacade = facade_factory.get_file_system_facade()
+        file_facade.verify_captured_directory(os.path.join(migration_directory, 'files'))
 
     def __find_repository_path(self, facade_factory: FacadeFactory) -> str:
         config = self.config(facade_factory)
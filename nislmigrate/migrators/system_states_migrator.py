@@ -1,7 +1,7 @@
 import os
 
 from nislmigrate.facades.facade_factory import FacadeFactory
-from nislmigrate.extensibility.migrator_plugin import MigratorPlugin
+from nislmigrate.extensibility.migrator_plugin import MigratorPlugin, MigratorResource
 from nislmigrate.facades.file_system_facade import FileSystemFacade
 from nislmigrate.facades.mongo_configuration import MongoConfiguration
 from nislmigrate.facades.mongo_facade import MongoFacade
@@ -32,6 +32,14 @@ class SystemStatesMigrator(MigratorPlugin):
     def help(self):
         return 'Migrate system states'
 
+    @property
+    def resources(self):
+        return {MigratorResource.MONGO, MigratorResource.DISK}
+
+    @property
+    def relative_workload(self):
+        return 4
+
     def capture(self, migration_directory: str, facade_factory: FacadeFactory, arguments: Dict[str, Any]):
         mongo_facade: MongoFacade = facade_factory.get_mongo_facade()
         file_facade: FileSystemFacade = facade_factory.get_file_system_facade()
@@ -42,10 +50,9 @@ class SystemStatesMigrator(MigratorPlugin):
             mongo_configuration,
             migration_directory,
             self.name)
-        file_facade.copy_directory_if_exists(
+        file_facade.capture_directory_if_exists(
             self.__find_git_repo_directory(facade_factory),
-            file_migration_directory,
-            False)
+            file_migration_directory)
 
     def restore(self, migration_directory: str, facade_factory: FacadeFactory, arguments: Dict[str, Any]):
         mongo_facade: MongoFacade = facade_factory.get_mongo_facade()
@@ -57,10 +64,9 @@ class SystemStatesMigrator(MigratorPlugin):
             mongo_configuration,
             migration_directory,
             self.name)
-        file_facade.copy_directory_if_exists(
+        file_facade.restore_directory_if_exists(
             file_migration_directory,
-            self.__find_git_repo_directory(facade_factory),
-            True)
+            self.__find_git_repo_directory(facade_factory))
 
     def pre_restore_check(
             self,
@@ -71,6 +77,8 @@ class SystemStatesMigrator(MigratorPlugin):
         mongo_facade.validate_can_restore_database_from_directory(
             migration_directory,
             self.name)
+        file_facade: FileSystemFacade = facade_factory.get_file_system_facade()
+        file_facade.verify_captured_directory(os.path.join(migration_directory, 'files'))
 
     def __find_git_repo_directory(self, facade_factory: FacadeFactory) -> str:
         config = self.config(facade_factory)
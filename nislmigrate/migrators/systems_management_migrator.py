@@ -2,7 +2,7 @@ from nislmigrate.facades.file_system_facade import FileSystemFacade
 from nislmigrate.facades.facade_factory import FacadeFactory
 from nislmigrate.facades.mongo_configuration import MongoConfiguration
 from nislmigrate.facades.mongo_facade import MongoFacade
-from nislmigrate.extensibility.migrator_plugin import MigratorPlugin
+from nislmigrate.extensibility.migrator_plugin import MigratorPlugin, MigratorResource
 from nislmigrate.utility.paths import get_ni_application_data_directory_path
 from nislmigrate.logs.migration_error import MigrationError
 from nislmigrate.argument_handler import SECRET_ARGUMENT
@@ -42,6 +42,14 @@ class SystemsManagementMigrator(MigratorPlugin):
         return 'Migrate registered systems. Must include the --secret <SECRET> command line argument when using this ' \
                'migrator. '
 
+    @property
+    def resources(self):
+        return {MigratorResource.MONGO, MigratorResource.CPU}
+
+    @property
+    def relative_workload(self):
+        return 2
+
     def capture(self, migration_directory: str, facade_factory: FacadeFactory, arguments: Dict[str, Any]):
         self.__file_facade = facade_factory.get_file_system_facade()
         self.__capture_mongo_data(facade_factory, migration_directory)
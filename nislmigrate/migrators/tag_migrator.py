@@ -1,7 +1,7 @@
 import os
 from typing import Any, Dict
 
-from nislmigrate.extensibility.migrator_plugin import MigratorPlugin
+from nislmigrate.extensibility.migrator_plugin import MigratorPlugin, MigratorResource
 from nislmigrate.facades.facade_factory import FacadeFactory
 from nislmigrate.facades.file_system_facade import FileSystemFacade
 from nislmigrate.facades.mongo_facade import MongoFacade
@@ -23,6 +23,14 @@ class TagMigrator(MigratorPlugin):
     def help(self):
         return 'migrate tags and tag histories'
 
+    @property
+    def resources(self):
+        return {MigratorResource.DISK}
+
+    @property
+    def relative_workload(self):
+        return 3
+
     __file_to_migrate = 'dump.rdb'
     __file_to_migrate_directory = os.path.join(
         get_ni_application_data_directory_path(),
@@ -1,9 +1,17 @@
 from nislmigrate.facades.facade_factory import FacadeFactory
 from nislmigrate.extensibility.migrator_plugin import MigratorPlugin
 from nislmigrate.facades.mongo_configuration import MongoConfiguration
+from nislmigrate.facades.mongo_dump import MongoDumpOptions
 from nislmigrate.facades.mongo_facade import MongoFacade
+from nislmigrate.facades.mongo_restore import MongoRestoreOptions
 from typing import Any, Dict
 
+# Results and steps hold most of the data, so dumping them on separate processes with fast
+# compression keeps the capture from being limited by the largest collection.
+MONGO_DUMP_OPTIONS = MongoDumpOptions(compression_level=1, per_collection_archives=True)
+# The results and steps carry many indexes, which are cheaper to build once than to update for every document.
+MONGO_RESTORE_OPTIONS = MongoRestoreOptions(insertion_workers_per_collection=4, defer_index_builds=True)
+
 
 class TestMonitorMigrator(MigratorPlugin):
 
@@ -19,13 +27,18 @@ class TestMonitorMigrator(MigratorPlugin):
     def help(self):
         return 'Migrate notifications strategies, templates, and groups'
 
+    @property
+    def relative_workload(self):
+        return 4
+
     def capture(self, migration_directory: str, facade_factory: FacadeFactory, arguments: Dict[str, Any]):
         mongo_facade: MongoFacade = facade_factory.get_mongo_facade()
         mongo_configuration: MongoConfiguration = MongoConfiguration(self.config(facade_factory))
         mongo_facade.capture_database_to_directory(
             mongo_configuration,
             migration_directory,
-            self.name)
+            self.name,
+            MONGO_DUMP_OPTIONS)
 
     def restore(self, migration_directory: str, facade_factory: FacadeFactory, arguments: Dict[str, Any]):
         mongo_facade: MongoFacade = facade_factory.get_mongo_facade()
@@ -33,7 +46,8 @@ class TestMonitorMigrator(MigratorPlugin):
         mongo_facade.restore_database_from_directory(
             mongo_configuration,
             migration_directory,
-            self.name)
+            self.name,
+            options=MONGO_RESTORE_OPTIONS)
 
     def pre_restore_check(
             self,
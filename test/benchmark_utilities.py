@@ -0,0 +1,33 @@
+import os
+import time
+from typing import Callable, TypeVar
+
+T = TypeVar('T')
+
+
+def get_benchmark_count(variable: str, default: int) -> int:
+    """
+    Gets the size of a benchmark from an environment variable.
+
+    :param variable: The environment variable that can override the size.
+    :param default: The size to use when the variable is not set.
+    :return: The size of the benchmark.
+    """
+    return int(os.environ.get(variable, str(default)))
+
+
+def measure_throughput(name: str, count: int, unit: str, operation: Callable[[], T]) -> T:
+    """
+    Runs an operation and prints how many units per second it processed.
+
+    :param name: The name of the measured operation.
+    :param count: The number of units the operation processes.
+    :param unit: The name of the units the operation processes, such as 'documents'.
+    :param operation: The operation to measure.
+    :return: The value returned by the operation.
+    """
+    start = time.perf_counter()
+    result = operation()
+    elapsed = time.perf_counter() - start
+    print(f'{name}: {count} {unit} in {elapsed:.2f}s ({count / max(elapsed, 1e-9):.0f} {unit}/s)')
+    return result
@@ -7,3 +7,7 @@ def pytest_configure(config) -> None:
         'markers',
         'unit: Run only unit tests.',
     )
+    config.addinivalue_line(
+        'markers',
+        'benchmark: Measure throughput. Benchmarks live in benchmark_*.py files and only run when requested.',
+    )
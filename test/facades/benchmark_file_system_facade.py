@@ -0,0 +1,93 @@
+"""
+Throughput benchmarks for the encrypted bundles written by FileSystemFacade and for deleting
+directories. They are not part of the unit test run. To run them:
+
+    poetry run pytest test/facades/benchmark_file_system_facade.py -s
+
+The amount of data encrypted defaults to 1024 MiB and can be changed with
+NISLMIGRATE_BENCHMARK_ENCRYPTION_MEGABYTES. The number of files deleted defaults to 20000 and can be
+changed with NISLMIGRATE_BENCHMARK_DELETION_FILES.
+"""
+import os
+import shutil
+from typing import Iterator
+
+import pytest
+
+from nislmigrate.facades.encrypted_stream import (
+    DecryptingReader,
+    EncryptingWriter,
+    KeyManager,
+    DEFAULT_CHUNK_SIZE,
+    DEFAULT_ENCRYPTION_WORKERS,
+)
+from nislmigrate.facades.file_copy_engine import DEFAULT_COPY_WORKERS
+from nislmigrate.facades.file_deletion_engine import FileDeletionEngine
+from test.benchmark_utilities import get_benchmark_count, measure_throughput
+
+MEGABYTES = get_benchmark_count('NISLMIGRATE_BENCHMARK_ENCRYPTION_MEGABYTES', 1024)
+DELETION_FILES = get_benchmark_count('NISLMIGRATE_BENCHMARK_DELETION_FILES', 20000)
+MEGABYTE = 1024 * 1024
+SECRET = 'benchmark'
+
+
+@pytest.fixture(scope='module')
+def encrypted_file(tmp_path_factory) -> Iterator[str]:
+    path = str(tmp_path_factory.mktemp('encryption') / 'encrypted')
+    with open(path, 'wb') as file:
+        encrypt(file, DEFAULT_ENCRYPTION_WORKERS)
+    yield path
+    os.remove(path)
+
+
+@pytest.mark.benchmark
+@pytest.mark.parametrize('workers', sorted({1, DEFAULT_ENCRYPTION_WORKERS}))
+def test_benchmark_encryption(workers: int):
+    with open(os.devnull, 'wb') as destination:
+        measure_throughput(f'encrypt with {workers} workers', MEGABYTES, 'MiB', lambda: encrypt(destination, workers))
+
+
+@pytest.mark.benchmark
+@pytest.mark.parametrize('workers', sorted({1, DEFAULT_ENCRYPTION_WORKERS}))
+def test_benchmark_decryption(encrypted_file: str, workers: int):
+    def decrypt():
+        with open(encrypted_file, 'rb') as source, DecryptingReader(source, SECRET, workers=workers) as reader:
+            while reader.read(DEFAULT_CHUNK_SIZE):
+                pass
+
+    measure_throughput(f'decrypt with {workers} workers', MEGABYTES, 'MiB', decrypt)
+
+
+@pytest.mark.benchmark
+def test_benchmark_deletion_with_rmtree(tmp_path):
+    directory = make_directory_tree(str(tmp_path))
+    measure_throughput('delete with shutil.rmtree', DELETION_FILES, 'files', lambda: shutil.rmtree(directory))
+
+
+@pytest.mark.benchmark
+@pytest.mark.parametrize('workers', sorted({1, DEFAULT_COPY_WORKERS}))
+def test_benchmark_deletion(tmp_path, workers: int):
+    directory = make_directory_tree(str(tmp_path))
+    measure_throughput(
+        f'delete with {workers} workers',
+        DELETION_FILES,
+        'files',
+        lambda: FileDeletionEngine(workers).remove_directory(directory))
+
+
+def make_directory_tree(parent: str) -> str:
+    directory = os.path.join(parent, 'tree')
+    for index in range(DELETION_FILES):
+        subdirectory = os.path.join(directory, str(index // 100))
+        if index % 100 == 0:
+            os.makedirs(subdirectory)
+        with open(os.path.join(subdirectory, f'{index}.txt'), 'wb') as file:
+            file.write(b'x' * 1024)
+    return directory
+
+
+def encrypt(destination, workers: int) -> None:
+    data = os.urandom(MEGABYTE)
+    with EncryptingWriter(destination, SECRET, key_manager=KeyManager(), workers=workers) as writer:
+        for _ in range(MEGABYTES):
+            writer.write(data)
@@ -0,0 +1,117 @@
+"""
+Throughput benchmarks for MongoFacade document updates. They need a mongod that can be written to and
+are not part of the unit test run. To run them:
+
+    set NISLMIGRATE_BENCHMARK_MONGO_URI=mongodb://localhost:27017
+    poetry run pytest test/facades/benchmark_mongo_facade.py -s
+
+The number of synthetic documents defaults to one million and can be changed with
+NISLMIGRATE_BENCHMARK_DOCUMENT_COUNT.
+"""
+import os
+from typing import Any, Dict, Iterator
+
+import pytest
+from pymongo import MongoClient
+from pymongo.collection import Collection
+
+from nislmigrate.facades import mongo_configuration
+from nislmigrate.facades.mongo_configuration import MongoConfiguration
+from nislmigrate.facades.mongo_facade import MongoFacade, DEFAULT_PARALLEL_PARTITIONS
+from test.benchmark_utilities import get_benchmark_count, measure_throughput
+from test.test_utilities import FakeProcessFacade
+
+CONNECTION_STRING = os.environ.get('NISLMIGRATE_BENCHMARK_MONGO_URI', '')
+DOCUMENT_COUNT = get_benchmark_count('NISLMIGRATE_BENCHMARK_DOCUMENT_COUNT', 1000000)
+DATABASE_NAME = 'nislmigrate_benchmark'
+COLLECTION_NAME = 'fileingestion'
+OLD_ROOT = 'C:\\ProgramData\\National Instruments\\Skyline\\Data\\FileIngestion'
+NEW_ROOT = 'D:\\FileIngestion'
+INSERT_BATCH_SIZE = 10000
+
+if not CONNECTION_STRING:
+    pytest.skip('NISLMIGRATE_BENCHMARK_MONGO_URI is not set', allow_module_level=True)
+
+
+@pytest.fixture
+def file_collection() -> Iterator[Collection]:
+    client: MongoClient = MongoClient(CONNECTION_STRING)
+    client.drop_database(DATABASE_NAME)
+    collection = client[DATABASE_NAME][COLLECTION_NAME]
+    batch = []
+    for index in range(DOCUMENT_COUNT):
+        batch.append(make_file_document(index))
+        if len(batch) == INSERT_BATCH_SIZE:
+            collection.insert_many(batch)
+            batch = []
+    if batch:
+        collection.insert_many(batch)
+    yield collection
+    client.drop_database(DATABASE_NAME)
+    client.close()
+
+
+@pytest.mark.benchmark
+def test_benchmark_update_documents_in_collection(file_collection: Collection):
+    mongo_facade = MongoFacade(FakeProcessFacade())
+
+    summary = measure_throughput(
+        'update_documents_in_collection',
+        DOCUMENT_COUNT,
+        'documents',
+        lambda: mongo_facade.update_documents_in_collection(
+            get_benchmark_mongo_configuration(),
+            COLLECTION_NAME,
+            replace_root))
+    mongo_facade.close_connections()
+
+    assert summary.modified == DOCUMENT_COUNT
+
+
+@pytest.mark.benchmark
+def test_benchmark_update_documents_in_collection_in_partitions(file_collection: Collection):
+    mongo_facade = MongoFacade(FakeProcessFacade())
+
+    summary = measure_throughput(
+        f'update_documents_in_collection with {DEFAULT_PARALLEL_PARTITIONS} partitions',
+        DOCUMENT_COUNT,
+        'documents',
+        lambda: mongo_facade.update_documents_in_collection(
+            get_benchmark_mongo_configuration(),
+            COLLECTION_NAME,
+            replace_root,
+            projection={'path': 1},
+            partitions=DEFAULT_PARALLEL_PARTITIONS))
+    mongo_facade.close_connections()
+
+    assert summary.modified == DOCUMENT_COUNT
+
+
+@pytest.mark.benchmark
+def test_benchmark_per_document_replace_baseline(file_collection: Collection):
+    def replace_each_document():
+        for document in file_collection.find():
+            file_collection.replace_one({'_id': document['_id']}, replace_root(document))
+
+    measure_throughput('replace_one per document', DOCUMENT_COUNT, 'documents', replace_each_document)
+
+
+def replace_root(document: Dict[str, Any]) -> Dict[str, Any]:
+    document['path'] = NEW_ROOT + document['path'][len(OLD_ROOT):]
+    return document
+
+
+def make_file_document(index: int) -> Dict[str, Any]:
+    return {
+        'path': f'{OLD_ROOT}\\{index % 1000}\\{index}.tdms',
+        'size': index,
+        'workspace': 'benchmark',
+        'properties': {'Name': f'{index}.tdms'},
+    }
+
+
+def get_benchmark_mongo_configuration() -> MongoConfiguration:
+    return MongoConfiguration({
+        mongo_configuration.MONGO_CUSTOM_CONNECTION_STRING_CONFIGURATION_KEY: CONNECTION_STRING,
+        mongo_configuration.MONGO_DATABASE_NAME_CONFIGURATION_KEY: DATABASE_NAME,
+    })
@@ -0,0 +1,99 @@
+"""
+Capture and restore throughput benchmarks comparing the native engine of MongoFacade with the mongo
+tools. They start their own mongod process and are not part of the unit test run. To run them:
+
+    set NISLMIGRATE_BENCHMARK_MONGO_BINARIES=<the directory holding mongod, mongodump and mongorestore>
+    poetry run pytest test/facades/benchmark_mongo_native_engine.py -s
+
+The number of synthetic documents in each database defaults to 200000 and can be changed with
+NISLMIGRATE_BENCHMARK_RESTORE_DOCUMENT_COUNT.
+"""
+import os
+from typing import Iterator
+
+import pytest
+from pymongo import MongoClient
+
+from nislmigrate.facades import mongo_configuration, mongo_facade
+from nislmigrate.facades.mongo_configuration import MongoConfiguration
+from nislmigrate.facades.mongo_facade import MONGO_ENGINES, MongoFacade
+from nislmigrate.facades.process_facade import ProcessFacade
+from test.benchmark_utilities import measure_throughput
+from test.facades.benchmark_mongo_restore_profiles import (
+    CONNECTION_STRING,
+    DATABASES,
+    DOCUMENT_COUNT,
+    INSERT_BATCH_SIZE,
+    get_executable,
+    run_mongod,
+)
+
+
+@pytest.fixture(scope='module')
+def mongod(tmp_path_factory) -> Iterator[None]:
+    with run_mongod(str(tmp_path_factory.mktemp('data')), []):
+        client: MongoClient = MongoClient(CONNECTION_STRING)
+        for database_name, make_document in DATABASES.items():
+            collection = client[database_name]['documents']
+            for start in range(0, DOCUMENT_COUNT, INSERT_BATCH_SIZE):
+                end = min(start + INSERT_BATCH_SIZE, DOCUMENT_COUNT)
+                collection.insert_many([make_document(index) for index in range(start, end)])
+            collection.create_index('properties.Serial')
+        client.close()
+        yield
+
+
+@pytest.fixture(autouse=True)
+def benchmark_mongo_tools(monkeypatch) -> None:
+    monkeypatch.setattr(
+        mongo_facade,
+        'get_mongo_executable_path',
+        lambda executable_name: get_executable(os.path.splitext(executable_name)[0]))
+
+
+@pytest.mark.benchmark
+@pytest.mark.parametrize('database_name', sorted(DATABASES))
+@pytest.mark.parametrize('engine', MONGO_ENGINES)
+def test_benchmark_capture(mongod, tmp_path, database_name: str, engine: str):
+    facade = make_mongo_facade(engine)
+    try:
+        measure_throughput(
+            f'capture {database_name} with the {engine} engine',
+            DOCUMENT_COUNT,
+            'documents',
+            lambda: facade.capture_database_to_directory(
+                get_configuration(database_name),
+                str(tmp_path),
+                database_name))
+    finally:
+        facade.close_connections()
+
+
+@pytest.mark.benchmark
+@pytest.mark.parametrize('database_name', sorted(DATABASES))
+@pytest.mark.parametrize('engine', MONGO_ENGINES)
+def test_benchmark_restore(mongod, tmp_path, database_name: str, engine: str):
+    facade = make_mongo_facade(engine)
+    configuration = get_configuration(database_name)
+    try:
+        facade.capture_database_to_directory(configuration, str(tmp_path), database_name)
+        measure_throughput(
+            f'restore {database_name} with the {engine} engine',
+            DOCUMENT_COUNT,
+            'documents',
+            lambda: facade.restore_database_from_directory(configuration, str(tmp_path), database_name))
+    finally:
+        facade.close_connections()
+
+
+def make_mongo_facade(engine: str) -> MongoFacade:
+    facade = MongoFacade(ProcessFacade())
+    facade.mongo_engine = engine
+    return facade
+
+
+def get_configuration(database_name: str) -> MongoConfiguration:
+    return MongoConfiguration({
+        mongo_configuration.MONGO_CUSTOM_CONNECTION_STRING_CONFIGURATION_KEY: f'{CONNECTION_STRING}/{database_name}',
+        mongo_configuration.MONGO_DATABASE_NAME_CONFIGURATION_KEY: database_name,
+    })
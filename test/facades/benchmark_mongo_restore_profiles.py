@@ -0,0 +1,118 @@
+"""
+Restore throughput benchmarks for the mongo profiles of MongoFacade. They start their own mongod
+processes, with the mongod defaults standing in for the production configuration, and are not part
+of the unit test run. To run them:
+
+    set NISLMIGRATE_BENCHMARK_MONGO_BINARIES=<the directory holding mongod, mongodump and mongorestore>
+    poetry run pytest test/facades/benchmark_mongo_restore_profiles.py -s
+
+The number of synthetic documents in each database defaults to 200000 and can be changed with
+NISLMIGRATE_BENCHMARK_RESTORE_DOCUMENT_COUNT.
+"""
+import json
+import os
+import subprocess
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List
+
+import pytest
+from pymongo import MongoClient
+
+from nislmigrate.facades.mongo_facade import (
+    MONGO_PROFILES,
+    get_mongod_profile_arguments,
+    get_write_concern_for_profile,
+)
+from test.benchmark_utilities import get_benchmark_count, measure_throughput
+
+BINARIES_DIRECTORY = os.environ.get('NISLMIGRATE_BENCHMARK_MONGO_BINARIES', '')
+DOCUMENT_COUNT = get_benchmark_count('NISLMIGRATE_BENCHMARK_RESTORE_DOCUMENT_COUNT', 200000)
+PORT = 27099
+CONNECTION_STRING = f'mongodb://localhost:{PORT}'
+INSERT_BATCH_SIZE = 10000
+EXECUTABLE_SUFFIX = '.exe' if os.name == 'nt' else ''
+
+if not BINARIES_DIRECTORY:
+    pytest.skip('NISLMIGRATE_BENCHMARK_MONGO_BINARIES is not set', allow_module_level=True)
+
+
+def make_test_result(index: int) -> Dict[str, Any]:
+    return {
+        'programName': f'program{index % 100}',
+        'status': {'statusType': 'PASSED' if index % 10 else 'FAILED'},
+        'properties': {'Operator': 'benchmark', 'Serial': str(index)},
+        'keywords': ['benchmark'],
+        'totalTimeInSeconds': index % 1000 / 10,
+    }
+
+
+def make_file_document(index: int) -> Dict[str, Any]:
+    return {
+        'path': f'C:\\ProgramData\\National Instruments\\Skyline\\Data\\FileIngestion\\{index % 1000}\\{index}.tdms',
+        'size': index,
+        'workspace': 'benchmark',
+        'properties': {'Name': f'{index}.tdms'},
+    }
+
+
+DATABASES: Dict[str, Callable[[int], Dict[str, Any]]] = {
+    'nitestmonitor': make_test_result,
+    'nifile': make_file_document,
+}
+
+
+@pytest.fixture(scope='module')
+def dumps(tmp_path_factory) -> Iterator[Dict[str, str]]:
+    directory = tmp_path_factory.mktemp('dumps')
+    paths = {}
+    with run_mongod(str(directory / 'data'), []):
+        client: MongoClient = MongoClient(CONNECTION_STRING)
+        for database_name, make_document in DATABASES.items():
+            collection = client[database_name]['documents']
+            for start in range(0, DOCUMENT_COUNT, INSERT_BATCH_SIZE):
+                end = min(start + INSERT_BATCH_SIZE, DOCUMENT_COUNT)
+                collection.insert_many([make_document(index) for index in range(start, end)])
+            paths[database_name] = str(directory / f'{database_name}.gz')
+            run_tool('mongodump', [f'--db={database_name}', f'--archive={paths[database_name]}', '--gzip'])
+        client.close()
+    yield paths
+
+
+@pytest.mark.benchmark
+@pytest.mark.parametrize('database_name', sorted(DATABASES))
+@pytest.mark.parametrize('profile', MONGO_PROFILES)
+def test_benchmark_restore(dumps: Dict[str, str], tmp_path, database_name: str, profile: str):
+    arguments = [f'--archive={dumps[database_name]}', '--gzip', '--drop']
+    write_concern = get_write_concern_for_profile(profile)
+    if write_concern is not None:
+        arguments.append('--writeConcern=' + json.dumps(write_concern.document))
+
+    with run_mongod(str(tmp_path / 'data'), get_mongod_profile_arguments(profile)):
+        measure_throughput(
+            f'restore {database_name} with the {profile} profile',
+            DOCUMENT_COUNT,
+            'documents',
+            lambda: run_tool('mongorestore', arguments))
+
+
+@contextmanager
+def run_mongod(data_directory: str, arguments: List[str]) -> Iterator[None]:
+    os.makedirs(data_directory, exist_ok=True)
+    command = [get_executable('mongod'), '--dbpath', data_directory, '--port', str(PORT)] + arguments
+    process = subprocess.Popen(command, stdout=subprocess.DEVNULL)
+    try:
+        client: MongoClient = MongoClient(CONNECTION_STRING, serverSelectionTimeoutMS=60000)
+        client.admin.command('ping')
+        client.close()
+        yield
+    finally:
+        process.terminate()
+        process.wait()
+
+
+def run_tool(name: str, arguments: List[str]) -> None:
+    subprocess.check_output([get_executable(name), f'--uri={CONNECTION_STRING}'] + arguments, stderr=subprocess.STDOUT)
+
+
+def get_executable(name: str) -> str:
+    return os.path.join(BINARIES_DIRECTORY, name + EXECUTABLE_SUFFIX)
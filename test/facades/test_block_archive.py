@@ -0,0 +1,129 @@
+import io
+import os
+
+import pytest
+from testfixtures import tempdir, TempDirectory
+
+from nislmigrate.facades.block_archive import (
+    BlockArchiveReader,
+    BlockArchiveWriter,
+    is_compressible,
+)
+from nislmigrate.logs.migration_error import MigrationError
+
+
+def write_archive(directory: TempDirectory, block_size: int = 16) -> io.BytesIO:
+    archive = io.BytesIO()
+    with BlockArchiveWriter(archive, workers=2, block_size=block_size) as writer:
+        writer.add_directory(os.path.join(directory.path, 'source'))
+    return archive
+
+
+@pytest.mark.unit
+@tempdir()
+def test_extract_restores_every_file_and_directory(directory: TempDirectory):
+    directory.write('source/a.txt', b'first file contents')
+    directory.write('source/nested/b.txt', b'second file spans several blocks of the archive')
+    directory.write('source/nested/empty.txt', b'')
+    directory.makedir('source/empty')
+    os.utime(os.path.join(directory.path, 'source', 'a.txt'), ns=(1000000000, 1000000000))
+    archive = write_archive(directory)
+
+    count = BlockArchiveReader(archive).extract(os.path.join(directory.path, 'target'))
+
+    assert count == 3
+    assert directory.read('target/a.txt') == b'first file contents'
+    assert directory.read('target/nested/b.txt') == b'second file spans several blocks of the archive'
+    assert directory.read('target/nested/empty.txt') == b''
+    assert os.path.isdir(os.path.join(directory.path, 'target', 'empty'))
+    assert os.stat(os.path.join(directory.path, 'target', 'a.txt')).st_mtime_ns == 1000000000
+
+
+@pytest.mark.unit
+@tempdir()
+def test_extract_subtree_only_extracts_files_in_subtree(directory: TempDirectory):
+    directory.write('source/a.txt', b'a')
+    directory.write('source/nested/b.txt', b'b')
+    directory.write('source/nested_sibling/c.txt', b'c')
+    archive = write_archive(directory)
+
+    count = BlockArchiveReader(archive).extract(os.path.join(directory.path, 'target'), 'nested')
+
+    assert count == 1
+    assert os.listdir(os.path.join(directory.path, 'target')) == ['nested']
+    assert directory.read('target/nested/b.txt') == b'b'
+
+
+@pytest.mark.unit
+@tempdir()
+@pytest.mark.skipif(os.name == 'nt', reason='creating symbolic links needs privileges on Windows')
+def test_add_directory_skips_symbolic_links(directory: TempDirectory):
+    directory.write('source/a.txt', b'a')
+    directory.write('outside/b.txt', b'b')
+    os.symlink(os.path.join(directory.path, 'source'), os.path.join(directory.path, 'source', 'loop'))
+    os.symlink(os.path.join(directory.path, 'outside', 'b.txt'), os.path.join(directory.path, 'source', 'b.txt'))
+    archive = write_archive(directory)
+
+    count = BlockArchiveReader(archive).extract(os.path.join(directory.path, 'target'))
+
+    assert count == 1
+    assert os.listdir(os.path.join(directory.path, 'target')) == ['a.txt']
+
+
+@pytest.mark.unit
+@tempdir()
+def test_read_file_reads_single_file(directory: TempDirectory):
+    directory.write('source/a.txt', b'a' * 100)
+    directory.write('source/b.txt', b'contents of b')
+    archive = write_archive(directory)
+
+    assert BlockArchiveReader(archive).read_file('b.txt') == b'contents of b'
+
+
+@pytest.mark.unit
+@tempdir()
+def test_read_file_missing_file_raises_error(directory: TempDirectory):
+    directory.write('source/a.txt', b'a')
+    archive = write_archive(directory)
+
+    with pytest.raises(MigrationError):
+        BlockArchiveReader(archive).read_file('missing.txt')
+
+
+@pytest.mark.unit
+@tempdir()
+def test_incompressible_files_are_stored_uncompressed(directory: TempDirectory):
+    contents = os.urandom(256 * 1024)
+    directory.write('source/package.nipkg', contents)
+    archive = write_archive(directory, block_size=64 * 1024)
+
+    assert len(archive.getvalue()) > len(contents)
+    assert BlockArchiveReader(archive).read_file('package.nipkg') == contents
+
+
+@pytest.mark.unit
+@tempdir()
+def test_is_compressible_detects_compressed_contents(directory: TempDirectory):
+    compressed = directory.write('compressed.png', os.urandom(64 * 1024))
+    text = directory.write('text.txt', b'line of text\n' * 8192)
+
+    assert not is_compressible(compressed, 64 * 1024)
+    assert is_compressible(text, 8192 * 13)
+
+
+@pytest.mark.unit
+@tempdir()
+def test_verify_corrupt_block_raises_error(directory: TempDirectory):
+    directory.write('source/a.txt', b'some contents to compress ' * 100)
+    archive = write_archive(directory, block_size=1024)
+    data = bytearray(archive.getvalue())
+    data[40] ^= 0xff
+
+    with pytest.raises(MigrationError):
+        BlockArchiveReader(io.BytesIO(bytes(data))).verify()
+
+
+@pytest.mark.unit
+def test_reader_invalid_archive_raises_error():
+    with pytest.raises(MigrationError):
+        BlockArchiveReader(io.BytesIO(b'not an archive at all, just some bytes'))
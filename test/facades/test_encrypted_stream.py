@@ -0,0 +1,149 @@
+import io
+from unittest.mock import patch
+
+import pytest
+
+from nislmigrate.facades.encrypted_stream import DecryptingReader, EncryptingWriter, KeyManager, is_encrypted_stream
+from nislmigrate.logs.migration_error import MigrationError
+
+TEST_ITERATIONS = 1000
+
+
+@pytest.mark.unit
+@pytest.mark.parametrize('size', [0, 1, 100, 256, 1000])
+def test_encrypted_stream_round_trips_data(size: int):
+    data = bytes(index % 251 for index in range(size))
+
+    decrypted = DecryptingReader(io.BytesIO(encrypt(data)), 'secret').read()
+
+    assert decrypted == data
+
+
+@pytest.mark.unit
+@pytest.mark.parametrize('workers', [1, 2])
+def test_encrypted_stream_round_trips_data_with_workers(workers: int):
+    data = bytes(index % 251 for index in range(5000))
+
+    reader = DecryptingReader(io.BytesIO(encrypt(data, workers)), 'secret', workers=workers)
+    with reader:
+        decrypted = reader.read()
+
+    assert decrypted == data
+
+
+@pytest.mark.unit
+def test_encrypted_stream_is_the_same_format_for_any_number_of_workers():
+    data = bytes(index % 251 for index in range(5000))
+
+    assert DecryptingReader(io.BytesIO(encrypt(data, workers=2)), 'secret', workers=1).read() == data
+    assert DecryptingReader(io.BytesIO(encrypt(data, workers=1)), 'secret', workers=2).read() == data
+
+
+@pytest.mark.unit
+def test_encrypted_stream_reads_in_parts_of_any_size():
+    data = bytes(index % 251 for index in range(1000))
+    reader = DecryptingReader(io.BytesIO(encrypt(data)), 'secret')
+
+    parts = []
+    part = reader.read(70)
+    while part:
+        parts.append(part)
+        part = reader.read(70)
+
+    assert b''.join(parts) == data
+
+
+@pytest.mark.unit
+def test_encrypted_stream_starts_with_header():
+    assert is_encrypted_stream(encrypt(b'data'))
+    assert not is_encrypted_stream(b'gAAAAABh')
+
+
+@pytest.mark.unit
+def test_encrypted_streams_sharing_a_key_manager_use_different_keys():
+    key_manager = KeyManager(TEST_ITERATIONS)
+    first, second = io.BytesIO(), io.BytesIO()
+    with EncryptingWriter(first, 'secret', key_manager=key_manager) as writer:
+        writer.write(bytes(100))
+    with EncryptingWriter(second, 'secret', key_manager=key_manager) as writer:
+        writer.write(bytes(100))
+
+    assert first.getvalue()[-100:] != second.getvalue()[-100:]
+    assert DecryptingReader(io.BytesIO(second.getvalue()), 'secret', key_manager).read() == bytes(100)
+
+
+@pytest.mark.unit
+def test_encrypted_stream_with_wrong_secret_raises_error():
+    reader = DecryptingReader(io.BytesIO(encrypt(b'data')), 'wrong')
+
+    with pytest.raises(MigrationError):
+        reader.read()
+
+
+@pytest.mark.unit
+def test_encrypted_stream_with_modified_data_raises_error():
+    encrypted = bytearray(encrypt(bytes(1000)))
+    encrypted[-1] ^= 1
+    reader = DecryptingReader(io.BytesIO(bytes(encrypted)), 'secret')
+
+    with pytest.raises(MigrationError):
+        reader.read()
+
+
+@pytest.mark.unit
+def test_encrypted_stream_with_missing_last_chunk_raises_error():
+    encrypted = encrypt(bytes(1000))
+    last_chunk_size = 4 + 1 + 1000 % 256 + 16
+    reader = DecryptingReader(io.BytesIO(encrypted[:-last_chunk_size]), 'secret')
+
+    with pytest.raises(MigrationError):
+        reader.read()
+
+
+@pytest.mark.unit
+def test_encrypted_stream_without_secret_raises_error():
+    with pytest.raises(MigrationError):
+        EncryptingWriter(io.BytesIO(), '')
+
+
+def encrypt(data: bytes, workers: int = 1) -> bytes:
+    destination = io.BytesIO()
+    key_manager = KeyManager(TEST_ITERATIONS)
+    with EncryptingWriter(destination, 'secret', chunk_size=256, key_manager=key_manager, workers=workers) as writer:
+        writer.write(data)
+    return destination.getvalue()
+
+
+@pytest.mark.unit
+def test_key_manager_derives_each_key_once():
+    key_manager = KeyManager(TEST_ITERATIONS)
+
+    with patch('nislmigrate.facades.encrypted_stream.derive_key', return_value=b'k' * 32) as derive_key:
+        first_key = key_manager.get_key('secret', b's' * 16, TEST_ITERATIONS)
+        second_key = key_manager.get_key('secret', b's' * 16, TEST_ITERATIONS)
+
+    assert first_key == second_key
+    derive_key.assert_called_once()
+
+
+@pytest.mark.unit
+def test_key_manager_uses_one_random_salt_for_every_encryption():
+    key_manager = KeyManager(TEST_ITERATIONS)
+
+    first_salt, _, first_key = key_manager.get_encryption_key('secret')
+    second_salt, _, second_key = key_manager.get_encryption_key('secret')
+
+    assert first_salt == second_salt
+    assert first_key == second_key
+    assert first_salt != KeyManager(TEST_ITERATIONS).encryption_salt
+
+
+@pytest.mark.unit
+def test_encrypted_stream_decrypts_with_other_key_manager():
+    destination = io.BytesIO()
+    with EncryptingWriter(destination, 'secret', key_manager=KeyManager(TEST_ITERATIONS)) as writer:
+        writer.write(b'data')
+
+    reader = DecryptingReader(io.BytesIO(destination.getvalue()), 'secret', KeyManager())
+
+    assert reader.read() == b'data'
@@ -0,0 +1,211 @@
+import logging
+import os
+from unittest.mock import patch
+
+import pytest
+from testfixtures import tempdir, TempDirectory
+
+from nislmigrate.facades.file_copy_engine import (
+    FileCopyEngine,
+    LINK_MODE_HARDLINK,
+    LINK_MODE_REFLINK,
+    _get_clone_ranges,
+)
+
+
+@pytest.mark.unit
+@tempdir()
+def test_copy_directory_copies_nested_files_and_empty_directories(directory: TempDirectory):
+    directory.write('source/a.txt', b'a')
+    directory.write('source/nested/deeper/b.txt', b'bb')
+    directory.makedir('source/empty')
+    destination = os.path.join(directory.path, 'destination')
+
+    summary = FileCopyEngine(workers=2).copy_directory(os.path.join(directory.path, 'source'), destination)
+
+    assert directory.read('destination/a.txt') == b'a'
+    assert directory.read('destination/nested/deeper/b.txt') == b'bb'
+    assert os.path.isdir(os.path.join(destination, 'empty'))
+    assert summary.files == 2
+    assert summary.bytes_copied == 3
+
+
+@pytest.mark.unit
+@tempdir()
+def test_copy_directory_copies_large_files(directory: TempDirectory):
+    content = os.urandom(100000)
+    directory.write('source/large.bin', content)
+
+    FileCopyEngine(large_file_threshold=1000).copy_directory(
+        os.path.join(directory.path, 'source'),
+        os.path.join(directory.path, 'destination'))
+
+    assert directory.read('destination/large.bin') == content
+
+
+@pytest.mark.unit
+@tempdir()
+def test_copy_directory_copies_large_files_in_chunks_without_in_kernel_copy(directory: TempDirectory):
+    content = os.urandom(100000)
+    directory.write('source/large.bin', content)
+
+    with patch('os.copy_file_range', side_effect=OSError, create=True):
+        with patch('os.sendfile', side_effect=OSError, create=True):
+            FileCopyEngine(large_file_threshold=1000).copy_directory(
+                os.path.join(directory.path, 'source'),
+                os.path.join(directory.path, 'destination'))
+
+    assert directory.read('destination/large.bin') == content
+
+
+@pytest.mark.unit
+@tempdir()
+def test_copy_directory_raises_first_copy_error(directory: TempDirectory):
+    for index in range(10):
+        directory.write(f'source/{index}.txt', b'data')
+
+    with patch('shutil.copy2', side_effect=PermissionError('denied')):
+        with pytest.raises(PermissionError):
+            FileCopyEngine(workers=2).copy_directory(
+                os.path.join(directory.path, 'source'),
+                os.path.join(directory.path, 'destination'))
+
+
+@pytest.mark.unit
+@tempdir()
+def test_copy_directory_with_hardlink_mode_links_files(directory: TempDirectory):
+    directory.write('source/nested/a.txt', b'a')
+    destination = os.path.join(directory.path, 'destination')
+
+    summary = FileCopyEngine(link_mode=LINK_MODE_HARDLINK).copy_directory(
+        os.path.join(directory.path, 'source'),
+        destination)
+
+    assert os.path.samefile(
+        os.path.join(directory.path, 'source', 'nested', 'a.txt'),
+        os.path.join(destination, 'nested', 'a.txt'))
+    assert summary.files_linked == 1
+
+
+@pytest.mark.unit
+@tempdir()
+def test_copy_directory_with_hardlink_mode_copies_files_when_links_fail(directory: TempDirectory):
+    directory.write('source/a.txt', b'a')
+    destination = os.path.join(directory.path, 'destination')
+
+    with patch('os.link', side_effect=OSError):
+        with patch('fcntl.ioctl', side_effect=OSError, create=True):
+            summary = FileCopyEngine(link_mode=LINK_MODE_HARDLINK).copy_directory(
+                os.path.join(directory.path, 'source'),
+                destination)
+
+    assert directory.read('destination/a.txt') == b'a'
+    assert not os.path.samefile(os.path.join(directory.path, 'source', 'a.txt'), os.path.join(destination, 'a.txt'))
+    assert summary.files_linked == 0
+
+
+@pytest.mark.unit
+@tempdir()
+def test_copy_directory_with_link_mode_on_other_device_copies_files(directory: TempDirectory):
+    directory.write('source/a.txt', b'a')
+    destination = os.path.join(directory.path, 'destination')
+    real_stat = os.stat
+
+    def stat_on_other_device(path, *args, **kwargs):
+        result = real_stat(path, *args, **kwargs)
+        if path == directory.path:
+            return os.stat_result((result.st_mode, result.st_ino, result.st_dev + 1) + tuple(result)[3:])
+        return result
+
+    with patch('os.link') as link:
+        with patch('os.stat', side_effect=stat_on_other_device):
+            FileCopyEngine(link_mode=LINK_MODE_HARDLINK).copy_directory(
+                os.path.join(directory.path, 'source'),
+                destination)
+
+    link.assert_not_called()
+    assert directory.read('destination/a.txt') == b'a'
+
+
+@pytest.mark.unit
+@tempdir()
+def test_copy_files_replaces_hard_linked_file_without_changing_the_linked_file(directory: TempDirectory):
+    source = directory.write('source/a.txt', b'new')
+    linked = directory.write('linked/a.txt', b'old')
+    destination = os.path.join(directory.makedir('destination'), 'a.txt')
+    os.link(linked, destination)
+
+    FileCopyEngine().copy_files([(source, destination, 3)])
+
+    assert directory.read('destination/a.txt') == b'new'
+    assert directory.read('linked/a.txt') == b'old'
+
+
+@pytest.mark.unit
+@tempdir()
+def test_copy_files_with_link_mode_decides_link_mode_for_each_device(directory: TempDirectory):
+    other_device_source = directory.write('other/a.txt', b'a')
+    same_device_source = directory.write('source/b.txt', b'b')
+    destination_path = directory.makedir('destination')
+    other_device_path = os.path.join(directory.path, 'other')
+    real_stat = os.stat
+
+    def stat_on_other_device(path, *args, **kwargs):
+        result = real_stat(path, *args, **kwargs)
+        if path == other_device_path:
+            return os.stat_result((result.st_mode, result.st_ino, result.st_dev + 1) + tuple(result)[3:])
+        return result
+
+    with patch('os.stat', side_effect=stat_on_other_device):
+        summary = FileCopyEngine(link_mode=LINK_MODE_HARDLINK).copy_files([
+            (other_device_source, os.path.join(destination_path, 'a.txt'), 1),
+            (same_device_source, os.path.join(destination_path, 'b.txt'), 1),
+        ])
+
+    assert summary.files_linked == 1
+    assert not os.path.samefile(other_device_source, os.path.join(destination_path, 'a.txt'))
+    assert os.path.samefile(same_device_source, os.path.join(destination_path, 'b.txt'))
+
+
+@pytest.mark.unit
+def test_get_clone_ranges_aligns_ranges_to_clusters():
+    gibibyte = 1024 * 1024 * 1024
+
+    assert _get_clone_ranges(0, 4096) == []
+    assert _get_clone_ranges(1, 4096) == [(0, 4096)]
+    assert _get_clone_ranges(65536, 65536) == [(0, 65536)]
+    assert _get_clone_ranges(gibibyte + 1, 65536) == [(0, gibibyte), (gibibyte, 65536)]
+
+
+@pytest.mark.unit
+@tempdir()
+def test_copy_directory_with_reflink_mode_clones_files_on_windows(directory: TempDirectory):
+    directory.write('source/a.txt', b'a')
+    destination = os.path.join(directory.path, 'destination')
+
+    with patch('nislmigrate.facades.file_copy_engine.msvcrt', create=True):
+        with patch('nislmigrate.facades.file_copy_engine._clone_file_on_windows', return_value=True) as clone:
+            summary = FileCopyEngine(link_mode=LINK_MODE_REFLINK).copy_directory(
+                os.path.join(directory.path, 'source'),
+                destination)
+
+    clone.assert_called_once_with(os.path.join(directory.path, 'source', 'a.txt'), os.path.join(destination, 'a.txt'))
+    assert summary.files_linked == 1
+
+
+@pytest.mark.unit
+@tempdir()
+def test_copy_directory_with_reflink_mode_warns_once_when_files_can_not_be_cloned(directory: TempDirectory, caplog):
+    directory.write('source/a.txt', b'a')
+    directory.write('source/b.txt', b'b')
+
+    with patch('nislmigrate.facades.file_copy_engine.msvcrt', None):
+        with patch('fcntl.ioctl', side_effect=OSError, create=True):
+            with caplog.at_level(logging.WARNING):
+                summary = FileCopyEngine(link_mode=LINK_MODE_REFLINK).copy_directory(
+                    os.path.join(directory.path, 'source'),
+                    os.path.join(directory.path, 'destination'))
+
+    assert directory.read('destination/b.txt') == b'b'
+    assert summary.files_linked == 0
+    assert len([record for record in caplog.records if record.levelno == logging.WARNING]) == 1
@@ -0,0 +1,50 @@
+import os
+import stat
+
+import pytest
+from testfixtures import tempdir, TempDirectory
+
+from nislmigrate.facades.file_deletion_engine import FileDeletionEngine
+
+
+@pytest.mark.unit
+@tempdir()
+def test_remove_directory_removes_nested_files_and_directories(directory: TempDirectory):
+    directory.write('to_remove/a.txt', b'a')
+    directory.write('to_remove/nested/deeper/b.txt', b'b')
+    directory.makedir('to_remove/empty')
+    to_remove = os.path.join(directory.path, 'to_remove')
+
+    removed = FileDeletionEngine(workers=2).remove_directory(to_remove)
+
+    assert removed == 2
+    assert not os.path.exists(to_remove)
+
+
+@pytest.mark.unit
+@tempdir()
+def test_remove_directory_removes_readonly_files_and_directories(directory: TempDirectory):
+    readonly_file = directory.write('to_remove/nested/readonly.txt', b'a')
+    os.chmod(readonly_file, stat.S_IREAD)
+    os.chmod(os.path.join(directory.path, 'to_remove', 'nested'), stat.S_IREAD | stat.S_IEXEC)
+    to_remove = os.path.join(directory.path, 'to_remove')
+
+    FileDeletionEngine().remove_directory(to_remove)
+
+    assert not os.path.exists(to_remove)
+
+
+@pytest.mark.unit
+@tempdir()
+def test_remove_directory_does_not_follow_symbolic_links(directory: TempDirectory):
+    directory.write('kept/file.txt', b'kept')
+    to_remove = directory.makedir('to_remove')
+    try:
+        os.symlink(os.path.join(directory.path, 'kept'), os.path.join(to_remove, 'link'), target_is_directory=True)
+    except OSError:
+        pytest.skip('Creating symbolic links is not permitted.')
+
+    FileDeletionEngine().remove_directory(to_remove)
+
+    assert not os.path.exists(to_remove)
+    assert directory.read('kept/file.txt') == b'kept'
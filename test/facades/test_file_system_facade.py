@@ -1,7 +1,24 @@
+import base64
+import hashlib
 import os
+import shutil
+from typing import Dict
+from unittest.mock import patch
+
 import pytest
+from cryptography.fernet import Fernet
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
 from testfixtures import tempdir, TempDirectory
-from nislmigrate.facades.file_system_facade import FileSystemFacade
+from nislmigrate.facades.file_copy_engine import FileCopyEngine, LINK_MODE_HARDLINK
+from nislmigrate.facades.file_manifest import FileManifest
+from nislmigrate.facades.file_system_facade import (
+    FileSystemFacade,
+    VERIFY_MODE_FULL,
+    VERIFY_MODE_SAMPLE,
+    VERIFY_SAMPLE_SIZE,
+)
+from nislmigrate.facades.object_store import get_default_object_store_directory
 from nislmigrate.logs.migration_error import MigrationError
 
 
@@ -81,6 +98,457 @@ def test_copy_directory_if_exists_source_directory_exists_copies_data(directory)
     assert os.path.isfile(destination_file_path)
 
 
+@pytest.mark.unit
+@tempdir()
+def test_capture_directory_without_incremental_capture_copies_directory(directory):
+    source_path = make_directory(directory, 'source')
+    make_file(source_path, 'demofile3.txt')
+    destination_path = os.path.join(directory.path, 'destination')
+    file_system_facade = FileSystemFacade()
+
+    file_system_facade.capture_directory(source_path, destination_path)
+
+    assert os.path.isfile(os.path.join(destination_path, 'demofile3.txt'))
+    assert not os.path.exists(FileManifest.get_manifest_path(destination_path))
+
+
+@pytest.mark.unit
+@tempdir()
+def test_incremental_capture_directory_copies_directory_and_writes_manifest(directory):
+    directory.write('source/a.txt', b'a')
+    directory.write('source/nested/b.txt', b'bb')
+    source_path = os.path.join(directory.path, 'source')
+    destination_path = os.path.join(directory.path, 'destination')
+    file_system_facade = make_incremental_file_system_facade()
+
+    file_system_facade.capture_directory(source_path, destination_path)
+
+    assert directory.read('destination/a.txt') == b'a'
+    assert directory.read('destination/nested/b.txt') == b'bb'
+    manifest = FileManifest.load(FileManifest.get_manifest_path(destination_path))
+    assert sorted(manifest.files) == ['a.txt', 'nested/b.txt']
+    assert manifest.directories == {'nested'}
+
+
+@pytest.mark.unit
+@tempdir()
+def test_incremental_capture_directory_copies_only_changed_files(directory):
+    directory.write('source/changed.txt', b'old')
+    directory.write('source/unchanged.txt', b'same')
+    source_path = os.path.join(directory.path, 'source')
+    destination_path = os.path.join(directory.path, 'destination')
+    file_system_facade = make_incremental_file_system_facade()
+    file_system_facade.capture_directory(source_path, destination_path)
+    directory.write('destination/unchanged.txt', b'not copied again')
+    directory.write('source/changed.txt', b'new content')
+    directory.write('source/added.txt', b'added')
+
+    file_system_facade.capture_directory(source_path, destination_path)
+
+    assert directory.read('destination/changed.txt') == b'new content'
+    assert directory.read('destination/added.txt') == b'added'
+    assert directory.read('destination/unchanged.txt') == b'not copied again'
+
+
+@pytest.mark.unit
+@tempdir()
+def test_incremental_capture_directory_removes_deleted_files_and_directories(directory):
+    directory.write('source/kept.txt', b'kept')
+    directory.write('source/deleted.txt', b'deleted')
+    directory.write('source/deleted/nested/file.txt', b'deleted')
+    source_path = os.path.join(directory.path, 'source')
+    destination_path = os.path.join(directory.path, 'destination')
+    file_system_facade = make_incremental_file_system_facade()
+    file_system_facade.capture_directory(source_path, destination_path)
+    os.remove(os.path.join(source_path, 'deleted.txt'))
+    shutil.rmtree(os.path.join(source_path, 'deleted'))
+
+    file_system_facade.capture_directory(source_path, destination_path)
+
+    assert os.listdir(destination_path) == ['kept.txt']
+
+
+@pytest.mark.unit
+@tempdir()
+def test_incremental_capture_directory_replaces_file_with_directory(directory):
+    directory.write('source/entry', b'file')
+    source_path = os.path.join(directory.path, 'source')
+    destination_path = os.path.join(directory.path, 'destination')
+    file_system_facade = make_incremental_file_system_facade()
+    file_system_facade.capture_directory(source_path, destination_path)
+    os.remove(os.path.join(source_path, 'entry'))
+    directory.write('source/entry/file.txt', b'nested')
+
+    file_system_facade.capture_directory(source_path, destination_path)
+
+    assert directory.read('destination/entry/file.txt') == b'nested'
+
+
+@pytest.mark.unit
+@tempdir()
+def test_incremental_capture_directory_with_hash_skips_files_with_only_a_new_modification_time(directory):
+    directory.write('source/touched.txt', b'same')
+    source_path = os.path.join(directory.path, 'source')
+    destination_path = os.path.join(directory.path, 'destination')
+    file_system_facade = make_incremental_file_system_facade()
+    file_system_facade.content_hash_algorithm = 'sha256'
+    file_system_facade.capture_directory(source_path, destination_path)
+    directory.write('destination/touched.txt', b'SAME')
+    os.utime(os.path.join(source_path, 'touched.txt'), ns=(0, 1000000000))
+
+    file_system_facade.capture_directory(source_path, destination_path)
+
+    assert directory.read('destination/touched.txt') == b'SAME'
+    manifest = FileManifest.load(FileManifest.get_manifest_path(destination_path))
+    assert manifest.files['touched.txt'].modified_time == 1000000000
+    assert manifest.files['touched.txt'].content_hash is not None
+
+
+@pytest.mark.unit
+@tempdir()
+def test_incremental_capture_directory_without_manifest_into_non_empty_directory_raises_error(directory):
+    source_path = make_directory(directory, 'source')
+    destination_path = make_directory(directory, 'destination')
+    make_file(destination_path, 'demofile2.txt')
+    file_system_facade = make_incremental_file_system_facade()
+
+    with pytest.raises(MigrationError):
+        file_system_facade.capture_directory(source_path, destination_path)
+
+
+@pytest.mark.unit
+@tempdir()
+def test_capture_directory_if_exists_source_directory_does_not_exist_returns_false(directory):
+    source_path = os.path.join(directory.path, 'source')
+    destination_path = os.path.join(directory.path, 'destination')
+    file_system_facade = make_incremental_file_system_facade()
+
+    assert not file_system_facade.capture_directory_if_exists(source_path, destination_path)
+    assert not os.path.exists(destination_path)
+
+
+@pytest.mark.unit
+@tempdir()
+def test_restore_directory_without_sync_restore_replaces_directory(directory):
+    directory.write('captured/a.txt', b'a')
+    directory.write('target/extra.txt', b'extra')
+    file_system_facade = FileSystemFacade()
+
+    file_system_facade.restore_directory(
+        os.path.join(directory.path, 'captured'),
+        os.path.join(directory.path, 'target'))
+
+    assert os.listdir(os.path.join(directory.path, 'target')) == ['a.txt']
+
+
+@pytest.mark.unit
+@tempdir()
+def test_sync_restore_directory_copies_only_differences_and_removes_extras(directory):
+    directory.write('captured/same.txt', b'same')
+    directory.write('captured/changed.txt', b'captured content')
+    directory.write('captured/nested/missing.txt', b'missing')
+    source_path = os.path.join(directory.path, 'captured')
+    target_path = os.path.join(directory.path, 'target')
+    shutil.copytree(source_path, target_path)
+    directory.write('target/changed.txt', b'changed')
+    directory.write('target/extra.txt', b'extra')
+    directory.write('target/extra/nested.txt', b'extra')
+    os.remove(os.path.join(target_path, 'nested', 'missing.txt'))
+    file_system_facade = make_sync_restore_file_system_facade()
+
+    with patch('shutil.copy2', wraps=shutil.copy2) as copy:
+        file_system_facade.restore_directory(source_path, target_path)
+
+    assert sorted(os.listdir(target_path)) == ['changed.txt', 'nested', 'same.txt']
+    assert directory.read('target/changed.txt') == b'captured content'
+    assert directory.read('target/nested/missing.txt') == b'missing'
+    copied = sorted(os.path.basename(arguments[0][0]) for arguments in copy.call_args_list)
+    assert copied == ['changed.txt', 'missing.txt']
+
+
+@pytest.mark.unit
+@tempdir()
+def test_sync_restore_directory_with_hash_compares_files_with_a_new_modification_time(directory):
+    directory.write('captured/same.txt', b'same')
+    directory.write('captured/differs.txt', b'abcd')
+    source_path = os.path.join(directory.path, 'captured')
+    target_path = os.path.join(directory.path, 'target')
+    directory.write('target/same.txt', b'same')
+    directory.write('target/differs.txt', b'dcba')
+    file_system_facade = make_sync_restore_file_system_facade()
+    file_system_facade.content_hash_algorithm = 'sha256'
+
+    with patch.object(FileCopyEngine, 'copy_files', autospec=True, side_effect=FileCopyEngine.copy_files) as copy:
+        file_system_facade.restore_directory(source_path, target_path)
+
+    assert directory.read('target/differs.txt') == b'abcd'
+    copied = [os.path.basename(source) for source, _, _ in copy.call_args[0][1]]
+    assert copied == ['differs.txt']
+    same_stat = os.stat(os.path.join(target_path, 'same.txt'))
+    assert same_stat.st_mtime_ns == os.stat(os.path.join(source_path, 'same.txt')).st_mtime_ns
+
+
+@pytest.mark.unit
+@tempdir()
+def test_sync_restore_directory_creates_missing_target(directory):
+    directory.write('captured/nested/a.txt', b'a')
+    file_system_facade = make_sync_restore_file_system_facade()
+
+    file_system_facade.restore_directory(
+        os.path.join(directory.path, 'captured'),
+        os.path.join(directory.path, 'target'))
+
+    assert directory.read('target/nested/a.txt') == b'a'
+
+
+@pytest.mark.unit
+@tempdir()
+def test_sync_restore_directory_source_directory_does_not_exist_raises_error(directory):
+    target_path = make_directory(directory, 'target')
+    file_system_facade = make_sync_restore_file_system_facade()
+
+    with pytest.raises(MigrationError):
+        file_system_facade.restore_directory(os.path.join(directory.path, 'captured'), target_path)
+
+
+@pytest.mark.unit
+@tempdir()
+def test_capture_directory_to_object_store_writes_only_a_manifest(directory):
+    directory.write('source/a.txt', b'same')
+    directory.write('source/nested/b.txt', b'same')
+    source_path = os.path.join(directory.path, 'source')
+    destination_path = os.path.join(directory.path, 'migration', 'service', 'files')
+    file_system_facade = make_deduplicating_file_system_facade(directory)
+
+    file_system_facade.capture_directory(source_path, destination_path)
+
+    assert not os.path.exists(destination_path)
+    manifest = FileManifest.load(FileManifest.get_manifest_path(destination_path))
+    assert manifest.object_store == '../objects'
+    assert manifest.files['a.txt'].content_hash == manifest.files['nested/b.txt'].content_hash
+    assert len(os.listdir(os.path.join(directory.path, 'migration', 'objects', 'sha256'))) == 1
+
+
+@pytest.mark.unit
+@tempdir()
+def test_capture_directory_to_object_store_does_not_hash_unchanged_files_again(directory):
+    directory.write('source/unchanged.txt', b'unchanged')
+    source_path = os.path.join(directory.path, 'source')
+    destination_path = os.path.join(directory.path, 'migration', 'files')
+    file_system_facade = make_deduplicating_file_system_facade(directory)
+    file_system_facade.capture_directory(source_path, destination_path)
+    directory.write('source/added.txt', b'added')
+
+    with patch('nislmigrate.facades.object_store.ObjectStore.add_files', return_value=['hash']) as add_files:
+        file_system_facade.capture_directory(source_path, destination_path)
+
+    add_files.assert_called_once_with([os.path.join(source_path, 'added.txt')])
+
+
+@pytest.mark.unit
+@tempdir()
+def test_capture_directory_to_default_object_store_shares_objects_between_sibling_captures(directory):
+    directory.write('source/a.txt', b'a')
+    source_path = os.path.join(directory.path, 'source')
+    first_path = os.path.join(directory.path, 'first')
+    second_path = os.path.join(directory.path, 'second')
+    file_system_facade = FileSystemFacade()
+    file_system_facade.object_store_directory = get_default_object_store_directory(first_path)
+    file_system_facade.capture_directory(source_path, os.path.join(first_path, 'files'))
+    file_system_facade.object_store_directory = get_default_object_store_directory(second_path)
+
+    file_system_facade.capture_directory(source_path, os.path.join(second_path, 'files'))
+
+    manifest = FileManifest.load(FileManifest.get_manifest_path(os.path.join(second_path, 'files')))
+    assert manifest.object_store == '../.objects'
+    assert len(os.listdir(os.path.join(directory.path, '.objects', 'sha256'))) == 1
+    file_system_facade.restore_directory(os.path.join(second_path, 'files'), os.path.join(directory.path, 'target'))
+    assert directory.read('target/a.txt') == b'a'
+
+
+@pytest.mark.unit
+@tempdir()
+def test_restore_directory_from_object_store_materializes_files(directory):
+    directory.write('source/a.txt', b'a')
+    directory.write('source/nested/b.txt', b'b')
+    directory.makedir('source/empty')
+    destination_path = os.path.join(directory.path, 'migration', 'files')
+    file_system_facade = make_deduplicating_file_system_facade(directory)
+    file_system_facade.capture_directory(os.path.join(directory.path, 'source'), destination_path)
+    directory.write('target/extra.txt', b'extra')
+    target_path = os.path.join(directory.path, 'target')
+
+    assert file_system_facade.restore_directory_if_exists(destination_path, target_path)
+
+    assert directory.read('target/a.txt') == b'a'
+    assert directory.read('target/nested/b.txt') == b'b'
+    assert os.path.isdir(os.path.join(target_path, 'empty'))
+    assert not os.path.exists(os.path.join(target_path, 'extra.txt'))
+
+
+@pytest.mark.unit
+@tempdir()
+def test_does_captured_directory_exist_with_object_store_manifest_returns_true(directory):
+    directory.write('source/a.txt', b'a')
+    destination_path = os.path.join(directory.path, 'migration', 'files')
+    file_system_facade = make_deduplicating_file_system_facade(directory)
+    file_system_facade.capture_directory(os.path.join(directory.path, 'source'), destination_path)
+
+    assert file_system_facade.does_captured_directory_exist(destination_path)
+    assert not file_system_facade.does_captured_directory_exist(os.path.join(directory.path, 'migration', 'other'))
+
+
+@pytest.mark.unit
+@tempdir()
+def test_capture_directory_with_hardlink_mode_links_immutable_files(directory):
+    source_file = directory.write('source/a.txt', b'a')
+    destination_path = os.path.join(directory.path, 'destination')
+    file_system_facade = FileSystemFacade()
+    file_system_facade.link_mode = LINK_MODE_HARDLINK
+
+    file_system_facade.capture_directory(os.path.join(directory.path, 'source'), destination_path, ['*'])
+
+    assert os.path.samefile(source_file, os.path.join(destination_path, 'a.txt'))
+
+
+@pytest.mark.unit
+@tempdir()
+def test_capture_directory_with_hardlink_mode_links_only_files_matching_immutable_patterns(directory):
+    package_file = directory.write('source/package.nipkg', b'package')
+    index_file = directory.write('source/Packages', b'index')
+    destination_path = os.path.join(directory.path, 'destination')
+    file_system_facade = FileSystemFacade()
+    file_system_facade.link_mode = LINK_MODE_HARDLINK
+
+    file_system_facade.capture_directory(os.path.join(directory.path, 'source'), destination_path, ['*.nipkg'])
+
+    assert os.path.samefile(package_file, os.path.join(destination_path, 'package.nipkg'))
+    assert not os.path.samefile(index_file, os.path.join(destination_path, 'Packages'))
+    assert directory.read('destination/Packages') == b'index'
+
+
+@pytest.mark.unit
+@tempdir()
+def test_capture_directory_with_hardlink_mode_does_not_link_mutable_files(directory):
+    source_file = directory.write('source/a.txt', b'a')
+    destination_path = os.path.join(directory.path, 'destination')
+    file_system_facade = FileSystemFacade()
+    file_system_facade.link_mode = LINK_MODE_HARDLINK
+
+    file_system_facade.capture_directory(os.path.join(directory.path, 'source'), destination_path)
+
+    assert not os.path.samefile(source_file, os.path.join(destination_path, 'a.txt'))
+    assert directory.read('destination/a.txt') == b'a'
+
+
+@pytest.mark.unit
+@tempdir()
+def test_capture_directory_with_hash_algorithm_writes_hashes_computed_during_copy(directory):
+    directory.write('source/a.txt', b'a')
+    directory.write('source/large.bin', b'x' * 100000)
+    destination_path = os.path.join(directory.path, 'destination')
+    file_system_facade = FileSystemFacade()
+    file_system_facade.content_hash_algorithm = 'sha256'
+
+    with patch.object(FileManifest, 'compute_hash') as compute_hash:
+        file_system_facade.capture_directory(os.path.join(directory.path, 'source'), destination_path)
+
+    compute_hash.assert_not_called()
+    manifest = FileManifest.load(FileManifest.get_manifest_path(destination_path))
+    assert manifest.files['a.txt'].content_hash == hashlib.sha256(b'a').hexdigest()
+    assert manifest.files['large.bin'].content_hash == hashlib.sha256(b'x' * 100000).hexdigest()
+    assert directory.read('destination/large.bin') == b'x' * 100000
+
+
+@pytest.mark.unit
+@tempdir()
+def test_capture_directory_with_hash_algorithm_into_non_empty_directory_raises_error(directory):
+    source_path = make_directory(directory, 'source')
+    destination_path = make_directory(directory, 'destination')
+    make_file(destination_path, 'demofile2.txt')
+    file_system_facade = FileSystemFacade()
+    file_system_facade.content_hash_algorithm = 'sha256'
+
+    with pytest.raises(MigrationError):
+        file_system_facade.capture_directory(source_path, destination_path)
+
+
+@pytest.mark.unit
+@pytest.mark.parametrize('verify_mode', [VERIFY_MODE_SAMPLE, VERIFY_MODE_FULL])
+@tempdir()
+def test_verify_captured_directory_with_matching_files_succeeds(directory, verify_mode: str):
+    destination_path = capture_with_hashes(directory, {'a.txt': b'a', 'nested/b.txt': b'b'})
+    file_system_facade = FileSystemFacade()
+    file_system_facade.verify_mode = verify_mode
+
+    file_system_facade.verify_captured_directory(destination_path)
+
+
+@pytest.mark.unit
+@tempdir()
+def test_verify_captured_directory_with_corrupt_file_raises_error(directory):
+    destination_path = capture_with_hashes(directory, {'a.txt': b'a', 'nested/b.txt': b'b'})
+    directory.write('destination/nested/b.txt', b'c')
+    file_system_facade = FileSystemFacade()
+    file_system_facade.verify_mode = VERIFY_MODE_FULL
+
+    with pytest.raises(MigrationError, match='nested/b.txt'):
+        file_system_facade.verify_captured_directory(destination_path)
+
+
+@pytest.mark.unit
+@tempdir()
+def test_verify_captured_directory_with_missing_file_raises_error(directory):
+    destination_path = capture_with_hashes(directory, {'a.txt': b'a'})
+    os.remove(os.path.join(destination_path, 'a.txt'))
+    file_system_facade = FileSystemFacade()
+    file_system_facade.verify_mode = VERIFY_MODE_FULL
+
+    with pytest.raises(MigrationError):
+        file_system_facade.verify_captured_directory(destination_path)
+
+
+@pytest.mark.unit
+@tempdir()
+def test_verify_captured_directory_with_sample_mode_checks_a_sample(directory):
+    files = {f'{index}.txt': str(index).encode() for index in range(VERIFY_SAMPLE_SIZE * 2)}
+    destination_path = capture_with_hashes(directory, files)
+    file_system_facade = FileSystemFacade()
+    file_system_facade.verify_mode = VERIFY_MODE_SAMPLE
+
+    with patch.object(FileManifest, 'compute_hash', autospec=True, side_effect=FileManifest.compute_hash) as hashes:
+        file_system_facade.verify_captured_directory(destination_path)
+
+    assert hashes.call_count == VERIFY_SAMPLE_SIZE
+
+
+@pytest.mark.unit
+@tempdir()
+def test_verify_captured_directory_without_verify_mode_does_not_read_files(directory):
+    destination_path = capture_with_hashes(directory, {'a.txt': b'a'})
+    directory.write('destination/a.txt', b'corrupt')
+
+    FileSystemFacade().verify_captured_directory(destination_path)
+
+
+@pytest.mark.unit
+@tempdir()
+def test_verify_captured_directory_in_object_store_checks_objects(directory):
+    directory.write('source/a.txt', b'a')
+    destination_path = os.path.join(directory.path, 'migration', 'files')
+    file_system_facade = make_deduplicating_file_system_facade(directory)
+    file_system_facade.capture_directory(os.path.join(directory.path, 'source'), destination_path)
+    object_path = os.path.join(directory.path, 'migration', 'objects', 'sha256')
+    object_path = os.path.join(object_path, os.listdir(object_path)[0])
+    object_path = os.path.join(object_path, os.listdir(object_path)[0])
+    with open(object_path, 'wb') as corrupt_object:
+        corrupt_object.write(b'b')
+    file_system_facade.verify_mode = VERIFY_MODE_FULL
+
+    with pytest.raises(MigrationError):
+        file_system_facade.verify_captured_directory(destination_path)
+
+
 @pytest.mark.unit
 @tempdir()
 def test_copy_file(directory):
@@ -184,16 +652,22 @@ def test_copy_directory_to_encrypted_file_creates_when_file_already_exists_raise
 
 @pytest.mark.unit
 @tempdir()
-def test_copy_directory_to_encrypted_file_creates_when_tar_file_already_exists_raises_error(directory):
+def test_incremental_copy_directory_to_encrypted_file_twice_replaces_file(directory):
     source_path = make_directory(directory, 'source')
     destination_path = make_directory(directory, 'destination')
-    make_file(source_path, 'demofile3.txt')
-    make_file(directory.path, 'source.tar')
+    restored_path = make_directory(directory, 'restored')
+    make_file(source_path, 'demofile3.txt', 'old')
     encrypted_file_path = os.path.join(destination_path, 'encrypted_file')
-    file_system_facade = FileSystemFacade()
+    file_system_facade = make_incremental_file_system_facade()
+    file_system_facade.copy_directory_to_encrypted_file(source_path, encrypted_file_path, 'password')
+    make_file(source_path, 'demofile3.txt', 'new')
 
-    with pytest.raises(FileExistsError):
-        file_system_facade.copy_directory_to_encrypted_file(source_path, encrypted_file_path, 'password')
+    file_system_facade.copy_directory_to_encrypted_file(source_path, encrypted_file_path, 'password')
+
+    assert os.listdir(destination_path) == ['encrypted_file']
+    file_system_facade.copy_directory_from_encrypted_file(encrypted_file_path, restored_path, 'password')
+    with open(os.path.join(restored_path, 'demofile3.txt')) as restored_file:
+        assert restored_file.read() == 'new'
 
 
 @pytest.mark.unit
@@ -211,6 +685,62 @@ def test_copy_directory_from_encrypted_file_decrypts_file(directory):
     assert os.path.isfile(os.path.join(destination_path, 'demofile3.txt'))
 
 
+@pytest.mark.unit
+@tempdir()
+def test_copy_directory_to_encrypted_file_does_not_write_unencrypted_archive(directory):
+    source_path = make_directory(directory, 'source')
+    destination_path = make_directory(directory, 'destination')
+    make_file(source_path, 'demofile3.txt', 'content')
+    encrypted_file_path = os.path.join(destination_path, 'encrypted_file')
+    file_system_facade = FileSystemFacade()
+
+    file_system_facade.copy_directory_to_encrypted_file(source_path, encrypted_file_path, 'password')
+
+    assert sorted(os.listdir(directory.path)) == ['destination', 'source']
+    assert os.listdir(destination_path) == ['encrypted_file']
+    with open(encrypted_file_path, 'rb') as encrypted_file:
+        assert b'content' not in encrypted_file.read()
+
+
+@pytest.mark.unit
+@tempdir()
+def test_copy_directory_from_encrypted_file_restores_nested_directories(directory):
+    source_path = make_directory(directory, 'source')
+    nested_path = make_directory(directory, os.path.join('source', 'nested'))
+    make_file(nested_path, 'demofile3.txt', 'content')
+    destination_path = make_directory(directory, 'destination')
+    encrypted_file_path = os.path.join(directory.path, 'encrypted_file')
+    file_system_facade = FileSystemFacade()
+    file_system_facade.copy_directory_to_encrypted_file(source_path, encrypted_file_path, 'password')
+
+    file_system_facade.copy_directory_from_encrypted_file(encrypted_file_path, destination_path, 'password')
+
+    with open(os.path.join(destination_path, 'nested', 'demofile3.txt')) as restored_file:
+        assert restored_file.read() == 'content'
+
+
+@pytest.mark.unit
+@tempdir()
+def test_copy_directory_from_encrypted_file_decrypts_legacy_fernet_file(directory):
+    source_path = make_directory(directory, 'source')
+    destination_path = make_directory(directory, 'destination')
+    make_file(source_path, 'demofile3.txt', 'content')
+    shutil.make_archive(source_path, 'tar', source_path)
+    with open(source_path + '.tar', 'rb') as tar_file:
+        key_derivation_function = PBKDF2HMAC(algorithm=hashes.SHA256(), length=32, iterations=320000, salt=b'0'*16)
+        key = base64.urlsafe_b64encode(key_derivation_function.derive(b'password'))
+        encrypted_text = Fernet(key).encrypt(tar_file.read())
+    encrypted_file_path = make_file(directory.path, 'encrypted_file')
+    with open(encrypted_file_path, 'wb') as encrypted_file:
+        encrypted_file.write(encrypted_text)
+    file_system_facade = FileSystemFacade()
+
+    file_system_facade.copy_directory_from_encrypted_file(encrypted_file_path, destination_path, 'password')
+
+    with open(os.path.join(destination_path, 'demofile3.txt')) as restored_file:
+        assert restored_file.read() == 'content'
+
+
 @pytest.mark.unit
 @tempdir()
 def test_write_file_writes_file(directory):
@@ -243,6 +773,90 @@ def test_read_reads_correct_content(directory):
     assert file_system_facade.read_file(file_path) == 'content'
 
 
+@pytest.mark.unit
+@tempdir()
+def test_capture_directory_to_archive_restores_files(directory):
+    directory.write('source/a.txt', b'a')
+    directory.write('source/nested/b.txt', b'b')
+    destination_path = os.path.join(directory.path, 'migration', 'files')
+    file_system_facade = make_archiving_file_system_facade()
+    file_system_facade.capture_directory(os.path.join(directory.path, 'source'), destination_path)
+    directory.write('target/extra.txt', b'extra')
+    target_path = os.path.join(directory.path, 'target')
+
+    assert file_system_facade.restore_directory_if_exists(destination_path, target_path)
+
+    assert not os.path.exists(destination_path)
+    assert os.listdir(os.path.join(directory.path, 'migration')) == ['files.archive']
+    assert directory.read('target/a.txt') == b'a'
+    assert directory.read('target/nested/b.txt') == b'b'
+    assert not os.path.exists(os.path.join(target_path, 'extra.txt'))
+
+
+@pytest.mark.unit
+@tempdir()
+def test_capture_directory_to_existing_archive_raises_error(directory):
+    directory.write('source/a.txt', b'a')
+    destination_path = os.path.join(directory.path, 'migration', 'files')
+    file_system_facade = make_archiving_file_system_facade()
+    file_system_facade.capture_directory(os.path.join(directory.path, 'source'), destination_path)
+
+    with pytest.raises(MigrationError):
+        file_system_facade.capture_directory(os.path.join(directory.path, 'source'), destination_path)
+
+
+@pytest.mark.unit
+@tempdir()
+def test_verify_captured_archive_with_corrupt_block_raises_error(directory):
+    directory.write('source/a.txt', b'a')
+    destination_path = os.path.join(directory.path, 'migration', 'files')
+    file_system_facade = make_archiving_file_system_facade()
+    file_system_facade.capture_directory(os.path.join(directory.path, 'source'), destination_path)
+    file_system_facade.verify_mode = VERIFY_MODE_FULL
+    file_system_facade.verify_captured_directory(destination_path)
+    with open(destination_path + '.archive', 'r+b') as archive:
+        archive.seek(30)
+        archive.write(b'x')
+
+    assert file_system_facade.does_captured_directory_exist(destination_path)
+    with pytest.raises(MigrationError):
+        file_system_facade.verify_captured_directory(destination_path)
+
+
+def make_incremental_file_system_facade() -> FileSystemFacade:
+    file_system_facade = FileSystemFacade()
+    file_system_facade.incremental_capture = True
+    return file_system_facade
+
+
+def make_sync_restore_file_system_facade() -> FileSystemFacade:
+    file_system_facade = FileSystemFacade()
+    file_system_facade.sync_restore = True
+    return file_system_facade
+
+
+def make_deduplicating_file_system_facade(temp_directory: TempDirectory) -> FileSystemFacade:
+    file_system_facade = FileSystemFacade()
+    file_system_facade.object_store_directory = os.path.join(temp_directory.path, 'migration', 'objects')
+    return file_system_facade
+
+
+def make_archiving_file_system_facade() -> FileSystemFacade:
+    file_system_facade = FileSystemFacade()
+    file_system_facade.archive_capture = True
+    return file_system_facade
+
+
+def capture_with_hashes(temp_directory: TempDirectory, files: Dict[str, bytes]) -> str:
+    for path, content in files.items():
+        temp_directory.write(f'source/{path}', content)
+    destination_path = os.path.join(temp_directory.path, 'destination')
+    file_system_facade = FileSystemFacade()
+    file_system_facade.content_hash_algorithm = 'sha256'
+    file_system_facade.capture_directory(os.path.join(temp_directory.path, 'source'), destination_path)
+    return destination_path
+
+
 def make_directory(temp_directory: TempDirectory, name: str) -> str:
     path = os.path.join(temp_directory.path, name)
     os.mkdir(path)
@@ -0,0 +1,83 @@
+import io
+import struct
+from typing import Any, Dict, List
+
+import bson
+import pytest
+
+from nislmigrate.facades.mongo_archive import ARCHIVE_MAGIC_NUMBER, MongoArchiveReader
+from nislmigrate.logs.migration_error import MigrationError
+
+TERMINATOR = struct.pack('<i', -1)
+
+
+@pytest.mark.unit
+def test_mongo_archive_reader_reads_collection_metadata():
+    archive = make_archive('database', {
+        'files': ('{"options": {}, "indexes": [{"v": 2, "key": {"path": 1}, "name": "path_1"}]}', []),
+        'other': ('', []),
+    })
+    reader = MongoArchiveReader(io.BytesIO(archive))
+
+    collections = reader.read_collections()
+
+    assert [collection.namespace for collection in collections] == ['database.files', 'database.other']
+    assert collections[0].indexes == [{'v': 2, 'key': {'path': 1}, 'name': 'path_1'}]
+    assert collections[1].indexes == []
+
+
+@pytest.mark.unit
+def test_mongo_archive_reader_reads_documents_of_every_collection():
+    archive = make_archive('database', {
+        'files': ('', [{'_id': 1, 'path': 'a'}, {'_id': 2, 'path': 'b'}]),
+        'other': ('', [{'_id': 3}]),
+    })
+    reader = MongoArchiveReader(io.BytesIO(archive))
+    reader.read_collections()
+
+    documents = [(namespace, bson.decode(document)) for namespace, document in reader.read_documents()]
+
+    assert documents == [
+        ('database.files', {'_id': 1, 'path': 'a'}),
+        ('database.files', {'_id': 2, 'path': 'b'}),
+        ('database.other', {'_id': 3}),
+    ]
+
+
+@pytest.mark.unit
+def test_mongo_archive_reader_with_other_file_raises_error():
+    reader = MongoArchiveReader(io.BytesIO(b'not an archive'))
+
+    with pytest.raises(MigrationError):
+        reader.read_collections()
+
+
+@pytest.mark.unit
+def test_mongo_archive_reader_with_truncated_archive_raises_error():
+    archive = make_archive('database', {'files': ('', [{'_id': 1, 'path': 'a'}])})
+    reader = MongoArchiveReader(io.BytesIO(archive[:-6]))
+    reader.read_collections()
+
+    with pytest.raises(MigrationError):
+        list(reader.read_documents())
+
+
+def make_archive(database_name: str, collections: Dict[str, Any]) -> bytes:
+    """
+    Writes an archive in the layout used by mongodump --archive.
+
+    :param database_name: The name of the database of every collection.
+    :param collections: The metadata and documents of each collection, by collection name.
+    :return: The archive.
+    """
+    parts: List[bytes] = [struct.pack('<I', ARCHIVE_MAGIC_NUMBER), bson.encode({'version': '0.1'})]
+    for collection_name, (metadata, _) in collections.items():
+        parts.append(bson.encode({'db': database_name, 'collection': collection_name, 'metadata': metadata}))
+    parts.append(TERMINATOR)
+    for collection_name, (_, documents) in collections.items():
+        parts.append(bson.encode({'db': database_name, 'collection': collection_name, 'EOF': False}))
+        parts.extend(bson.encode(document) for document in documents)
+        parts.append(TERMINATOR)
+        parts.append(bson.encode({'db': database_name, 'collection': collection_name, 'EOF': True}))
+        parts.append(TERMINATOR)
+    return b''.join(parts)
@@ -0,0 +1,88 @@
+import gzip
+import io
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from testfixtures import tempdir, TempDirectory
+
+from nislmigrate.facades.mongo_dump import (
+    DUMP_COMPRESSION_NONE,
+    MongoDumpOptions,
+    ParallelGzipWriter,
+    is_gzip_file,
+    open_dump_archive,
+    write_dump_archive,
+)
+from nislmigrate.logs.migration_error import MigrationError
+from test.facades.test_mongo_archive import make_archive
+
+
+@pytest.mark.unit
+def test_parallel_gzip_writer_output_decompresses_to_input():
+    data = os.urandom(1000) + b'compressible text ' * 5000
+    output = io.BytesIO()
+
+    with ThreadPoolExecutor(max_workers=3) as executor:
+        writer = ParallelGzipWriter(output, executor, block_size=4096, pending_blocks=2)
+        for index in range(0, len(data), 1000):
+            writer.write(data[index:index + 1000])
+        writer.close()
+
+    assert gzip.decompress(output.getvalue()) == data
+    assert len(output.getvalue()) < len(data)
+
+
+@pytest.mark.unit
+def test_write_dump_archive_reports_every_collection():
+    archive = make_archive('database', {
+        'files': ('', [{'_id': 1, 'path': 'a'}, {'_id': 2, 'path': 'b'}]),
+        'empty': ('', []),
+    })
+    output = io.BytesIO()
+
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        reports = write_dump_archive(io.BytesIO(archive), output, MongoDumpOptions(), executor)
+
+    assert gzip.decompress(output.getvalue()) == archive
+    assert [(report.namespace, report.documents) for report in reports] == [
+        ('database.files', 2),
+        ('database.empty', 0),
+    ]
+    assert reports[0].bytes_dumped > 0
+    assert reports[1].bytes_dumped == 0
+
+
+@pytest.mark.unit
+def test_write_dump_archive_truncated_archive_raises_error():
+    archive = make_archive('database', {'files': ('', [{'_id': 1, 'path': 'a'}])})
+
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        with pytest.raises(MigrationError):
+            write_dump_archive(io.BytesIO(archive[:-6]), io.BytesIO(), MongoDumpOptions(), executor)
+
+
+@pytest.mark.unit
+@tempdir()
+def test_open_dump_archive_reads_compressed_and_plain_archives(directory: TempDirectory):
+    archive = make_archive('database', {'files': ('', [{'_id': 1}])})
+    compressed = directory.write('compressed', gzip.compress(archive))
+    plain = directory.write('plain', archive)
+
+    with open_dump_archive(compressed) as stream:
+        assert stream.read() == archive
+    with open_dump_archive(plain) as stream:
+        assert stream.read() == archive
+    assert is_gzip_file(compressed)
+    assert not is_gzip_file(plain)
+
+
+@pytest.mark.unit
+def test_write_dump_archive_without_compression_copies_archive():
+    archive = make_archive('database', {'files': ('', [{'_id': 1}])})
+    output = io.BytesIO()
+
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        write_dump_archive(io.BytesIO(archive), output, MongoDumpOptions(compression=DUMP_COMPRESSION_NONE), executor)
+
+    assert output.getvalue() == archive
@@ -1,84 +1,896 @@
+import gzip
+import io
 import os
-from unittest.mock import patch, Mock
+from typing import Any, BinaryIO, Callable, Dict, List, Tuple
+from unittest.mock import patch, Mock, MagicMock
 
+import bson
 import pytest as pytest
+from pymongo import ReplaceOne, UpdateOne
+from pymongo.errors import BulkWriteError, OperationFailure
 from testfixtures import tempdir, TempDirectory
 
 from nislmigrate.facades import mongo_configuration
+from nislmigrate.facades.document_transform import DocumentTransform, DocumentTransformStep
 from nislmigrate.facades.mongo_configuration import MongoConfiguration
-from nislmigrate.facades.mongo_facade import MongoFacade
+from nislmigrate.facades.mongo_dump import DUMP_COMPRESSION_NONE, MongoDumpOptions
+from nislmigrate.facades.mongo_restore import MongoRestoreOptions
+from nislmigrate.facades.mongo_facade import (
+    MongoFacade,
+    MongoProcessManager,
+    DocumentUpdateSummary,
+    MONGO_ENGINE_NATIVE,
+    MONGO_PROFILE_BULK_LOAD,
+    MONGO_PROFILE_PRODUCTION,
+    get_mongod_profile_arguments,
+    get_write_concern_for_profile,
+)
+from nislmigrate.logs.migration_error import MigrationError
 from nislmigrate.facades.process_facade import ProcessFacade
+from test.facades.test_mongo_archive import make_archive
+from test.facades.test_mongo_native_engine import make_database
 
 
 @pytest.mark.unit
 @tempdir()
+@patch('nislmigrate.facades.mongo_facade.MongoProcessManager.ping', side_effect=[False, True])
 @patch('subprocess.run')
 @patch('subprocess.Popen')
 def test_mongo_facade_capture_migration_directory_created_when_it_does_not_exist(
         process_open: Mock,
         run: Mock,
+        ping: Mock,
         temp_directory: TempDirectory,
 ) -> None:
     migration_directory = os.path.join(temp_directory.path, 'migration')
     assert not os.path.exists(migration_directory)
     configuration = get_fake_mongo_configuration()
     mongo_facade = MongoFacade(ProcessFacade())
+    set_up_mongo_dump_process(process_open)
 
     mongo_facade.capture_database_to_directory(configuration, migration_directory, 'testname.gz')
 
     assert os.path.exists(migration_directory)
-    run.assert_called()
+    assert os.path.isfile(os.path.join(migration_directory, 'testname.gz'))
     process_open.assert_called()
 
 
 @pytest.mark.unit
 @tempdir()
+@patch('nislmigrate.facades.mongo_facade.MongoProcessManager.ping', side_effect=[False, True])
 @patch('subprocess.run')
 @patch('subprocess.Popen')
 def test_mongo_facade_capture_migration_nested_directory_created_when_it_does_not_exist(
         process_open: Mock,
         run: Mock,
+        ping: Mock,
         temp_directory: TempDirectory,
 ) -> None:
     migration_directory = os.path.join(temp_directory.path, 'migration', 'other')
     assert not os.path.exists(migration_directory)
     configuration = get_fake_mongo_configuration()
     mongo_facade = MongoFacade(ProcessFacade())
+    set_up_mongo_dump_process(process_open)
 
     mongo_facade.capture_database_to_directory(configuration, migration_directory, 'testname.gz')
 
     assert os.path.exists(migration_directory)
-    run.assert_called()
+    assert os.path.isfile(os.path.join(migration_directory, 'testname.gz'))
     process_open.assert_called()
 
 
 @pytest.mark.unit
 @tempdir()
+@patch('nislmigrate.facades.mongo_facade.MongoProcessManager.ping', side_effect=[False, True])
 @patch('subprocess.run')
 @patch('subprocess.Popen')
 def test_mongo_facade_capture_migration_directory_already_exists_and_empty(
         process_open: Mock,
         run: Mock,
+        ping: Mock,
         temp_directory: TempDirectory,
 ) -> None:
     migration_directory = make_directory(temp_directory, 'migration')
     assert os.path.exists(migration_directory)
     configuration = get_fake_mongo_configuration()
     mongo_facade = MongoFacade(ProcessFacade())
+    set_up_mongo_dump_process(process_open)
 
     mongo_facade.capture_database_to_directory(configuration, migration_directory, 'testname.gz')
 
     assert os.path.exists(migration_directory)
-    run.assert_called()
+    assert os.path.isfile(os.path.join(migration_directory, 'testname.gz'))
     process_open.assert_called()
 
 
+@pytest.mark.unit
+@patch('nislmigrate.facades.mongo_facade.MongoProcessManager.ping', return_value=True)
+@patch('nislmigrate.facades.mongo_facade.MongoClient')
+@patch('subprocess.Popen')
+def test_mongo_facade_get_collection_shares_client_for_equal_configurations(
+        process_open: Mock,
+        mongo_client: Mock,
+        ping: Mock,
+) -> None:
+    mongo_facade = MongoFacade(ProcessFacade())
+
+    mongo_facade.get_collection(get_fake_mongo_configuration(), 'first')
+    mongo_facade.get_collection(get_fake_mongo_configuration(), 'second')
+
+    mongo_client.assert_called_once()
+
+
+@pytest.mark.unit
+@patch('nislmigrate.facades.mongo_facade.MongoClient')
+@patch('subprocess.Popen')
+def test_mongo_facade_get_collection_configures_connection_pool(
+        process_open: Mock,
+        mongo_client: Mock,
+) -> None:
+    mongo_facade = MongoFacade(ProcessFacade(), max_pool_size=4, max_idle_time_milliseconds=1000)
+
+    mongo_facade.get_collection(get_fake_mongo_configuration(), 'collection')
+
+    _, keyword_arguments = mongo_client.call_args
+    assert keyword_arguments['maxPoolSize'] == 4
+    assert keyword_arguments['maxIdleTimeMS'] == 1000
+
+
+@pytest.mark.unit
+@patch('nislmigrate.facades.mongo_facade.MongoProcessManager.ping', return_value=True)
+@patch('nislmigrate.facades.mongo_facade.MongoClient')
+@patch('subprocess.Popen')
+def test_mongo_facade_close_connections_closes_shared_clients(
+        process_open: Mock,
+        mongo_client: Mock,
+        ping: Mock,
+) -> None:
+    mongo_facade = MongoFacade(ProcessFacade())
+    mongo_facade.get_collection(get_fake_mongo_configuration(), 'collection')
+
+    mongo_facade.close_connections()
+    mongo_facade.get_collection(get_fake_mongo_configuration(), 'collection')
+
+    mongo_client.return_value.close.assert_called_once()
+    assert mongo_client.call_count == 2
+
+
+@pytest.mark.unit
+@patch('nislmigrate.facades.mongo_facade.MongoClient')
+@patch('subprocess.Popen')
+def test_mongo_facade_update_documents_writes_changes_in_unordered_batches(
+        process_open: Mock,
+        mongo_client: Mock,
+) -> None:
+    documents = [{'_id': i, 'path': 'old'} for i in range(5)]
+    collection = configure_fake_collection(mongo_client, documents)
+    mongo_facade = MongoFacade(ProcessFacade())
+
+    mongo_facade.update_documents_in_collection(
+        get_fake_mongo_configuration(),
+        'collection',
+        set_path_function('new'),
+        batch_size=2)
+
+    batch_sizes = [len(call[0][0]) for call in collection.bulk_write.call_args_list]
+    assert batch_sizes == [2, 2, 1]
+    assert all(call[1]['ordered'] is False for call in collection.bulk_write.call_args_list)
+
+
+@pytest.mark.unit
+@patch('nislmigrate.facades.mongo_facade.MongoClient')
+@patch('subprocess.Popen')
+def test_mongo_facade_update_documents_sets_single_changed_field(
+        process_open: Mock,
+        mongo_client: Mock,
+) -> None:
+    collection = configure_fake_collection(mongo_client, [{'_id': 1, 'path': 'old', 'size': 10}])
+    mongo_facade = MongoFacade(ProcessFacade())
+
+    mongo_facade.update_documents_in_collection(get_fake_mongo_configuration(), 'collection', set_path_function('new'))
+
+    operations = collection.bulk_write.call_args[0][0]
+    assert operations == [UpdateOne({'_id': 1}, {'$set': {'path': 'new'}})]
+
+
+@pytest.mark.unit
+@patch('nislmigrate.facades.mongo_facade.MongoClient')
+@patch('subprocess.Popen')
+def test_mongo_facade_update_documents_replaces_document_when_several_fields_change(
+        process_open: Mock,
+        mongo_client: Mock,
+) -> None:
+    collection = configure_fake_collection(mongo_client, [{'_id': 1, 'path': 'old', 'size': 10}])
+    mongo_facade = MongoFacade(ProcessFacade())
+
+    def update_function(document: Dict[str, Any]) -> Dict[str, Any]:
+        document['path'] = 'new'
+        document['size'] = 20
+        return document
+
+    mongo_facade.update_documents_in_collection(get_fake_mongo_configuration(), 'collection', update_function)
+
+    operations = collection.bulk_write.call_args[0][0]
+    assert operations == [ReplaceOne({'_id': 1}, {'_id': 1, 'path': 'new', 'size': 20})]
+
+
+@pytest.mark.unit
+@patch('nislmigrate.facades.mongo_facade.MongoClient')
+@patch('subprocess.Popen')
+def test_mongo_facade_conditionally_update_documents_skips_unmatched_and_unchanged_documents(
+        process_open: Mock,
+        mongo_client: Mock,
+) -> None:
+    documents = [{'_id': 1, 'path': 'old'}, {'_id': 2, 'path': 'other'}, {'_id': 3, 'path': 'new'}]
+    collection = configure_fake_collection(mongo_client, documents)
+    mongo_facade = MongoFacade(ProcessFacade())
+
+    mongo_facade.conditionally_update_documents_in_collection(
+        get_fake_mongo_configuration(),
+        'collection',
+        lambda document: document['path'] != 'other',
+        set_path_function('new'))
+
+    operations = collection.bulk_write.call_args[0][0]
+    assert operations == [UpdateOne({'_id': 1}, {'$set': {'path': 'new'}})]
+
+
+@pytest.mark.unit
+@patch('nislmigrate.facades.mongo_facade.MongoClient')
+@patch('subprocess.Popen')
+def test_mongo_facade_update_documents_returns_summary_of_all_batches(
+        process_open: Mock,
+        mongo_client: Mock,
+) -> None:
+    documents = [{'_id': i, 'path': 'old'} for i in range(3)]
+    collection = configure_fake_collection(mongo_client, documents)
+    collection.bulk_write.side_effect = [
+        Mock(matched_count=2, modified_count=2),
+        BulkWriteError({'nMatched': 0, 'nModified': 0, 'writeErrors': [{'errmsg': 'error'}]}),
+    ]
+    mongo_facade = MongoFacade(ProcessFacade())
+
+    summary = mongo_facade.update_documents_in_collection(
+        get_fake_mongo_configuration(),
+        'collection',
+        set_path_function('new'),
+        batch_size=2)
+
+    assert summary == DocumentUpdateSummary(matched=2, modified=2, failed=1)
+
+
+@pytest.mark.unit
+@patch('nislmigrate.facades.mongo_facade.MongoClient')
+@patch('subprocess.Popen')
+def test_mongo_facade_update_documents_passes_query_options_to_cursor(
+        process_open: Mock,
+        mongo_client: Mock,
+) -> None:
+    collection = configure_fake_collection(mongo_client, [])
+    mongo_facade = MongoFacade(ProcessFacade())
+
+    mongo_facade.update_documents_in_collection(
+        get_fake_mongo_configuration(),
+        'collection',
+        set_path_function('new'),
+        query_filter={'path': 'old'},
+        projection={'path': 1},
+        cursor_batch_size=500,
+        no_cursor_timeout=True)
+
+    collection.find.assert_called_once_with({'path': 'old'}, {'path': 1}, batch_size=500, no_cursor_timeout=True)
+    collection.find.return_value.close.assert_called_once()
+
+
+@pytest.mark.unit
+@patch('nislmigrate.facades.mongo_facade.MongoClient')
+@patch('subprocess.Popen')
+def test_mongo_facade_update_documents_with_projection_sets_changed_fields(
+        process_open: Mock,
+        mongo_client: Mock,
+) -> None:
+    collection = configure_fake_collection(mongo_client, [{'_id': 1, 'path': 'old', 'name': 'old'}])
+    mongo_facade = MongoFacade(ProcessFacade())
+
+    def update_function(document: Dict[str, Any]) -> Dict[str, Any]:
+        document['path'] = 'new'
+        del document['name']
+        return document
+
+    mongo_facade.update_documents_in_collection(
+        get_fake_mongo_configuration(),
+        'collection',
+        update_function,
+        projection={'path': 1, 'name': 1})
+
+    operations = collection.bulk_write.call_args[0][0]
+    assert operations == [UpdateOne({'_id': 1}, {'$set': {'path': 'new'}, '$unset': {'name': ''}})]
+
+
+@pytest.mark.unit
+@patch('nislmigrate.facades.mongo_facade.MongoClient')
+@patch('subprocess.Popen')
+def test_mongo_facade_update_documents_in_partitions_scans_each_id_range(
+        process_open: Mock,
+        mongo_client: Mock,
+) -> None:
+    collection = configure_fake_collection(mongo_client, [])
+    collection.aggregate.return_value = [{'_id': _id} for _id in [7, 1, 5, 3]]
+    mongo_facade = MongoFacade(ProcessFacade())
+
+    mongo_facade.update_documents_in_collection(
+        get_fake_mongo_configuration(),
+        'collection',
+        set_path_function('new'),
+        query_filter={'path': 'old'},
+        partitions=2)
+
+    scanned_filters = [find_call[0][0] for find_call in collection.find.call_args_list]
+    assert len(scanned_filters) == 2
+    assert {'$and': [{'path': 'old'}, {'_id': {'$not': {'$gte': 5}}}]} in scanned_filters
+    assert {'$and': [{'path': 'old'}, {'_id': {'$gte': 5}}]} in scanned_filters
+
+
+@pytest.mark.unit
+@patch('nislmigrate.facades.mongo_facade.MongoClient')
+@patch('subprocess.Popen')
+def test_mongo_facade_update_documents_in_partitions_with_mixed_id_types_scans_once(
+        process_open: Mock,
+        mongo_client: Mock,
+) -> None:
+    collection = configure_fake_collection(mongo_client, [])
+    collection.aggregate.return_value = [{'_id': 1}, {'_id': 'a'}, {'_id': 2}]
+    mongo_facade = MongoFacade(ProcessFacade())
+
+    mongo_facade.update_documents_in_collection(
+        get_fake_mongo_configuration(),
+        'collection',
+        set_path_function('new'),
+        partitions=2)
+
+    collection.find.assert_called_once()
+    assert collection.find.call_args[0][0] == {}
+
+
+@pytest.mark.unit
+@patch('nislmigrate.facades.mongo_facade.MongoClient')
+@patch('subprocess.Popen')
+def test_mongo_facade_update_documents_in_partitions_merges_summaries(
+        process_open: Mock,
+        mongo_client: Mock,
+) -> None:
+    collection = configure_fake_collection(mongo_client, [])
+    collection.aggregate.return_value = [{'_id': _id} for _id in range(4)]
+    collection.find.side_effect = lambda *args, **kwargs: make_fake_cursor([{'_id': 0, 'path': 'old'}])
+    collection.bulk_write.return_value = Mock(matched_count=1, modified_count=1)
+    mongo_facade = MongoFacade(ProcessFacade())
+
+    summary = mongo_facade.update_documents_in_collection(
+        get_fake_mongo_configuration(),
+        'collection',
+        set_path_function('new'),
+        partitions=4)
+
+    assert summary == DocumentUpdateSummary(matched=4, modified=4)
+
+
+@pytest.mark.unit
+@tempdir()
+@patch('nislmigrate.facades.mongo_facade.MongoClient')
+@patch('subprocess.check_output', return_value=b'')
+@patch('subprocess.Popen')
+def test_mongo_facade_restore_with_transforms_inserts_transformed_documents_from_archive(
+        process_open: Mock,
+        check_output: Mock,
+        mongo_client: Mock,
+        temp_directory: TempDirectory,
+) -> None:
+    collection = configure_fake_collection(mongo_client, [])
+    collection.codec_options = bson.codec_options.DEFAULT_CODEC_OPTIONS
+    indexes = '{"indexes": [{"key": {"_id": 1}, "name": "_id_"}, {"key": {"path": 1}, "name": "path_1"}]}'
+    archive = make_archive('database', {
+        'files': (indexes, [{'_id': 1, 'path': 'old'}, {'_id': 2, 'path': 'other'}]),
+        'other': ('', [{'_id': 3}]),
+    })
+    with gzip.open(os.path.join(temp_directory.path, 'dump'), 'wb') as dump:
+        dump.write(archive)
+    transform = DocumentTransform()
+    transform.add_step(DocumentTransformStep(
+        {'path': 'old'},
+        lambda document: document['path'] == 'old',
+        set_path_function('new'),
+        ['path']))
+    mongo_facade = MongoFacade(ProcessFacade())
+
+    mongo_facade.restore_database_from_directory(
+        get_fake_mongo_configuration(),
+        temp_directory.path,
+        'dump',
+        {'files': transform})
+
+    assert '--nsExclude=*.files' in check_output.call_args[0][0]
+    collection.drop.assert_called_once()
+    restored_documents = [{'_id': 1, 'path': 'new'}, {'_id': 2, 'path': 'other'}]
+    collection.insert_many.assert_called_once_with(restored_documents, ordered=False)
+    [index] = collection.create_indexes.call_args[0][0]
+    assert index.document['name'] == 'path_1'
+
+
+@pytest.mark.unit
+@tempdir()
+@patch('nislmigrate.facades.mongo_facade.MongoClient')
+@patch('subprocess.check_output', return_value=b'')
+@patch('subprocess.Popen')
+def test_mongo_facade_restore_with_deferred_indexes_builds_indexes_after_documents(
+        process_open: Mock,
+        check_output: Mock,
+        mongo_client: Mock,
+        temp_directory: TempDirectory,
+) -> None:
+    collection = configure_fake_collection(mongo_client, [])
+    collection.codec_options = bson.codec_options.DEFAULT_CODEC_OPTIONS
+    indexes = '{"indexes": [{"key": {"_id": 1}, "name": "_id_"}, {"key": {"path": 1}, "name": "path_1"}]}'
+    archive = make_archive('database', {
+        'files': (indexes, [{'_id': 1, 'path': 'old'}]),
+        'other': ('{"indexes": [{"key": {"_id": 1}, "name": "_id_"}]}', [{'_id': 3}]),
+    })
+    with gzip.open(os.path.join(temp_directory.path, 'dump'), 'wb') as dump:
+        dump.write(archive)
+    transform = DocumentTransform()
+    transform.add_step(DocumentTransformStep({}, lambda document: False, set_path_function('new'), ['path']))
+    options = MongoRestoreOptions(insertion_workers_per_collection=3, parallel_collections=2, defer_index_builds=True)
+    mongo_facade = MongoFacade(ProcessFacade())
+
+    mongo_facade.restore_database_from_directory(
+        get_fake_mongo_configuration(),
+        temp_directory.path,
+        'dump',
+        {'files': transform},
+        options)
+
+    mongo_restore_command = check_output.call_args[0][0]
+    assert '--noIndexRestore' in mongo_restore_command
+    assert '--numInsertionWorkersPerCollection=3' in mongo_restore_command
+    assert '--numParallelCollections=2' in mongo_restore_command
+    collection.insert_many.assert_called_once()
+    # The indexes of the transformed collection are only built in the deferred phase.
+    [index] = collection.create_indexes.call_args[0][0]
+    assert index.document['name'] == 'path_1'
+    collection.create_indexes.assert_called_once()
+
+
+@pytest.mark.unit
+@tempdir()
+@patch('nislmigrate.facades.mongo_facade.MongoClient')
+@patch('nislmigrate.facades.mongo_facade.MongoProcessManager.ping', side_effect=[False, True])
+@patch('subprocess.check_output', return_value=b'')
+@patch('subprocess.Popen')
+def test_mongo_facade_restore_with_bulk_load_profile_starts_tuned_mongo(
+        process_open: Mock,
+        check_output: Mock,
+        ping: Mock,
+        mongo_client: Mock,
+        temp_directory: TempDirectory,
+) -> None:
+    temp_directory.write('dump', b'')
+    mongo_facade = MongoFacade(ProcessFacade())
+    mongo_facade.mongo_profile = MONGO_PROFILE_BULK_LOAD
+
+    mongo_facade.restore_database_from_directory(get_fake_mongo_configuration(), temp_directory.path, 'dump')
+
+    mongod_command = process_open.call_args[0][0]
+    assert '--journalCommitInterval' in mongod_command
+    assert '--config' in mongod_command
+    assert '--writeConcern={"j": false, "w": 1}' in check_output.call_args[0][0]
+
+
+@pytest.mark.unit
+@tempdir()
+@patch('nislmigrate.facades.mongo_facade.MongoClient')
+@patch('nislmigrate.facades.mongo_facade.MongoProcessManager.ping', return_value=True)
+@patch('subprocess.check_output', return_value=b'')
+def test_mongo_facade_restore_with_bulk_load_profile_flushes_restored_documents_to_journal(
+        check_output: Mock,
+        ping: Mock,
+        mongo_client: Mock,
+        temp_directory: TempDirectory,
+) -> None:
+    temp_directory.write('dump', b'')
+    mongo_facade = MongoFacade(ProcessFacade())
+    mongo_facade.mongo_profile = MONGO_PROFILE_BULK_LOAD
+
+    mongo_facade.restore_database_from_directory(get_fake_mongo_configuration(), temp_directory.path, 'dump')
+
+    get_database = mongo_client.return_value.get_database
+    assert get_database.call_args[1]['write_concern'].document == {'j': True}
+    collection = get_database.return_value.__getitem__.return_value
+    collection.insert_one.assert_called_once()
+    collection.drop.assert_called_once()
+
+
+@pytest.mark.unit
+@tempdir()
+@patch('nislmigrate.facades.mongo_facade.MongoClient')
+@patch('nislmigrate.facades.mongo_facade.MongoProcessManager.ping', return_value=True)
+@patch('subprocess.check_output', return_value=b'')
+def test_mongo_facade_restore_with_production_profile_does_not_flush_journal(
+        check_output: Mock,
+        ping: Mock,
+        mongo_client: Mock,
+        temp_directory: TempDirectory,
+) -> None:
+    temp_directory.write('dump', b'')
+    mongo_facade = MongoFacade(ProcessFacade())
+
+    mongo_facade.restore_database_from_directory(get_fake_mongo_configuration(), temp_directory.path, 'dump')
+
+    mongo_client.return_value.get_database.assert_not_called()
+
+
+@pytest.mark.unit
+@patch('nislmigrate.facades.mongo_facade.MongoProcessManager.ping', return_value=True)
+def test_mongo_facade_start_mongo_with_bulk_load_profile_warns_once_when_mongo_is_running(ping: Mock, caplog) -> None:
+    mongo_facade = MongoFacade(Mock())
+    mongo_facade.mongo_profile = MONGO_PROFILE_BULK_LOAD
+
+    mongo_facade.start_mongo(get_fake_mongo_configuration())
+    mongo_facade.start_mongo(get_fake_mongo_configuration())
+
+    warnings = [record.getMessage() for record in caplog.records if record.levelname == 'WARNING']
+    assert len(warnings) == 1
+    assert MONGO_PROFILE_BULK_LOAD in warnings[0]
+
+
+@pytest.mark.unit
+def test_get_mongod_profile_arguments_production_has_no_overrides() -> None:
+    assert get_mongod_profile_arguments(MONGO_PROFILE_PRODUCTION) == []
+    assert get_write_concern_for_profile(MONGO_PROFILE_PRODUCTION) is None
+
+
+@pytest.mark.unit
+@patch('nislmigrate.facades.mongo_facade._get_total_memory_bytes', return_value=9 * 1024 * 1024 * 1024)
+def test_get_mongod_profile_arguments_bulk_load_sizes_cache_from_memory(total_memory: Mock) -> None:
+    arguments = get_mongod_profile_arguments(MONGO_PROFILE_BULK_LOAD)
+
+    assert arguments[arguments.index('--wiredTigerCacheSizeGB') + 1] == '5.60'
+
+
+def configure_fake_collection(mongo_client: Mock, documents: List[Dict[str, Any]]) -> MagicMock:
+    collection = MagicMock()
+    collection.find.return_value = make_fake_cursor(documents)
+    collection.bulk_write.return_value = Mock(matched_count=0, modified_count=0)
+    mongo_client.return_value.get_database.return_value.__getitem__.return_value = collection
+    return collection
+
+
+def make_fake_cursor(documents: List[Dict[str, Any]]) -> MagicMock:
+    cursor = MagicMock()
+    cursor.__iter__.return_value = iter(documents)
+    return cursor
+
+
+def set_path_function(path: str):
+    def update_function(document: Dict[str, Any]) -> Dict[str, Any]:
+        document['path'] = path
+        return document
+    return update_function
+
+
 def make_directory(temp_directory: TempDirectory, name: str) -> str:
     path = os.path.join(temp_directory.path, name)
     os.mkdir(path)
     return path
 
 
+def set_up_mongo_dump_process(process_open: Mock, archive: bytes = b'') -> None:
+    process = process_open.return_value
+    process.stdout = io.BytesIO(archive or make_archive('database', {}))
+    process.stderr = io.BytesIO(b'')
+    process.returncode = 0
+
+
+def make_dumping_process_facade(collections: Dict[str, Any]) -> Mock:
+    """
+    Creates a process facade that dumps the given collections, or only the collection a
+    --collection argument names.
+    """
+    def run_process_with_output(arguments: List[str], read_output: Callable[[BinaryIO], Any]) -> Tuple[Any, str]:
+        names = [argument.split('=')[1] for argument in arguments if argument.startswith('--collection=')]
+        dumped = {name: collections[name] for name in names} if names else collections
+        return read_output(io.BytesIO(make_archive('database', dumped))), ''
+
+    process_facade = Mock()
+    process_facade.run_process_with_output.side_effect = run_process_with_output
+    return process_facade
+
+
+@pytest.mark.unit
+@tempdir()
+@patch('nislmigrate.facades.mongo_facade.MongoProcessManager.ping', return_value=True)
+def test_mongo_facade_capture_compresses_archive_and_reports_collections(
+        ping: Mock,
+        temp_directory: TempDirectory,
+) -> None:
+    collections = {
+        'first': ('', [{'_id': 1, 'value': 'a'}, {'_id': 2, 'value': 'b'}]),
+        'second': ('', [{'_id': 3}]),
+    }
+    process_facade = make_dumping_process_facade(collections)
+    mongo_facade = MongoFacade(process_facade)
+
+    reports = mongo_facade.capture_database_to_directory(
+        get_fake_mongo_configuration(),
+        temp_directory.path,
+        'dump',
+        MongoDumpOptions(parallel_collections=2, compression_level=1))
+
+    arguments = process_facade.run_process_with_output.call_args[0][0]
+    assert '--numParallelCollections=2' in arguments
+    assert '--archive' in arguments
+    with gzip.open(os.path.join(temp_directory.path, 'dump'), 'rb') as archive:
+        assert archive.read() == make_archive('database', collections)
+    assert [(report.namespace, report.documents) for report in reports] == [
+        ('database.first', 2),
+        ('database.second', 1),
+    ]
+    assert reports[1].bytes_dumped == len(bson.encode({'_id': 3}))
+
+
+@pytest.mark.unit
+@tempdir()
+@patch('nislmigrate.facades.mongo_facade.MongoProcessManager.ping', return_value=True)
+def test_mongo_facade_capture_without_compression_writes_plain_archive(
+        ping: Mock,
+        temp_directory: TempDirectory,
+) -> None:
+    collections = {'first': ('', [{'_id': 1}])}
+    mongo_facade = MongoFacade(make_dumping_process_facade(collections))
+
+    mongo_facade.capture_database_to_directory(
+        get_fake_mongo_configuration(),
+        temp_directory.path,
+        'dump',
+        MongoDumpOptions(compression=DUMP_COMPRESSION_NONE))
+
+    assert temp_directory.read('dump') == make_archive('database', collections)
+
+
+@pytest.mark.unit
+@tempdir()
+@patch('nislmigrate.facades.mongo_facade.MongoProcessManager.ping', return_value=True)
+@patch('nislmigrate.facades.mongo_facade.MongoClient')
+def test_mongo_facade_capture_per_collection_archives_and_restore_them(
+        mongo_client: Mock,
+        ping: Mock,
+        temp_directory: TempDirectory,
+) -> None:
+    collections = {
+        'first': ('', [{'_id': 1, 'value': 'a'}]),
+        'second': ('', [{'_id': 2, 'value': 'b'}]),
+    }
+    mongo_client.return_value.__getitem__.return_value.list_collections.return_value = [
+        {'name': 'second', 'type': 'collection'},
+        {'name': 'first', 'type': 'collection'},
+        {'name': 'view', 'type': 'view'},
+        {'name': 'system.js', 'type': 'collection'},
+    ]
+    temp_directory.write('dump/dropped.archive', make_archive('database', {'dropped': ('', [])}))
+    process_facade = make_dumping_process_facade(collections)
+    process_facade.run_process.return_value = ''
+    mongo_facade = MongoFacade(process_facade)
+    configuration = get_fake_mongo_configuration()
+
+    reports = mongo_facade.capture_database_to_directory(
+        configuration,
+        temp_directory.path,
+        'dump',
+        MongoDumpOptions(per_collection_archives=True))
+    mongo_facade.restore_database_from_directory(configuration, temp_directory.path, 'dump')
+
+    assert sorted(os.listdir(os.path.join(temp_directory.path, 'dump'))) == ['first.archive', 'second.archive']
+    assert [report.namespace for report in reports] == ['database.first', 'database.second']
+    with gzip.open(os.path.join(temp_directory.path, 'dump', 'second.archive'), 'rb') as archive:
+        assert archive.read() == make_archive('database', {'second': collections['second']})
+    restore_commands = [call[0][0] for call in process_facade.run_process.call_args_list]
+    restored_archives = sorted(argument for command in restore_commands for argument in command
+                               if argument.startswith('--archive='))
+    assert restored_archives == [
+        '--archive=' + os.path.join(temp_directory.path, 'dump', 'first.archive'),
+        '--archive=' + os.path.join(temp_directory.path, 'dump', 'second.archive'),
+    ]
+    assert all('--gzip' in command for command in restore_commands)
+
+
+@pytest.mark.unit
+@tempdir()
+@patch('nislmigrate.facades.mongo_facade.MongoProcessManager.ping', return_value=True)
+@patch('nislmigrate.facades.mongo_facade.MongoClient')
+def test_mongo_facade_native_engine_captures_and_restores_without_mongo_tools(
+        mongo_client: Mock,
+        ping: Mock,
+        temp_directory: TempDirectory,
+) -> None:
+    source = make_database({'first': ({}, [{'_id': 1, 'name': 'a'}])})
+    target = make_database({})
+    mongo_client.return_value.__getitem__.return_value = source
+    mongo_client.return_value.get_database.return_value = target
+    process_facade = Mock()
+    configuration = get_fake_mongo_configuration()
+    capturing_facade = MongoFacade(process_facade)
+    capturing_facade.mongo_engine = MONGO_ENGINE_NATIVE
+    capturing_facade.capture_database_to_directory(configuration, temp_directory.path, 'dump')
+
+    # Native captures are restored natively even when the tools are selected.
+    MongoFacade(process_facade).restore_database_from_directory(configuration, temp_directory.path, 'dump')
+
+    process_facade.run_process_with_output.assert_not_called()
+    process_facade.run_process.assert_not_called()
+    [document] = target['first'].insert_many.call_args[0][0]
+    assert bson.decode(document.raw) == {'_id': 1, 'name': 'a'}
+    [index] = target['first'].create_indexes.call_args[0][0]
+    assert index.document['name'] == 'name_1'
+
+
+@pytest.mark.unit
+@tempdir()
+@patch('nislmigrate.facades.mongo_facade.MongoProcessManager.ping', return_value=True)
+@patch('nislmigrate.facades.mongo_facade.MongoClient')
+def test_mongo_facade_restore_decides_the_engine_of_each_collection_archive(
+        mongo_client: Mock,
+        ping: Mock,
+        temp_directory: TempDirectory,
+) -> None:
+    source = make_database({'native': ({}, [{'_id': 1, 'name': 'a'}])})
+    target = make_database({})
+    mongo_client.return_value.__getitem__.return_value = source
+    mongo_client.return_value.get_database.return_value = target
+    process_facade = Mock()
+    process_facade.run_process.return_value = ''
+    configuration = get_fake_mongo_configuration()
+    capturing_facade = MongoFacade(process_facade)
+    capturing_facade.mongo_engine = MONGO_ENGINE_NATIVE
+    capturing_facade.capture_database_to_directory(
+        configuration,
+        temp_directory.path,
+        'dump',
+        MongoDumpOptions(per_collection_archives=True))
+    temp_directory.write('dump/tools.archive', make_archive('database', {'tools': ('', [{'_id': 2}])}))
+
+    MongoFacade(process_facade).restore_database_from_directory(configuration, temp_directory.path, 'dump')
+
+    [restore_call] = process_facade.run_process.call_args_list
+    restore_command = restore_call[0][0]
+    assert '--archive=' + os.path.join(temp_directory.path, 'dump', 'tools.archive') in restore_command
+    assert '--noIndexRestore' not in restore_command
+    [document] = target['native'].insert_many.call_args[0][0]
+    assert bson.decode(document.raw) == {'_id': 1, 'name': 'a'}
+    [index] = target['native'].create_indexes.call_args[0][0]
+    assert index.document['name'] == 'name_1'
+
+
+@pytest.mark.unit
+@tempdir()
+@patch('nislmigrate.facades.mongo_facade.MongoProcessManager.ping', return_value=True)
+def test_mongo_facade_restore_plain_archive_does_not_pass_gzip(
+        ping: Mock,
+        temp_directory: TempDirectory,
+) -> None:
+    temp_directory.write('dump', make_archive('database', {}))
+    process_facade = Mock()
+    process_facade.run_process.return_value = ''
+    mongo_facade = MongoFacade(process_facade)
+
+    mongo_facade.restore_database_from_directory(get_fake_mongo_configuration(), temp_directory.path, 'dump')
+
+    assert '--gzip' not in process_facade.run_process.call_args[0][0]
+
+
+@pytest.mark.unit
+@patch('nislmigrate.facades.mongo_facade.MongoProcessManager.ping', return_value=True)
+def test_mongo_process_manager_attaches_to_running_mongo(ping: Mock) -> None:
+    process_facade = Mock()
+    manager = MongoProcessManager(process_facade)
+
+    manager.ensure_running(get_fake_mongo_configuration(), lambda: ['mongod'])
+    manager.ensure_running(get_fake_mongo_configuration(), lambda: ['mongod'])
+    manager.stop()
+
+    process_facade.run_background_process.assert_not_called()
+    ping.assert_called_once()
+
+
+@pytest.mark.unit
+@patch('time.sleep')
+@patch('nislmigrate.facades.mongo_facade.MongoProcessManager.ping', side_effect=[False, False, False, True])
+def test_mongo_process_manager_starts_mongo_and_waits_with_backoff(ping: Mock, sleep: Mock) -> None:
+    process_facade = Mock()
+    manager = MongoProcessManager(process_facade)
+
+    manager.ensure_running(get_fake_mongo_configuration(), lambda: ['mongod'])
+
+    process_facade.run_background_process.assert_called_once_with(['mongod'])
+    intervals = [call[0][0] for call in sleep.call_args_list]
+    assert intervals == sorted(intervals) and intervals[0] < intervals[-1]
+
+
+@pytest.mark.unit
+@patch('nislmigrate.facades.mongo_facade.MongoProcessManager.ping', return_value=False)
+def test_mongo_process_manager_mongo_exits_while_starting_raises_error(ping: Mock) -> None:
+    process_facade = Mock()
+    process_facade.run_background_process.return_value.is_running.return_value = False
+    manager = MongoProcessManager(process_facade)
+
+    with pytest.raises(MigrationError):
+        manager.ensure_running(get_fake_mongo_configuration(), lambda: ['mongod'])
+
+
+@pytest.mark.unit
+@patch('time.sleep')
+@patch('nislmigrate.facades.mongo_facade.MongoProcessManager.ping', return_value=False)
+def test_mongo_process_manager_mongo_never_answers_raises_error(ping: Mock, sleep: Mock) -> None:
+    manager = MongoProcessManager(Mock(), start_timeout_seconds=0)
+
+    with pytest.raises(MigrationError):
+        manager.ensure_running(get_fake_mongo_configuration(), lambda: ['mongod'])
+
+
+@pytest.mark.unit
+@patch('nislmigrate.facades.mongo_facade.MongoProcessManager.ping', return_value=False)
+def test_mongo_process_manager_mongo_that_failed_to_start_raises_error_again(ping: Mock) -> None:
+    process_facade = Mock()
+    process = process_facade.run_background_process.return_value
+    process.is_running.return_value = False
+    manager = MongoProcessManager(process_facade)
+    with pytest.raises(MigrationError):
+        manager.ensure_running(get_fake_mongo_configuration(), lambda: ['mongod'])
+
+    with pytest.raises(MigrationError):
+        manager.ensure_running(get_fake_mongo_configuration(), lambda: ['mongod'])
+
+    assert process_facade.run_background_process.call_count == 2
+    assert process.stop.call_count == 2
+
+
+@pytest.mark.unit
+@patch('nislmigrate.facades.mongo_facade.MongoClient')
+@patch('nislmigrate.facades.mongo_facade.MongoProcessManager.ping', side_effect=[False, True])
+def test_mongo_process_manager_stop_shuts_down_started_mongo(ping: Mock, mongo_client: Mock) -> None:
+    process_facade = Mock()
+    process = process_facade.run_background_process.return_value
+    process.wait.return_value = False
+    manager = MongoProcessManager(process_facade, stop_timeout_seconds=5)
+    manager.ensure_running(get_fake_mongo_configuration(), lambda: ['mongod'])
+
+    manager.stop()
+    manager.stop()
+
+    mongo_client.return_value.__enter__.return_value.admin.command.assert_called_once_with('shutdown')
+    process.wait.assert_called_once_with(5)
+    process.stop.assert_called_once()
+
+
+@pytest.mark.unit
+@patch('nislmigrate.facades.mongo_facade.MongoClient')
+@patch('nislmigrate.facades.mongo_facade.MongoProcessManager.ping', side_effect=[False, True])
+def test_mongo_process_manager_stop_waits_for_mongo_that_refuses_to_shut_down(
+        ping: Mock,
+        mongo_client: Mock,
+        caplog,
+) -> None:
+    process_facade = Mock()
+    process = process_facade.run_background_process.return_value
+    process.wait.return_value = True
+    mongo_client.return_value.__enter__.return_value.admin.command.side_effect = OperationFailure('not authorized')
+    manager = MongoProcessManager(process_facade, stop_timeout_seconds=5)
+    manager.ensure_running(get_fake_mongo_configuration(), lambda: ['mongod'])
+
+    manager.stop()
+
+    process.wait.assert_called_once_with(5)
+    process.stop.assert_not_called()
+    assert 'mongod refused to shut down: not authorized' in caplog.text
+
+
 def get_fake_mongo_configuration():
     return MongoConfiguration({
         mongo_configuration.MONGO_PASSWORD_CONFIGURATION_KEY: '',
@@ -0,0 +1,186 @@
+import io
+import logging
+from typing import Any, Dict, List, Tuple
+from unittest.mock import MagicMock, Mock
+
+import bson
+import pytest
+from pymongo.errors import BulkWriteError
+from pymongo.results import InsertManyResult
+
+from nislmigrate.facades.mongo_archive import NATIVE_ARCHIVE_TOOL_VERSION, MongoArchiveReader
+from nislmigrate.facades.mongo_native_engine import NativeMongoEngine
+from nislmigrate.logs.migration_error import MigrationError
+
+ID_INDEX = {'v': 2, 'key': {'_id': 1}, 'name': '_id_'}
+NAME_INDEX = {'v': 2, 'key': {'name': 1}, 'name': 'name_1'}
+
+
+def make_database(collections: Dict[str, Tuple[Dict[str, Any], List[Dict[str, Any]]]]) -> MagicMock:
+    """
+    Creates a fake database whose collections return their documents in batches of two.
+
+    :param collections: The options and documents of each collection, by collection name.
+    :return: The database.
+    """
+    database = MagicMock()
+    database.name = 'database'
+    database.list_collections.return_value = [
+        {'name': name, 'type': 'collection', 'options': options} for name, (options, _) in collections.items()
+    ] + [{'name': 'view', 'type': 'view', 'options': {}}, {'name': 'system.js', 'type': 'collection'}]
+    fake_collections: Dict[str, MagicMock] = {}
+    for name, (_, documents) in collections.items():
+        collection = make_collection(name)
+        collection.list_indexes.return_value = [ID_INDEX, NAME_INDEX]
+        collection.find_raw_batches.return_value = [
+            b''.join(bson.encode(document) for document in documents[index:index + 2])
+            for index in range(0, len(documents), 2)
+        ]
+        fake_collections[name] = collection
+    database.__getitem__.side_effect = lambda name: fake_collections.setdefault(name, make_collection(name))
+    return database
+
+
+def make_collection(name: str) -> MagicMock:
+    collection = MagicMock()
+    collection.name = name
+    collection.insert_many.side_effect = lambda documents, **_: InsertManyResult(
+        [document['_id'] for document in documents],
+        True)
+    return collection
+
+
+def get_inserted_documents(collection: MagicMock) -> List[Dict[str, Any]]:
+    return [
+        bson.decode(document.raw)
+        for call in collection.insert_many.call_args_list
+        for document in call[0][0]
+    ]
+
+
+@pytest.mark.unit
+def test_dump_database_writes_readable_archive_of_every_collection():
+    database = make_database({
+        'first': ({}, [{'_id': 1, 'name': 'a'}, {'_id': 2, 'name': 'b'}, {'_id': 3, 'name': 'c'}]),
+        'second': ({'capped': True, 'size': 4096}, []),
+    })
+    archive = io.BytesIO()
+
+    reports = NativeMongoEngine().dump_database(database, archive, parallel_collections=2)
+
+    reader = MongoArchiveReader(io.BytesIO(archive.getvalue()))
+    collections = reader.read_collections()
+    documents = [(namespace, bson.decode(document)) for namespace, document in reader.read_documents()]
+    assert reader.header['tool_version'] == NATIVE_ARCHIVE_TOOL_VERSION
+    assert [collection.collection_name for collection in collections] == ['first', 'second']
+    assert collections[0].indexes == [ID_INDEX, NAME_INDEX]
+    assert collections[1].options == {'capped': True, 'size': 4096}
+    assert documents == [
+        ('database.first', {'_id': 1, 'name': 'a'}),
+        ('database.first', {'_id': 2, 'name': 'b'}),
+        ('database.first', {'_id': 3, 'name': 'c'}),
+    ]
+    assert [(report.namespace, report.documents) for report in reports] == [
+        ('database.first', 3),
+        ('database.second', 0),
+    ]
+
+
+@pytest.mark.unit
+def test_dump_database_warns_about_skipped_views_and_system_collections(caplog):
+    database = make_database({'first': ({}, [{'_id': 1, 'name': 'a'}])})
+
+    with caplog.at_level(logging.WARNING):
+        NativeMongoEngine().dump_database(database, io.BytesIO())
+
+    skipped_messages = [record.getMessage() for record in caplog.records if record.levelno == logging.WARNING]
+    assert len(skipped_messages) == 2
+    assert skipped_messages[0].startswith('Skipped view of database')
+    assert skipped_messages[1].startswith('Skipped system.js of database')
+
+
+@pytest.mark.unit
+def test_dump_database_only_dumps_requested_collections():
+    database = make_database({'first': ({}, [{'_id': 1}]), 'second': ({}, [{'_id': 2}])})
+    archive = io.BytesIO()
+
+    NativeMongoEngine().dump_database(database, archive, ['second'])
+
+    reader = MongoArchiveReader(io.BytesIO(archive.getvalue()))
+    assert [collection.collection_name for collection in reader.read_collections()] == ['second']
+
+
+@pytest.mark.unit
+def test_dump_database_cursor_error_raises_error():
+    database = make_database({'first': ({}, [{'_id': 1}])})
+    database['first'].find_raw_batches.side_effect = RuntimeError('cursor failed')
+
+    with pytest.raises(MigrationError):
+        NativeMongoEngine().dump_database(database, io.BytesIO())
+
+
+@pytest.mark.unit
+def test_restore_database_inserts_documents_in_bounded_batches():
+    documents = [{'_id': index, 'name': str(index)} for index in range(5)]
+    source = make_database({'first': ({}, documents), 'second': ({'capped': True, 'size': 4096}, [{'_id': 9}])})
+    archive = io.BytesIO()
+    NativeMongoEngine().dump_database(source, archive)
+    target = make_database({})
+
+    restored = NativeMongoEngine(insert_batch_size=2).restore_database(
+        target,
+        io.BytesIO(archive.getvalue()),
+        insertion_workers=2)
+
+    assert restored == 6
+    assert sorted(get_inserted_documents(target['first']), key=lambda document: document['_id']) == documents
+    assert all(len(call[0][0]) <= 2 for call in target['first'].insert_many.call_args_list)
+    assert target['first'].insert_many.call_count == 3
+    target.drop_collection.assert_any_call('first')
+    target.create_collection.assert_called_once_with('second', capped=True, size=4096)
+    target['first'].create_indexes.assert_not_called()
+
+
+@pytest.mark.unit
+def test_restore_database_counts_the_documents_the_server_inserted():
+    source = make_database({'first': ({}, [{'_id': 1}, {'_id': 2}])})
+    archive = io.BytesIO()
+    NativeMongoEngine().dump_database(source, archive)
+    target = make_database({})
+    target['first'].insert_many.side_effect = lambda documents, **_: InsertManyResult([1], True)
+
+    restored = NativeMongoEngine().restore_database(target, io.BytesIO(archive.getvalue()))
+
+    assert restored == 1
+
+
+@pytest.mark.unit
+def test_restore_database_skips_excluded_collections():
+    source = make_database({'first': ({}, [{'_id': 1}]), 'second': ({}, [{'_id': 2}])})
+    archive = io.BytesIO()
+    NativeMongoEngine().dump_database(source, archive)
+    target = make_database({})
+
+    NativeMongoEngine().restore_database(target, io.BytesIO(archive.getvalue()), ['first'])
+
+    target['first'].insert_many.assert_not_called()
+    assert get_inserted_documents(target['second']) == [{'_id': 2}]
+    assert target.drop_collection.call_count == 1
+
+
+@pytest.mark.unit
+def test_restore_database_failed_insert_raises_error():
+    source = make_database({'first': ({}, [{'_id': 1}])})
+    archive = io.BytesIO()
+    NativeMongoEngine().dump_database(source, archive)
+    target = make_database({})
+    target['first'].insert_many.side_effect = BulkWriteError({'writeErrors': [{'errmsg': 'duplicate key'}]})
+
+    with pytest.raises(MigrationError):
+        NativeMongoEngine().restore_database(target, io.BytesIO(archive.getvalue()))
+
+
+@pytest.mark.unit
+def test_restore_database_invalid_archive_raises_error():
+    with pytest.raises(MigrationError):
+        NativeMongoEngine().restore_database(Mock(), io.BytesIO(b'not an archive'))
@@ -0,0 +1,102 @@
+import hashlib
+import os
+import shutil
+from unittest.mock import patch
+
+import pytest
+from testfixtures import tempdir, TempDirectory
+
+from nislmigrate.facades.object_store import ObjectStore
+from nislmigrate.logs.migration_error import MigrationError
+
+
+@pytest.mark.unit
+@tempdir()
+def test_add_files_stores_contents_by_hash(directory: TempDirectory):
+    first = directory.write('source/first.txt', b'first')
+    second = directory.write('source/second.txt', b'second')
+    object_store = ObjectStore(os.path.join(directory.path, 'objects'), workers=2)
+
+    hashes = object_store.add_files([first, second])
+
+    assert hashes == [hashlib.sha256(b'first').hexdigest(), hashlib.sha256(b'second').hexdigest()]
+    with open(object_store.get_object_path(hashes[1]), 'rb') as stored_object:
+        assert stored_object.read() == b'second'
+
+
+@pytest.mark.unit
+@tempdir()
+def test_add_files_does_not_write_contents_already_in_store(directory: TempDirectory):
+    first = directory.write('source/first.txt', b'same')
+    second = directory.write('source/second.txt', b'same')
+    object_store = ObjectStore(os.path.join(directory.path, 'objects'))
+    object_store.add_files([first])
+
+    with patch('os.replace') as replace:
+        hashes = object_store.add_files([second])
+
+    replace.assert_not_called()
+    assert object_store.contains(hashes[0])
+
+
+@pytest.mark.unit
+@tempdir()
+def test_materialize_files_does_not_link_objects(directory: TempDirectory):
+    source = directory.write('source/file.txt', b'content')
+    object_store = ObjectStore(os.path.join(directory.path, 'objects'))
+    content_hash = object_store.add_files([source])[0]
+    destination = os.path.join(directory.makedir('target'), 'file.txt')
+
+    object_store.materialize_files([(content_hash, destination, 0)])
+    with open(destination, 'wb') as restored_file:
+        restored_file.write(b'changed')
+
+    assert not os.path.samefile(destination, object_store.get_object_path(content_hash))
+    with open(object_store.get_object_path(content_hash), 'rb') as stored_object:
+        assert stored_object.read() == b'content'
+
+
+@pytest.mark.unit
+@tempdir()
+def test_materialize_files_replaces_existing_files(directory: TempDirectory):
+    source = directory.write('source/file.txt', b'content')
+    object_store = ObjectStore(os.path.join(directory.path, 'objects'))
+    content_hash = object_store.add_files([source])[0]
+    destination = directory.write('target/file.txt', b'old content')
+
+    object_store.materialize_files([(content_hash, destination, 1000000000)])
+
+    assert directory.read('target/file.txt') == b'content'
+    assert os.stat(destination).st_mtime_ns == 1000000000
+
+
+@pytest.mark.unit
+@tempdir()
+def test_materialize_files_with_missing_object_raises_error(directory: TempDirectory):
+    object_store = ObjectStore(os.path.join(directory.path, 'objects'))
+    destination = os.path.join(directory.makedir('target'), 'file.txt')
+
+    with pytest.raises(MigrationError):
+        object_store.materialize_files([(hashlib.sha256(b'missing').hexdigest(), destination, 0)])
+
+
+@pytest.mark.unit
+@tempdir()
+def test_materialize_files_clones_objects_where_supported(directory: TempDirectory):
+    source = directory.write('source/file.txt', b'content')
+    object_store = ObjectStore(os.path.join(directory.path, 'objects'))
+    content_hash = object_store.add_files([source])[0]
+    destination = os.path.join(directory.makedir('target'), 'file.txt')
+
+    def clone(object_path: str, clone_path: str) -> bool:
+        shutil.copyfile(object_path, clone_path)
+        return True
+
+    with patch('nislmigrate.facades.file_copy_engine.msvcrt', create=True):
+        with patch('nislmigrate.facades.file_copy_engine._clone_file_on_windows', side_effect=clone) as clone_file:
+            cloned = object_store.materialize_files([(content_hash, destination, 1000000000)])
+
+    clone_file.assert_called_once_with(object_store.get_object_path(content_hash), destination)
+    assert cloned == 1
+    assert directory.read('target/file.txt') == b'content'
+    assert os.stat(destination).st_mtime_ns == 1000000000
@@ -1,5 +1,7 @@
 import os
+import re
 
+from nislmigrate.facades.document_transform import DocumentTransform
 from nislmigrate.facades.mongo_configuration import MongoConfiguration
 from nislmigrate.logs.migration_error import MigrationError
 from nislmigrate.migrators.file_migrator import (
@@ -17,104 +19,130 @@ from nislmigrate.migrators.file_migrator import (
     _CHANGE_FILE_STORE_SLASHES_ARGUMENT,
 )
 import pytest
+from test.facades.test_mongo_archive import make_archive
 from test.test_utilities import FakeFacadeFactory, FakeFileSystemFacade
 from typing import Any, Dict, Optional, Tuple, List
 
 
+@pytest.fixture
+def migration_directory(tmp_path) -> str:
+    (tmp_path / FileMigrator().name).write_bytes(make_archive('fileingestion', {}))
+    return str(tmp_path)
+
+
 @pytest.mark.unit
 @pytest.mark.parametrize('null_path', [(False), (True)])
-def test_file_migrator_captures_from_default_location_when_unconfigured(null_path: bool):
+def test_file_migrator_captures_from_default_location_when_unconfigured(null_path: bool, tmp_path):
 
     facade_factory, file_system_facade = configure_facade_factory(null_data_directory=null_path)
     migrator = FileMigrator()
 
-    migrator.capture('data_dir', facade_factory, {})
+    migrator.capture(str(tmp_path), facade_factory, {})
 
     assert file_system_facade.last_from_directory == DEFAULT_DATA_DIRECTORY
 
 
 @pytest.mark.unit
-def test_file_migrator_captures_from_configured_location():
+def test_file_migrator_captures_from_configured_location(tmp_path):
 
     expected_directory = 'custom/directory'
     facade_factory, file_system_facade = configure_facade_factory(data_directory=expected_directory)
     migrator = FileMigrator()
 
-    migrator.capture('data_dir', facade_factory, {})
+    migrator.capture(str(tmp_path), facade_factory, {})
 
     assert file_system_facade.last_from_directory == expected_directory
 
 
 @pytest.mark.unit
 @pytest.mark.parametrize('null_path', [(False), (True)])
-def test_file_migrator_restores_to_default_location_when_unconfigured(null_path: bool):
+def test_file_migrator_restores_to_default_location_when_unconfigured(null_path: bool, migration_directory: str):
 
     facade_factory, file_system_facade = configure_facade_factory(null_data_directory=null_path)
     migrator = FileMigrator()
 
-    migrator.restore('data_dir', facade_factory, {})
+    migrator.restore(migration_directory, facade_factory, {})
 
     assert file_system_facade.last_to_directory == DEFAULT_DATA_DIRECTORY
 
 
 @pytest.mark.unit
-def test_file_migrator_restores_to_configured_location():
+def test_file_migrator_restores_to_configured_location(migration_directory: str):
 
     expected_directory = 'custom/directory'
     facade_factory, file_system_facade = configure_facade_factory(data_directory=expected_directory)
     migrator = FileMigrator()
 
-    migrator.restore('data_dir', facade_factory, {})
+    migrator.restore(migration_directory, facade_factory, {})
 
     assert file_system_facade.last_to_directory == expected_directory
 
 
 @pytest.mark.unit
-def test_file_migrator_does_not_capture_files_when_metadata_only_is_passed():
+def test_file_migrator_does_not_capture_files_when_metadata_only_is_passed(tmp_path):
     facade_factory, file_system_facade = configure_facade_factory()
     migrator = FileMigrator()
 
-    migrator.capture('data_dir', facade_factory, {_METADATA_ONLY_ARGUMENT: True})
+    migrator.capture(str(tmp_path), facade_factory, {_METADATA_ONLY_ARGUMENT: True})
 
     assert file_system_facade.last_from_directory is None
 
 
 @pytest.mark.unit
-def test_file_migrator_does_not_restore_files_when_metadata_only_is_passed():
+def test_file_migrator_does_not_restore_files_when_metadata_only_is_passed(migration_directory: str):
     facade_factory, file_system_facade = configure_facade_factory()
     migrator = FileMigrator()
 
-    migrator.restore('data_dir', facade_factory, {_METADATA_ONLY_ARGUMENT: True})
+    migrator.restore(migration_directory, facade_factory, {_METADATA_ONLY_ARGUMENT: True})
 
     assert file_system_facade.last_to_directory is None
 
 
 @pytest.mark.unit
-def test_file_migrator_captures_the_old_file_store_root():
+def test_file_migrator_captures_the_old_file_store_root(tmp_path):
     facade_factory, file_system_facade = configure_facade_factory()
     migrator = FileMigrator()
 
-    migrator.capture('data_dir', facade_factory, {_METADATA_ONLY_ARGUMENT: True})
+    migrator.capture(str(tmp_path), facade_factory, {_METADATA_ONLY_ARGUMENT: True})
 
-    expected_stored_root_path = os.path.join('data_dir', _SAVED_OLD_FILE_STORE_ROOT_FILE_NAME)
+    expected_stored_root_path = os.path.join(str(tmp_path), _SAVED_OLD_FILE_STORE_ROOT_FILE_NAME)
     assert file_system_facade.written_files[expected_stored_root_path] == DEFAULT_DATA_DIRECTORY
 
 
 @pytest.mark.unit
-def test_file_migrator_restore_with_change_file_store_argument_updates_the_metadata_collection():
+def test_file_migrator_restore_with_change_file_store_argument_updates_the_metadata_collection(
+        migration_directory: str):
     facade_factory, file_system_facade = configure_facade_factory()
     mongo_facade = facade_factory.mongo_facade
     file_system_facade.write_file(_SAVED_OLD_FILE_STORE_ROOT_FILE_NAME, 'old/path')
     migrator = FileMigrator()
     arguments = {_METADATA_ONLY_ARGUMENT: True, _CHANGE_FILE_STORE_ARGUMENT: 'new/path'}
 
-    migrator.restore('data_dir', facade_factory, arguments)
+    migrator.restore(migration_directory, facade_factory, arguments)
 
     expected_mongo_configuration = MongoConfiguration(migrator.config(facade_factory))
     modified_collection_name = migrator.name.lower()
     assert mongo_facade.did_update_documents_in_collection(expected_mongo_configuration, modified_collection_name)
 
 
+@pytest.mark.unit
+def test_file_migrator_restore_with_change_file_store_argument_transforms_documents_while_restoring(
+        migration_directory: str):
+    facade_factory, file_system_facade = configure_facade_factory()
+    mongo_facade = facade_factory.mongo_facade
+    file_system_facade.write_file(_SAVED_OLD_FILE_STORE_ROOT_FILE_NAME, 'old/path')
+    migrator = FileMigrator()
+    arguments = {_METADATA_ONLY_ARGUMENT: True, _CHANGE_FILE_STORE_ARGUMENT: 'new/path'}
+
+    migrator.restore(migration_directory, facade_factory, arguments)
+
+    modified_collection_name = migrator.name.lower()
+    transform = mongo_facade.restore_transforms[modified_collection_name]
+    assert transform.update_function({'_id': 1, 'path': 'old/path/file'})['path'] == 'new/path/file'
+    assert modified_collection_name not in mongo_facade.document_queries
+    assert modified_collection_name not in mongo_facade.server_side_updates
+
+
 @pytest.mark.unit
 def test_file_migrator_modify_with_change_file_store_argument_updates_the_metadata_collection():
     facade_factory, _ = configure_facade_factory()
@@ -134,14 +162,15 @@ def test_file_migrator_modify_with_change_file_store_argument_updates_the_metada
 
 
 @pytest.mark.unit
-def test_file_migrator_restore_with_switch_to_forward_slashes_argument_updates_the_metadata_collection():
+def test_file_migrator_restore_with_switch_to_forward_slashes_argument_updates_the_metadata_collection(
+        migration_directory: str):
     facade_factory, file_system_facade = configure_facade_factory()
     mongo_facade = facade_factory.mongo_facade
     file_system_facade.write_file(_SAVED_OLD_FILE_STORE_ROOT_FILE_NAME, 'S3:\\a\\path')
     migrator = FileMigrator()
     arguments = {_METADATA_ONLY_ARGUMENT: True, _CHANGE_FILE_STORE_SLASHES_ARGUMENT: True}
 
-    migrator.restore('data_dir', facade_factory, arguments)
+    migrator.restore(migration_directory, facade_factory, arguments)
 
     expected_mongo_configuration = MongoConfiguration(migrator.config(facade_factory))
     modified_collection_name = migrator.name.lower()
@@ -149,14 +178,141 @@ def test_file_migrator_restore_with_switch_to_forward_slashes_argument_updates_t
 
 
 @pytest.mark.unit
-def test_file_migrator_restore_without_change_file_store_argument_does_not_update_the_metadata_collection():
+def test_file_migrator_modify_with_change_file_store_argument_updates_paths_on_the_server():
+    facade_factory, _ = configure_facade_factory()
+    mongo_facade = facade_factory.mongo_facade
+    mongo_facade.server_version = (4, 2, 8)
+    migrator = FileMigrator()
+    arguments = {_FILE_STORE_ROOT_ARGUMENT: 'C:\\old.store', _CHANGE_FILE_STORE_ARGUMENT: 'new/path'}
+
+    migrator.modify('data_dir', facade_factory, arguments)
+
+    [(query_filter, pipeline)] = mongo_facade.server_side_updates[migrator.name.lower()]
+    assert query_filter == {'path': {'$regex': '^' + re.escape('C:\\old.store')}}
+    [stage] = pipeline
+    [starts_with_old_prefix, new_path, unchanged_path] = stage['$set']['path']['$cond']
+    assert starts_with_old_prefix['$eq'][1] == 'C:\\old.store'
+    assert new_path['$concat'][0] == 'new/path'
+    assert unchanged_path == '$path'
+
+
+@pytest.mark.unit
+def test_file_migrator_modify_with_change_file_store_argument_on_old_server_updates_paths_in_python():
+    facade_factory, _ = configure_facade_factory()
+    mongo_facade = facade_factory.mongo_facade
+    mongo_facade.server_version = (4, 0, 0)
+    migrator = FileMigrator()
+    arguments = {_FILE_STORE_ROOT_ARGUMENT: 'old/path', _CHANGE_FILE_STORE_ARGUMENT: 'new/path'}
+
+    migrator.modify('data_dir', facade_factory, arguments)
+
+    expected_mongo_configuration = MongoConfiguration(migrator.config(facade_factory))
+    modified_collection_name = migrator.name.lower()
+    assert mongo_facade.did_update_documents_in_collection(expected_mongo_configuration, modified_collection_name)
+    assert modified_collection_name not in mongo_facade.server_side_updates
+    query_filter, projection = mongo_facade.document_queries[modified_collection_name]
+    assert query_filter == FileMigrator.path_starts_with_prefix_filter('old/path')
+    assert projection == {'path': 1}
+
+
+@pytest.mark.unit
+def test_file_migrator_modify_with_both_path_arguments_updates_paths_in_one_server_side_update():
+    facade_factory, _ = configure_facade_factory()
+    mongo_facade = facade_factory.mongo_facade
+    mongo_facade.server_version = (4, 4, 0)
+    migrator = FileMigrator()
+    arguments = {
+        _FILE_STORE_ROOT_ARGUMENT: 'old/path',
+        _CHANGE_FILE_STORE_ARGUMENT: 'new/path',
+        _CHANGE_FILE_STORE_SLASHES_ARGUMENT: True,
+    }
+
+    migrator.modify('data_dir', facade_factory, arguments)
+
+    [(query_filter, pipeline)] = mongo_facade.server_side_updates[migrator.name.lower()]
+    assert query_filter == {'$or': [
+        FileMigrator.path_starts_with_prefix_filter('old/path'),
+        FileMigrator.path_contains_back_slash_filter(),
+    ]}
+    assert len(pipeline) == 2
+
+
+@pytest.mark.unit
+def test_file_migrator_modify_with_both_path_arguments_on_old_server_scans_documents_once():
+    facade_factory, _ = configure_facade_factory()
+    mongo_facade = facade_factory.mongo_facade
+    mongo_facade.server_version = (4, 2, 8)
+    migrator = FileMigrator()
+    arguments = {
+        _FILE_STORE_ROOT_ARGUMENT: 'old/path',
+        _CHANGE_FILE_STORE_ARGUMENT: 'new/path',
+        _CHANGE_FILE_STORE_SLASHES_ARGUMENT: True,
+    }
+
+    migrator.modify('data_dir', facade_factory, arguments)
+
+    modified_collection_name = migrator.name.lower()
+    assert modified_collection_name not in mongo_facade.server_side_updates
+    query_filter, projection = mongo_facade.document_queries[modified_collection_name]
+    assert len(query_filter['$or']) == 2
+    assert projection == {'path': 1}
+
+
+@pytest.mark.unit
+@pytest.mark.parametrize('path,expected_path', [
+    ('C:\\old\\file.txt', 'D:/new/file.txt'),
+    ('E:\\other\\file.txt', 'E:/other/file.txt'),
+    ('C:/old/file.txt', 'C:/old/file.txt'),
+])
+def test_file_migrator_path_steps_apply_in_order_in_one_update(path: str, expected_path: str):
+    migrator = FileMigrator()
+    transform = DocumentTransform()
+    transform.add_step(migrator.replace_path_prefix_step('C:\\old', 'D:\\new'))
+    transform.add_step(migrator.replace_back_slashes_step())
+
+    document = transform.update_function({'_id': 1, 'path': path})
+
+    assert document['path'] == expected_path
+
+
+@pytest.mark.unit
+@pytest.mark.parametrize('server_version,expect_server_side_update', [((4, 2, 8), False), ((4, 4, 0), True)])
+def test_file_migrator_modify_with_switch_to_forward_slashes_argument_uses_server_side_update_when_supported(
+        server_version,
+        expect_server_side_update: bool):
+    facade_factory, _ = configure_facade_factory()
+    mongo_facade = facade_factory.mongo_facade
+    mongo_facade.server_version = server_version
+    migrator = FileMigrator()
+
+    migrator.modify('data_dir', facade_factory, {_CHANGE_FILE_STORE_SLASHES_ARGUMENT: True})
+
+    modified_collection_name = migrator.name.lower()
+    assert (modified_collection_name in mongo_facade.server_side_updates) == expect_server_side_update
+
+
+@pytest.mark.unit
+def test_file_migrator_server_side_filter_matches_same_paths_as_python_predicate():
+    prefix = 'C:\\Program Data (x86)\\Files+[1]'
+    paths = [prefix + '\\file.txt', 'D:' + prefix, prefix.upper(), prefix]
+    query_filter = FileMigrator.path_starts_with_prefix_filter(prefix)
+    predicate = FileMigrator.does_path_start_with_prefix_predicate(prefix)
+    pattern = re.compile(query_filter['path']['$regex'])
+
+    for path in paths:
+        assert bool(pattern.search(path)) == predicate({'path': path})
+
+
+@pytest.mark.unit
+def test_file_migrator_restore_without_change_file_store_argument_does_not_update_the_metadata_collection(
+        migration_directory: str):
     facade_factory, file_system_facade = configure_facade_factory()
     mongo_facade = facade_factory.mongo_facade
     file_system_facade.write_file(_SAVED_OLD_FILE_STORE_ROOT_FILE_NAME, 'old/path')
     migrator = FileMigrator()
     arguments = {_METADATA_ONLY_ARGUMENT: True}
 
-    migrator.restore('data_dir', facade_factory, arguments)
+    migrator.restore(migration_directory, facade_factory, arguments)
 
     expected_mongo_configuration = MongoConfiguration(migrator.config(facade_factory))
     modified_collection_name = migrator.name.lower()
@@ -179,6 +335,26 @@ def test_file_migrator_reports_error_if_no_files_to_restore_and_not_metdata_only
     assert _NO_FILES_ERROR.strip() in e.exconly()
 
 
+@pytest.mark.unit
+def test_file_migrator_pre_restore_check_verifies_captured_files():
+    facade_factory, file_system_facade = configure_facade_factory()
+    migrator = FileMigrator()
+
+    migrator.pre_restore_check('data_dir', facade_factory, {})
+
+    assert file_system_facade.verified_directories == [os.path.join('data_dir', 'files')]
+
+
+@pytest.mark.unit
+def test_file_migrator_pre_restore_check_metadata_only_does_not_verify_captured_files():
+    facade_factory, file_system_facade = configure_facade_factory()
+    migrator = FileMigrator()
+
+    migrator.pre_restore_check('data_dir', facade_factory, {_METADATA_ONLY_ARGUMENT: True})
+
+    assert file_system_facade.verified_directories == []
+
+
 @pytest.mark.unit
 def test_file_migrator_pre_capture_check_metadata_only_does_not_throw_when_s3_backend_is_enabled():
     facade_factory, file_system_facade = configure_facade_factory(enable_s3_backend=True)
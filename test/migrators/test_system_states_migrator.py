@@ -14,7 +14,7 @@ def test_file_migrator_does_not_copy_nonexistant_git_repo(directory):
     facade_factory, file_system_facade = configure_facade_factory(git_path)
     migrator = SystemStatesMigrator()
 
-    migrator.capture('data_dir', facade_factory, {})
+    migrator.capture(os.path.join(directory.path, 'migration'), facade_factory, {})
 
     assert file_system_facade.last_from_directory is None
 
@@ -27,7 +27,7 @@ def test_file_migrator_copies_existing_git_repo(directory):
     facade_factory, file_system_facade = configure_facade_factory(git_path)
     migrator = SystemStatesMigrator()
 
-    migrator.capture('data_dir', facade_factory, {})
+    migrator.capture(os.path.join(directory.path, 'migration'), facade_factory, {})
 
     assert file_system_facade.last_from_directory == git_path
 
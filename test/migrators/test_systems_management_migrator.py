@@ -1,3 +1,4 @@
+import os
 from nislmigrate.logs.migration_error import MigrationError
 import pytest
 
@@ -61,36 +62,39 @@ def test_systems_management_migrator_pre_restore_check_raises_when_salt_data_not
 
 
 @pytest.mark.unit
-def test_systems_management_migrator_capture_pki_files_captured():
+def test_systems_management_migrator_capture_pki_files_captured(tmp_path):
 
     facade_factory, file_system_facade = configure_facade_factory()
     migrator = SystemsManagementMigrator()
 
-    migrator.capture('data_dir', facade_factory, {'secret': 'password'})
+    migrator.capture(str(tmp_path), facade_factory, {'secret': 'password'})
 
-    assert (PKI_INSTALLED_PATH, 'data_dir\\pki', 'password') in file_system_facade.directories_encrypted
+    expected_encryption = (PKI_INSTALLED_PATH, os.path.join(str(tmp_path), 'pki'), 'password')
+    assert expected_encryption in file_system_facade.directories_encrypted
 
 
 @pytest.mark.unit
-def test_systems_management_migrator_capture_pillar_files_captured():
+def test_systems_management_migrator_capture_pillar_files_captured(tmp_path):
 
     facade_factory, file_system_facade = configure_facade_factory()
     migrator = SystemsManagementMigrator()
 
-    migrator.capture('data_dir', facade_factory, {'secret': 'password'})
+    migrator.capture(str(tmp_path), facade_factory, {'secret': 'password'})
 
-    assert (PILLAR_INSTALLED_PATH, 'data_dir\\pillar', 'password') in file_system_facade.directories_encrypted
+    expected_encryption = (PILLAR_INSTALLED_PATH, os.path.join(str(tmp_path), 'pillar'), 'password')
+    assert expected_encryption in file_system_facade.directories_encrypted
 
 
 @pytest.mark.unit
-def test_systems_management_migrator_capture_pillar_files_do_not_exist_and_are_not_captured():
+def test_systems_management_migrator_capture_pillar_files_do_not_exist_and_are_not_captured(tmp_path):
     facade_factory, file_system_facade = configure_facade_factory()
     file_system_facade.missing_directories.append(PILLAR_INSTALLED_PATH)
     migrator = SystemsManagementMigrator()
 
-    migrator.capture('data_dir', facade_factory, {'secret': 'password'})
+    migrator.capture(str(tmp_path), facade_factory, {'secret': 'password'})
 
-    assert (PILLAR_INSTALLED_PATH, 'data_dir\\pillar', 'password') not in file_system_facade.directories_encrypted
+    expected_encryption = (PILLAR_INSTALLED_PATH, os.path.join(str(tmp_path), 'pillar'), 'password')
+    assert expected_encryption not in file_system_facade.directories_encrypted
 
 
 def configure_facade_factory() -> Tuple[FakeFacadeFactory, FakeFileSystemFacade]:
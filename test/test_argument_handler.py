@@ -6,8 +6,11 @@ import pytest
 from nislmigrate.argument_handler import ArgumentHandler, LIST_INSTALLED_SERVICES_ARGUMENT
 from nislmigrate.argument_handler import CAPTURE_ARGUMENT
 from nislmigrate.argument_handler import RESTORE_ARGUMENT
+from nislmigrate.argument_handler import MODIFY_ARGUMENT
 from nislmigrate.argument_handler import DEFAULT_MIGRATION_DIRECTORY
+from nislmigrate.argument_handler import DEFAULT_JOBS
 from nislmigrate.extensibility.migrator_plugin import MigratorPlugin, ArgumentManager
+from nislmigrate.facades.mongo_facade import DEFAULT_MAX_IDLE_TIME_MILLISECONDS, DEFAULT_MAX_POOL_SIZE
 from nislmigrate.logs.migration_error import MigrationError
 from nislmigrate.migration_action import MigrationAction
 from nislmigrate.migrators.asset_migrator import AssetMigrator
@@ -150,6 +153,228 @@ def test_list_command():
     assert argument_handler.get_migration_action() == MigrationAction.LIST
 
 
+@pytest.mark.unit
+def test_get_number_of_jobs_returns_default():
+    arguments = [CAPTURE_ARGUMENT, '--tags']
+    argument_handler = ArgumentHandler(arguments, facade_factory=FakeFacadeFactory())
+
+    assert argument_handler.get_number_of_jobs() == DEFAULT_JOBS
+
+
+@pytest.mark.unit
+def test_get_number_of_jobs_returns_jobs():
+    arguments = [CAPTURE_ARGUMENT, '--tags', '--jobs', '4']
+    argument_handler = ArgumentHandler(arguments, facade_factory=FakeFacadeFactory())
+
+    assert argument_handler.get_number_of_jobs() == 4
+
+
+@pytest.mark.unit
+def test_jobs_argument_does_not_enable_a_service():
+    arguments = [CAPTURE_ARGUMENT, '--tags', '--jobs', '4']
+    argument_handler = ArgumentHandler(arguments, facade_factory=FakeFacadeFactory())
+
+    services_to_migrate = argument_handler.get_list_of_services_to_capture_or_restore()
+
+    assert len(services_to_migrate) == 1
+
+
+@pytest.mark.unit
+@pytest.mark.parametrize('jobs', ['0', '-1', 'many'])
+def test_invalid_jobs_argument_exits_with_exception(jobs: str):
+    arguments = [CAPTURE_ARGUMENT, '--tags', '--jobs', jobs]
+    with pytest.raises(SystemExit):
+        ArgumentHandler(arguments, facade_factory=FakeFacadeFactory())
+
+
+@pytest.mark.unit
+def test_get_mongo_connection_pool_arguments_return_defaults():
+    arguments = [MODIFY_ARGUMENT, '--tags']
+    argument_handler = ArgumentHandler(arguments, facade_factory=FakeFacadeFactory())
+
+    assert argument_handler.get_mongo_pool_size() == DEFAULT_MAX_POOL_SIZE
+    assert argument_handler.get_mongo_idle_time_milliseconds() == DEFAULT_MAX_IDLE_TIME_MILLISECONDS
+
+
+@pytest.mark.unit
+def test_get_mongo_connection_pool_arguments_return_arguments():
+    arguments = [MODIFY_ARGUMENT, '--tags', '--mongo-pool-size', '4', '--mongo-idle-time', '1000']
+    argument_handler = ArgumentHandler(arguments, facade_factory=FakeFacadeFactory())
+
+    assert argument_handler.get_mongo_pool_size() == 4
+    assert argument_handler.get_mongo_idle_time_milliseconds() == 1000
+    assert len(argument_handler.get_list_of_services_to_capture_or_restore()) == 1
+
+
+@pytest.mark.unit
+@pytest.mark.parametrize('pool_size', ['0', '-1', 'many'])
+def test_invalid_mongo_pool_size_argument_exits_with_exception(pool_size: str):
+    arguments = [CAPTURE_ARGUMENT, '--tags', '--mongo-pool-size', pool_size]
+    with pytest.raises(SystemExit):
+        ArgumentHandler(arguments, facade_factory=FakeFacadeFactory())
+
+
+@pytest.mark.unit
+def test_is_incremental_capture_flag_present_flag_present():
+    arguments = [CAPTURE_ARGUMENT, '--tags', '--incremental']
+    argument_handler = ArgumentHandler(arguments, facade_factory=FakeFacadeFactory())
+
+    assert argument_handler.is_incremental_capture_flag_present()
+    assert len(argument_handler.get_list_of_services_to_capture_or_restore()) == 1
+
+
+@pytest.mark.unit
+def test_is_incremental_capture_flag_present_flag_not_present():
+    arguments = [CAPTURE_ARGUMENT, '--tags']
+    argument_handler = ArgumentHandler(arguments, facade_factory=FakeFacadeFactory())
+
+    assert not argument_handler.is_incremental_capture_flag_present()
+
+
+@pytest.mark.unit
+def test_is_sync_restore_flag_present_flag_present():
+    arguments = [RESTORE_ARGUMENT, '--tags', '--sync']
+    argument_handler = ArgumentHandler(arguments, facade_factory=FakeFacadeFactory())
+
+    assert argument_handler.is_sync_restore_flag_present()
+
+
+@pytest.mark.unit
+def test_sync_argument_is_not_accepted_by_capture():
+    arguments = [CAPTURE_ARGUMENT, '--tags', '--sync']
+    with pytest.raises(SystemExit):
+        ArgumentHandler(arguments, facade_factory=FakeFacadeFactory())
+
+
+@pytest.mark.unit
+def test_is_deduplicate_flag_present_flag_present():
+    arguments = [CAPTURE_ARGUMENT, '--tags', '--deduplicate']
+    argument_handler = ArgumentHandler(arguments, facade_factory=FakeFacadeFactory())
+
+    assert argument_handler.is_deduplicate_flag_present()
+
+
+@pytest.mark.unit
+def test_get_object_store_directory_returns_object_store():
+    arguments = [CAPTURE_ARGUMENT, '--tags', '--deduplicate', '--object-store', 'objects']
+    argument_handler = ArgumentHandler(arguments, facade_factory=FakeFacadeFactory())
+
+    assert argument_handler.get_object_store_directory() == 'objects'
+
+
+@pytest.mark.unit
+def test_get_object_store_directory_returns_none_by_default():
+    arguments = [CAPTURE_ARGUMENT, '--tags', '--deduplicate']
+    argument_handler = ArgumentHandler(arguments, facade_factory=FakeFacadeFactory())
+
+    assert argument_handler.get_object_store_directory() is None
+
+
+@pytest.mark.unit
+def test_is_archive_flag_present_flag_present():
+    arguments = [CAPTURE_ARGUMENT, '--tags', '--archive']
+    argument_handler = ArgumentHandler(arguments, facade_factory=FakeFacadeFactory())
+
+    assert argument_handler.is_archive_flag_present()
+
+
+@pytest.mark.unit
+def test_archive_and_deduplicate_flags_present_raises_error():
+    arguments = [CAPTURE_ARGUMENT, '--tags', '--archive', '--deduplicate']
+
+    with pytest.raises(SystemExit):
+        ArgumentHandler(arguments, facade_factory=FakeFacadeFactory())
+
+
+@pytest.mark.unit
+@pytest.mark.parametrize('option', [['--checksum', 'sha256'], ['--link', 'hardlink']])
+def test_archive_flag_with_checksum_or_link_raises_error(option: List[str]):
+    arguments = [CAPTURE_ARGUMENT, '--tags', '--archive'] + option
+
+    with pytest.raises(SystemExit):
+        ArgumentHandler(arguments, facade_factory=FakeFacadeFactory())
+
+
+@pytest.mark.unit
+def test_get_link_mode_returns_default():
+    arguments = [CAPTURE_ARGUMENT, '--tags']
+    argument_handler = ArgumentHandler(arguments, facade_factory=FakeFacadeFactory())
+
+    assert argument_handler.get_link_mode() == 'copy'
+
+
+@pytest.mark.unit
+def test_get_link_mode_returns_link_mode():
+    arguments = [CAPTURE_ARGUMENT, '--tags', '--link', 'hardlink']
+    argument_handler = ArgumentHandler(arguments, facade_factory=FakeFacadeFactory())
+
+    assert argument_handler.get_link_mode() == 'hardlink'
+
+
+@pytest.mark.unit
+def test_invalid_link_mode_exits_with_exception():
+    arguments = [CAPTURE_ARGUMENT, '--tags', '--link', 'symlink']
+    with pytest.raises(SystemExit):
+        ArgumentHandler(arguments, facade_factory=FakeFacadeFactory())
+
+
+@pytest.mark.unit
+def test_get_checksum_algorithm_returns_algorithm():
+    arguments = [CAPTURE_ARGUMENT, '--tags', '--checksum', 'sha256']
+    argument_handler = ArgumentHandler(arguments, facade_factory=FakeFacadeFactory())
+
+    assert argument_handler.get_checksum_algorithm() == 'sha256'
+
+
+@pytest.mark.unit
+def test_get_checksum_algorithm_returns_none_by_default():
+    arguments = [CAPTURE_ARGUMENT, '--tags']
+    argument_handler = ArgumentHandler(arguments, facade_factory=FakeFacadeFactory())
+
+    assert argument_handler.get_checksum_algorithm() is None
+
+
+@pytest.mark.unit
+def test_get_verify_mode_returns_verify_mode():
+    arguments = [RESTORE_ARGUMENT, '--tags', '--verify', 'sample']
+    argument_handler = ArgumentHandler(arguments, facade_factory=FakeFacadeFactory())
+
+    assert argument_handler.get_verify_mode() == 'sample'
+
+
+@pytest.mark.unit
+def test_get_mongo_profile_returns_production_by_default():
+    arguments = [RESTORE_ARGUMENT, '--tags']
+    argument_handler = ArgumentHandler(arguments, facade_factory=FakeFacadeFactory())
+
+    assert argument_handler.get_mongo_profile() == 'production'
+
+
+@pytest.mark.unit
+def test_get_mongo_profile_returns_mongo_profile():
+    arguments = [RESTORE_ARGUMENT, '--tags', '--mongo-profile', 'bulkload']
+    argument_handler = ArgumentHandler(arguments, facade_factory=FakeFacadeFactory())
+
+    assert argument_handler.get_mongo_profile() == 'bulkload'
+
+
+@pytest.mark.unit
+def test_get_mongo_engine_returns_tools_by_default():
+    arguments = [CAPTURE_ARGUMENT, '--tags']
+    argument_handler = ArgumentHandler(arguments, facade_factory=FakeFacadeFactory())
+
+    assert argument_handler.get_mongo_engine() == 'tools'
+
+
+@pytest.mark.unit
+def test_get_mongo_engine_returns_mongo_engine_for_capture_and_restore():
+    for action in [CAPTURE_ARGUMENT, RESTORE_ARGUMENT]:
+        arguments = [action, '--tags', '--mongo-engine', 'native']
+        argument_handler = ArgumentHandler(arguments, facade_factory=FakeFacadeFactory())
+
+        assert argument_handler.get_mongo_engine() == 'native'
+
+
 @pytest.mark.unit
 def test_is_force_migration_flag_present_short_flag_present():
     arguments = [RESTORE_ARGUMENT, '-f']
@@ -3,9 +3,11 @@ import os
 import pytest
 
 from nislmigrate.argument_handler import ArgumentHandler
+from nislmigrate.argument_handler import CAPTURE_ARGUMENT
 from nislmigrate.argument_handler import RESTORE_ARGUMENT
 from nislmigrate.argument_handler import MIGRATION_DIRECTORY_ARGUMENT
-from nislmigrate.facades.mongo_facade import MongoFacade
+from nislmigrate.facades.mongo_facade import MongoFacade, MONGO_ENGINE_NATIVE, MONGO_PROFILE_BULK_LOAD
+from nislmigrate.facades.object_store import OBJECT_STORE_DIRECTORY_NAME
 from nislmigrate.migration_facilitator import MigrationFacilitator
 from test.test_utilities import FakeFacadeFactory
 
@@ -44,6 +46,91 @@ def test_missing_service_migration_file() -> None:
         migrator.migrate()
 
 
+@pytest.mark.unit
+def test_deduplicated_capture_uses_object_store_next_to_migration_directory() -> None:
+    test_arguments = [
+        CAPTURE_ARGUMENT,
+        '--tags',
+        '--' + MIGRATION_DIRECTORY_ARGUMENT + '=' + test_migration_directory,
+        '--deduplicate',
+    ]
+    facade_factory = FakeFacadeFactory()
+    argument_handler = ArgumentHandler(test_arguments, facade_factory=facade_factory)
+
+    MigrationFacilitator(facade_factory, argument_handler)
+
+    expected_directory = os.path.join(os.path.dirname(test_migration_directory), OBJECT_STORE_DIRECTORY_NAME)
+    assert facade_factory.file_system_facade.object_store_directory == expected_directory
+
+
+@pytest.mark.unit
+def test_deduplicated_capture_uses_object_store_argument() -> None:
+    object_store_directory = os.path.join(os.path.abspath(os.sep), 'objects')
+    test_arguments = [
+        CAPTURE_ARGUMENT,
+        '--tags',
+        '--' + MIGRATION_DIRECTORY_ARGUMENT + '=' + test_migration_directory,
+        '--deduplicate',
+        '--object-store=' + object_store_directory,
+    ]
+    facade_factory = FakeFacadeFactory()
+    argument_handler = ArgumentHandler(test_arguments, facade_factory=facade_factory)
+
+    MigrationFacilitator(facade_factory, argument_handler)
+
+    assert facade_factory.file_system_facade.object_store_directory == object_store_directory
+
+
+@pytest.mark.unit
+def test_restore_uses_mongo_profile() -> None:
+    test_arguments = [
+        RESTORE_ARGUMENT,
+        '--tags',
+        '--' + MIGRATION_DIRECTORY_ARGUMENT + '=' + test_migration_directory,
+        '--mongo-profile=bulkload',
+    ]
+    facade_factory = FakeFacadeFactory()
+    argument_handler = ArgumentHandler(test_arguments, facade_factory=facade_factory)
+
+    MigrationFacilitator(facade_factory, argument_handler)
+
+    assert facade_factory.mongo_facade.mongo_profile == MONGO_PROFILE_BULK_LOAD
+
+
+@pytest.mark.unit
+def test_capture_uses_mongo_engine() -> None:
+    test_arguments = [
+        CAPTURE_ARGUMENT,
+        '--tags',
+        '--' + MIGRATION_DIRECTORY_ARGUMENT + '=' + test_migration_directory,
+        '--mongo-engine=native',
+    ]
+    facade_factory = FakeFacadeFactory()
+    argument_handler = ArgumentHandler(test_arguments, facade_factory=facade_factory)
+
+    MigrationFacilitator(facade_factory, argument_handler)
+
+    assert facade_factory.mongo_facade.mongo_engine == MONGO_ENGINE_NATIVE
+
+
+@pytest.mark.unit
+def test_migration_uses_mongo_connection_pool_arguments() -> None:
+    test_arguments = [
+        RESTORE_ARGUMENT,
+        '--tags',
+        '--' + MIGRATION_DIRECTORY_ARGUMENT + '=' + test_migration_directory,
+        '--mongo-pool-size=4',
+        '--mongo-idle-time=1000',
+    ]
+    facade_factory = FakeFacadeFactory()
+    argument_handler = ArgumentHandler(test_arguments, facade_factory=facade_factory)
+
+    MigrationFacilitator(facade_factory, argument_handler)
+
+    assert facade_factory.mongo_facade.max_pool_size == 4
+    assert facade_factory.mongo_facade.max_idle_time_milliseconds == 1000
+
+
 class FakeFacadeFactoryWithRealMongoFacade(FakeFacadeFactory):
     def __init__(self):
         super().__init__()
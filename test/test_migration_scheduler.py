@@ -0,0 +1,164 @@
+import threading
+from typing import List, Optional, Set
+
+import pytest
+
+from nislmigrate.extensibility.migrator_plugin import MigratorPlugin, MigratorResource
+from nislmigrate.logs.migration_error import MigrationError
+from nislmigrate.migration_scheduler import MigrationScheduler
+
+
+@pytest.mark.unit
+def test_scheduler_runs_every_migrator_once():
+    migrators = [FakeMigrator('a'), FakeMigrator('b'), FakeMigrator('c')]
+    started: List[str] = []
+
+    MigrationScheduler(jobs=2).run(migrators, lambda migrator: started.append(migrator.name))
+
+    assert sorted(started) == ['a', 'b', 'c']
+
+
+@pytest.mark.unit
+def test_scheduler_starts_largest_workload_first():
+    migrators = [FakeMigrator('small', workload=1), FakeMigrator('large', workload=10)]
+    started: List[str] = []
+
+    MigrationScheduler(jobs=1).run(migrators, lambda migrator: started.append(migrator.name))
+
+    assert started == ['large', 'small']
+
+
+@pytest.mark.unit
+def test_scheduler_runs_dependencies_before_dependents():
+    migrators = [
+        FakeMigrator('dependent', workload=10, dependencies=['dependency']),
+        FakeMigrator('dependency', workload=1),
+    ]
+    started: List[str] = []
+
+    MigrationScheduler(jobs=2).run(migrators, lambda migrator: started.append(migrator.name))
+
+    assert started == ['dependency', 'dependent']
+
+
+@pytest.mark.unit
+def test_scheduler_ignores_dependencies_that_are_not_migrated():
+    migrators = [FakeMigrator('dependent', dependencies=['not migrated'])]
+    started: List[str] = []
+
+    MigrationScheduler(jobs=2).run(migrators, lambda migrator: started.append(migrator.name))
+
+    assert started == ['dependent']
+
+
+@pytest.mark.unit
+def test_scheduler_with_dependency_cycle_raises_error():
+    migrators = [FakeMigrator('a', dependencies=['b']), FakeMigrator('b', dependencies=['a'])]
+
+    with pytest.raises(MigrationError):
+        MigrationScheduler(jobs=2).run(migrators, lambda migrator: None)
+
+
+@pytest.mark.unit
+def test_scheduler_runs_independent_migrators_at_the_same_time():
+    migrators = [FakeMigrator('a'), FakeMigrator('b')]
+    barrier = threading.Barrier(2, timeout=5)
+
+    MigrationScheduler(jobs=2).run(migrators, lambda migrator: barrier.wait())
+
+
+@pytest.mark.unit
+def test_scheduler_does_not_run_migrators_sharing_a_limited_resource_at_the_same_time():
+    disk = {MigratorResource.MONGO, MigratorResource.DISK}
+    migrators = [FakeMigrator('a', resources=disk), FakeMigrator('b', resources=disk), FakeMigrator('c')]
+    tracker = ConcurrencyTracker()
+
+    MigrationScheduler(jobs=3).run(migrators, tracker.run)
+
+    assert tracker.maximum_disk_migrators == 1
+
+
+@pytest.mark.unit
+def test_scheduler_raises_first_error_and_does_not_start_more_migrators():
+    migrators = [FakeMigrator('failing', workload=10), FakeMigrator('never', workload=1)]
+    started: List[str] = []
+
+    def migrate(migrator: MigratorPlugin):
+        started.append(migrator.name)
+        if migrator.name == 'failing':
+            raise RuntimeError('failure')
+
+    with pytest.raises(RuntimeError):
+        MigrationScheduler(jobs=1).run(migrators, migrate)
+
+    assert started == ['failing']
+
+
+@pytest.mark.unit
+def test_scheduler_with_no_jobs_raises_error():
+    with pytest.raises(MigrationError):
+        MigrationScheduler(jobs=0)
+
+
+class ConcurrencyTracker:
+    def __init__(self):
+        self.__lock = threading.Lock()
+        self.__running_disk_migrators = 0
+        self.maximum_disk_migrators = 0
+
+    def run(self, migrator: MigratorPlugin):
+        uses_disk = MigratorResource.DISK in migrator.resources
+        with self.__lock:
+            if uses_disk:
+                self.__running_disk_migrators += 1
+                self.maximum_disk_migrators = max(self.maximum_disk_migrators, self.__running_disk_migrators)
+        threading.Event().wait(0.05)
+        with self.__lock:
+            if uses_disk:
+                self.__running_disk_migrators -= 1
+
+
+class FakeMigrator(MigratorPlugin):
+    def __init__(
+            self,
+            name: str,
+            workload: int = 1,
+            dependencies: Optional[List[str]] = None,
+            resources: Optional[Set[MigratorResource]] = None):
+        self.__name = name
+        self.__workload = workload
+        self.__dependencies = dependencies or []
+        self.__resources = resources or {MigratorResource.MONGO}
+
+    @property
+    def argument(self) -> str:
+        return self.__name
+
+    @property
+    def name(self) -> str:
+        return self.__name
+
+    @property
+    def help(self) -> str:
+        return ''
+
+    @property
+    def resources(self) -> Set[MigratorResource]:
+        return self.__resources
+
+    @property
+    def dependencies(self) -> List[str]:
+        return self.__dependencies
+
+    @property
+    def relative_workload(self) -> int:
+        return self.__workload
+
+    def capture(self, migration_directory, facade_factory, arguments) -> None:
+        pass
+
+    def restore(self, migration_directory, facade_factory, arguments) -> None:
+        pass
+
+    def pre_restore_check(self, migration_directory, facade_factory, arguments) -> None:
+        pass
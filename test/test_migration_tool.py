@@ -72,10 +72,6 @@ def test_migrator_receives_extra_arguments(tmp_path) -> None:
 
 
 class FakeProcessFacadeWithPathVerification(FakeProcessFacade):
-    def handle_mongo_dump(self, archive_path: Path):
-        # create an empty file at the requested path
-        archive_path.touch()
-
     def handle_mongo_restore(self, archive_path: Path):
         # ensure the requested file exists
         if not archive_path.exists():
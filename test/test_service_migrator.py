@@ -180,6 +180,38 @@ def test_migrate_services_starts_stopped_services(operation: MigrationAction):
     assert facade_factory.system_link_service_manager_facade.are_services_running
 
 
+@pytest.mark.unit
+@pytest.mark.parametrize('operation', [
+    MigrationAction.CAPTURE,
+    MigrationAction.RESTORE
+])
+def test_migrate_services_closes_mongo_connections(operation: MigrationAction):
+    facade_factory = configure_fake_facade_factory()
+    service = FakeMigrator()
+
+    argument_handler = FakeArgumentHandler([service], operation)
+    service_migrator = MigrationFacilitator(facade_factory, argument_handler)
+    service_migrator.migrate()
+
+    assert facade_factory.mongo_facade.close_connections_count == 1
+
+
+@pytest.mark.unit
+@pytest.mark.parametrize('operation', [
+    MigrationAction.CAPTURE,
+    MigrationAction.RESTORE
+])
+def test_migrate_services_stops_mongo(operation: MigrationAction):
+    facade_factory = configure_fake_facade_factory()
+    service = FakeMigrator()
+
+    argument_handler = FakeArgumentHandler([service], operation)
+    service_migrator = MigrationFacilitator(facade_factory, argument_handler)
+    service_migrator.migrate()
+
+    assert not facade_factory.mongo_facade.is_mongo_running
+
+
 @pytest.mark.unit
 def test_migrate_services_with_capture_action_does_not_restart_web_server():
     facade_factory = configure_fake_facade_factory()
@@ -1,20 +1,34 @@
 import argparse
+import io
 
-from nislmigrate.facades.file_system_facade import FileSystemFacade
+from nislmigrate.facades.document_transform import DocumentTransform
+from nislmigrate.facades.file_copy_engine import LINK_MODE_COPY
+from nislmigrate.facades.file_system_facade import FileSystemFacade, VERIFY_MODE_NONE
 from nislmigrate.facades.mongo_configuration import MongoConfiguration
 from nislmigrate.facades.ni_web_server_manager_facade import NiWebServerManagerFacade
 from nislmigrate.argument_handler import ArgumentHandler
 from nislmigrate.extensibility.migrator_plugin import MigratorPlugin
 from nislmigrate.extensibility.migrator_plugin_loader import MigratorPluginLoader
 from nislmigrate.facades.facade_factory import FacadeFactory
-from nislmigrate.facades.mongo_facade import MongoFacade
+from nislmigrate.facades.mongo_facade import (
+    MongoFacade,
+    DocumentUpdateSummary,
+    DEFAULT_MAX_IDLE_TIME_MILLISECONDS,
+    DEFAULT_MAX_POOL_SIZE,
+    MONGO_ENGINE_TOOLS,
+    MONGO_PROFILE_PRODUCTION,
+)
+from nislmigrate.facades.mongo_restore import MongoRestoreOptions
 from nislmigrate.facades.process_facade import ProcessError, ProcessFacade, BackgroundProcess
 from nislmigrate.facades.system_link_service_manager_facade import SystemLinkServiceManagerFacade
 import os
 from pathlib import Path
-from typing import List, Optional, Dict, Any, Callable
+from typing import BinaryIO, List, Optional, Dict, Any, Callable, Tuple, TypeVar
 
 from nislmigrate.migration_action import MigrationAction
+from test.facades.test_mongo_archive import make_archive
+
+T = TypeVar('T')
 
 
 class FakeFacadeFactory(FacadeFactory):
@@ -63,6 +77,42 @@ class FakeArgumentHandler(ArgumentHandler):
     def is_force_migration_flag_present(self) -> bool:
         return True
 
+    def is_incremental_capture_flag_present(self) -> bool:
+        return False
+
+    def is_sync_restore_flag_present(self) -> bool:
+        return False
+
+    def is_deduplicate_flag_present(self) -> bool:
+        return False
+
+    def get_object_store_directory(self) -> Optional[str]:
+        return None
+
+    def is_archive_flag_present(self) -> bool:
+        return False
+
+    def get_link_mode(self) -> str:
+        return LINK_MODE_COPY
+
+    def get_checksum_algorithm(self) -> Optional[str]:
+        return None
+
+    def get_verify_mode(self) -> str:
+        return VERIFY_MODE_NONE
+
+    def get_mongo_profile(self) -> str:
+        return MONGO_PROFILE_PRODUCTION
+
+    def get_mongo_engine(self) -> str:
+        return MONGO_ENGINE_TOOLS
+
+    def get_mongo_pool_size(self) -> int:
+        return DEFAULT_MAX_POOL_SIZE
+
+    def get_mongo_idle_time_milliseconds(self) -> int:
+        return DEFAULT_MAX_IDLE_TIME_MILLISECONDS
+
 
 class FakeFileSystemFacade(FileSystemFacade):
     def __init__(self):
@@ -75,8 +125,23 @@ class FakeFileSystemFacade(FileSystemFacade):
         self.directories_encrypted = []
         self.directories_decrypted = []
         self.written_files = {}
+        self.verified_directories: List[str] = []
+
+    def copy_directory(
+            self,
+            from_directory: str,
+            to_directory: str,
+            force: bool,
+            link_mode: str = LINK_MODE_COPY,
+            hardlink_patterns: Optional[List[str]] = None):
+        self.last_from_directory = from_directory
+        self.last_to_directory = to_directory
+
+    def capture_directory(self, from_directory: str, to_directory: str, immutable_files: Optional[List[str]] = None):
+        self.last_from_directory = from_directory
+        self.last_to_directory = to_directory
 
-    def copy_directory(self, from_directory: str, to_directory: str, force: bool):
+    def restore_directory(self, from_directory: str, to_directory: str):
         self.last_from_directory = from_directory
         self.last_to_directory = to_directory
 
@@ -93,6 +158,12 @@ class FakeFileSystemFacade(FileSystemFacade):
             self.missing_directories = []
         return dir_ not in self.missing_directories
 
+    def does_captured_directory_exist(self, directory: str) -> bool:
+        return self.does_directory_exist(directory)
+
+    def verify_captured_directory(self, directory: str) -> None:
+        self.verified_directories.append(directory)
+
     def copy_directory_to_encrypted_file(self, from_directory: str, encrypted_file_path: str, secret: str):
         self.directories_encrypted.append((from_directory, encrypted_file_path, secret))
 
@@ -116,17 +187,39 @@ class FakeMigratorPluginLoader(MigratorPluginLoader):
 
 class FakeMongoFacade(MongoFacade):
     is_mongo_running = True
+    server_version: Tuple[int, ...] = (4, 4, 0)
 
     def __init__(self, process_facade: Optional[ProcessFacade] = None):
         super().__init__(process_facade or FakeProcessFacade())
         self.updated_documents_in_collections: Dict[str, Any] = {}
+        self.server_side_updates: Dict[str, List[Tuple[Dict[str, Any], List[Dict[str, Any]]]]] = {}
+        self.document_queries: Dict[str, Tuple[Optional[Dict[str, Any]], Optional[Dict[str, Any]]]] = {}
+        self.restore_transforms: Dict[str, DocumentTransform] = {}
+        self.close_connections_count = 0
 
-    def start_mongo(self):
+    def start_mongo(self, configuration: MongoConfiguration):
         self.is_mongo_running = True
 
     def stop_mongo(self):
         self.is_mongo_running = False
 
+    def close_connections(self):
+        self.close_connections_count += 1
+        super().close_connections()
+
+    def restore_database_from_directory(
+            self,
+            configuration: MongoConfiguration,
+            directory: str,
+            dump_name: str,
+            transforms: Optional[Dict[str, DocumentTransform]] = None,
+            options: Optional[MongoRestoreOptions] = None,
+    ) -> None:
+        super().restore_database_from_directory(configuration, directory, dump_name, options=options)
+        for collection_name, transform in (transforms or {}).items():
+            self.updated_documents_in_collections[collection_name] = configuration
+            self.restore_transforms[collection_name] = transform
+
     @staticmethod
     def validate_can_restore_database_from_directory(
             directory: str,
@@ -139,15 +232,44 @@ class FakeMongoFacade(MongoFacade):
             configuration: MongoConfiguration,
             collection_name: str,
             predicate: Callable[[Any], bool],
-            update_function: Callable[[Any], Any]):
+            update_function: Callable[[Any], Any],
+            batch_size: int = 0,
+            query_filter: Optional[Dict[str, Any]] = None,
+            projection: Optional[Dict[str, Any]] = None,
+            cursor_batch_size: int = 0,
+            no_cursor_timeout: bool = False,
+            partitions: int = 1) -> DocumentUpdateSummary:
         self.updated_documents_in_collections[collection_name] = configuration
+        self.document_queries[collection_name] = (query_filter, projection)
+        return DocumentUpdateSummary()
 
     def update_documents_in_collection(
             self,
             configuration: MongoConfiguration,
             collection_name: str,
-            update_function: Callable[[Any], Any]):
+            update_function: Callable[[Any], Any],
+            batch_size: int = 0,
+            query_filter: Optional[Dict[str, Any]] = None,
+            projection: Optional[Dict[str, Any]] = None,
+            cursor_batch_size: int = 0,
+            no_cursor_timeout: bool = False,
+            partitions: int = 1) -> DocumentUpdateSummary:
+        self.updated_documents_in_collections[collection_name] = configuration
+        self.document_queries[collection_name] = (query_filter, projection)
+        return DocumentUpdateSummary()
+
+    def update_documents_in_collection_on_server(
+            self,
+            configuration: MongoConfiguration,
+            collection_name: str,
+            query_filter: Dict[str, Any],
+            pipeline: List[Dict[str, Any]]) -> DocumentUpdateSummary:
         self.updated_documents_in_collections[collection_name] = configuration
+        self.server_side_updates.setdefault(collection_name, []).append((query_filter, pipeline))
+        return DocumentUpdateSummary()
+
+    def get_server_version(self, configuration: MongoConfiguration) -> Tuple[int, ...]:
+        return self.server_version
 
     def did_update_documents_in_collection(
             self,
@@ -171,10 +293,10 @@ class FakeProcessFacade(ProcessFacade):
         self.reset()
 
     def reset(self):
-        self.last_capture_path: Optional[Path] = None
         self.captured: bool = False
         self.last_restore_path: Optional[Path] = None
         self.restored: bool = False
+        self.dump_output: bytes = make_archive('database', {})
 
     def run_process(self, args: List[str]):
         archive_arg = [a for a in args if a.startswith('--archive=')][0]
@@ -183,24 +305,23 @@ class FakeProcessFacade(ProcessFacade):
 
         archive_path = Path(archive_arg.split('=')[1])
 
-        if 'mongodump' in args[0]:
-            self.handle_mongo_dump(archive_path)
-            self.last_capture_path = archive_path
-            self.captured = True
-        elif 'mongorestore' in args[0]:
+        if 'mongorestore' in args[0]:
             self.handle_mongo_restore(archive_path)
             self.last_restore_path = archive_path
             self.restored = True
         else:
             raise ProcessError('unknown command')
 
+    def run_process_with_output(self, args: List[str], read_output: Callable[[BinaryIO], T]) -> Tuple[T, str]:
+        if 'mongodump' not in args[0] or '--archive' not in args:
+            raise ProcessError('unknown command')
+        result = read_output(io.BytesIO(self.dump_output))
+        self.captured = True
+        return result, ''
+
     def run_background_process(self, args: List[str]) -> BackgroundProcess:
         return NoopBackgroundProcess(args)
 
-    def handle_mongo_dump(self, archive_path: Path):
-        """Override this method to add test-specific handling."""
-        pass
-
     def handle_mongo_restore(self, archive_path: Path):
         """Override this method to add test-specific handling."""
         pass